@@ -5,6 +5,7 @@ from datetime import datetime, timedelta, timezone
 import requests
 import hashlib
 import logging
+from functools import lru_cache
 
 from models.airtable_model import Message, Conversation
 
@@ -63,6 +64,31 @@ def list_records_by_view(view_name: str, *, max_records: int = 50):
     data = _request("GET", BASE_URL, params=params)
     return (data or {}).get("records") or []
 
+
+def list_records(formula: str = "", *, view: str = "", fields: tuple = (), max_records: int = 0,
+                 table: str = "") -> list[dict]:
+    """
+    Every Leads record (or `table` record) matching filterByFormula (optionally within a
+    view), following pagination. fields limits the columns returned; max_records=0 means no cap.
+    """
+    url = return_table_url(table) if table else BASE_URL
+    params = {"pageSize": 100}
+    if formula:
+        params["filterByFormula"] = formula
+    if view:
+        params["view"] = view
+    if fields:
+        params["fields[]"] = list(fields)
+    out = []
+    while True:
+        data = _request("GET", url, params=params) or {}
+        out.extend(data.get("records") or [])
+        if max_records and len(out) >= max_records:
+            return out[:max_records]
+        if not data.get("offset"):
+            return out
+        params["offset"] = data["offset"]
+
 def find_by_conversation_id(conversation_id: str):
     """
     Returns Airtable Conversation record (or None) by conversation_id.
@@ -740,18 +766,48 @@ def find_by_opp_id(opp_id: str) -> dict | None:
     return recs[0] if recs else None
 
 
+# fn(record) after every Leads write made by this process; record is what Airtable
+# returned (all non-empty fields). cadence_scheduler uses it to keep its timers current.
+_write_listeners: list = []
+
+
+def add_write_listener(fn) -> None:
+    _write_listeners.append(fn)
+
+
+def _notify_write(rec: dict) -> dict:
+    for fn in _write_listeners:
+        try:
+            fn(rec)
+        except Exception:
+            log.exception("Leads write listener failed rec=%s", (rec or {}).get("id"))
+    return rec
+
+
 def upsert_lead(opp_id: str, fields: dict) -> dict:
     existing = find_by_opp_id(opp_id)
     payload = {"fields": {"opp_id": opp_id, **fields}}
     if existing:
-        return _request("PATCH", f"{BASE_URL}/{existing['id']}", json=payload)
-    return _request("POST", BASE_URL, json=payload)
+        return _notify_write(_request("PATCH", f"{BASE_URL}/{existing['id']}", json=payload))
+    return _notify_write(_request("POST", BASE_URL, json=payload))
+
+
+@lru_cache(maxsize=1024)
+def _is_hr_key(k: str) -> bool:
+    return ("Human Review" in k) or ("needs_human" in k.lower())
+
+
+def _hr_keys(fields: dict) -> list[str]:
+    """Human-review fields in a PATCH payload (per-key result cached; field names repeat)."""
+    if not log.isEnabledFor(logging.WARNING):
+        return []
+    return [k for k in fields if isinstance(k, str) and _is_hr_key(k)]
 
 
 def patch_by_id(rec_id: str, fields: dict) -> dict:
     # 🔍 Log any Human Review writes at the last possible moment
     try:
-        hr_keys = [k for k in fields.keys() if ("Human Review" in k) or ("needs_human" in k.lower())]
+        hr_keys = _hr_keys(fields)
         if hr_keys:
             log.warning(
                 "HR_WRITE patch_by_id rec_id=%s payload=%r",
@@ -761,12 +817,12 @@ def patch_by_id(rec_id: str, fields: dict) -> dict:
     except Exception:
         pass
 
-    return _request("PATCH", f"{BASE_URL}/{rec_id}", json={"fields": fields})
+    return _notify_write(_request("PATCH", f"{BASE_URL}/{rec_id}", json={"fields": fields}))
 
 
 def patch_conversations_by_id(rec_id: str, fields: dict) -> dict:
     try:
-        hr_keys = [k for k in fields.keys() if ("Human Review" in k) or ("needs_human" in k.lower())]
+        hr_keys = _hr_keys(fields)
         if hr_keys:
             log.warning(
                 "HR_WRITE patch_by_id rec_id=%s payload=%r",
@@ -781,18 +837,30 @@ def patch_conversations_by_id(rec_id: str, fields: dict) -> dict:
     return _request("PATCH", f"{url}/{rec_id}", json={"fields": fields})
 
 
+def query_view_page(view: str, offset: str | None = None, sort_field: str = "",
+                    page_size: int = 100) -> tuple[list[dict], str | None]:
+    """
+    One page of a view: (records, next_offset). next_offset is None on the last page.
+    sort_field sorts ascending server-side (e.g. "follow_up_at": most overdue first).
+    """
+    params = {"view": view, "pageSize": page_size}
+    if offset:
+        params["offset"] = offset
+    if sort_field:
+        params["sort[0][field]"] = sort_field
+        params["sort[0][direction]"] = "asc"
+    data = _request("GET", BASE_URL, params=params)
+    return data.get("records", []), data.get("offset")
+
+
 def query_view(view: str, max_records: int = 200) -> list[dict]:
     out = []
     offset = None
     while True:
-        params = {"view": view, "pageSize": 100}
-        if offset:
-            params["offset"] = offset
-        data = _request("GET", BASE_URL, params=params)
-        out.extend(data.get("records", []))
+        records, offset = query_view_page(view, offset)
+        out.extend(records)
         if len(out) >= max_records:
             return out[:max_records]
-        offset = data.get("offset")
         if not offset:
             return out
 
@@ -1264,22 +1332,9 @@ def save_opp(opp: dict, *, extra_fields: dict | None = None):
     if extra_fields:
         patch.update(extra_fields)
 
-    # ✅ HR write detector: tell us when code is PATCHing human review fields
-    try:
-        hr_keys = [k for k in patch.keys() if ("Needs Human Review" in k) or ("Human Review" in k)]
-        if hr_keys:
-            log.warning(
-                "HR_WRITE save_opp rec_id=%s opp=%s payload=%r",
-                rec_id,
-                opp.get("opportunityId") or opp.get("id"),
-                {k: patch.get(k) for k in hr_keys},
-            )
-    except Exception:
-        pass
-
-    # ✅ HR write detector (final patch going to Airtable)
+    # ✅ HR write detector: tell us when code is PATCHing human review fields (final patch)
     try:
-        hr_keys = [k for k in patch.keys() if ("Human Review" in k) or ("needs_human" in k.lower())]
+        hr_keys = _hr_keys(patch)
         if hr_keys:
             log.warning(
                 "HR_WRITE final_patch rec_id=%s opp=%s keys=%s payload=%r",
@@ -0,0 +1,243 @@
+# appt_parser.py
+# Rule-based fast path for gpt.extract_appt_time.
+#
+# Handles the short, unambiguous replies that make up most scheduling traffic
+# ("Wednesday at 4", "Tomorrow at 10:30am", "tomorrow afternoon", "ok thanks")
+# with the same business-hours and relative-date rules as the GPT prompt, and
+# returns the same {classification, iso, confidence, window, reason} schema.
+# Anything it is not sure about returns None and goes to GPT.
+
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+log = logging.getLogger("patti.appt_parser")
+
+APPT_FASTPATH_ENABLED = os.getenv("APPT_FASTPATH", "1").strip().lower() not in ("0", "false", "no")
+# longer texts are usually quoted threads / conversation history -> GPT
+FASTPATH_MAX_CHARS = int(os.getenv("APPT_FASTPATH_MAX_CHARS", "160"))
+
+# Same store hours as the extract_appt_time prompt (weekday -> (open, close) hour)
+BUSINESS_HOURS = {
+    0: (9, 19), 1: (9, 19), 2: (9, 19), 3: (9, 19), 4: (9, 19),
+    5: (9, 20),
+    6: (10, 18),
+}
+
+_WEEKDAYS = {
+    "mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6,
+}
+
+_DAY_RE = re.compile(
+    r"\b(?:(?P<qual>this|next)\s+)?"
+    # "sat"/"sun" are ordinary words, so only the full names count for those
+    r"(?P<dow>mon(?:day)?|tue(?:s(?:day)?)?|wed(?:nesday)?|thu(?:r(?:s(?:day)?)?)?|fri(?:day)?|saturday|sunday)\b"
+    r"|\b(?P<rel>today|tonight|tomorrow|tmrw|tmr|later today)\b"
+    r"|\b(?P<vague>(?:this|next)\s+week(?:end)?|weekend)\b"
+)
+_TIME_RE = re.compile(
+    r"(?:\b(?P<lead>at|@|around|by|for)\s*)?"
+    r"\b(?P<h>\d{1,2})(?::(?P<m>[0-5]\d))?\s*(?P<mer>am|pm|a\.m\.|p\.m\.)?(?![\w:])"
+    r"|\b(?P<noon>noon)\b"
+)
+_WINDOW_RE = re.compile(r"\b(?P<w>morning|afternoon|evening|tonight|after work|after school)\b")
+_RESCHEDULE_RE = re.compile(
+    r"\b(reschedul\w*|move (?:it|my|the|our)|push (?:it|my|the)|change (?:my|the) (?:appointment|appt|time)|"
+    r"different (?:day|time)|instead)\b"
+)
+# things the rules deliberately don't try to interpret
+_UNSURE_RE = re.compile(
+    r"\b(not|no|can'?t|cannot|won'?t|don'?t|unable|busy|except|until|before|between|"
+    r"hours|open|close[ds]?|closing|opening|midnight|maybe|might|if)\b|n't\b"
+)
+_OPEN_ENDED_RE = re.compile(
+    r"\bwhen (?:can|could|should|do|would) (?:i|we)\b"
+    r"|\bwhat (?:times?|days?) (?:are|do|would|work|is)\b"
+    r"|\b(?:available|open) (?:times|slots|appointments)\b"
+    r"|\bwhat are your available\b"
+)
+# any of these means "might be scheduling" -> never a confident NO_INTENT
+_SCHED_HINT_RE = re.compile(
+    r"\b(come|coming|stop|swing|visit|appointment|appt|schedule|book|drive|test|time|times|when|"
+    r"available|availability|meet|see|week|weekend|later|soon|asap|now|works?|day|"
+    # could be confirming a time Patti proposed
+    r"yes|yep|yeah|sure|good|great|perfect|confirm\w*)\b"
+)
+
+_stats_lock = threading.Lock()
+_stats = {"rules": 0, "gpt": 0, "rules_s": 0.0, "gpt_s": 0.0}
+
+
+def _result(classification: str, iso: str = "", confidence: float = 0.5, window: str = "", reason: str = "") -> Dict[str, Any]:
+    return {
+        "classification": classification,
+        "iso": iso,
+        "confidence": confidence,
+        "window": window,
+        "reason": f"rules: {reason}" if reason else "rules",
+    }
+
+
+def _parse_days(low: str) -> Tuple[List[Dict[str, Any]], List[Tuple[int, int]]]:
+    days, spans = [], []
+    for m in _DAY_RE.finditer(low):
+        spans.append(m.span())
+        if m.group("dow"):
+            days.append({"kind": "dow", "dow": _WEEKDAYS[m.group("dow")[:3]], "qual": m.group("qual"), "end": m.end()})
+        elif m.group("rel"):
+            rel = m.group("rel")
+            offset = 1 if rel in ("tomorrow", "tmrw", "tmr") else 0
+            days.append({"kind": "rel", "offset": offset, "later": rel == "later today", "tonight": rel == "tonight", "end": m.end()})
+        else:
+            days.append({"kind": "vague", "end": m.end()})
+    return days, spans
+
+
+def _parse_times(low: str, days: List[Dict[str, Any]]) -> Optional[Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]]:
+    """[(hour24, minute)] plus the spans they cover; None if a time is malformed."""
+    times, spans = [], []
+    day_ends = {d["end"] for d in days}
+    for m in _TIME_RE.finditer(low):
+        if m.group("noon"):
+            times.append((12, 0))
+            spans.append(m.span())
+            continue
+        h = int(m.group("h"))
+        minute = int(m.group("m") or 0)
+        mer = (m.group("mer") or "").replace(".", "")
+        # a bare number only counts as a time after "at"/"@"/... or right after a day ("friday 4")
+        follows_day = any(0 <= m.start("h") - e <= 1 for e in day_ends)
+        if not (mer or m.group("m") or m.group("lead") or follows_day):
+            continue
+        if mer:
+            if not 1 <= h <= 12:
+                return None
+            h = (h % 12) + (12 if mer == "pm" else 0)
+        elif h > 12:
+            if not m.group("m") or h > 23:
+                return None
+        elif h == 0:
+            return None
+        else:
+            # no am/pm: 1-7 -> afternoon/evening, 8-11 -> morning, 12 -> noon
+            h = h + 12 if 1 <= h <= 7 else h
+        times.append((h, minute))
+        spans.append(m.span())
+    return times, spans
+
+
+def _resolve_date(day: Dict[str, Any], now: datetime, hm: Optional[Tuple[int, int]]):
+    if day["kind"] == "rel":
+        return (now + timedelta(days=day["offset"])).date()
+    wd = now.weekday()
+    delta = (day["dow"] - wd) % 7
+    if day["qual"] == "next" and delta == 0:
+        delta = 7
+    elif delta == 0 and hm is not None:
+        # same weekday as today: today if that time hasn't passed, else next week
+        if now.replace(hour=hm[0], minute=hm[1], second=0, microsecond=0) <= now:
+            delta = 7
+    return (now + timedelta(days=delta)).date()
+
+
+def _within_business_hours(dt: datetime) -> bool:
+    open_h, close_h = BUSINESS_HOURS[dt.weekday()]
+    minutes = dt.hour * 60 + dt.minute
+    return open_h * 60 <= minutes <= close_h * 60
+
+
+def fast_extract_appt_time(text: str, tz: str = "America/Los_Angeles", now: datetime = None) -> Optional[Dict[str, Any]]:
+    """
+    Rule-based extraction. Returns the extract_appt_time schema when the rules
+    are confident, else None (caller falls back to GPT).
+    """
+    t = (text or "").strip()
+    if not t or len(t) > FASTPATH_MAX_CHARS or "\n" in t:
+        return None
+    low = t.lower().replace("’", "'")
+    now = now or datetime.now(ZoneInfo(tz))
+
+    if _UNSURE_RE.search(low):
+        return None
+
+    days, day_spans = _parse_days(low)
+    parsed = _parse_times(low, days)
+    if parsed is None:
+        return None
+    times, time_spans = parsed
+    windows = [m.group("w") for m in _WINDOW_RE.finditer(low)]
+
+    # every number must be part of a recognized time, otherwise it's something else
+    covered = day_spans + time_spans
+    for m in re.finditer(r"\d+", low):
+        if not any(a <= m.start() < b for a, b in covered):
+            return None
+
+    if _RESCHEDULE_RE.search(low):
+        return _result("RESCHEDULE", confidence=0.6, reason="reschedule wording")
+
+    if len(days) > 1 or len(times) > 1:
+        if re.search(r"\bor\b", low):
+            return _result("MULTI_OPTION", confidence=0.6, reason="multiple options offered")
+        return None
+
+    day = days[0] if days else None
+
+    if times:
+        if day is None or day["kind"] == "vague" or day.get("later"):
+            return None
+        hm = times[0]
+        d = _resolve_date(day, now, hm)
+        dt = datetime(d.year, d.month, d.day, hm[0], hm[1], tzinfo=now.tzinfo)
+        if dt <= now:
+            return None  # "today at 4" said at 5:30 -> GPT
+        if not _within_business_hours(dt):
+            return None  # out-of-hours handling is a judgment call -> GPT
+        return _result("EXACT_TIME", iso=dt.isoformat(), confidence=0.95, window="exact", reason="explicit day and time")
+
+    if windows:
+        w = windows[0]
+        window = "evening" if w in ("tonight", "after work", "after school") else w
+        return _result("VAGUE_WINDOW", confidence=0.5, window=window, reason=f"time window '{w}'")
+
+    if day is not None:
+        if day.get("tonight"):
+            return _result("VAGUE_WINDOW", confidence=0.5, window="evening", reason="tonight")
+        return _result("VAGUE_DATE", confidence=0.5, reason="day without a time")
+
+    if _OPEN_ENDED_RE.search(low):
+        return _result("OPEN_ENDED", confidence=0.5, reason="asks when to come in")
+
+    if not re.search(r"\d", low) and not _SCHED_HINT_RE.search(low):
+        return _result("NO_INTENT", confidence=1.0, reason="no scheduling signal")
+
+    return None
+
+
+def record(route: str, elapsed_s: float) -> None:
+    """route = 'rules' | 'gpt'"""
+    with _stats_lock:
+        _stats[route] += 1
+        _stats[f"{route}_s"] += elapsed_s
+
+
+def fastpath_stats() -> Dict[str, Any]:
+    """Share of extract_appt_time traffic served by rules and the latency it avoided."""
+    with _stats_lock:
+        st = dict(_stats)
+    total = st["rules"] + st["gpt"]
+    avg_gpt_ms = (st["gpt_s"] * 1000.0 / st["gpt"]) if st["gpt"] else 0.0
+    avg_rules_ms = (st["rules_s"] * 1000.0 / st["rules"]) if st["rules"] else 0.0
+    return {
+        "calls": total,
+        "rules": st["rules"],
+        "gpt": st["gpt"],
+        "rules_share": (st["rules"] / total) if total else 0.0,
+        "avg_rules_ms": avg_rules_ms,
+        "avg_gpt_ms": avg_gpt_ms,
+        "est_gpt_ms_avoided": st["rules"] * max(avg_gpt_ms - avg_rules_ms, 0.0),
+    }
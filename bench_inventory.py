@@ -0,0 +1,220 @@
+# bench_inventory.py
+# Memory/throughput benchmark for inventory_matcher.parse_vehicle_inventory.
+#
+#   python bench_inventory.py              # 20k vehicles
+#   python bench_inventory.py 50000        # custom size
+#   python bench_inventory.py recommend    # recommender latency at 1k/10k/50k
+#
+# Parser: compares the old ET.fromstring + full-dict parser against the
+# streaming iterparse parser (from text and from a file on disk).
+# Recommender: per-lead latency of the old score_vehicle loop vs InventoryIndex,
+# checking that both return the same ranking for every query.
+
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from inventory_matcher import (
+    _NS,
+    _ymd,
+    InventoryIndex,
+    extract_interest,
+    iter_vehicle_inventory,
+    parse_vehicle_inventory,
+    score_vehicle,
+)
+
+_MAKES = {
+    "TOYOTA": ["RAV4", "CAMRY", "COROLLA", "TACOMA", "HIGHLANDER"],
+    "HONDA": ["CIVIC", "ACCORD", "CR-V", "PILOT"],
+    "MAZDA": ["CX-5", "CX-50", "MAZDA3", "CX-90"],
+    "FORD": ["F-150", "ESCAPE", "EXPLORER", "BRONCO"],
+    "KIA": ["SPORTAGE", "TELLURIDE", "SORENTO", "K5"],
+}
+_BODIES = ["SUV", "SEDAN", "TRUCK", "HATCHBACK", "VAN", "COUPE"]
+
+
+def synthetic_inventory_xml(n: int, seed: int = 7) -> str:
+    rnd = random.Random(seed)
+    out = [
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>'
+        '<VehicleInventoryResponse xmlns="opentrack.dealertrack.com">'
+        '<VehicleInventoryResult xmlns="opentrack.dealertrack.com/transitional">'
+    ]
+    for i in range(n):
+        make = rnd.choice(list(_MAKES))
+        model = rnd.choice(_MAKES[make])
+        opt_fields = "".join(
+            f"<VehicleOptionalField><OptionNumber>{j}</OptionNumber><Description>Field {j}</Description>"
+            f"<FieldType>A</FieldType><AlphaFieldValue>VAL{j}</AlphaFieldValue><NumericFieldValue>0</NumericFieldValue>"
+            f"<DateFieldValue>0</DateFieldValue><AddToCostFlag>N</AddToCostFlag></VehicleOptionalField>"
+            for j in range(6)
+        )
+        options = "".join(
+            f"<VehicleOption><OptionCode>OC{j}</OptionCode><Description>Package {j}</Description></VehicleOption>"
+            for j in range(8)
+        )
+        out.append(
+            "<Result>"
+            f"<CompanyNumber>ZE7</CompanyNumber><VIN>VIN{i:014d}</VIN><StockNumber>S{i}</StockNumber>"
+            f"<Status>{rnd.choice('IIIIS')}</Status><TypeNU>{rnd.choice('NNU')}</TypeNU>"
+            f"<ModelYear>{rnd.randint(2016, 2026)}</ModelYear><Make>{make}</Make><Model>{model}</Model>"
+            f"<Trim>{rnd.choice(['LX', 'EX', 'SPORT', 'LIMITED', ''])}</Trim><BodyStyle>{rnd.choice(_BODIES)}</BodyStyle>"
+            f"<Color>BLUE</Color><FuelType>G</FuelType><Cylinders>4</Cylinders><Odometer>{rnd.randint(5, 90000)}</Odometer>"
+            f"<DateInInventory>20250{rnd.randint(1, 9)}1{rnd.randint(0, 9)}</DateInInventory>"
+            f"<ListPrice>{rnd.randint(15000, 65000)}</ListPrice><VehicleCost>0</VehicleCost>"
+            f"<PublishVehicleInfoToWeb>{rnd.choice('YN')}</PublishVehicleInfoToWeb>"
+            f"<OptionalFields>{opt_fields}</OptionalFields><Options>{options}</Options>"
+            "</Result>"
+        )
+    out.append("</VehicleInventoryResult></VehicleInventoryResponse></soap:Body></soap:Envelope>")
+    return "".join(out)
+
+
+def legacy_parse_vehicle_inventory(xml_text: str):
+    """The pre-streaming parser, kept here only as the benchmark baseline."""
+    root = ET.fromstring(xml_text)
+    rows = []
+    for r in root.findall(".//t:Result", _NS):
+        def g(tag):
+            el = r.find(f"t:{tag}", _NS)
+            return (el.text or "").strip() if el is not None and el.text is not None else ""
+        def tx(parent, name):
+            el = parent.find(f"t:{name}", _NS)
+            return (el.text or "").strip() if el is not None and el.text else ""
+        opt = [
+            {k: tx(of, k) for k in ("OptionNumber", "Description", "FieldType", "AlphaFieldValue",
+                                    "NumericFieldValue", "DateFieldValue", "AddToCostFlag")}
+            for of in r.findall("t:OptionalFields/t:VehicleOptionalField", _NS)
+        ]
+        opts = [
+            {"OptionCode": tx(op, "OptionCode"), "Description": tx(op, "Description")}
+            for op in r.findall("t:Options/t:VehicleOption", _NS)
+        ]
+        rows.append({
+            "CompanyNumber": g("CompanyNumber"), "VIN": g("VIN"), "StockNumber": g("StockNumber"),
+            "Status": g("Status"), "TypeNU": g("TypeNU"), "Year": g("ModelYear"), "Make": g("Make"),
+            "Model": g("Model"), "Trim": g("Trim"), "BodyStyle": g("BodyStyle"), "Color": g("Color"),
+            "FuelType": g("FuelType"), "Cylinders": g("Cylinders"), "Odometer": g("Odometer"),
+            "DateInInventory": _ymd(g("DateInInventory")), "ListPrice": g("ListPrice"),
+            "VehicleCost": g("VehicleCost"),
+            "PublishToWeb": g("PublishVehicleInfoToWeb") in ("Y", "y", "1", "true"),
+            "OptionalFields": opt, "Options": opts,
+        })
+    return rows
+
+
+def _measure(label, fn, n):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    count = result if isinstance(result, int) else len(result)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    assert count == n, f"{label}: expected {n} rows, got {count}"
+    print(f"{label:<38} | {elapsed:7.2f}s | {n / elapsed:9.0f} veh/s | peak {peak / 1e6:8.1f} MB")
+
+
+def run_benchmark(n: int = 20000):
+    xml_text = synthetic_inventory_xml(n)
+    print(f"Synthetic feed: {n} vehicles, {len(xml_text) / 1e6:.1f} MB of XML")
+    print("-" * 90)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".xml", delete=False, encoding="utf-8") as f:
+        f.write(xml_text)
+        path = f.name
+    try:
+        _measure("legacy ET.fromstring (full dicts)", lambda: legacy_parse_vehicle_inventory(xml_text), n)
+        _measure("streaming, list from text", lambda: parse_vehicle_inventory(xml_text), n)
+        _measure("streaming, list + options", lambda: parse_vehicle_inventory(xml_text, True, True), n)
+        del xml_text
+
+        def _stream_from_file():
+            with open(path, "rb") as fh:
+                return sum(1 for _ in iter_vehicle_inventory(fh))
+        _measure("streaming, iterate from file", _stream_from_file, n)
+    finally:
+        os.unlink(path)
+
+
+SAMPLE_LEADS = [
+    "Hi, is the 2024 Toyota RAV4 still available? Budget is $32,000",
+    "Looking for a used Honda CR-V, 2021 or so",
+    "Do you have any new Mazda CX-50 in stock?",
+    "I want a pickup truck under 40k",
+    "Interested in a certified pre-owned Kia Telluride",
+    "What SUVs do you have?",
+    "2019 Ford Escape",
+    "Need a sedan for my daughter, max 20k",
+]
+
+
+def synthetic_inventory_rows(n: int, seed: int = 11):
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(n):
+        make = rnd.choice(list(_MAKES))
+        rows.append({
+            "VIN": f"VIN{i:014d}",
+            "StockNumber": f"S{i}",
+            "Status": rnd.choice("IIIIS"),
+            "TypeNU": rnd.choice("NNU"),
+            "Year": str(rnd.randint(2016, 2026)),
+            "Make": make,
+            "Model": rnd.choice(_MAKES[make]),
+            "BodyStyle": rnd.choice(_BODIES),
+            "ListPrice": str(rnd.randint(15000, 65000)) if rnd.random() > 0.05 else "",
+            "PublishToWeb": rnd.random() > 0.3,
+        })
+    return rows
+
+
+def legacy_recommend_inventory(rows, email_text: str, k: int = 2):
+    """The pre-index recommender: score every row, full sort."""
+    interest = extract_interest(email_text)
+    scored = [(score_vehicle(v, interest), v) for v in rows]
+    scored = [x for x in scored if x[0] >= 0.0]
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [v for _, v in scored[:k]]
+
+
+def _per_lead_ms(fn, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for lead in SAMPLE_LEADS:
+            fn(lead)
+    return (time.perf_counter() - t0) * 1000.0 / (repeat * len(SAMPLE_LEADS))
+
+
+def run_recommend_benchmark(sizes=(1000, 10000, 50000), k: int = 2):
+    print(f"{'vehicles':>9} | {'index build':>11} | {'legacy/lead':>11} | {'index/lead':>10} | speedup")
+    print("-" * 66)
+    for n in sizes:
+        rows = synthetic_inventory_rows(n)
+        t0 = time.perf_counter()
+        index = InventoryIndex(rows)
+        build_ms = (time.perf_counter() - t0) * 1000.0
+
+        for lead in SAMPLE_LEADS:
+            want = legacy_recommend_inventory(rows, lead, k)
+            got = index.top_k(extract_interest(lead), k)
+            assert [id(v) for v in got] == [id(v) for v in want], f"ranking mismatch n={n} lead={lead!r}"
+
+        repeat = max(1, 20000 // n)
+        legacy_ms = _per_lead_ms(lambda lead: legacy_recommend_inventory(rows, lead, k), repeat)
+        index_ms = _per_lead_ms(lambda lead: index.top_k(extract_interest(lead), k), repeat)
+        print(f"{n:>9} | {build_ms:>9.1f}ms | {legacy_ms:>9.2f}ms | {index_ms:>8.2f}ms | {legacy_ms / index_ms:6.1f}x")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "recommend":
+        run_recommend_benchmark()
+    else:
+        run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
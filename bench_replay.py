@@ -0,0 +1,668 @@
+# bench_replay.py
+# Offline replay benchmark: recorded opportunity snapshots (jsons/process,
+# jsons/newOPPs) run through processHit, email_ingestion.process_inbound_email
+# and sms_poller.poll_once with every external service replaced by a local,
+# deterministic fake. Nothing leaves the process.
+#
+#   python bench_replay.py                               # all three flows
+#   python bench_replay.py processHit --repeat 5 --workers 4
+#   python bench_replay.py --json replay.json --no-memory
+#
+# Fakes:
+#   - requests (Airtable, Fortellis, GoTo, SendGrid, Outlook webhook): the transport
+#     (HTTPAdapter.send, below patti_metrics' Session hook) is routed to FakeServices.
+#     Airtable is an in-memory base seeded from the snapshots (filterByFormula: field
+#     equality, LOWER(), RECORD_ID(), FIND(), AND/OR); Fortellis
+#     serves the snapshot opportunity / customer / activity history; GoTo holds one
+#     inbound text per snapshot. Any other host raises ConnectionError.
+#   - OpenAI: llm_gateway's client is swapped for one canned JSON reply (LLM cache off;
+#     per-model RPM/TPM budgets lifted, since the real prompts would trip them in seconds).
+#   - Elasticsearch stays unconfigured; the send windows are held open so runs match
+#     at any hour. Flows run in a scratch directory (debug snapshots land there).
+#
+# Reports per flow: records/sec, p50/p95/max latency, external calls per record
+# by dependency, peak traced memory (tracemalloc), errors. Exits 1 when a budget
+# is exceeded, so it can run as a CI regression check:
+#
+#   REPLAY_LATENCY_MS      per-dependency latency, e.g. "airtable=40,fortellis=120,openai=900"
+#   REPLAY_ERROR_RATE      injected failures (503; raised for openai), e.g. "fortellis=0.05"
+#   REPLAY_SEED            error-injection seed (default 7)
+#   REPLAY_MAX_P95_MS      p95 budget per flow (default 0 = off)
+#   REPLAY_MAX_CALLS       external calls per record budget (default 0 = off); without
+#                          injected errors the call counts are deterministic, so this is
+#                          the budget that catches N+1 regressions
+#   REPLAY_MAX_ERROR_RATE  share of records allowed to raise (default 0.0)
+
+import argparse
+import copy
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_DIRS = (os.path.join(ROOT, "jsons", "process"), os.path.join(ROOT, "jsons", "newOPPs"))
+FLOWS = ("processHit", "inbound_email", "sms_poll")
+
+REPLAY_SEED = int(os.getenv("REPLAY_SEED", "7"))
+REPLAY_MAX_P95_MS = float(os.getenv("REPLAY_MAX_P95_MS", "0"))
+REPLAY_MAX_CALLS = float(os.getenv("REPLAY_MAX_CALLS", "0"))
+REPLAY_MAX_ERROR_RATE = float(os.getenv("REPLAY_MAX_ERROR_RATE", "0"))
+
+OWNER_SMS = "+17145977229"                 # PATTI_SMS_NUMBER default
+INBOUND_EMAIL_TEXT = "Hi, is the vehicle still available? Could I come by Saturday around 11am?"
+INBOUND_SMS_TEXT = "Is it still available? What time are you open Saturday?"
+
+# one reply that satisfies every caller's JSON shape (run_gpt, triage gate, sms_brain, analysis)
+CANNED_REPLY = {
+    "subject": "Re: Your vehicle inquiry",
+    "body": "<p>Hi there,</p><p>Thanks for reaching out! The vehicle is available and we'd be happy "
+            "to see you. What day works best for a visit?</p>",
+    "reply": "Thanks for the text! It's available. What time works for you Saturday?",
+    "can_auto_reply": True,
+    "confidence": 0.95,
+    "reason": "replay",
+    "intent": "reply",
+    "needs_handoff": False,
+    "opt_out": False,
+}
+
+
+def _parse_map(raw: str) -> Dict[str, float]:
+    out = {}
+    for part in (raw or "").split(","):
+        if "=" in part:
+            k, v = part.split("=", 1)
+            out[k.strip()] = float(v)
+    return out
+
+
+def _now_iso(delta_s: float = 0.0) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=delta_s)).replace(microsecond=0).isoformat()
+
+
+# --- corpus ---
+
+def load_snapshots(dirs=SNAPSHOT_DIRS) -> List[dict]:
+    """Recorded opportunities, one per opportunityId (sorted, so runs are repeatable)."""
+    seen: Dict[str, dict] = {}
+    for d in dirs:
+        if not os.path.isdir(d):
+            continue
+        for name in sorted(os.listdir(d)):
+            path = os.path.join(d, name)
+            if not name.endswith(".json") or not os.path.isfile(path):
+                continue
+            try:
+                with open(path, encoding="utf-8") as fh:
+                    opp = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            if isinstance(opp, dict) and opp.get("opportunityId") and opp.get("_subscription_id"):
+                seen.setdefault(opp["opportunityId"], opp)
+    return [seen[k] for k in sorted(seen)]
+
+
+def _email_of(opp: dict) -> str:
+    emails = (opp.get("customer") or {}).get("emails") or []
+    pref = [e for e in emails if e.get("isPreferred")] or emails
+    return ((pref[0].get("address") if pref else "") or "").strip().lower()
+
+
+def _phone_of(opp: dict) -> str:
+    phones = (opp.get("customer") or {}).get("phones") or []
+    cell = [p for p in phones if (p.get("phoneType") or "").lower() == "cellular"] or phones
+    digits = re.sub(r"\D", "", (cell[0].get("number") if cell else "") or "")[-10:]
+    return f"+1{digits}" if len(digits) == 10 else ""
+
+
+def _lead_fields(i: int, opp: dict) -> Dict[str, Any]:
+    cust = opp.get("customer") or {}
+    fields = {
+        "opp_id": opp["opportunityId"],
+        "subscription_id": opp["_subscription_id"],
+        "opp_json": json.dumps(opp, default=str),
+        "customer_email": _email_of(opp),
+        "customer_phone": _phone_of(opp),
+        "Customer First Name": cust.get("firstName") or "",
+        "Customer Last Name": cust.get("lastName") or "",
+        "source": opp.get("source") or "",
+        "is_active": True,
+        "follow_up_at": _now_iso(-3600),
+    }
+    if i % 2:                                   # half already got the first touch -> follow-up path
+        fields.update({"first_email_sent_at": _now_iso(-3 * 86400), "last_template_day_sent": 1})
+    return fields
+
+
+# --- fakes ---
+
+class FakeServices:
+    """Everything requests can reach, in memory. status/payload per (method, url, json body)."""
+
+    def __init__(self, corpus: List[dict], latency_ms: Optional[Dict[str, float]] = None,
+                 error_rate: Optional[Dict[str, float]] = None, seed: int = REPLAY_SEED):
+        self.latency_ms = latency_ms or {}
+        self.error_rate = error_rate or {}
+        self._rng = random.Random(seed)
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self.tables: Dict[str, Dict[str, dict]] = {}
+        self.opps = {o["opportunityId"]: o for o in corpus}
+        self.customers = {(o.get("customer") or {}).get("id"): o.get("customer") for o in corpus}
+        self.activities = {a.get("activityId"): a for o in corpus for a in (o.get("completedActivities") or [])}
+        self.sent: Dict[str, int] = {}
+        self._thread = threading.local()            # .sms: the one inbound conversation poll_once sees
+        leads = self.tables.setdefault("Leads", {})
+        for i, opp in enumerate(corpus):
+            rid = f"recReplay{i:05d}"
+            leads[rid] = {"id": rid, "createdTime": _now_iso(-7 * 86400), "fields": _lead_fields(i, opp)}
+
+    # -- plumbing --
+
+    def dependency(self, url: str) -> str:
+        import patti_metrics
+
+        return patti_metrics.dependency_for_url(url)
+
+    def _inject(self, dep: str) -> bool:
+        ms = self.latency_ms.get(dep, 0.0)
+        if ms:
+            time.sleep(ms / 1000.0)
+        rate = self.error_rate.get(dep, 0.0)
+        if rate:
+            with self._lock:
+                return self._rng.random() < rate
+        return False
+
+    def _count(self, what: str) -> None:
+        with self._lock:
+            self.sent[what] = self.sent.get(what, 0) + 1
+
+    def handle(self, method: str, url: str, body: Any) -> Tuple[int, Any]:
+        dep = self.dependency(url)
+        if self._inject(dep):
+            return 503, {"error": "injected by bench_replay"}
+        parts = urlsplit(url)
+        query = {k: v if k.endswith("[]") else v[0] for k, v in parse_qs(parts.query).items()}
+        path = unquote(parts.path)
+        with self._lock:
+            if dep == "airtable":
+                return self._airtable(method, path, query, body)
+            if dep == "fortellis":
+                return self._fortellis(method, path, query, body)
+            if dep == "goto":
+                return self._goto(method, path, query, body)
+            if dep in ("sendgrid", "outlook"):
+                self._count(f"email:{dep}")
+                return 202, {}
+        raise ConnectionError(f"bench_replay: no fake for {method} {parts.scheme}://{parts.netloc}")
+
+    # -- Airtable --
+
+    def _match(self, formula: str, fields: Dict[str, Any], rec_id: str) -> bool:
+        if not formula:
+            return True
+        terms: List[bool] = []
+        for m in re.finditer(r"(LOWER\()?\{([^}]+)\}\)?\s*=\s*(['\"])(.*?)\3", formula):
+            val = str(fields.get(m.group(2), "") or "")
+            terms.append((val.lower() if m.group(1) else val) == m.group(4))
+        for m in re.finditer(r"RECORD_ID\(\)\s*=\s*(['\"])(.*?)\1", formula):
+            terms.append(rec_id == m.group(2))
+        for m in re.finditer(r"FIND\((['\"])(.*?)\1,\s*\{([^}]+)\}\)\s*>\s*0", formula):
+            terms.append(m.group(2) in str(fields.get(m.group(3), "") or ""))
+        if not terms:
+            return True                          # NOW()/LAST_MODIFIED_TIME()/truthiness: keep everything
+        return any(terms) if formula.lstrip().upper().startswith("OR(") else all(terms)
+
+    def _airtable(self, method: str, path: str, query: Dict[str, Any], body: Any) -> Tuple[int, Any]:
+        segs = [s for s in path.split("/") if s]          # v0, base, table[, rec]
+        if len(segs) < 3:
+            return 404, {"error": "NOT_FOUND"}
+        table = self.tables.setdefault(segs[2], {})
+        rec_id = segs[3] if len(segs) > 3 else ""
+        body = body if isinstance(body, dict) else {}
+        if method == "GET" and rec_id:
+            rec = table.get(rec_id)
+            return (200, copy.deepcopy(rec)) if rec else (404, {"error": "NOT_FOUND"})
+        if method == "GET":
+            rows = [r for rid, r in table.items() if self._match(query.get("filterByFormula", ""), r["fields"], rid)]
+            cap = int(query.get("maxRecords") or 0)
+            rows = rows[:cap] if cap else rows
+            start, size = int(query.get("offset") or 0), int(query.get("pageSize") or 100)
+            page = rows[start:start + size]
+            out: Dict[str, Any] = {"records": copy.deepcopy(page)}
+            if start + size < len(rows):
+                out["offset"] = str(start + size)
+            return 200, out
+        if method in ("PATCH", "PUT", "POST"):
+            if "records" in body:                      # batch
+                return 200, {"records": [self._write(table, r.get("id", ""), r.get("fields") or {}) for r in body["records"]]}
+            if method != "POST" and rec_id not in table:
+                return 404, {"error": "NOT_FOUND"}
+            return 200, self._write(table, rec_id, body.get("fields") or {})
+        if method == "DELETE":
+            table.pop(rec_id, None)
+            return 200, {"id": rec_id, "deleted": True}
+        return 405, {"error": "METHOD_NOT_ALLOWED"}
+
+    def _write(self, table: Dict[str, dict], rec_id: str, fields: Dict[str, Any]) -> dict:
+        if not rec_id or rec_id not in table:
+            rec_id = rec_id or f"recNew{next(self._ids):06d}"
+            table[rec_id] = {"id": rec_id, "createdTime": _now_iso(), "fields": {}}
+        cur = table[rec_id]["fields"]
+        for k, v in fields.items():
+            if v is None or v == "":
+                cur.pop(k, None)
+            else:
+                cur[k] = v
+        return copy.deepcopy(table[rec_id])
+
+    # -- Fortellis --
+
+    def _fortellis(self, method: str, path: str, query: Dict[str, Any], body: Any) -> Tuple[int, Any]:
+        if "oauth2" in path or path.endswith("/token"):
+            return 200, {"access_token": "replay-token", "token_type": "Bearer", "expires_in": 3600}
+        tail = path.rstrip("/").rsplit("/", 1)[-1]
+        if method == "GET":
+            if "/activities/history/" in path:
+                items = [{
+                    "id": a.get("activityId"), "name": a.get("activityName"), "activityType": a.get("activityType"),
+                    "completedDate": a.get("completedDate"), "outcome": a.get("outcome"), "category": "completed",
+                } for a in (self.opps.get(tail) or {}).get("completedActivities") or []]
+                return 200, {"items": items, "totalItems": len(items)}
+            if "/activities/" in path:
+                act = self.activities.get(tail)
+                return (200, copy.deepcopy(act)) if act else (404, {"message": "activity not found"})
+            if "/search-by-customerId/" in path:
+                return 200, {"items": [self._search_item(o) for o in self.opps.values()
+                                       if (o.get("customer") or {}).get("id") == tail]}
+            if "/customers/" in path:
+                cust = self.customers.get(tail)
+                return (200, copy.deepcopy(cust)) if cust else (404, {"message": "customer not found"})
+            if "/opportunities/" in path and tail in self.opps:
+                return 200, copy.deepcopy(self.opps[tail])
+            return 200, {"items": []}
+        if path.endswith("/customers/search"):
+            email = ((body or {}).get("emailAddress") or "").lower()
+            return 200, {"items": [copy.deepcopy(o["customer"]) for o in self.opps.values()
+                                   if email and _email_of(o) == email]}
+        if path.endswith("/sendEmail"):
+            self._count("email:fortellis")
+        return 200, {"id": f"replay-{next(self._ids)}", "activityId": f"replay-{next(self._ids)}"}
+
+    @staticmethod
+    def _search_item(opp: dict) -> dict:
+        """Snapshots are stored normalized; opportunity searches answer in the API's shape."""
+        item = copy.deepcopy(opp)
+        item.update({"id": opp["opportunityId"], "status": "Active" if opp.get("isActive", True) else "Lost",
+                     "updatedAt": opp.get("updated_at") or "", "createdAt": opp.get("created_at") or ""})
+        return item
+
+    # -- GoTo --
+
+    def _goto(self, method: str, path: str, query: Dict[str, Any], body: Any) -> Tuple[int, Any]:
+        if "oauth" in path or "token" in path:
+            return 200, {"access_token": "replay-token", "expires_in": 3600}
+        conv = getattr(self._thread, "sms", None)
+        if method == "GET" and path.endswith("/conversations"):
+            return 200, {"items": [copy.deepcopy(conv)] if conv else []}
+        if method == "GET" and path.endswith("/messages"):
+            return 200, {"items": [copy.deepcopy(conv["lastMessage"])] if conv else []}
+        if method == "POST" and path.endswith("/messages"):
+            self._count("sms")
+            return 200, {"id": f"replay-sms-{next(self._ids)}", "conversationId": (conv or {}).get("id", "")}
+        return 404, {"message": "not faked"}
+
+    # -- OpenAI --
+
+    def llm_call(self) -> None:
+        if self._inject("openai"):
+            raise RuntimeError("openai: injected by bench_replay (503)")
+
+
+class _FakeOpenAI:
+    """Just enough of the SDK surface llm_gateway uses (chat.completions.create / beta...parse)."""
+
+    def __init__(self, fake: FakeServices):
+        self.fake = fake
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.beta = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(parse=self._parse)))
+
+    def _response(self, kwargs: Dict[str, Any], content: str, parsed: Any = None):
+        self.fake.llm_call()
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in kwargs.get("messages") or []) // 4
+        return SimpleNamespace(
+            model=kwargs.get("model"),
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content, parsed=parsed, refusal=None),
+                                     finish_reason="stop", index=0)],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=60,
+                                  total_tokens=prompt_tokens + 60),
+        )
+
+    def _create(self, **kwargs):
+        return self._response(kwargs, json.dumps(CANNED_REPLY))
+
+    def _parse(self, **kwargs):
+        model = kwargs.get("response_format")
+        values = {}
+        for name, f in getattr(model, "model_fields", {}).items():
+            if not f.is_required():
+                continue
+            ann = str(f.annotation)
+            values[name] = False if "bool" in ann else 0 if ("int" in ann or "float" in ann) else \
+                [] if "list" in ann.lower() else ""
+        parsed = model.model_construct(**values) if hasattr(model, "model_construct") else None
+        return self._response(kwargs, json.dumps(values), parsed)
+
+
+def _fake_send(fake: FakeServices):
+    import requests
+
+    def send(adapter, request, **kwargs):
+        body: Any = request.body
+        if isinstance(body, bytes):
+            body = body.decode("utf-8", "replace")
+        try:
+            body = json.loads(body) if body else None
+        except ValueError:
+            pass
+        status, payload = fake.handle(request.method, request.url, body)
+        resp = requests.Response()
+        resp.status_code = status
+        resp._content = json.dumps(payload).encode("utf-8")
+        resp.headers["Content-Type"] = "application/json"
+        resp.encoding = "utf-8"
+        resp.url = request.url
+        resp.request = request
+        return resp
+
+    return send
+
+
+# --- environment ---
+
+_ENV = {
+    "AIRTABLE_API_TOKEN": "replay", "AIRTABLE_BASE_ID": "appReplay",
+    "OPENAI_API_KEY": "replay",
+    "FORTELLIS_CLIENT_ID": "replay", "FORTELLIS_CLIENT_SECRET": "replay",
+    "GOTO_CLIENT_ID": "replay", "GOTO_CLIENT_SECRET": "replay", "GOTO_PAT": "replay",
+    "SENDGRID_API_KEY": "replay", "SENDGRID_FROM_EMAIL": "patti@replay.invalid",
+    "OUTLOOK_SEND_ENDPOINT": "https://outlook.replay.invalid/send",
+    "PATTI_SMS_NUMBERS": OWNER_SMS, "PATTI_SMS_NUMBER": OWNER_SMS,
+    "OFFLINE_MODE": "0", "LLM_CACHE_DISABLE": "1",
+    "LLM_DEFAULT_RPM": "100000000", "LLM_DEFAULT_TPM": "100000000000",
+    "WEB_WARM_IMPORTS": "0", "INBOUND_SWEEPER": "0",
+}
+
+
+def prepare(workdir: str, fake: FakeServices) -> Callable[[], None]:
+    """Point the app at the fakes; returns undo(). Call before importing any app module."""
+    import requests
+
+    old_env = {k: os.environ.get(k) for k in list(_ENV) + ["ELASTIC_URL", "LLM_METRICS_PATH"]}
+    os.environ.update(_ENV)
+    os.environ.pop("ELASTIC_URL", None)
+    os.environ["LLM_METRICS_PATH"] = os.path.join(workdir, "llm_calls.jsonl")
+    old_send, old_cwd = requests.adapters.HTTPAdapter.send, os.getcwd()
+    requests.adapters.HTTPAdapter.send = _fake_send(fake)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    os.chdir(workdir)
+
+    def undo():
+        os.chdir(old_cwd)
+        requests.adapters.HTTPAdapter.send = old_send
+        for k, v in old_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+    return undo
+
+
+def _wire(fake: FakeServices) -> Callable[[], None]:
+    """After imports: patti_json snapshots seeded, fake LLM client, send windows open,
+    calls counted. Returns undo() for the module attributes it replaced."""
+    import airtable_store
+    import llm_gateway
+    import patti_common
+    import patti_mailer
+    import patti_metrics
+    import sms_poller
+
+    for rec in fake.tables["Leads"].values():
+        opp = json.loads(rec["fields"]["opp_json"])
+        rec["fields"]["patti_json"] = json.dumps(airtable_store._build_patti_snapshot(opp), sort_keys=True, default=str)
+    patches = [
+        (llm_gateway, "_client", _FakeOpenAI(fake)),
+        (patti_common, "within_email_send_window", lambda: True),
+        (patti_mailer, "_within_send_window", lambda: True),
+        (sms_poller, "_within_send_window", lambda: True),
+    ]
+    saved = [(mod, name, getattr(mod, name)) for mod, name, _ in patches]
+    for mod, name, value in patches:
+        setattr(mod, name, value)
+    patti_metrics.install_requests_hook()
+    if _note_call not in patti_metrics._dependency_listeners:
+        patti_metrics.add_dependency_listener(_note_call)
+
+    def undo():
+        for mod, name, value in saved:
+            setattr(mod, name, value)
+
+    return undo
+
+
+# --- flows ---
+
+def _cases(flow: str, fake: FakeServices) -> List[Tuple[str, Callable[[], Any]]]:
+    leads = list(fake.tables["Leads"].values())
+    if flow == "processHit":
+        from processNewData import processHit
+
+        return [(r["fields"]["opp_id"], (lambda r=r: processHit(copy.deepcopy(r)))) for r in leads]
+    if flow == "inbound_email":
+        from email_ingestion import process_inbound_email
+        from rooftops import get_rooftop_info
+
+        out = []
+        for i, r in enumerate(leads):
+            f = r["fields"]
+            if not f.get("customer_email"):
+                continue
+            inbound = {
+                "from": f["customer_email"],
+                "to": (get_rooftop_info(f["subscription_id"]) or {}).get("sender") or "patti@replay.invalid",
+                "subject": "Re: Your vehicle inquiry", "body_text": INBOUND_EMAIL_TEXT, "body_html": "",
+                "timestamp": _now_iso(), "headers": {}, "subscription_id": f["subscription_id"],
+                "source": "reply", "message_id": f"<replay-{i}@bench.invalid>",
+            }
+            out.append((f["opp_id"], (lambda inbound=inbound: process_inbound_email(dict(inbound)))))
+        return out
+    if flow == "sms_poll":
+        from sms_poller import poll_once
+
+        out = []
+        for i, r in enumerate(leads):
+            phone = r["fields"].get("customer_phone")
+            if not phone:
+                continue
+            conv = {
+                "id": f"conv-replay-{i}", "contactPhoneNumber": phone,
+                "lastMessage": {"id": f"msg-replay-{i}", "direction": "IN", "authorPhoneNumber": phone,
+                                "body": INBOUND_SMS_TEXT, "timestamp": _now_iso(-60), "media": []},
+            }
+
+            def run(conv=conv):
+                fake._thread.sms = conv
+                return poll_once(OWNER_SMS)
+
+            out.append((r["fields"]["opp_id"], run))
+        return out
+    raise ValueError(f"unknown flow {flow!r} (choose from {', '.join(FLOWS)})")
+
+
+_calls = threading.local()
+
+
+def _note_call(dependency: str) -> None:
+    counts = getattr(_calls, "counts", None)
+    if counts is not None:
+        counts[dependency] = counts.get(dependency, 0) + 1
+
+
+def _pct(vals: List[float], q: float) -> float:
+    s = sorted(vals)
+    return s[min(len(s) - 1, int(len(s) * q))] if s else 0.0
+
+
+def run_flow(flow: str, fake: FakeServices, repeat: int = 1, workers: int = 1,
+             memory: bool = True) -> Dict[str, Any]:
+    cases = _cases(flow, fake) * max(1, repeat)
+    lat: List[float] = []
+    calls: Dict[str, int] = {}
+    errors: List[Tuple[str, str]] = []
+    mu = threading.Lock()
+    sent_before = dict(fake.sent)
+
+    def one(case):
+        key, fn = case
+        _calls.counts = {}
+        t0 = time.perf_counter()
+        err = None
+        try:
+            fn()
+        except Exception as e:
+            err = f"{type(e).__name__}: {str(e)[:200]}"
+        elapsed = time.perf_counter() - t0
+        with mu:
+            lat.append(elapsed)
+            for dep, n in _calls.counts.items():
+                calls[dep] = calls.get(dep, 0) + n
+            if err:
+                errors.append((key, err))
+        _calls.counts = None
+
+    if memory:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+    t0 = time.perf_counter()
+    if workers > 1:
+        with ThreadPoolExecutor(workers) as ex:
+            list(ex.map(one, cases))
+    else:
+        for case in cases:
+            one(case)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1] if memory else 0
+    if memory:
+        tracemalloc.stop()
+
+    n = len(cases)
+    return {
+        "flow": flow,
+        "records": n,
+        "workers": workers,
+        "elapsed_s": round(elapsed, 3),
+        "records_per_s": round(n / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(_pct(lat, 0.5) * 1000, 1),
+            "p95": round(_pct(lat, 0.95) * 1000, 1),
+            "max": round(max(lat) * 1000, 1) if lat else 0.0,
+        },
+        "calls_per_record": {
+            "total": round(sum(calls.values()) / n, 2) if n else 0.0,
+            **{dep: round(c / n, 2) for dep, c in sorted(calls.items())},
+        },
+        "sent": {k: v - sent_before.get(k, 0) for k, v in fake.sent.items() if v != sent_before.get(k, 0)},
+        "peak_mem_mb": round(peak / 1e6, 2) if memory else None,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+    }
+
+
+def run(flows=FLOWS, *, repeat: int = 1, workers: int = 1, memory: bool = True,
+        corpus: Optional[List[dict]] = None, latency_ms: Optional[Dict[str, float]] = None,
+        error_rate: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    corpus = load_snapshots() if corpus is None else corpus
+    if latency_ms is None:
+        latency_ms = _parse_map(os.getenv("REPLAY_LATENCY_MS", ""))
+    if error_rate is None:
+        error_rate = _parse_map(os.getenv("REPLAY_ERROR_RATE", ""))
+    reports = []
+    with tempfile.TemporaryDirectory(prefix="patti-replay-") as workdir:
+        for flow in flows:
+            fake = FakeServices(corpus, latency_ms, error_rate)      # fresh base per flow
+            undo = prepare(workdir, fake)
+            try:
+                unwire = _wire(fake)
+                try:
+                    reports.append(run_flow(flow, fake, repeat, workers, memory))
+                finally:
+                    unwire()
+                    if "snapshot_sink" in sys.modules:
+                        sys.modules["snapshot_sink"].flush()
+            finally:
+                undo()
+    return reports
+
+
+def check_budgets(reports: List[Dict[str, Any]]) -> List[str]:
+    problems = []
+    for r in reports:
+        if REPLAY_MAX_P95_MS and r["latency_ms"]["p95"] > REPLAY_MAX_P95_MS:
+            problems.append(f"{r['flow']}: p95 {r['latency_ms']['p95']} ms > {REPLAY_MAX_P95_MS:.0f} ms")
+        if REPLAY_MAX_CALLS and r["calls_per_record"]["total"] > REPLAY_MAX_CALLS:
+            problems.append(f"{r['flow']}: {r['calls_per_record']['total']} calls/record > {REPLAY_MAX_CALLS:g}")
+        if r["records"] and r["errors"] / r["records"] > REPLAY_MAX_ERROR_RATE:
+            problems.append(f"{r['flow']}: {r['errors']}/{r['records']} records raised "
+                            f"(allowed {REPLAY_MAX_ERROR_RATE:.0%})")
+    return problems
+
+
+def main(argv: List[str]) -> int:
+    ap = argparse.ArgumentParser(description="Offline replay benchmark over recorded snapshots")
+    ap.add_argument("flows", nargs="*", default=list(FLOWS), help=f"any of {', '.join(FLOWS)}")
+    ap.add_argument("--repeat", type=int, default=1, help="replay the corpus this many times")
+    ap.add_argument("--workers", type=int, default=1, help="records processed concurrently")
+    ap.add_argument("--no-memory", action="store_true", help="skip tracemalloc (it slows the run)")
+    ap.add_argument("--json", help="also write the report here")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=os.getenv("APP_LOG_LEVEL", "ERROR").upper(),
+                        format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    reports = run(args.flows, repeat=args.repeat, workers=args.workers, memory=not args.no_memory)
+    for r in reports:
+        lat, calls = r["latency_ms"], r["calls_per_record"]
+        deps = " ".join(f"{k}={v}" for k, v in calls.items() if k != "total")
+        mem = f"{r['peak_mem_mb']:.1f} MB peak" if r["peak_mem_mb"] is not None else "memory not traced"
+        print(f"{r['flow']:<14} {r['records']:4d} records  {r['records_per_s']:7.2f}/s  "
+              f"p50 {lat['p50']:7.1f} ms  p95 {lat['p95']:7.1f} ms  max {lat['max']:7.1f} ms  {mem}")
+        print(f"{'':<14} calls/record {calls['total']} ({deps})  sent {r['sent']}  errors {r['errors']}")
+        for key, err in r["error_samples"]:
+            print(f"{'':<14}   {key}: {err}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(reports, fh, indent=2)
+    problems = check_budgets(reports)
+    for p in problems:
+        print(f"OVER BUDGET  {p}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,64 @@
+# bench_startup.py
+# Import-time budget for web_app (gunicorn worker boot / Render cold start).
+#
+#   python bench_startup.py                 # web_app, 3 runs, budget STARTUP_BUDGET_MS
+#   python bench_startup.py email_ingestion # any module
+#
+# Runs `python -X importtime -c "import <module>"` in fresh interpreters (warm-up
+# thread and queue sweeper off, so only the import itself is measured), reports
+# the best run and the heaviest top-level packages by cumulative time, and exits
+# 1 when the best run is over budget.
+#
+#   STARTUP_BUDGET_MS   budget for the best run (default 400)
+#   STARTUP_RUNS        fresh-interpreter runs (default 3)
+
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "400"))
+STARTUP_RUNS = int(os.getenv("STARTUP_RUNS", "3"))
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)\s*$")
+
+
+def import_profile(module: str) -> List[Tuple[str, int, int, int]]:
+    """[(name, self_us, cumulative_us, depth)] from one fresh interpreter."""
+    env = {**os.environ, "WEB_WARM_IMPORTS": "0", "INBOUND_SWEEPER": "0"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    out = []
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            out.append((m.group(4), int(m.group(1)), int(m.group(2)), (len(m.group(3)) - 1) // 2))
+    return out
+
+
+def summarize(rows: List[Tuple[str, int, int, int]], module: str, top: int = 12) -> Dict[str, object]:
+    total_us = next((cum for name, _, cum, depth in rows if name == module and depth == 0), 0)
+    direct = sorted(((cum, name) for name, _, cum, depth in rows if depth == 1), reverse=True)
+    return {"total_ms": total_us / 1000.0, "modules": len(rows), "top": [(n, c / 1000.0) for c, n in direct[:top]]}
+
+
+def main(argv: List[str]) -> int:
+    module = argv[0] if argv else "web_app"
+    runs = [summarize(import_profile(module), module) for _ in range(max(1, STARTUP_RUNS))]
+    best = min(runs, key=lambda r: r["total_ms"])
+    all_ms = ", ".join(f"{r['total_ms']:.0f}" for r in runs)
+    print(f"import {module}: best {best['total_ms']:.1f} ms of {len(runs)} runs ({all_ms} ms), {best['modules']} modules")
+    for name, ms in best["top"]:
+        print(f"  {ms:8.1f} ms  {name}")
+    ok = best["total_ms"] <= STARTUP_BUDGET_MS
+    print(f"budget {STARTUP_BUDGET_MS:.0f} ms: {'OK' if ok else 'OVER'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,136 @@
+# cadence_batch.py
+# Two-phase cadence follow-ups for the hourly Due Now run.
+#
+#   1. collect   processHit runs as before under the record lock, but a due
+#                general follow-up only records its prompt and returns (no LLM call)
+#   2. generate  all collected prompts go out as one batch (llm_batch), no locks held
+#   3. apply     per record: re-read it, skip if that cadence day was already sent,
+#                take the lock, then hand the fresh record to the job, which re-runs
+#                the send gates on it (reply, opt-out, follow_up_at, appointment)
+#                and sends + saves like the inline path
+#
+# Each job is keyed "<opp_id>:day<template_day>", so a record gets at most one
+# follow-up per cadence day even if it shows up twice or the run is repeated.
+#
+#   CADENCE_BATCH   1 (default) batch follow-ups in the Due Now run; 0 = inline run_gpt
+
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from llm_batch import BatchProvider, BatchRequest, run_batch
+
+log = logging.getLogger("patti.cadence_batch")
+
+CADENCE_BATCH_ENABLED = (os.getenv("CADENCE_BATCH", "1").strip().lower() not in ("0", "false", "no", "off"))
+
+_active = threading.local()
+
+
+@dataclass
+class FollowupJob:
+    key: str
+    rec_id: str
+    template_day: int
+    messages: List[Dict[str, str]]
+    finish: Callable[[str], Dict[str, Any]]   # model text -> run_gpt-style response
+    # (response, fresh record) -> outcome: "applied", "not_sent", "deferred", "skipped:<why>"
+    # (True/False for applied/not_sent); re-checks the record, sends + persists, under the lock
+    apply: Callable[[Dict[str, Any], dict], Any]
+    tags: Dict[str, str] = field(default_factory=dict)
+
+
+class FollowupBatch:
+    def __init__(self):
+        self.jobs: Dict[str, FollowupJob] = {}
+        self._lock = threading.Lock()     # the Due Now runner collects from several threads
+
+    def add(self, job: FollowupJob) -> None:
+        with self._lock:
+            if job.key in self.jobs:
+                log.info("cadence batch: duplicate job %s ignored", job.key)
+                return
+            self.jobs[job.key] = job
+
+    def __len__(self) -> int:
+        return len(self.jobs)
+
+    def run(
+        self,
+        provider: Optional[BatchProvider] = None,
+        *,
+        get_record: Optional[Callable[[str], dict]] = None,
+        acquire: Optional[Callable[..., Optional[str]]] = None,
+        release: Optional[Callable[[str, str], Any]] = None,
+    ) -> Dict[str, str]:
+        """Generate all follow-ups as one batch, then apply them. Returns {key: outcome}."""
+        if not self.jobs:
+            return {}
+        if get_record is None or acquire is None or release is None:
+            from airtable_store import acquire_lock, get_by_id, release_lock
+            get_record = get_record or get_by_id
+            acquire = acquire or acquire_lock
+            release = release or release_lock
+
+        results = run_batch(
+            [BatchRequest(custom_id=j.key, messages=j.messages, tags=j.tags) for j in self.jobs.values()],
+            provider,
+        )
+
+        outcomes = {}
+        for key, job in self.jobs.items():
+            outcomes[key] = self._apply_one(job, results.get(key), get_record, acquire, release)
+        counts = {}
+        for v in outcomes.values():
+            counts[v] = counts.get(v, 0) + 1
+        log.info("cadence batch applied jobs=%d outcomes=%s", len(outcomes), counts)
+        return outcomes
+
+    def _apply_one(self, job: FollowupJob, text: Optional[str], get_record, acquire, release) -> str:
+        if not text:
+            return "no_result"
+        try:
+            rec = get_record(job.rec_id) or {}
+        except Exception as e:
+            log.warning("cadence batch: re-read failed %s: %s", job.key, e)
+            return "error"
+        fields = rec.get("fields") or {}
+        try:
+            sent_day = int(float(fields.get("last_template_day_sent") or 0))
+        except (TypeError, ValueError):
+            sent_day = 0
+        if sent_day >= job.template_day:
+            log.info("cadence batch: %s already sent (last_template_day_sent=%s)", job.key, sent_day)
+            return "already_sent"
+
+        token = acquire(rec, lock_minutes=10)
+        if not token:
+            return "locked"
+        try:
+            outcome = job.apply(job.finish(text), rec)
+        except Exception:
+            log.exception("cadence batch: apply failed %s", job.key)
+            return "error"
+        finally:
+            release(job.rec_id, token)
+        if isinstance(outcome, str) and outcome:
+            return outcome
+        return "applied" if outcome else "not_sent"
+
+
+@contextmanager
+def collecting(batch: Optional[FollowupBatch]):
+    """While active, processHit defers general follow-ups into `batch` (None = inline)."""
+    prev = getattr(_active, "batch", None)
+    _active.batch = batch
+    try:
+        yield batch
+    finally:
+        _active.batch = prev
+
+
+def current() -> Optional[FollowupBatch]:
+    return getattr(_active, "batch", None)
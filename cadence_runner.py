@@ -0,0 +1,427 @@
+# cadence_runner.py
+# Concurrent runner for the hourly "Due Now" cadence pass (processNewData).
+#
+# processHit spends nearly all its time waiting on Fortellis, Airtable and
+# OpenAI, so records run on a small thread pool instead of one after another.
+# Dispatch is round-robin across subscriptions (rooftops), and one rooftop may
+# hold at most CADENCE_ROOFTOP_MAX workers while others have records waiting,
+# so a big backlog at one store doesn't starve the rest. Each record still takes
+# the Airtable lease lock first (acquire_lock / release_lock) and a failure only
+# affects that record.
+#
+# drain_due_now() pages through the whole view (no 200-record cap), most
+# overdue follow_up_at first, and stops at a wall-clock budget. Progress is
+# checkpointed to a small JSON file so the next run resumes: from the saved page
+# offset if it is still fresh, otherwise from the top of the view (records that
+# were handled leave "Due Now", and ones that failed or were locked this cycle
+# are skipped until the view has been fully drained once).
+#
+#   CADENCE_WORKERS          records processed concurrently (default 4; 1 = sequential)
+#   CADENCE_ROOFTOP_MAX      per-rooftop share while others wait (default: half the workers, min 1)
+#   DUE_NOW_BUDGET_S         wall-clock budget for one drain (default 2400; leaves room for the batch)
+#   DUE_NOW_MAX_RECORDS      stop after this many records (default 0 = no cap)
+#   DUE_NOW_CHECKPOINT_PATH  checkpoint file (default /tmp/patti_due_now_checkpoint.json)
+#   DUE_NOW_OFFSET_TTL_S     reuse a saved Airtable page offset only if younger (default 240)
+#   DUE_NOW_CYCLE_MAX_H      start a fresh cycle after this long even if not drained (default 24)
+#
+#   python cadence_runner.py bench [records] [workers]   # mocked-I/O benchmark
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+log = logging.getLogger("patti.cadence_runner")
+
+CADENCE_WORKERS = max(1, int(os.getenv("CADENCE_WORKERS", "4")))
+CADENCE_ROOFTOP_MAX = int(os.getenv("CADENCE_ROOFTOP_MAX", "0"))   # 0 = half the workers
+DUE_NOW_BUDGET_S = float(os.getenv("DUE_NOW_BUDGET_S", "2400"))
+DUE_NOW_MAX_RECORDS = int(os.getenv("DUE_NOW_MAX_RECORDS", "0"))
+DUE_NOW_CHECKPOINT_PATH = os.getenv("DUE_NOW_CHECKPOINT_PATH", "/tmp/patti_due_now_checkpoint.json")
+DUE_NOW_OFFSET_TTL_S = float(os.getenv("DUE_NOW_OFFSET_TTL_S", "240"))
+DUE_NOW_CYCLE_MAX_S = float(os.getenv("DUE_NOW_CYCLE_MAX_H", "24")) * 3600.0
+
+
+def subscription_of(rec: dict) -> str:
+    fields = rec.get("fields") or {}
+    return (fields.get("subscription_id") or fields.get("_subscription_id") or "").strip() or "unknown"
+
+
+def overdue_key(rec: dict) -> float:
+    """Sort key: oldest follow_up_at first; records without one go last."""
+    raw = ((rec.get("fields") or {}).get("follow_up_at") or "").strip()
+    try:
+        return datetime.fromisoformat(raw.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return float("inf")
+
+
+def _pct(vals: List[float], q: float) -> float:
+    s = sorted(vals)
+    return s[min(len(s) - 1, int(len(s) * q))] if s else 0.0
+
+
+@dataclass
+class RecordResult:
+    rec_id: str
+    subscription_id: str
+    outcome: str                 # ok | locked | skipped | error | deferred (budget ran out)
+    seconds: float = 0.0
+    error: str = ""
+
+
+@dataclass
+class RunSummary:
+    workers: int
+    elapsed_s: float = 0.0
+    results: List[RecordResult] = field(default_factory=list)
+
+    def counts(self) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        for r in self.results:
+            out[r.outcome] = out.get(r.outcome, 0) + 1
+        return out
+
+    def as_dict(self) -> Dict[str, Any]:
+        lat = [r.seconds for r in self.results if r.outcome in ("ok", "error")]
+        by_rooftop: Dict[str, Dict[str, int]] = {}
+        for r in self.results:
+            st = by_rooftop.setdefault(r.subscription_id, {})
+            st[r.outcome] = st.get(r.outcome, 0) + 1
+        return {
+            "workers": self.workers,
+            "records": len(self.results),
+            "elapsed_s": round(self.elapsed_s, 2),
+            "per_min": round(len(lat) * 60.0 / self.elapsed_s, 1) if self.elapsed_s else 0.0,
+            "outcomes": self.counts(),
+            "latency_s": {
+                "p50": round(_pct(lat, 0.5), 2),
+                "p90": round(_pct(lat, 0.9), 2),
+                "p99": round(_pct(lat, 0.99), 2),
+                "max": round(max(lat), 2) if lat else 0.0,
+            },
+            "by_rooftop": by_rooftop,
+            "failures": [(r.rec_id, r.error) for r in self.results if r.outcome == "error"][:20],
+        }
+
+    def log(self, logger: logging.Logger = log) -> None:
+        d = self.as_dict()
+        logger.info(
+            "Due Now run: %d records in %.1fs (%.1f/min, workers=%d) outcomes=%s latency p50=%.1fs p90=%.1fs max=%.1fs",
+            d["records"], d["elapsed_s"], d["per_min"], d["workers"], d["outcomes"],
+            d["latency_s"]["p50"], d["latency_s"]["p90"], d["latency_s"]["max"],
+        )
+        for rec_id, err in d["failures"]:
+            logger.warning("Due Now failure rec=%s: %s", rec_id, err)
+
+
+class _FairQueue:
+    """Records grouped by rooftop, handed out round-robin with a per-rooftop in-flight cap."""
+
+    def __init__(self, records: List[dict], key: Callable[[dict], str], cap: int):
+        self.queues: "OrderedDict[str, Deque[dict]]" = OrderedDict()
+        for rec in records:
+            self.queues.setdefault(key(rec), deque()).append(rec)
+        self.rotation: Deque[str] = deque(self.queues)
+        self.inflight: Dict[str, int] = {k: 0 for k in self.queues}
+        self.cap = cap
+
+    def __bool__(self) -> bool:
+        return bool(self.rotation)
+
+    def next(self) -> Optional[tuple]:
+        # first pass honours the cap; if nothing else is waiting, any rooftop may use idle workers
+        for capped in (True, False):
+            for _ in range(len(self.rotation)):
+                sub = self.rotation[0]
+                self.rotation.rotate(-1)
+                if capped and self.inflight[sub] >= self.cap:
+                    continue
+                q = self.queues[sub]
+                rec = q.popleft()
+                if not q:
+                    self.rotation.remove(sub)
+                self.inflight[sub] += 1
+                return sub, rec
+        return None
+
+    def done(self, sub: str) -> None:
+        self.inflight[sub] -= 1
+
+
+def run_due_now(
+    records: List[dict],
+    process: Callable[[dict], Any],
+    *,
+    acquire: Callable[..., Optional[str]],
+    release: Callable[[str, str], Any],
+    workers: Optional[int] = None,
+    rooftop_max: Optional[int] = None,
+    key: Callable[[dict], str] = subscription_of,
+    lock_minutes: int = 10,
+    deadline: Optional[float] = None,
+) -> RunSummary:
+    """
+    process(rec) for every record holding its lease lock, `workers` at a time.
+    process runs on a worker thread, so it must set any thread-local context
+    (llm_priority, cadence_batch.collecting) itself. Past `deadline`
+    (time.monotonic()) nothing new starts; the rest come back as "deferred".
+    """
+    workers = max(1, workers or CADENCE_WORKERS)
+    cap = max(1, rooftop_max or CADENCE_ROOFTOP_MAX or workers // 2)
+    summary = RunSummary(workers=workers)
+    lock = threading.Lock()
+
+    def _run(sub: str, rec: dict) -> RecordResult:
+        rec_id = rec.get("id") or ""
+        if not rec_id:
+            log.warning("Skipping Airtable item with no record id: %r", rec)
+            return RecordResult("", sub, "skipped")
+        t0 = time.monotonic()
+        try:
+            token = acquire(rec, lock_minutes=lock_minutes)
+        except Exception as e:
+            log.exception("acquire_lock failed rec=%s", rec_id)
+            return RecordResult(rec_id, sub, "error", time.monotonic() - t0, f"lock: {type(e).__name__}: {e}")
+        if not token:
+            return RecordResult(rec_id, sub, "locked")
+        try:
+            process(rec)
+            return RecordResult(rec_id, sub, "ok", time.monotonic() - t0)
+        except Exception as e:
+            log.exception("Due Now record %s failed", rec_id)
+            return RecordResult(rec_id, sub, "error", time.monotonic() - t0, f"{type(e).__name__}: {e}")
+        finally:
+            try:
+                release(rec_id, token)
+            except Exception:
+                log.exception("release_lock failed rec=%s", rec_id)
+
+    def _one(sub: str, rec: dict) -> None:
+        result = _run(sub, rec)
+        with lock:
+            summary.results.append(result)
+
+    def _expired() -> bool:
+        return deadline is not None and time.monotonic() >= deadline
+
+    t_start = time.monotonic()
+    fq = _FairQueue(records, key, cap)
+    if workers == 1:
+        while fq and not _expired():
+            sub, rec = fq.next()
+            _one(sub, rec)
+            fq.done(sub)
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="due-now") as pool:
+            running: Dict[Any, str] = {}
+            while (fq and not _expired()) or running:
+                while fq and len(running) < workers and not _expired():
+                    sub, rec = fq.next()
+                    running[pool.submit(_one, sub, rec)] = sub
+                if not running:
+                    break
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    fq.done(running.pop(fut))
+                    fut.result()   # _one never raises; surfaces bugs in the runner itself
+    while fq:
+        sub, rec = fq.next()
+        summary.results.append(RecordResult(rec.get("id") or "", sub, "deferred"))
+    summary.elapsed_s = time.monotonic() - t_start
+    return summary
+
+
+# --- draining the whole view ---
+
+def _load_checkpoint(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cp = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception:
+        log.warning("Due Now checkpoint %s unreadable; starting a new cycle", path, exc_info=True)
+        return {}
+    if time.time() - float(cp.get("cycle_started_at") or 0) > DUE_NOW_CYCLE_MAX_S:
+        log.info("Due Now checkpoint older than %.0fh; starting a new cycle", DUE_NOW_CYCLE_MAX_S / 3600)
+        return {}
+    return cp
+
+
+def _save_checkpoint(path: str, cp: Dict[str, Any]) -> None:
+    cp["updated_at"] = time.time()
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cp, f)
+        os.replace(tmp, path)
+    except OSError:
+        log.warning("could not write Due Now checkpoint %s", path, exc_info=True)
+
+
+def _clear_checkpoint(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        log.warning("could not remove Due Now checkpoint %s", path, exc_info=True)
+
+
+def drain_due_now(
+    fetch_page: Callable[[Optional[str]], Tuple[List[dict], Optional[str]]],
+    process: Callable[[dict], Any],
+    *,
+    acquire: Callable[..., Optional[str]],
+    release: Callable[[str, str], Any],
+    budget_s: Optional[float] = None,
+    max_records: Optional[int] = None,
+    checkpoint_path: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> RunSummary:
+    """
+    Page through the view with fetch_page(offset) -> (records, next_offset)
+    (sorted most overdue first), running each page through run_due_now until the
+    view is exhausted, the budget is spent or max_records were handled.
+    """
+    budget_s = DUE_NOW_BUDGET_S if budget_s is None else budget_s
+    max_records = DUE_NOW_MAX_RECORDS if max_records is None else max_records
+    path = checkpoint_path or DUE_NOW_CHECKPOINT_PATH
+    t_start = time.monotonic()
+    deadline = t_start + budget_s
+
+    cp = _load_checkpoint(path) or {"cycle_started_at": time.time(), "attempted": [], "pages": 0}
+    attempted = set(cp.get("attempted") or [])
+    offset = cp.get("offset")
+    if offset and time.time() - float(cp.get("offset_at") or 0) > DUE_NOW_OFFSET_TTL_S:
+        offset = None
+    if cp.get("pages"):
+        log.info("Due Now: resuming cycle (%d records handled, %s)", len(attempted),
+                 "from saved page offset" if offset else "from the top of the view")
+
+    total = RunSummary(workers=max(1, workers or CADENCE_WORKERS))
+    stopped = ""
+    while True:
+        if time.monotonic() >= deadline:
+            stopped = "budget"
+            break
+        if max_records and sum(r.outcome != "deferred" for r in total.results) >= max_records:
+            stopped = "max_records"
+            break
+        try:
+            records, next_offset = fetch_page(offset)
+        except Exception:
+            if not offset:
+                raise
+            log.warning("Due Now: saved page offset rejected; restarting from the top of the view", exc_info=True)
+            offset = None
+            continue
+
+        page = sorted((r for r in records if r.get("id") not in attempted), key=overdue_key)
+        truncated = False
+        if max_records:
+            room = max(0, max_records - sum(r.outcome != "deferred" for r in total.results))
+            truncated, page = len(page) > room, page[:room]
+        s = run_due_now(page, process, acquire=acquire, release=release, workers=workers, deadline=deadline)
+        total.results.extend(s.results)
+        done_ids = [r.rec_id for r in s.results if r.rec_id and r.outcome != "deferred"]
+        attempted.update(done_ids)
+        cp.update(attempted=sorted(attempted), pages=int(cp.get("pages") or 0) + 1)
+        if done_ids:
+            last = next(r for r in reversed(page) if r.get("id") in attempted)
+            cp.update(last_record_id=last.get("id"), last_follow_up_at=(last.get("fields") or {}).get("follow_up_at"))
+
+        if truncated or any(r.outcome == "deferred" for r in s.results):
+            # stopped mid-page: resume this same page (handled ids are skipped)
+            cp.update(offset=offset, offset_at=time.time())
+            stopped = "max_records" if truncated else "budget"
+            break
+        if not next_offset:
+            break
+        offset = next_offset
+        cp.update(offset=offset, offset_at=time.time())
+        _save_checkpoint(path, cp)
+
+    total.elapsed_s = time.monotonic() - t_start
+    if stopped:
+        _save_checkpoint(path, cp)
+        log.info("Due Now: stopped (%s) after %d pages; checkpoint saved, next run resumes", stopped, cp["pages"])
+    else:
+        _clear_checkpoint(path)
+        log.info("Due Now: view drained (%d records this cycle)", len(attempted))
+    return total
+
+
+def run_benchmark(n_records: int = 120, workers: int = 8, io_s: float = 0.05) -> None:
+    """Mocked I/O: three rooftops (one with most of the backlog), sleeps standing in for API waits."""
+    import random
+
+    rnd = random.Random(7)
+    subs = ["big"] * (n_records * 7 // 10) + ["mid"] * (n_records * 2 // 10)
+    subs += ["small"] * (n_records - len(subs))
+    records = [{"id": f"rec{i}", "fields": {"subscription_id": s}} for i, s in enumerate(subs)]
+
+    def acquire(rec, lock_minutes=10):
+        time.sleep(io_s * 0.2)                    # Airtable read + patch
+        return "tok"
+
+    def release(rec_id, token):
+        time.sleep(io_s * 0.1)
+
+    def process(rec):
+        time.sleep(io_s * rnd.uniform(0.5, 2.0))  # Fortellis + OpenAI + Airtable
+        if rec["id"].endswith("7"):
+            raise RuntimeError("mock Fortellis 502")
+
+    def legacy_loop():
+        # the old processNewData loop: records in view order, one at a time
+        summary = RunSummary(workers=1)
+        t_start = time.monotonic()
+        for rec in records:
+            t0 = time.monotonic()
+            token = acquire(rec)
+            try:
+                process(rec)
+                outcome, err = "ok", ""
+            except Exception as e:
+                outcome, err = "error", str(e)
+            finally:
+                release(rec["id"], token)
+            summary.results.append(RecordResult(rec["id"], subscription_of(rec), outcome, time.monotonic() - t0, err))
+        summary.elapsed_s = time.monotonic() - t_start
+        return summary
+
+    def first_done(summary, sub):
+        return next((i + 1 for i, r in enumerate(summary.results) if r.subscription_id == sub), 0)
+
+    log.disabled = True   # the mocked failures would log a traceback each
+    try:
+        runs = [("old loop", legacy_loop())]
+        for w in (1, workers):
+            runs.append((f"workers={w}", run_due_now(records, process, acquire=acquire, release=release, workers=w)))
+    finally:
+        log.disabled = False
+    print(f"{n_records} records (70% one rooftop), mocked I/O ~{io_s * 1000:.0f}ms/call")
+    for label, s in runs:
+        d = s.as_dict()
+        print(f"  {label:<10} {d['elapsed_s']:6.2f}s  {d['per_min']:7.1f} rec/min  outcomes={d['outcomes']}  "
+              f"p90={d['latency_s']['p90']:.2f}s  first 'small' record done: #{first_done(s, 'small')}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        run_benchmark(
+            int(sys.argv[2]) if len(sys.argv) > 2 else 120,
+            int(sys.argv[3]) if len(sys.argv) > 3 else 8,
+        )
+    else:
+        print("usage: python cadence_runner.py bench [records] [workers]")
@@ -0,0 +1,401 @@
+# cadence_scheduler.py
+# Long-running cadence daemon: fires follow-ups when they come due instead of
+# waiting for the next cron poll of the Airtable views.
+#
+# Every pending follow_up_at / next_sms_at / next_email_at is held in an
+# in-memory hierarchical timer wheel (1 s ticks). When a timer fires, the record
+# is re-read through its view ("Due Now", SMS_DUE_VIEW, EMAIL_DUE_VIEW, filtered
+# to the fired ids) so the view's own conditions still decide, and is handed to
+# the same code the crons run (processNewData.run_cadence, send_sms_cadence_once,
+# send_email_cadence_once). Outside the send window (within_email_send_window /
+# sms_poller._within_send_window) timers are pushed to the next window opening.
+#
+# The wheel is kept current incrementally:
+#   - writes from this process: airtable_store.add_write_listener (patch_by_id / upsert_lead)
+#   - writes from elsewhere (web_app, crons): every SCHEDULER_SYNC_S, records whose
+#     LAST_MODIFIED_TIME() moved since the previous sync
+#   - a full reload every SCHEDULER_FULL_SYNC_H (drops deleted records / drift)
+# A fired record gets a recheck timer; when processing writes a new timestamp (or
+# clears it) that replaces the recheck. A timestamp that fires SCHEDULER_MAX_REFIRES
+# times without changing is left alone until the record gets a new one.
+#
+# Run it instead of the hourly SMS / email cadence crons, not alongside them (those
+# passes don't take the record lock). The Due Now cron can stay as a safety net.
+#
+#   python cadence_scheduler.py
+#
+#   SCHEDULER_SYNC_S        incremental sync interval (default 60)
+#   SCHEDULER_FULL_SYNC_H   full reload interval (default 6)
+#   SCHEDULER_RECHECK_S     re-fire delay when a fired record's timestamp didn't move (default 300)
+#   SCHEDULER_MAX_REFIRES   give up on a timestamp after this many fires (default 6)
+#   SCHEDULER_BATCH_MAX     record ids per view lookup / batch (default 50)
+
+import logging
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+log = logging.getLogger("patti.cadence_scheduler")
+
+SCHEDULER_SYNC_S = float(os.getenv("SCHEDULER_SYNC_S", "60"))
+SCHEDULER_FULL_SYNC_S = float(os.getenv("SCHEDULER_FULL_SYNC_H", "6")) * 3600.0
+SCHEDULER_RECHECK_S = float(os.getenv("SCHEDULER_RECHECK_S", "300"))
+SCHEDULER_MAX_REFIRES = int(os.getenv("SCHEDULER_MAX_REFIRES", "6"))
+SCHEDULER_BATCH_MAX = max(1, int(os.getenv("SCHEDULER_BATCH_MAX", "50")))
+
+STORE_TZ = os.getenv("STORE_TIMEZONE", "America/Los_Angeles")
+SEND_WINDOW_START_HOUR = 8          # both send windows are 8am–8pm store time
+
+# timestamp field -> timer kind
+TIMER_FIELDS = (("follow_up_at", "due_now"), ("next_sms_at", "sms"), ("next_email_at", "email"))
+
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel: 60 one-tick slots, 60 one-minute slots, 24 one-hour
+    slots, and an overflow set for anything further out than a day. schedule() and
+    cancel() are O(1); advance() empties one slot per tick and re-spreads one
+    coarser slot per minute / hour, so a tick costs the same with 10 or 50k timers.
+    A key holds at most one timer; scheduling it again moves it.
+    """
+
+    LEVELS = (60, 60, 24)
+
+    def __init__(self, now: float, tick_s: float = 1.0):
+        self.tick_s = tick_s
+        self.tick = int(now // tick_s)
+        self._spans: List[int] = []          # ticks per slot, per level
+        span = 1
+        for n in self.LEVELS:
+            self._spans.append(span)
+            span *= n
+        self._horizon = span
+        self._slots: List[List[Set[Hashable]]] = [[set() for _ in range(n)] for n in self.LEVELS]
+        self._overflow: Set[Hashable] = set()
+        self._ready: Set[Hashable] = set()   # already due when scheduled
+        self._timers: Dict[Hashable, Tuple[int, Any, Set[Hashable]]] = {}   # key -> (due tick, item, bucket)
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._timers
+
+    def when(self, key: Hashable) -> Optional[float]:
+        t = self._timers.get(key)
+        return t[0] * self.tick_s if t else None
+
+    def schedule(self, key: Hashable, at: float, item: Any = None) -> None:
+        self.cancel(key)
+        self._place(key, int(-(-at // self.tick_s)), item)     # round up: never early
+
+    def cancel(self, key: Hashable) -> bool:
+        t = self._timers.pop(key, None)
+        if t is None:
+            return False
+        t[2].discard(key)
+        return True
+
+    def _place(self, key: Hashable, due: int, item: Any) -> None:
+        delta = due - self.tick
+        if delta <= 0:
+            bucket = self._ready
+        elif delta >= self._horizon:
+            bucket = self._overflow
+        else:
+            level = next(i for i, n in enumerate(self.LEVELS) if delta < self._spans[i] * n)
+            bucket = self._slots[level][(due // self._spans[level]) % self.LEVELS[level]]
+        bucket.add(key)
+        self._timers[key] = (due, item, bucket)
+
+    def _respread(self, keys: Iterable[Hashable]) -> None:
+        for key in keys:
+            due, item, _ = self._timers.pop(key)
+            self._place(key, due, item)
+
+    def _take(self, level: int, idx: int) -> Set[Hashable]:
+        keys = self._slots[level][idx]
+        self._slots[level][idx] = set()
+        return keys
+
+    def advance(self, now: float) -> List[Tuple[Hashable, Any]]:
+        """Move the wheel to `now`; returns (key, item) for every timer now due, oldest first."""
+        fired = [(k, self._timers.pop(k)[1]) for k in sorted(self._ready, key=lambda k: self._timers[k][0])]
+        self._ready = set()
+        target = int(now // self.tick_s)
+        while self.tick < target:
+            self.tick += 1
+            # coarse levels first, so timers cascading into this very tick still fire
+            for level in range(len(self.LEVELS) - 1, 0, -1):
+                span = self._spans[level]
+                if self.tick % span == 0:
+                    self._respread(self._take(level, (self.tick // span) % self.LEVELS[level]))
+            if self.tick % self._spans[-1] == 0 and self._overflow:
+                near = [k for k in self._overflow if self._timers[k][0] - self.tick < self._horizon]
+                self._overflow.difference_update(near)
+                self._respread(near)
+            due = self._take(0, self.tick % self.LEVELS[0]) | self._ready    # + cascaded onto this tick
+            self._ready = set()
+            for key in due:
+                fired.append((key, self._timers.pop(key)[1]))
+        return fired
+
+
+def parse_ts(raw: Any) -> Optional[float]:
+    """Airtable date/datetime value -> epoch seconds (naive values are UTC)."""
+    if not raw or not isinstance(raw, str):
+        return None
+    try:
+        dt = datetime.fromisoformat(raw.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def next_window_open(now: float, tz: str = STORE_TZ) -> float:
+    """Next SEND_WINDOW_START_HOUR in store time, strictly after `now`."""
+    local = datetime.fromtimestamp(now, ZoneInfo(tz))
+    opens = local.replace(hour=SEND_WINDOW_START_HOUR, minute=0, second=0, microsecond=0)
+    if opens <= local:
+        opens = (opens + timedelta(days=1)).replace(hour=SEND_WINDOW_START_HOUR)
+    return opens.timestamp()
+
+
+class CadenceScheduler:
+    """
+    Timers keyed (record id, kind). handlers[kind](ids) does the work for a batch of
+    due records; windows[kind]() says whether that kind may send right now;
+    load(since_iso) returns records (with the TIMER_FIELDS) modified since then,
+    or every record that has a timer when since_iso is None.
+    """
+
+    def __init__(
+        self,
+        handlers: Dict[str, Callable[[List[str]], Any]],
+        load: Callable[[Optional[str]], Iterable[dict]],
+        *,
+        windows: Optional[Dict[str, Callable[[], bool]]] = None,
+        clock: Callable[[], float] = time.time,
+        recheck_s: float = SCHEDULER_RECHECK_S,
+        max_refires: int = SCHEDULER_MAX_REFIRES,
+        batch_max: int = SCHEDULER_BATCH_MAX,
+        background: bool = True,
+    ):
+        self.handlers = handlers
+        self.load = load
+        self.windows = windows or {}
+        self.clock = clock
+        self.recheck_s = recheck_s
+        self.max_refires = max_refires
+        self.batch_max = batch_max
+        self.wheel = TimerWheel(clock())
+        self._lock = threading.Lock()
+        self._seen: Dict[Tuple[str, str], str] = {}     # key -> raw field value last scheduled
+        self._refires: Dict[Tuple[str, str], int] = {}
+        self._synced_at: Optional[float] = None
+        self._full_at = 0.0
+        # one worker per kind: a slow Due Now batch doesn't hold up texts
+        self._executors = {k: ThreadPoolExecutor(1, thread_name_prefix=f"sched-{k}") for k in handlers} \
+            if background else {}
+        self.fired = 0
+
+    # --- keeping the wheel current ---
+
+    def update(self, rec: dict) -> None:
+        """Apply one record's current timestamps (a missing field clears that timer)."""
+        rec_id = (rec or {}).get("id")
+        if not rec_id:
+            return
+        fields = rec.get("fields") or {}
+        with self._lock:
+            for field, kind in TIMER_FIELDS:
+                if kind not in self.handlers:
+                    continue
+                key = (rec_id, kind)
+                raw = fields.get(field)
+                at = parse_ts(raw)
+                if at is None:
+                    self.wheel.cancel(key)
+                    self._seen.pop(key, None)
+                    self._refires.pop(key, None)
+                elif self._seen.get(key) != raw:
+                    self._seen[key] = raw
+                    self._refires.pop(key, None)
+                    self.wheel.schedule(key, at)
+
+    def sync(self, full: bool = False) -> int:
+        now = self.clock()
+        since = None if full or self._synced_at is None else \
+            datetime.fromtimestamp(self._synced_at - 5, timezone.utc).isoformat()   # overlap for clock skew
+        records = list(self.load(since))
+        for rec in records:
+            self.update(rec)
+        if since is None:
+            present = {r.get("id") for r in records}
+            with self._lock:
+                for key in [k for k in self._seen if k[0] not in present]:
+                    self.wheel.cancel(key)
+                    self._seen.pop(key, None)
+                    self._refires.pop(key, None)
+            self._full_at = now
+        self._synced_at = now
+        log.info("scheduler %s sync: %d records, %d timers pending", "full" if since is None else "incremental",
+                 len(records), len(self.wheel))
+        return len(records)
+
+    # --- firing ---
+
+    def fire_due(self, now: Optional[float] = None) -> Dict[str, List[str]]:
+        """Advance to now and dispatch what came due; returns {kind: ids dispatched}."""
+        now = self.clock() if now is None else now
+        by_kind: Dict[str, List[str]] = {}
+        with self._lock:
+            for (rec_id, kind), _ in self.wheel.advance(now):
+                by_kind.setdefault(kind, []).append(rec_id)
+            dispatched: Dict[str, List[str]] = {}
+            for kind, ids in by_kind.items():
+                window = self.windows.get(kind)
+                if window is not None and not window():
+                    opens = next_window_open(now)
+                    for rec_id in ids:
+                        self.wheel.schedule((rec_id, kind), opens)
+                    log.info("scheduler: %d %s timers held until the send window opens (%s)", len(ids), kind,
+                             datetime.fromtimestamp(opens, timezone.utc).isoformat())
+                    continue
+                go = []
+                for rec_id in ids:
+                    key = (rec_id, kind)
+                    n = self._refires.get(key, 0)
+                    if n >= self.max_refires:
+                        # _seen keeps the value, so only a new timestamp schedules it again
+                        log.warning("scheduler: %s %s fired %d times without moving; waiting for a change",
+                                    kind, rec_id, n)
+                        continue
+                    self._refires[key] = n + 1
+                    # safety net; replaced as soon as the record's timestamp is written
+                    self.wheel.schedule(key, now + self.recheck_s)
+                    go.append(rec_id)
+                if go:
+                    dispatched[kind] = go
+        for kind, ids in dispatched.items():
+            for i in range(0, len(ids), self.batch_max):
+                self._dispatch(kind, ids[i:i + self.batch_max])
+        return dispatched
+
+    def _dispatch(self, kind: str, ids: List[str]) -> None:
+        self.fired += len(ids)
+        ex = self._executors.get(kind)
+        if ex is None:
+            self._run(kind, ids)
+        else:
+            ex.submit(self._run, kind, ids)
+
+    def _run(self, kind: str, ids: List[str]) -> None:
+        try:
+            self.handlers[kind](ids)
+        except Exception:
+            log.exception("scheduler %s batch failed (%d records)", kind, len(ids))
+
+    def run(self, stop: threading.Event, sync_s: float = SCHEDULER_SYNC_S,
+            full_sync_s: float = SCHEDULER_FULL_SYNC_S) -> None:
+        retry_at = 0.0
+        while not stop.is_set():
+            now = self.clock()
+            if now >= retry_at:
+                try:
+                    if now - self._full_at >= full_sync_s:
+                        self.sync(full=True)
+                    elif now - (self._synced_at or 0) >= sync_s:
+                        self.sync()
+                except Exception:
+                    log.exception("scheduler sync failed; keeping current timers")
+                    retry_at = now + min(sync_s, 30.0)    # `since` is unchanged, nothing is missed
+            self.fire_due()
+            tick = self.wheel.tick_s
+            stop.wait(tick - (self.clock() % tick))
+        for ex in self._executors.values():
+            ex.shutdown(wait=True)
+
+
+# --- production wiring (imports deferred: the daemon is its own process) ---
+
+def _ids_formula(ids: List[str]) -> str:
+    return "OR(" + ",".join(f"RECORD_ID()='{i}'" for i in ids) + ")"
+
+
+def _load(since_iso: Optional[str]) -> List[dict]:
+    from airtable_store import list_records
+
+    fields = tuple(f for f, _ in TIMER_FIELDS)
+    if since_iso is None:
+        formula = "OR(" + ",".join("{" + f + "}" for f in fields) + ")"
+    else:
+        formula = f"IS_AFTER(LAST_MODIFIED_TIME(), '{since_iso}')"
+    return list_records(formula, fields=fields)
+
+
+def _fire_due_now(ids: List[str]) -> None:
+    from airtable_store import list_records
+    from processNewData import run_cadence
+
+    records = list_records(_ids_formula(ids), view="Due Now")
+    if records:
+        run_cadence(records)
+
+
+def _fire_sms(ids: List[str]) -> None:
+    from airtable_store import list_records
+    from sms_poller import SMS_DUE_VIEW, send_sms_cadence_once
+
+    records = list_records(_ids_formula(ids), view=SMS_DUE_VIEW)
+    if records:
+        send_sms_cadence_once(records)
+
+
+def _fire_email(ids: List[str]) -> None:
+    from airtable_store import list_records
+    from email_cadence import EMAIL_DUE_VIEW, send_email_cadence_once
+
+    records = list_records(_ids_formula(ids), view=EMAIL_DUE_VIEW)
+    if records:
+        send_email_cadence_once(records)
+
+
+def build_scheduler() -> CadenceScheduler:
+    import airtable_store
+    from patti_common import within_email_send_window
+    from sms_poller import _within_send_window as within_sms_send_window
+
+    sched = CadenceScheduler(
+        {"due_now": _fire_due_now, "sms": _fire_sms, "email": _fire_email},
+        _load,
+        windows={"due_now": within_email_send_window, "sms": within_sms_send_window,
+                 "email": within_email_send_window},
+    )
+    airtable_store.add_write_listener(sched.update)
+    return sched
+
+
+def main() -> int:
+    from patti_logging import setup_logging
+
+    setup_logging(os.getenv("APP_LOG_LEVEL", "INFO"), "%(asctime)s %(levelname)s %(name)s %(message)s")
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+    sched = build_scheduler()
+    log.info("cadence scheduler starting (service=%s)", os.getenv("RENDER_SERVICE_NAME"))
+    sched.run(stop)
+    log.info("cadence scheduler stopped (%d records fired)", sched.fired)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
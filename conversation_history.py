@@ -0,0 +1,314 @@
+# conversation_history.py
+# Token-budgeted conversation history for SMS and email prompts.
+#
+# Every turn is cleaned once (HTML -> text, quoted replies and signatures
+# stripped; memoized by content), then the most recent turns are kept until
+# the token budget is reached. Older turns are folded into a short extractive
+# summary. Summaries are cached by a rolling hash of the dropped prefix, so
+# when one more turn falls out of the window only that turn is summarized.
+# Tokens are estimated locally (no tokenizer download, no network).
+#
+#   HISTORY_MAX_TOKENS       total budget for history in a prompt (default 1200)
+#   HISTORY_SUMMARY_TOKENS   share of it reserved for the summary (default 200)
+#   HISTORY_TURN_MAX_TOKENS  cap for a single turn (default 350)
+#
+#   python conversation_history.py           # benchmark on a recorded-style thread set
+
+import hashlib
+import html
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "1200"))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "200"))
+HISTORY_TURN_MAX_TOKENS = int(os.getenv("HISTORY_TURN_MAX_TOKENS", "350"))
+
+_SUMMARY_CACHE_SIZE = 2048
+
+# cut everything from the first reply/forward separator on
+_REPLY_SEP_RE = re.compile(
+    r"(?im)^\s*(?:"
+    r"from:\s|sent:\s|"
+    r"[-_ ]*original message[-_ ]*|"
+    r"[-_ ]*forwarded message[-_ ]*|"
+    r"on .{3,200} wrote:\s*$"
+    r")"
+)
+_SIGNATURE_RE = re.compile(
+    r"(?im)^\s*(?:--\s*$|"
+    r"sent from my (?:iphone|ipad|android|galaxy|samsung|mobile)|"
+    r"get outlook for (?:ios|android)|"
+    r"sent from (?:yahoo )?mail for)"
+)
+_QUOTED_LINE_RE = re.compile(r"(?m)^\s*>.*$\n?")
+_SCRIPT_STYLE_RE = re.compile(r"(?is)<(script|style)[^>]*>.*?</\1>")
+_QUOTE_BLOCK_RE = re.compile(
+    r"(?is)<blockquote[^>]*>.*?</blockquote>"
+    r"|<div[^>]+(?:id=['\"]divRplyFwdMsg['\"]|class=['\"][^'\"]*gmail_quote[^'\"]*['\"])[^>]*>.*$"
+)
+_BREAK_RE = re.compile(r"(?is)<br\s*/?>|</(?:p|div|li|tr|h[1-6])\s*>")
+_TAG_RE = re.compile(r"(?s)<[^>]+>")
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_RE = re.compile(r"(.+?[.!?])(?:\s|$)")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Local token estimate for English chat text: ~4 chars/token, but never
+    fewer than ~0.75 tokens per word/punctuation mark (short, choppy SMS).
+    """
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / 4), math.ceil(len(_WORD_RE.findall(text)) * 0.75))
+
+
+@lru_cache(maxsize=8192)
+def clean_turn(text: str) -> str:
+    """Fresh text of one message: HTML stripped, quoted thread and signature removed."""
+    s = text or ""
+    if "<" in s and ">" in s:
+        s = _SCRIPT_STYLE_RE.sub(" ", s)
+        s = _QUOTE_BLOCK_RE.sub("", s)
+        s = _BREAK_RE.sub("\n", s)
+        s = _TAG_RE.sub(" ", s)
+    s = html.unescape(s).replace("\r\n", "\n").replace("\r", "\n")
+    m = _REPLY_SEP_RE.search(s)
+    if m and m.start() > 0:
+        s = s[:m.start()]
+    m = _SIGNATURE_RE.search(s)
+    if m and m.start() > 0:
+        s = s[:m.start()]
+    s = _QUOTED_LINE_RE.sub("", s)
+    s = re.sub(r"[ \t ]+", " ", s)
+    return "\n".join(line.strip() for line in s.split("\n") if line.strip())
+
+
+def _clip_tokens(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = max(1, max_tokens * 4 - 1)
+    while cut > 1 and estimate_tokens(text[:cut] + "…") > max_tokens:
+        cut = int(cut * 0.9)
+    return text[:cut].rstrip() + "…"
+
+
+def _turn_hash(prev: str, role: str, text: str) -> str:
+    return hashlib.blake2b(f"{prev}\0{role}\0{text}".encode("utf-8"), digest_size=12).hexdigest()
+
+
+_summary_lock = threading.Lock()
+_summary_cache: "OrderedDict[str, str]" = OrderedDict()
+
+
+def _cache_get(key: str) -> Optional[str]:
+    with _summary_lock:
+        v = _summary_cache.get(key)
+        if v is not None:
+            _summary_cache.move_to_end(key)
+        return v
+
+
+def _cache_put(key: str, value: str) -> None:
+    with _summary_lock:
+        _summary_cache[key] = value
+        _summary_cache.move_to_end(key)
+        while len(_summary_cache) > _SUMMARY_CACHE_SIZE:
+            _summary_cache.popitem(last=False)
+
+
+def _summary_line(role: str, text: str) -> str:
+    m = _SENTENCE_RE.match(text)
+    gist = _clip_tokens((m.group(1) if m else text).strip(), 40)
+    return f"{'Customer' if role == 'user' else 'Patti'}: {gist}"
+
+
+def _rolling_summary(dropped: List[Dict[str, str]], max_tokens: int) -> str:
+    """Extractive summary of the dropped (older) turns, extended incrementally."""
+    hashes, h = [], ""
+    for t in dropped:
+        h = _turn_hash(h, t["role"], t["content"])
+        hashes.append(h)
+
+    start, lines = 0, []
+    for i in range(len(hashes) - 1, -1, -1):
+        cached = _cache_get(hashes[i])
+        if cached is not None:
+            start, lines = i + 1, cached.split("\n") if cached else []
+            break
+    for i in range(start, len(dropped)):
+        lines.append(_summary_line(dropped[i]["role"], dropped[i]["content"]))
+        _cache_put(hashes[i], "\n".join(lines))
+
+    # keep the newest summary lines that fit
+    out, used = [], 0
+    for line in reversed(lines):
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        out.append(line)
+        used += cost
+    return "\n".join(reversed(out))
+
+
+def build_history(
+    turns: List[Dict[str, Any]],
+    *,
+    max_tokens: Optional[int] = None,
+    summary_tokens: Optional[int] = None,
+    turn_max_tokens: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    turns: oldest -> newest [{"role": "user"|"assistant", "content": str}].
+    Returns {"turns": kept cleaned turns, "summary": str, "tokens": int, "dropped": int}.
+    The newest turn is always kept (clipped to turn_max_tokens).
+    """
+    max_tokens = HISTORY_MAX_TOKENS if max_tokens is None else max_tokens
+    summary_tokens = HISTORY_SUMMARY_TOKENS if summary_tokens is None else summary_tokens
+    turn_max_tokens = HISTORY_TURN_MAX_TOKENS if turn_max_tokens is None else turn_max_tokens
+
+    cleaned = []
+    for t in turns or []:
+        role = "assistant" if (t.get("role") or "").strip().lower() == "assistant" else "user"
+        content = clean_turn(t.get("content") or "")
+        if content:
+            cleaned.append({"role": role, "content": _clip_tokens(content, turn_max_tokens)})
+
+    kept, used = [], 0
+    for t in reversed(cleaned):
+        cost = estimate_tokens(t["content"]) + 4  # role/formatting overhead
+        if kept and used + cost > max_tokens - summary_tokens:
+            break
+        kept.append(t)
+        used += cost
+    kept.reverse()
+
+    dropped = cleaned[: len(cleaned) - len(kept)]
+    summary = _rolling_summary(dropped, summary_tokens) if dropped else ""
+    return {
+        "turns": kept,
+        "summary": summary,
+        "tokens": used + estimate_tokens(summary),
+        "dropped": len(dropped),
+    }
+
+
+def history_messages(turns: List[Dict[str, Any]], **kw) -> List[Dict[str, str]]:
+    """Chat messages for a prompt: optional summary (system) + recent turns."""
+    hist = build_history(turns, **kw)
+    out = []
+    if hist["summary"]:
+        out.append({"role": "system", "content": "Earlier in this conversation (summary):\n" + hist["summary"]})
+    return out + hist["turns"]
+
+
+def thread_text(turns: List[Dict[str, Any]] | None, max_msgs: int = 8) -> str:
+    """Plain "Customer:/Patti:" transcript of the last max_msgs turns (no budget)."""
+    out = []
+    for m in (turns or [])[-max_msgs:]:
+        role = (m.get("role") or "").strip().lower()
+        content = (m.get("content") or "").strip()
+        if not content:
+            continue
+        who = "Customer" if role == "user" else "Patti"
+        out.append(f"{who}: {content}")
+    return "\n".join(out).strip()
+
+
+def history_text(turns: List[Dict[str, Any]], **kw) -> str:
+    """Budgeted transcript: summary of older turns + recent turns."""
+    hist = build_history(turns, **kw)
+    body = thread_text(hist["turns"], max_msgs=len(hist["turns"]))
+    if hist["summary"]:
+        return f"[Earlier, summarized]\n{hist['summary']}\n[Recent]\n{body}"
+    return body
+
+
+def email_thread(messages: List[Dict[str, Any]], **kw) -> List[Dict[str, Any]]:
+    """
+    opportunity["messages"] -> the same list-of-dicts shape the email prompts
+    use, but cleaned and budgeted. Older messages are folded into a first
+    {"msgFrom": "summary", "body": ...} entry.
+    """
+    msgs = [m for m in (messages or []) if isinstance(m, dict)]
+    turns = [
+        {
+            "role": "assistant" if (m.get("msgFrom") or "").strip().lower() == "patti" else "user",
+            "content": m.get("body") or m.get("body_text") or m.get("text") or "",
+            "_src": m,
+        }
+        for m in msgs
+    ]
+    hist = build_history(turns, **kw)
+    # map kept (cleaned) turns back onto their source messages, newest first
+    out = []
+    src = [t for t in turns if clean_turn(t["content"])][-len(hist["turns"]):] if hist["turns"] else []
+    for t, kept in zip(src, hist["turns"]):
+        m = t["_src"]
+        entry = {"msgFrom": m.get("msgFrom") or ("patti" if kept["role"] == "assistant" else "customer")}
+        if m.get("subject"):
+            entry["subject"] = m.get("subject")
+        entry["body"] = kept["content"]
+        if m.get("date"):
+            entry["date"] = m.get("date")
+        out.append(entry)
+    if hist["summary"]:
+        out.insert(0, {"msgFrom": "summary", "body": hist["summary"]})
+    return out
+
+
+def _bench_threads(n_threads: int = 200, seed: int = 5) -> List[List[Dict[str, str]]]:
+    import random
+    rnd = random.Random(seed)
+    customer = [
+        "Is the 2024 CX-5 still available? What's the best price you can do?",
+        "Can I come in Saturday around 11?",
+        "I have a 2017 Civic to trade, about 60k miles.",
+        "Thanks! What documents should I bring?",
+        "Actually can we move it to Sunday afternoon instead?",
+    ]
+    patti = [
+        "<p>Hi Sam,</p><p>Thanks for reaching out about the CX-5! I can check availability and have "
+        "a specialist confirm pricing. What day works best for a quick visit?</p><p>Patti<br>Tustin Mazda</p>",
+        "<p>Perfect, you're all set. We'll have it ready for you.</p><div class=\"gmail_quote\">On Mon, Sam wrote: ...</div>",
+    ]
+    quoted = "\n\nOn Tue, Mar 3, 2026 at 9:14 AM Patti <patti@pattersonautos.com> wrote:\n> " + "\n> ".join(patti[0] for _ in range(3))
+    threads = []
+    for _ in range(n_threads):
+        t = []
+        for i in range(rnd.randint(4, 30)):
+            if i % 2 == 0:
+                t.append({"role": "user", "content": rnd.choice(customer) + (quoted if rnd.random() < 0.6 else "")
+                          + ("\n\nSent from my iPhone" if rnd.random() < 0.3 else "")})
+            else:
+                t.append({"role": "assistant", "content": rnd.choice(patti)})
+        threads.append(t)
+    return threads
+
+
+def run_benchmark() -> None:
+    import time
+
+    threads = _bench_threads()
+    raw_tokens = sum(estimate_tokens(thread_text([{**m, "content": m["content"][:800]} for m in t][-12:], 12)) for t in threads)
+    clean_turn.cache_clear()
+    t0 = time.perf_counter()
+    built = [history_text(t) for t in threads]
+    cold_ms = (time.perf_counter() - t0) * 1000.0 / len(threads)
+    t0 = time.perf_counter()
+    for t in threads:
+        history_text(t)
+    warm_ms = (time.perf_counter() - t0) * 1000.0 / len(threads)
+    new_tokens = sum(estimate_tokens(b) for b in built)
+    print(f"threads={len(threads)}  old (last 12 x 800 chars): {raw_tokens / len(threads):7.0f} tok/thread")
+    print(f"{'':>13}budgeted history:          {new_tokens / len(threads):7.0f} tok/thread "
+          f"({1 - new_tokens / raw_tokens:.0%} fewer)")
+    print(f"{'':>13}build time cold {cold_ms:.2f}ms / warm {warm_ms:.2f}ms per thread")
+
+
+if __name__ == "__main__":
+    run_benchmark()
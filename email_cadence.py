@@ -13,8 +13,10 @@ EMAIL_DUE_VIEW = os.getenv("EMAIL_DUE_VIEW", "Email Due")
 def _now_iso():
     return datetime.now(timezone.utc).isoformat()
 
-def send_email_cadence_once():
-    records = list_records_by_view(EMAIL_DUE_VIEW, max_records=100)
+def send_email_cadence_once(records: list | None = None):
+    """One email cadence pass over EMAIL_DUE_VIEW, or over `records` (cadence_scheduler)."""
+    if records is None:
+        records = list_records_by_view(EMAIL_DUE_VIEW, max_records=100)
 
     MAX_EMAIL_DAY = int(os.getenv("MAZDA_MAX_EMAIL_DAY", "3"))
 
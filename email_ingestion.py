@@ -1,12 +1,12 @@
 # email_ingestion.py
 import os
 import re
+import time
 import logging
 from datetime import datetime as _dt, timezone as _tz, timedelta
 from typing import Optional
 from phone_utils import norm_phone_e164_us
 from pydantic import BaseModel
-from openai import OpenAI
 
 from airtable_store import (
     mark_customer_reply,
@@ -49,6 +49,10 @@ from patti_triage import classify_inbound_email, handoff_to_human, should_triage
 from patti_common import EMAIL_RE, PHONE_RE
 from patti_common import extract_customer_comment_from_provider
 from prompt.customer_phone_number_extraction import CUSTOMER_PHONE_EXTRACTION_PROMPT
+from llm_cache import cached_llm_call, prompt_version
+from llm_gateway import parse_completion
+from inbound_analysis import INBOUND_ANALYSIS_ENABLED, InboundAnalysis, conversation_history_for
+import phase_timing
 
 # --- Sales-engaged / salesperson-heads-up config -----------------------------
 
@@ -753,6 +757,14 @@ def _sanitize_xml(xml_str: str) -> str:
     return re.sub(r"&(?!amp;|lt;|gt;|apos;|quot;|#\d+;)", "&amp;", xml_str)
 
 
+class _CustomerPhoneNumber(BaseModel):
+    customer_phone_number: str
+
+
+_PHONE_LLM_MODEL = "gpt-4.1-mini"
+_PHONE_PROMPT_VERSION = prompt_version(CUSTOMER_PHONE_EXTRACTION_PROMPT)
+
+
 def _extract_phone_number_from_email_body_using_llm(email_body: str) -> str:
     """
     Responsible for extracting customer phone number from the email body, ignoring lead provider's phone number [+1XXXXXXXXXX]
@@ -763,13 +775,10 @@ def _extract_phone_number_from_email_body_using_llm(email_body: str) -> str:
     :rtype: str
     """
 
-    class CustomerPhoneNumber(BaseModel):
-        customer_phone_number: str
-
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    try:
-        response = client.beta.chat.completions.parse(
-            model="gpt-4.1-mini",
+    def _call_llm() -> str:
+        response = parse_completion(
+            "email_ingestion.extract_phone_number",
+            model=_PHONE_LLM_MODEL,
             messages=[
                 {
                     "role": "system",
@@ -777,12 +786,21 @@ def _extract_phone_number_from_email_body_using_llm(email_body: str) -> str:
                 },
                 {"role": "user", "content": email_body},
             ],
-            response_format=CustomerPhoneNumber,
+            response_format=_CustomerPhoneNumber,
+        )
+        return response.choices[0].message.parsed.customer_phone_number or ""
+
+    try:
+        customer_phone_number = cached_llm_call(
+            "email_ingestion.extract_phone_number",
+            email_body,
+            _call_llm,
+            model=_PHONE_LLM_MODEL,
+            version=_PHONE_PROMPT_VERSION,
         )
     except Exception as e:
         log.error(f"Exception while extracting phone number using llm: {e}")
         return ""
-    customer_phone_number = response.choices[0].message.parsed.customer_phone_number
     return _validate_e164(customer_phone_number)
 
 
@@ -1140,6 +1158,7 @@ def _is_kbb_opp(opp: dict) -> bool:
     return (src or "").strip().lower() in _KBB_SOURCES
 
 
+@phase_timing.timed_flow("lead_notification", first="parse", key=lambda inbound: inbound.get("message_id") or inbound.get("source"))
 def process_lead_notification(inbound: dict) -> None:
     subject = inbound.get("subject") or ""
     provider_template = False
@@ -1384,6 +1403,7 @@ def process_lead_notification(inbound: dict) -> None:
             current_phone=phone, candidate_phone=candidate_phone
         )
 
+    phase_timing.mark("resolve_opp")
     ts = inbound.get("timestamp") or _dt.now(_tz.utc).isoformat()
     headers = inbound.get("headers") or {}
     safe_mode = _safe_mode_from(inbound)
@@ -1460,6 +1480,7 @@ def process_lead_notification(inbound: dict) -> None:
         return
 
     salesperson = "our team"
+    phase_timing.mark("airtable")
     # Airtable bootstrap
     rec = find_by_opp_id(opp_id)
 
@@ -1632,6 +1653,7 @@ def process_lead_notification(inbound: dict) -> None:
 
     save_opp(opportunity, extra_fields=extra)
 
+    phase_timing.mark("fast_paths")
     # ✅ Call existing internet lead first-touch logic (the extracted helper)
 
     fresh_opp = get_opportunity(opp_id, tok, subscription_id) or {}
@@ -2066,6 +2088,7 @@ def process_lead_notification(inbound: dict) -> None:
     # ✅ For provider lead notifications, always send to the provider-extracted shopper email
     customer_email = shopper_email
 
+    phase_timing.mark("triage")
     # -----------------------------
     # TRIAGE: provider lead message
     # -----------------------------
@@ -2266,6 +2289,7 @@ def process_lead_notification(inbound: dict) -> None:
                 log.exception("Trade lead safety stop save failed opp=%s", opp_id)
             return
 
+    phase_timing.mark("first_touch")
     # Vehicle string (Airtable fields are canonical source)
     vehicle_str = "one of our vehicles"
     make = (opportunity.get("make") or "").strip()
@@ -2704,6 +2728,7 @@ def _extract_customer_email_from_lead_body(body_text: str) -> str | None:
     return candidates[0].lower()
 
 
+@phase_timing.timed_flow("inbound_email", first="parse", key=lambda inbound: inbound.get("message_id") or inbound.get("source"))
 def process_inbound_email(inbound: dict) -> None:
     """
     Entry point called from web_app.py when Power Automate POSTs a
@@ -2715,6 +2740,7 @@ def process_inbound_email(inbound: dict) -> None:
       - Call process_kbb_ico_lead so the existing KBB brain decides
         what (if anything) to send next.
     """
+    inbound_t0 = time.monotonic()
     sender_raw = (inbound.get("from") or "").strip()
     subject = inbound.get("subject") or ""
 
@@ -2920,6 +2946,7 @@ def process_inbound_email(inbound: dict) -> None:
         return
 
     # 1) find opp
+    phase_timing.mark("find_opp")
     subscription_id = _resolve_subscription_id(inbound, headers)
     if not subscription_id:
         log.warning("No subscription_id resolved; cannot lookup opp in Fortellis")
@@ -3162,6 +3189,7 @@ def process_inbound_email(inbound: dict) -> None:
     is_kbb = _is_kbb_opp(opportunity)
 
     # 2) Append inbound message into the thread (in-memory)
+    phase_timing.mark("thread")
     timestamp = ts = inbound.get("timestamp") or _dt.now(_tz.utc).isoformat()
     msg_dict = {
         "msgFrom": "customer",
@@ -3357,10 +3385,19 @@ def process_inbound_email(inbound: dict) -> None:
             original_sender_email,
         )
 
+    # Combined gate + appointment analysis, shared with send_thread_reply_now
+    analysis = None
+    if INBOUND_ANALYSIS_ENABLED and not is_kbb and body_text:
+        analysis = InboundAnalysis(
+            body_text,
+            history_fn=lambda: conversation_history_for(conversation_id, body_text),
+        )
+
     # 4.5) TRIAGE (classify BEFORE any immediate reply)
+    phase_timing.mark("triage")
     try:
         if should_triage(is_kbb):
-            triage = classify_inbound_email(body_text)
+            triage = analysis.triage() if analysis else classify_inbound_email(body_text)
             cls = (triage.get("classification") or "").strip().upper()
             log.info(
                 "triage classification=%s reason=%r opp=%s",
@@ -3472,6 +3509,7 @@ def process_inbound_email(inbound: dict) -> None:
         )
 
     # 5) IMMEDIATE reply (do NOT wait for cron)
+    phase_timing.mark("reply")
     try:
         from kbb_ico import process_kbb_ico_lead
 
@@ -3536,6 +3574,8 @@ def process_inbound_email(inbound: dict) -> None:
                 inbound_ts=ts,
                 inbound_subject=subject,
                 message_id=message_id,
+                analysis=analysis,
+                inbound_t0=inbound_t0,
             )
 
             if isinstance(state, dict):
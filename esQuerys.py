@@ -38,7 +38,22 @@ def _make_es_client():
 
     return Elasticsearch(url, **client_kwargs)
 
-esClient = _make_es_client()
+_es_client = None
+
+
+def get_es_client():
+    """The Elasticsearch client, connected on first use (not at import)."""
+    global _es_client
+    if _es_client is None:
+        _es_client = _make_es_client()
+    return _es_client
+
+
+def __getattr__(name):
+    # keeps `from esQuerys import esClient` working without connecting at import time
+    if name == "esClient":
+        return get_es_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def getNewDataByDate(date="2025-10-30"):
     """
@@ -98,7 +113,7 @@ def getNewDataByDate(date="2025-10-30"):
 
 
     try:
-        res = esClient.search(index=ELASTIC_INDEX, query=query, size=1000)
+        res = get_es_client().search(index=ELASTIC_INDEX, query=query, size=1000)
         return res.get("hits", {}).get("hits", [])
     except AuthenticationException as e:
         print("❌ ES auth failed. Check ELASTIC_* env vars and endpoint allows Basic Auth.")
@@ -112,7 +127,7 @@ def getNewDataByDate(date="2025-10-30"):
 def getNewData():
     query = {"bool": {"filter": [{"term": {"isActive": True}}]}}
     try:
-        res = esClient.search(index=ELASTIC_INDEX, query=query, size=1000)
+        res = get_es_client().search(index=ELASTIC_INDEX, query=query, size=1000)
         return res.get("hits", {}).get("hits", [])
     except (AuthenticationException, TransportError) as e:
         print(f"❌ ES search error: {e}")
@@ -120,13 +135,13 @@ def getNewData():
 
 def getDocByID(doc_id, index=ELASTIC_INDEX):
     try:
-        return esClient.get(index=index, id=doc_id)
+        return get_es_client().get(index=index, id=doc_id)
     except Exception:
         return {"found": False}
 
 def isIdExist(doc_id, index=ELASTIC_INDEX):
     try:
-        return esClient.exists(index=index, id=doc_id)
+        return get_es_client().exists(index=index, id=doc_id)
     except Exception:
         return False
 
@@ -7,7 +7,7 @@ import os
 import re
 from typing import Any, Dict
 
-from openai import OpenAI
+from llm_gateway import chat_completion
 
 log = logging.getLogger("patti.event_campaign_brain")
 
@@ -19,7 +19,6 @@ EVENT_QA_MODEL = (
     or "gpt-4o-mini"
 ).strip()
 
-_oai = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 
 HANDOFF_REASONS = {
     "pricing",
@@ -203,7 +202,7 @@ def generate_event_reply(
             "handoff_reason": "complaint",
         }
 
-    if not _oai:
+    if not OPENAI_API_KEY:
         return _fallback_unknown(first_name)
 
     event_context = _build_event_context(event_fields)
@@ -219,7 +218,9 @@ GUEST MESSAGE:
 """.strip()
 
     try:
-        resp = _oai.chat.completions.create(
+        resp = chat_completion(
+            "event_campaign_brain.generate_event_reply",
+            tags={"persona": "event"},
             model=EVENT_QA_MODEL,
             response_format={"type": "json_object"},
             temperature=0.2,
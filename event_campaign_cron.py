@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 import logging
+from patti_logging import setup_logging
 import os
 import re
 from datetime import date, datetime, timedelta, timezone
@@ -21,10 +22,7 @@ from patti_common import build_patti_footer
 # CONFIG
 # =========================================================
 LOG_LEVEL = os.getenv("APP_LOG_LEVEL", "INFO").upper()
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL, logging.INFO),
-    format="%(asctime)s %(levelname)s %(message)s",
-)
+setup_logging(LOG_LEVEL, "%(asctime)s %(levelname)s %(message)s")
 log = logging.getLogger("patti.event_campaign")
 
 AIRTABLE_API_TOKEN = (os.getenv("AIRTABLE_API_TOKEN") or "").strip()
@@ -595,7 +595,8 @@ def handle_event_sms_reply(payload_json: dict | None, raw_text: str = "") -> dic
 
     clean = _strip_reply_text(body)
 
-    if STOP_RE.search(clean):
+    # coalesced texts arrive one per line; a STOP in any of them counts
+    if STOP_RE.search(clean) or any(STOP_RE.search(ln) for ln in body.splitlines()[1:]):
         _patch_opt_out_guest(guest_rec, "sms")
         _patch_opt_out_invite(invite_rec, "sms", clean)
         _send_sms_confirmation(
@@ -6,6 +6,7 @@ from datetime import datetime, timezone, timedelta
 import json
 import time
 import logging
+from patti_logging import setup_logging
 import re
 from html import unescape
 
@@ -13,8 +14,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 LOG_LEVEL = os.getenv("APP_LOG_LEVEL", "INFO").upper()
-logging.basicConfig(level=getattr(logging, LOG_LEVEL, logging.INFO),
-                    format="%(asctime)s %(levelname)s %(message)s")
+setup_logging(LOG_LEVEL, "%(asctime)s %(levelname)s %(message)s")
 log = logging.getLogger("fortellis")
 
 SENSITIVE_HEADERS = {"Authorization"}
@@ -1,15 +1,18 @@
-import os, time, json, logging, re
+import os, time, json, logging, re, threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
-from openai import OpenAI
-from openai import APIStatusError, NotFoundError  # available in recent SDKs; if import fails, just catch Exception
+from functools import lru_cache
 from rooftops import ROOFTOP_INFO
 from zoneinfo import ZoneInfo
+from llm_cache import cached_llm_call, prompt_version
+import appt_parser
+from llm_gateway import LLMQueueTimeout, chat_completion, current_priority, current_tags, llm_tags
+from patti_logging import lazy, lazy_json, log_sampled
 
 from dotenv import load_dotenv
 load_dotenv()
 
-client = OpenAI(api_key = os.getenv("OPENAI_API_KEY"))
-
 log = logging.getLogger("patti.gpt")
 
 PRIMARY_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
@@ -78,39 +81,214 @@ def _ensure_reply_dict(text: str, default_subject: str, default_body_leadin: str
         "body": default_body_leadin
     }
 
-def chat_complete_with_fallback(messages, want_json: bool = True, temperature: float = 0.6):
+# Routing mode for chat_complete_with_fallback:
+#   chain  - walk MODEL_CHAIN in order, next model only after an exception (default)
+#   hedged - if the first model hasn't answered after ~p90 of its recent latency,
+#            also start the next one and take the first valid answer
+OPENAI_ROUTING = os.getenv("OPENAI_ROUTING", "chain").strip().lower()
+HEDGE_DEFAULT_DELAY_S = float(os.getenv("OPENAI_HEDGE_DEFAULT_DELAY_S", "6"))
+HEDGE_MIN_DELAY_S = float(os.getenv("OPENAI_HEDGE_MIN_DELAY_S", "1.5"))
+HEDGE_QUANTILE = float(os.getenv("OPENAI_HEDGE_QUANTILE", "0.9"))
+HEDGE_MIN_SAMPLES = int(os.getenv("OPENAI_HEDGE_MIN_SAMPLES", "20"))
+# models failing more often than this (recently) are tried last
+ROUTE_MAX_ERROR_RATE = float(os.getenv("OPENAI_ROUTE_MAX_ERROR_RATE", "0.5"))
+
+_MODEL_STATS = {}          # model -> {"lat": deque[s], "err": deque[0/1]}
+_ROUTE_WINS = {}           # caller -> {"calls", "hedged", "won": {model: n}}
+_ROUTE_LOCK = threading.Lock()
+_hedge_pool = None
+
+
+def _model_stat(model: str) -> dict:
+    st = _MODEL_STATS.get(model)
+    if st is None:
+        st = _MODEL_STATS[model] = {"lat": deque(maxlen=200), "err": deque(maxlen=50)}
+    return st
+
+
+def _record_model_result(model: str, elapsed_s: float, ok: bool):
+    with _ROUTE_LOCK:
+        st = _model_stat(model)
+        st["err"].append(0 if ok else 1)
+        if ok:
+            st["lat"].append(elapsed_s)
+
+
+def _record_route(caller: str, model: str, hedged: bool):
+    with _ROUTE_LOCK:
+        st = _ROUTE_WINS.setdefault(caller, {"calls": 0, "hedged": 0, "won": {}})
+        st["calls"] += 1
+        st["hedged"] += 1 if hedged else 0
+        st["won"][model] = st["won"].get(model, 0) + 1
+    (log.info if hedged else log.debug)("LLM_ROUTE caller=%s model=%s hedged=%s", caller, model, hedged)
+
+
+def _hedge_delay(model: str) -> float:
+    with _ROUTE_LOCK:
+        lat = sorted(_model_stat(model)["lat"])
+    if len(lat) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY_S
+    return max(HEDGE_MIN_DELAY_S, lat[min(len(lat) - 1, int(len(lat) * HEDGE_QUANTILE))])
+
+
+def _ranked_chain() -> list:
+    """MODEL_CHAIN order, with recently failing models moved to the back."""
+    def _failing(m):
+        with _ROUTE_LOCK:
+            err = list(_model_stat(m)["err"])
+        return len(err) >= 5 and sum(err) / len(err) > ROUTE_MAX_ERROR_RATE
+    return sorted(MODEL_CHAIN, key=_failing)
+
+
+def model_routing_stats() -> dict:
+    """Per-model rolling p50/p90/error rate and per-caller winning model counts."""
+    with _ROUTE_LOCK:
+        models = {}
+        for m, st in _MODEL_STATS.items():
+            lat = sorted(st["lat"])
+            err = list(st["err"])
+            models[m] = {
+                "samples": len(lat),
+                "p50_ms": lat[len(lat) // 2] * 1000.0 if lat else 0.0,
+                "p90_ms": lat[min(len(lat) - 1, int(len(lat) * 0.9))] * 1000.0 if lat else 0.0,
+                "error_rate": sum(err) / len(err) if err else 0.0,
+            }
+        callers = {c: {**st, "won": dict(st["won"])} for c, st in _ROUTE_WINS.items()}
+    return {"mode": OPENAI_ROUTING, "models": models, "callers": callers}
+
+
+def _complete_on_model(m, messages, want_json, temperature, caller, priority=None, tags=None):
     """
-    Try models in MODEL_CHAIN until one works.
-    If JSON mode isn't supported by a model, retry without strict JSON.
+    One model: try JSON mode, then once without it. Raises the last error.
+    tags go to telemetry (hop = position in the fallback chain).
     """
     last_err = None
-    for m in MODEL_CHAIN:
-        # First try with JSON format (if requested)
-        for attempt in (0, 1):  # 0 = with json, 1 = without json
-            try:
-                kwargs = dict(model=m, messages=messages, temperature=temperature)
-                if want_json and attempt == 0:
-                    # Some SDKs support response_format={"type":"json_object"}
-                    kwargs["response_format"] = {"type": "json_object"}
-                resp = client.chat.completions.create(**kwargs)
-                return m, resp
-            except NotFoundError as e:
-                last_err = e
-                # Model truly not available; try next model
-                break
-            except APIStatusError as e:
-                last_err = e
-                # If the error might be due to response_format not supported, retry once without it
-                if attempt == 0:
-                    continue
-                # otherwise try next model
+    t0 = time.monotonic()
+    for attempt in (0, 1):  # 0 = with json, 1 = without json
+        try:
+            kwargs = dict(model=m, messages=messages, temperature=temperature)
+            if want_json and attempt == 0:
+                # Some SDKs support response_format={"type":"json_object"}
+                kwargs["response_format"] = {"type": "json_object"}
+            resp = chat_completion(caller, priority=priority, tags=tags, **kwargs)
+            _record_model_result(m, time.monotonic() - t0, True)
+            return resp
+        except LLMQueueTimeout as e:
+            last_err = e
+            # Over its budget; try next model
+            break
+        except Exception as e:
+            last_err = e
+            # openai.NotFoundError (checked by status so importing gpt doesn't load the SDK):
+            # model not available; try next model
+            if getattr(e, "status_code", None) == 404:
                 break
+            # APIStatusError may be response_format not supported, and unknown errors get
+            # the same treatment: retry once without JSON, then try next model
+            if attempt == 0:
+                continue
+            break
+    _record_model_result(m, time.monotonic() - t0, False)
+    raise last_err
+
+
+def _valid_answer(resp, want_json: bool) -> bool:
+    text = _safe_extract_text(resp)
+    if not text:
+        return False
+    if not want_json:
+        return True
+    try:
+        json.loads(text)
+        return True
+    except Exception:
+        return False
+
+
+def _hedged_complete(messages, want_json, temperature, caller):
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _ROUTE_LOCK:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("OPENAI_HEDGE_WORKERS", "16")), thread_name_prefix="llm-hedge"
+                )
+
+    chain = _ranked_chain()
+    prio = current_priority()  # thread-local; pass it into the worker threads
+    tags = current_tags()
+    legs = {}
+
+    def _start(m):
+        legs[_hedge_pool.submit(
+            _complete_on_model, m, messages, want_json, temperature, caller, prio, {**tags, "hop": chain.index(m)}
+        )] = m
+
+    _start(chain[0])
+    pending = set(legs)
+    done, pending = wait(pending, timeout=_hedge_delay(chain[0]))
+    hedged = False
+    if not done and len(chain) > 1:
+        _start(chain[1])
+        pending = set(legs) - done
+        hedged = True
+
+    last_err, fallback = None, None
+    while done or pending:
+        for f in done:
+            m = legs[f]
+            try:
+                resp = f.result()
             except Exception as e:
                 last_err = e
-                # On unknown errors, try next model (or next attempt without JSON)
-                if attempt == 0:
-                    continue
-                break
+                continue
+            if _valid_answer(resp, want_json):
+                # an already-running leg can't be interrupted; its result is dropped
+                for other in pending:
+                    other.cancel()
+                _record_route(caller, m, hedged)
+                return m, resp
+            fallback = fallback or (m, resp)
+        if not pending:
+            break
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+    # both legs failed or returned unusable output: rest of the chain in order
+    for m in chain:
+        if m in legs.values():
+            continue
+        try:
+            resp = _complete_on_model(m, messages, want_json, temperature, caller, prio, {**tags, "hop": chain.index(m)})
+        except Exception as e:
+            last_err = e
+            continue
+        _record_route(caller, m, hedged)
+        return m, resp
+    if fallback:
+        _record_route(caller, fallback[0], hedged)
+        return fallback
+    raise last_err or RuntimeError("OpenAI chat completion failed with all models")
+
+
+def chat_complete_with_fallback(messages, want_json: bool = True, temperature: float = 0.6, caller: str = "gpt"):
+    """
+    Try models in MODEL_CHAIN until one works.
+    If JSON mode isn't supported by a model, retry without strict JSON.
+    Calls go through llm_gateway; `caller` names the metrics row.
+    With OPENAI_ROUTING=hedged a slow first model is raced against the next one.
+    """
+    if OPENAI_ROUTING == "hedged" and len(MODEL_CHAIN) > 0:
+        return _hedged_complete(messages, want_json, temperature, caller)
+
+    last_err = None
+    for hop, m in enumerate(MODEL_CHAIN):
+        try:
+            resp = _complete_on_model(m, messages, want_json, temperature, caller, tags={"hop": hop})
+        except Exception as e:
+            last_err = e
+            continue
+        _record_route(caller, m, False)
+        return m, resp
     raise last_err or RuntimeError("OpenAI chat completion failed with all models")
 
 def _kbb_ico_rules_system(kbb_ctx: dict | None, rooftop_name: str | None):
@@ -138,89 +316,165 @@ def _kbb_ico_rules_system(kbb_ctx: dict | None, rooftop_name: str | None):
 
 
 
-def _build_system_stack(persona: str, customer_first: str, rooftop_name: str | None, kbb_ctx: dict | None, include_followup_rules: bool = True):
-    """
-    Returns a list of system messages tailored to persona.
-    For convo (prevMessages=True), we still keep JSON/format + convo brain.
-    """
-    base = []
+# --- Prompt assembly ----------------------------------------------------
+# Messages are laid out static-first, dynamic-last so the provider can reuse
+# its cached prompt prefix across leads:
+#   persona blocks (same for every rooftop) -> rooftop blocks -> per-lead blocks -> user prompt
+# The static parts are built once per process and reused.
+
+def _month_system():
+    return f"Current month: {CURRENT_MONTH}. Only reference charity campaigns if this month is listed; otherwise do not mention charity at all."
+
+@lru_cache(maxsize=16)
+def _persona_static_blocks(persona: str, include_followup_rules: bool) -> tuple:
     if persona == "kbb_ico":
-        base = [
-            {"role": "system", "content": _patti_persona_system()},
-            {"role": "system", "content": _patterson_why_buys_system()},
-            {"role": "system", "content": _kbb_ico_rules_system(kbb_ctx, rooftop_name)},
-            {"role": "system", "content": _personalization_rules_system()},
-            {"role": "system", "content": _appointment_cta_system()},
-            {"role": "system", "content": _compliance_system()},
-            {"role": "system", "content": f"Current month: {CURRENT_MONTH}. Only reference charity campaigns if this month is listed; otherwise do not mention charity at all."},
-            {"role": "system", "content": _links_and_boundaries_system()},
-            {"role": "system", "content": _objection_handling_system()},
-            {"role": "system", "content": _format_system()},
-            {"role": "system", "content": _getCustomerMessagePrompts()},
+        blocks = [
+            _patti_persona_system(),
+            _patterson_why_buys_system(),
+            _personalization_rules_system(),
+            _appointment_cta_system(),
+            _compliance_system(),
+            _month_system(),
+            _links_and_boundaries_system(),
+            _objection_handling_system(),
+            _format_system(),
+            _getCustomerMessagePrompts(),
         ]
-        # KBB cadence follow-ups are handled by your template scheduler, so we usually
-        # do NOT include the generic follow-up generator here. Keep it optional:
-        
-        if include_followup_rules:
-            base.append({"role": "system", "content": _getFollowUPRules()})
-            
-        # ---- Inject concrete KBB facts so the model can actually see them ----
-        if kbb_ctx:
-            amt = kbb_ctx.get("offer_amount_usd") or kbb_ctx.get("amount_usd")
-            veh = kbb_ctx.get("vehicle")
-            url = kbb_ctx.get("offer_url")
-        
-            if amt:
-                facts_lines = [f"Kelley Blue Book® Instant Cash Offer amount: {amt}."]
-                if veh:
-                    facts_lines.append(f"Vehicle: {veh}.")
-                if url:
-                    facts_lines.append(f"Offer details URL: {url}.")
-        
-                # (1) FACTS message
-                base.append({
-                    "role": "system",
-                    "content": (
-                        "Internal KBB facts (authoritative; use to answer customer questions accurately; "
-                        "do not volunteer unless asked):\n" + " ".join(facts_lines)
-                    )
-                })
-                log.info("KBB FACTS SYSTEM MSG: %r", base[-1]["content"])
-        
-                # (2) OVERRIDE rule message
-                base.append({
-                    "role": "system",
-                    "content": (
-                        "CRITICAL OVERRIDE: If the customer asks for their KBB/ICO offer/estimate/value/amount "
-                        "and an internal KBB facts message contains a dollar amount, you MUST state that exact "
-                        "dollar amount in your reply. Do NOT say you 'don't have access' or 'can't see it' when "
-                        "the amount is provided internally. Only say you don't have the amount if no dollar amount "
-                        "is present internally."
-                    )
-                })
-
-                log.info("KBB FACTS SYSTEM MSG: %r", base[-1]["content"])
-
-        return base
-
-    # default "sales" persona (your current stack)
-    base = [
-        {"role": "system", "content": _patti_persona_system()},
-        {"role": "system", "content": _patti_rules_system(customer_first)},
-        {"role": "system", "content": _patterson_why_buys_system()},
-        {"role": "system", "content": _first_message_rules_system()},
-        {"role": "system", "content": _personalization_rules_system()},
-        {"role": "system", "content": _appointment_cta_system()},
-        {"role": "system", "content": _compliance_system()},
-        {"role": "system", "content": f"Current month: {CURRENT_MONTH}. Only reference charity campaigns if this month is listed; otherwise do not mention charity at all."},
-        {"role": "system", "content": _links_and_boundaries_system()},
-        {"role": "system", "content": _objection_handling_system()},
-        {"role": "system", "content": _format_system()},
-        {"role": "system", "content": _getCustomerMessagePrompts()},
-    ]
+    elif persona == "facebook_closer":
+        blocks = [
+            _patti_persona_system(),
+            _patterson_why_buys_system(),
+            _personalization_rules_system(),
+            _appointment_cta_system(),
+            _compliance_system(),
+            _links_and_boundaries_system(),
+            _format_system(),
+        ]
+        include_followup_rules = False
+    else:
+        # default "sales" persona
+        blocks = [
+            _patti_persona_system(),
+            _patterson_why_buys_system(),
+            _first_message_rules_system(),
+            _personalization_rules_system(),
+            _appointment_cta_system(),
+            _compliance_system(),
+            _month_system(),
+            _links_and_boundaries_system(),
+            _objection_handling_system(),
+            _format_system(),
+            _getCustomerMessagePrompts(),
+        ]
+    # KBB cadence follow-ups are handled by the template scheduler, so callers
+    # usually pass include_followup_rules=False for kbb_ico.
     if include_followup_rules:
-        base.append({"role": "system", "content": _getFollowUPRules()})
-    return base
+        blocks.append(_getFollowUPRules())
+    return tuple(blocks)
+
+@lru_cache(maxsize=64)
+def _rooftop_static_blocks(persona: str, rooftop_name: str | None) -> tuple:
+    blocks = []
+    # --- Tustin Kia new-location flavor (subscription c27d7f4f...) ---
+    # That subscription maps to rooftop_name == "Tustin Kia" in rooftops.py.
+    if persona != "facebook_closer" and rooftop_name and rooftop_name.strip().lower() == "tustin kia":
+        blocks.append(_tustin_kia_new_location_system())
+    rooftop_addr = _get_rooftop_address(rooftop_name)
+    if rooftop_addr:
+        blocks.append(f"Dealer address: {rooftop_addr}. If the guest asks where to go or for directions, include this exact address plainly (no brackets).")
+    return tuple(blocks)
+
+def _lead_dynamic_blocks(persona: str, customer_first: str, rooftop_name: str | None, kbb_ctx: dict | None) -> list:
+    if persona == "facebook_closer":
+        return [_facebook_closer_rules_system(customer_first, rooftop_name)]
+    if persona != "kbb_ico":
+        return [_patti_rules_system(customer_first)]
+
+    blocks = [_kbb_ico_rules_system(kbb_ctx, rooftop_name)]
+    # ---- Inject concrete KBB facts so the model can actually see them ----
+    if kbb_ctx:
+        amt = kbb_ctx.get("offer_amount_usd") or kbb_ctx.get("amount_usd")
+        veh = kbb_ctx.get("vehicle")
+        url = kbb_ctx.get("offer_url")
+
+        if amt:
+            facts_lines = [f"Kelley Blue Book® Instant Cash Offer amount: {amt}."]
+            if veh:
+                facts_lines.append(f"Vehicle: {veh}.")
+            if url:
+                facts_lines.append(f"Offer details URL: {url}.")
+
+            # (1) FACTS message
+            blocks.append(
+                "Internal KBB facts (authoritative; use to answer customer questions accurately; "
+                "do not volunteer unless asked):\n" + " ".join(facts_lines)
+            )
+            log.info("KBB FACTS SYSTEM MSG: %r", blocks[-1])
+
+            # (2) OVERRIDE rule message
+            blocks.append(
+                "CRITICAL OVERRIDE: If the customer asks for their KBB/ICO offer/estimate/value/amount "
+                "and an internal KBB facts message contains a dollar amount, you MUST state that exact "
+                "dollar amount in your reply. Do NOT say you 'don't have access' or 'can't see it' when "
+                "the amount is provided internally. Only say you don't have the amount if no dollar amount "
+                "is present internally."
+            )
+    return blocks
+
+def _build_system_stack(persona: str, customer_first: str, rooftop_name: str | None, kbb_ctx: dict | None, include_followup_rules: bool = True):
+    """
+    Returns a list of system messages tailored to persona, ordered
+    persona-static -> rooftop-static -> per-lead so the prefix stays cacheable.
+    """
+    contents = (
+        list(_persona_static_blocks(persona, include_followup_rules))
+        + list(_rooftop_static_blocks(persona, rooftop_name))
+        + _lead_dynamic_blocks(persona, customer_first, rooftop_name, kbb_ctx)
+    )
+    return [{"role": "system", "content": c} for c in contents]
+
+# --- Prompt-cache instrumentation ---------------------------------------
+# Per-persona totals of prompt/cached tokens and request latency, so we can
+# see the cache hit rate the static-prefix layout is buying us.
+_PROMPT_USAGE = {}
+_PROMPT_USAGE_LOCK = threading.Lock()
+
+def _usage_tokens(resp):
+    usage = getattr(resp, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    return prompt_tokens, cached_tokens
+
+def _record_prompt_usage(persona: str, model: str, resp, elapsed_s: float):
+    prompt_tokens, cached_tokens = _usage_tokens(resp)
+    with _PROMPT_USAGE_LOCK:
+        st = _PROMPT_USAGE.setdefault(persona, {
+            "calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "latency_s": 0.0,
+        })
+        st["calls"] += 1
+        st["prompt_tokens"] += prompt_tokens
+        st["cached_tokens"] += cached_tokens
+        st["latency_s"] += elapsed_s
+    log.info("RUN_GPT usage persona=%s model=%s prompt_tokens=%d cached_tokens=%d latency_ms=%d",
+             persona, model, prompt_tokens, cached_tokens, int(elapsed_s * 1000))
+
+def prompt_cache_stats() -> dict:
+    """
+    {persona: {calls, prompt_tokens, cached_tokens, cache_hit_rate, avg_latency_ms}}
+    Latency is full request time (run_gpt does not stream).
+    """
+    with _PROMPT_USAGE_LOCK:
+        out = {}
+        for persona, st in _PROMPT_USAGE.items():
+            out[persona] = {
+                "calls": st["calls"],
+                "prompt_tokens": st["prompt_tokens"],
+                "cached_tokens": st["cached_tokens"],
+                "cache_hit_rate": (st["cached_tokens"] / st["prompt_tokens"]) if st["prompt_tokens"] else 0.0,
+                "avg_latency_ms": (st["latency_s"] * 1000.0 / st["calls"]) if st["calls"] else 0.0,
+            }
+        return out
 
 
 # --- Patti system instruction builders --------------------------------
@@ -560,30 +814,26 @@ def _getAlreadyBookedGuardrails():
         "Be brief, clear, and friendly. Never suggest additional actions or changes unless asked."
     )
 
-def run_gpt(prompt: str,
-            customer_name: str,
-            rooftop_name: str = None,
-            max_retries: int = MAX_RETRIES,
-            prevMessages: bool = False,
-            persona: str = "sales",
-            kbb_ctx: dict | None = None):
+def _system_stack_preview(system_msgs: list[dict], limit: int) -> str:
+    return "\n---\n".join([m.get("content","") for m in system_msgs if m.get("role") == "system"])[:limit]
 
-    rooftop_addr = _get_rooftop_address(rooftop_name)
 
-    addr_msg = None
-    if rooftop_addr:
-        addr_msg = {
-            "role": "system",
-            "content": f"Dealer address: {rooftop_addr}. If the guest asks where to go or for directions, include this exact address plainly (no brackets)."
-        }
-           
-    # Build system stack (persona-aware)
-    # For KBB ICO, we typically exclude generic follow-up rules because cadence uses templates.
-                
-    log.info("RUN_GPT debug: kbb_ctx keys=%s offer_amount=%r",
-         list((kbb_ctx or {}).keys()),
-         (kbb_ctx or {}).get("offer_amount_usd"))
+def _log_run_gpt_messages(messages: list[dict]) -> None:
+    # full prompt dumps are sampled (LOG_SAMPLE_RATES payload.run_gpt) and built lazily
+    log_sampled(log, "payload.run_gpt", logging.INFO, "RUN_GPT debug: kbb_ctx_in_messages=%s",
+                lazy(lambda: "$27,000" in json.dumps(messages, ensure_ascii=False)))
+    log_sampled(log, "payload.run_gpt", logging.INFO, "RUN_GPT debug: messages_preview=%s",
+                lazy_json(messages, 1500))
+
 
+def build_run_gpt_messages(prompt: str,
+                           customer_name: str,
+                           rooftop_name: str = None,
+                           persona: str = "sales",
+                           kbb_ctx: dict | None = None) -> list[dict]:
+    """The exact chat messages run_gpt sends (system stack + prompt)."""
+    # Build system stack (persona-aware, static blocks first)
+    # For KBB ICO, we typically exclude generic follow-up rules because cadence uses templates.
     system_msgs = _build_system_stack(
         persona=persona,
         customer_first=customer_name,
@@ -591,85 +841,78 @@ def run_gpt(prompt: str,
         kbb_ctx=kbb_ctx,
         include_followup_rules=(persona != "kbb_ico")
     )
-                
+
     if persona == "kbb_ico":
-        joined = "\n---\n".join([m.get("content","") for m in system_msgs if m.get("role") == "system"])
-        log.info("KBB SYSTEM STACK (trunc): %s", joined[:4000])
+        log_sampled(log, "payload.kbb_system_stack", logging.INFO, "KBB SYSTEM STACK (trunc): %s",
+                    lazy(_system_stack_preview, system_msgs, 4000))
 
-    if persona == "facebook_closer":
-        base = [
-            {"role": "system", "content": _patti_persona_system()},
-            {"role": "system", "content": _patterson_why_buys_system()},
-            {"role": "system", "content": _facebook_closer_rules_system(customer_name, rooftop_name)},
-            {"role": "system", "content": _personalization_rules_system()},
-            {"role": "system", "content": _appointment_cta_system()},
-            {"role": "system", "content": _compliance_system()},
-            {"role": "system", "content": _links_and_boundaries_system()},
-            {"role": "system", "content": _format_system()},
-        ]
-        return base
+    return system_msgs + [
+        {"role": "user", "content": prompt}
+    ]
 
 
-    # --- Tustin Kia new-location flavor (subscription c27d7f4f...) ---
-    # That subscription maps to rooftop_name == "Tustin Kia" in rooftops.py.
-    if rooftop_name and rooftop_name.strip().lower() == "tustin kia":
-        system_msgs.append({
-            "role": "system",
-            "content": _tustin_kia_new_location_system(),
-        })
+def finish_thread_reply(text: str, rooftop_name: str = None, persona: str = "sales") -> dict:
+    """run_gpt(prevMessages=True) post-processing: parse JSON, sane subject, single "Re:"."""
+    import re
 
+    dictResult = getDictRes(text) or {"subject": "Re: your offer", "body": "Thanks for the note—happy to help."}
 
-    if addr_msg:
-        system_msgs.insert(0, addr_msg)   # make sure the address is available to the model
+    placeholder_re = re.compile(r"(?i)\bthe subject (of|from)\b.*(patti|customer)")
+    subj = (dictResult.get("subject") or "").strip()
 
-    if prevMessages:
-        messages = system_msgs + [
-            {"role": "user", "content": prompt}
-        ]
+    log.info("RUN_GPT debug: subj=%s", subj)
+
+    if not subj or placeholder_re.search(subj):
+        # Use a strong default, especially for KBB persona
+        fallback_rooftop = rooftop_name or "Patterson Auto Group"
+        if persona == "kbb_ico":
+            dictResult["subject"] = f"Kelley Blue Book® Instant Cash Offer | {fallback_rooftop}"
+        else:
+            dictResult["subject"] = f"Your vehicle inquiry with {fallback_rooftop}"
 
-        import json, re
-        dump = json.dumps(messages, ensure_ascii=False)
-        log.info("RUN_GPT debug: kbb_ctx_in_messages=%s", "$27,000" in dump)
-        log.info("RUN_GPT debug: messages_preview=%s", dump[:1500])
+    # If we're replying, keep a single "Re:" prefix
+    if not dictResult["subject"].lower().startswith("re:"):
+        dictResult["subject"] = "Re: " + dictResult["subject"]
+
+    return dictResult
+
+
+def run_gpt(prompt: str,
+            customer_name: str,
+            rooftop_name: str = None,
+            max_retries: int = MAX_RETRIES,
+            prevMessages: bool = False,
+            persona: str = "sales",
+            kbb_ctx: dict | None = None):
+
+    log.info("RUN_GPT debug: kbb_ctx keys=%s offer_amount=%r",
+         list((kbb_ctx or {}).keys()),
+         (kbb_ctx or {}).get("offer_amount_usd"))
+
+    messages = build_run_gpt_messages(prompt, customer_name, rooftop_name, persona=persona, kbb_ctx=kbb_ctx)
+
+    if prevMessages:
+        _log_run_gpt_messages(messages)
         
-        model_used, resp = chat_complete_with_fallback(messages, want_json=True, temperature=0.6)
+        t0 = time.monotonic()
+        with llm_tags(persona=persona, rooftop=rooftop_name):
+            model_used, resp = chat_complete_with_fallback(messages, want_json=True, temperature=0.6, caller=f"gpt.run_gpt.{persona}")
+        _record_prompt_usage(persona, model_used, resp, time.monotonic() - t0)
         text = _safe_extract_text(resp)
         if not text:
             log.warning("OpenAI returned empty content (model=%s). Using fallback template.", model_used)
         
-        dictResult = getDictRes(text) or {"subject": "Re: your offer", "body": "Thanks for the note—happy to help."}
-
-        placeholder_re = re.compile(r"(?i)\bthe subject (of|from)\b.*(patti|customer)")
-        subj = (dictResult.get("subject") or "").strip()
-        
-        log.info("RUN_GPT debug: subj=%s", subj)
-        
-        if not subj or placeholder_re.search(subj):
-            # Use a strong default, especially for KBB persona
-            fallback_rooftop = rooftop_name or "Patterson Auto Group"
-            if persona == "kbb_ico":
-                dictResult["subject"] = f"Kelley Blue Book® Instant Cash Offer | {fallback_rooftop}"
-            else:
-                dictResult["subject"] = f"Your vehicle inquiry with {fallback_rooftop}"
-        
-        # If we're replying, keep a single "Re:" prefix
-        if not dictResult["subject"].lower().startswith("re:"):
-            dictResult["subject"] = "Re: " + dictResult["subject"]
-
-        return dictResult
+        return finish_thread_reply(text, rooftop_name, persona)
         
     # --- non-prevMessages path ---
 
-    messages = system_msgs + [
-        {"role": "user", "content": prompt}
-    ]
-
-    import json, re
-    dump = json.dumps(messages, ensure_ascii=False)
-    log.info("RUN_GPT debug: kbb_ctx_in_messages=%s", "$27,000" in dump)
-    log.info("RUN_GPT debug: messages_preview=%s", dump[:1500])
+    import re
+    _log_run_gpt_messages(messages)
 
-    model_used, resp = chat_complete_with_fallback(messages, want_json=True, temperature=0.6)
+    t0 = time.monotonic()
+    with llm_tags(persona=persona, rooftop=rooftop_name):
+        model_used, resp = chat_complete_with_fallback(messages, want_json=True, temperature=0.6, caller=f"gpt.run_gpt.{persona}")
+    _record_prompt_usage(persona, model_used, resp, time.monotonic() - t0)
     text = _safe_extract_text(resp)
     if not text:
         log.warning("OpenAI returned empty content (model=%s). Using fallback template.", model_used)
@@ -786,12 +1029,27 @@ def getCustomerMsgDict(inqueryTextBody):
         {"role": "user", "content": inqueryTextBody}
     ]
 
-    model_used, resp = chat_complete_with_fallback(messages, want_json=True, temperature=0.6)
-    text = _safe_extract_text(resp)
-    if not text:
-        log.warning("OpenAI returned empty content (model=%s). Using fallback template.", model_used)
-    
-    dictResult = getDictRes(text)
+    answered_by = []
+
+    def _call_llm():
+        model_used, resp = chat_complete_with_fallback(messages, want_json=True, temperature=0.0, caller="gpt.getCustomerMsgDict")
+        answered_by.append(model_used)
+        text = _safe_extract_text(resp)
+        if not text:
+            log.warning("OpenAI returned empty content (model=%s). Using fallback template.", model_used)
+        return getDictRes(text)
+
+    # Provider lead templates repeat across leads; reuse the extraction for identical text.
+    # Deterministic (temperature 0) and keyed on PRIMARY_MODEL, so answers from a
+    # fallback hop are used for this lead but never cached under the primary's key.
+    dictResult = cached_llm_call(
+        "gpt.getCustomerMsgDict",
+        inqueryTextBody,
+        _call_llm,
+        model=PRIMARY_MODEL,
+        version=prompt_version(system_msgs[0]["content"]),
+        cache_if=lambda v: isinstance(v, dict) and answered_by == [PRIMARY_MODEL],
+    )
 
     return dictResult
 
@@ -848,6 +1106,22 @@ def extract_appt_time(text: str, tz: str = "America/Los_Angeles") -> dict:
     if not (text or "").strip():
         return {"iso": "", "confidence": 0, "window": "", "classification": "NO_INTENT", "reason": "Empty text"}
 
+    # Short, unambiguous replies ("Wednesday at 4", "ok thanks") are handled by
+    # local rules with the same date/hours logic; everything else goes to GPT.
+    t0 = time.monotonic()
+    if appt_parser.APPT_FASTPATH_ENABLED:
+        fast = appt_parser.fast_extract_appt_time(text, tz=tz)
+        if fast is not None:
+            out = _validate_extraction(fast["iso"], fast["confidence"], fast["window"], fast["classification"], fast["reason"])
+            appt_parser.record("rules", time.monotonic() - t0)
+            return out
+
+    out = _extract_appt_time_gpt(text, tz)
+    appt_parser.record("gpt", time.monotonic() - t0)
+    return out
+
+
+def _extract_appt_time_gpt(text: str, tz: str) -> dict:
     # The system prompt below has been optimized to address the case where the user proposes a specific date and time (e.g., "Today at 18:30 works"),
     # and ensure that the classification is set to "EXACT_TIME" (not "NO_INTENT") if the message contains a *proposed* appointment, even if phrased as a confirmation.
     # This prevents "NO_INTENT" misclassification for valid scheduling scenarios, as asked in the instruction.
@@ -947,7 +1221,8 @@ def extract_appt_time(text: str, tz: str = "America/Los_Angeles") -> dict:
     model_used, resp = chat_complete_with_fallback(
         [system, user],
         want_json=True,
-        temperature=0.6
+        temperature=0.6,
+        caller="gpt.extract_appt_time",
     )
     text_out = _safe_extract_text(resp)
     try:
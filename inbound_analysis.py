@@ -0,0 +1,368 @@
+# inbound_analysis.py
+# One structured LLM call per inbound customer reply, replacing the serial
+# reply-gate -> extract_appt_time round-trips on the webhook path so the
+# reply-generation call (run_gpt) can start right after it.
+#
+# The call returns, as one JSON object:
+#   gate        can Patti auto-reply?   (same shape as patti_triage.gpt_reply_gate)
+#   opt_out     explicit request to stop contact
+#   scheduling  intent + ISO             (same schema as gpt.extract_appt_time)
+#   entities    vehicle / trade-in / phone / questions
+#
+# Each section is validated on its own. A missing or malformed section falls
+# back to the existing single-purpose call for that field only. The call is
+# made lazily, on the first field that actually needs a model, so a reply the
+# triage rules decide costs only the extraction call it needed anyway.
+#
+#   INBOUND_ANALYSIS   "0" to use the serial gate + extract_appt_time calls
+#
+# Inbound-to-reply latency is recorded per mode ("combined" / "serial"), see
+# reply_latency_stats(). Offline before/after comparison (needs OPENAI_API_KEY):
+#
+#   python inbound_analysis.py [repeat]    # median / p95 of the pre-reply phase
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from conversation_history import history_text
+
+log = logging.getLogger("patti.inbound_analysis")
+
+INBOUND_ANALYSIS_ENABLED = os.getenv("INBOUND_ANALYSIS", "1").strip().lower() not in ("0", "false", "no")
+
+SCHEDULING_CLASSES = {
+    "EXACT_TIME", "VAGUE_DATE", "VAGUE_WINDOW", "OPEN_ENDED", "MULTI_OPTION", "RESCHEDULE", "NO_INTENT",
+}
+_ENTITY_FIELDS = ("vehicle", "trade_in", "phone")
+
+# Static instructions first (provider prefix cache), per-lead data in the user turn.
+_SYSTEM_PROMPT = """
+You analyze one inbound customer message for Patti, a dealership assistant, and
+return ONE JSON object. Be literal; never guess facts that are not in the text.
+
+1) gate - can Patti reply truthfully and completely using ONLY what she has?
+   Patti has NO inventory access (availability, options, trims, holds), NO vehicle
+   history (accidents, title, owners, service), LIMITED pricing (no negotiation,
+   OTD, discounts, fees, finance approvals, payoff). She CAN schedule, give
+   location/hours, and ask one clarifying question.
+   can_auto_reply=false if the message needs verification or dealership-only data,
+   is multi-part, ambiguous, upset/angry, or needs a nuanced human response.
+
+2) opt_out - true ONLY if the customer explicitly asks to stop being contacted
+   (unsubscribe, stop emailing/texting, remove me). "Not interested right now" is false.
+
+3) scheduling - the customer's *proposed* appointment, using Timezone and Now Local ISO.
+   Weekdays resolve to the nearest upcoming occurrence ("this"/no qualifier); "tomorrow",
+   "today", "this weekend" are relative to Now Local ISO; "weekend" alone is vague.
+   Business hours: Mon-Fri 09:00-19:00, Sat 09:00-20:00, Sun 10:00-18:00.
+   classification: EXACT_TIME (date AND time within hours) | VAGUE_DATE | VAGUE_WINDOW |
+   MULTI_OPTION | RESCHEDULE | OPEN_ENDED | NO_INTENT.
+   iso: ISO8601 with offset for EXACT_TIME, otherwise "".
+   confidence: clear EXACT_TIME > 0.9, vague < 0.6, out-of-hours/unclear < 0.7, NO_INTENT 1.0.
+   window: exact | morning | afternoon | evening | "".
+
+4) entities - only what the customer wrote: vehicle, trade_in, phone ("" if absent),
+   questions (list of the customer's direct questions, short).
+
+Return JSON ONLY, exactly:
+{
+  "gate": {"can_auto_reply": true/false, "confidence": 0.0, "reason": "short"},
+  "opt_out": true/false,
+  "scheduling": {"classification": "...", "iso": "", "confidence": 0.0, "window": "", "reason": "short"},
+  "entities": {"vehicle": "", "trade_in": "", "phone": "", "questions": []}
+}
+""".strip()
+
+_HISTORY_CLIP = 6000
+
+_latency_lock = threading.Lock()
+_latency: Dict[str, deque] = {}
+_LATENCY_WINDOW = 2000
+
+
+def _conf(v: Any) -> Optional[float]:
+    if isinstance(v, bool):
+        return None
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return f if 0.0 <= f <= 1.0 else None
+
+
+def _validate_gate(v: Any) -> Optional[Dict[str, Any]]:
+    if not isinstance(v, dict) or not isinstance(v.get("can_auto_reply"), bool):
+        return None
+    conf = _conf(v.get("confidence"))
+    if conf is None:
+        return None
+    return {"can_auto_reply": v["can_auto_reply"], "confidence": conf, "reason": str(v.get("reason") or "").strip()}
+
+
+def _validate_scheduling(v: Any) -> Optional[Dict[str, Any]]:
+    if not isinstance(v, dict):
+        return None
+    cls = str(v.get("classification") or "").strip().upper()
+    conf = _conf(v.get("confidence"))
+    if cls not in SCHEDULING_CLASSES or conf is None:
+        return None
+    iso = str(v.get("iso") or "").strip()
+    if iso:
+        try:
+            dt = datetime.fromisoformat(iso.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if dt.tzinfo is None:
+            return None
+    elif cls == "EXACT_TIME":
+        return None
+    window = str(v.get("window") or "").strip().lower()
+    return {"classification": cls, "iso": iso, "confidence": conf, "window": window,
+            "reason": str(v.get("reason") or "").strip()}
+
+
+def _validate_entities(v: Any) -> Dict[str, Any]:
+    v = v if isinstance(v, dict) else {}
+    out: Dict[str, Any] = {k: str(v.get(k) or "").strip() for k in _ENTITY_FIELDS}
+    qs = v.get("questions")
+    out["questions"] = [str(q).strip() for q in qs if str(q).strip()] if isinstance(qs, list) else []
+    return out
+
+
+def validate_analysis(data: Any) -> Dict[str, Any]:
+    """
+    Per-section schema check of the model output. Invalid sections come back
+    as None (gate, opt_out, scheduling) so the caller can fall back per field;
+    entities degrade to empty values.
+    """
+    data = data if isinstance(data, dict) else {}
+    opt_out = data.get("opt_out")
+    return {
+        "gate": _validate_gate(data.get("gate")),
+        "opt_out": opt_out if isinstance(opt_out, bool) else None,
+        "scheduling": _validate_scheduling(data.get("scheduling")),
+        "entities": _validate_entities(data.get("entities")),
+    }
+
+
+def _analysis_llm(messages: List[Dict[str, str]]) -> Any:
+    from gpt import chat_complete_with_fallback, _safe_extract_text
+
+    _, resp = chat_complete_with_fallback(messages, want_json=True, temperature=0, caller="inbound_analysis")
+    return json.loads(_safe_extract_text(resp) or "{}")
+
+
+def format_history(previous: str, latest: str) -> str:
+    """Same layout send_thread_reply_now has always sent to extract_appt_time."""
+    return f"""
+        User (earlier) :
+        {previous if previous else "None"}
+
+        User (most recent message):
+        {latest}
+        """
+
+
+def conversation_history_for(conversation_id: str, latest: str) -> str:
+    """Earlier inbound messages of the conversation (Airtable) + the latest one."""
+    from airtable_store import _find_conversation_by_conversation_id, _get_messages_for_conversation
+
+    conv_id = _find_conversation_by_conversation_id(conversation_id=conversation_id)
+    earlier = []
+    for conv in _get_messages_for_conversation(conversation_id=conv_id, direction="inbound"):
+        fields = conv.get("fields", {})
+        body_text = fields.get("body_text", "") or fields.get("body_html", "")
+        if body_text:
+            earlier.append({"role": "user", "content": body_text})
+    # quoted replies/signatures stripped, older messages summarized past the budget
+    return format_history(history_text(earlier), latest)
+
+
+class InboundAnalysis:
+    """
+    Lazily-run combined analysis of one inbound message.
+
+    text        the latest customer message (what triage looks at)
+    history_fn  returns the conversation history used for scheduling; only
+                called when the combined call (or its fallback) actually runs
+    """
+
+    def __init__(
+        self,
+        text: str,
+        *,
+        history_fn: Optional[Callable[[], str]] = None,
+        tz: str = "America/Los_Angeles",
+        llm: Optional[Callable[[List[Dict[str, str]]], Any]] = None,
+    ):
+        self.text = (text or "").strip()
+        self.tz = tz
+        self.started_at = time.monotonic()
+        self.fallbacks: List[str] = []
+        self._history_fn = history_fn
+        self._history: Optional[str] = None
+        self._llm = llm or _analysis_llm
+        self._data: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def matches(self, text: str) -> bool:
+        return re.sub(r"\s+", " ", (text or "")).strip() == re.sub(r"\s+", " ", self.text)
+
+    @property
+    def ran(self) -> bool:
+        return self._data is not None
+
+    def history(self) -> str:
+        if self._history is None:
+            try:
+                self._history = self._history_fn() if self._history_fn else format_history("", self.text)
+            except Exception as e:
+                log.warning("inbound history fetch failed: %s", e)
+                self._history = format_history("", self.text)
+        return self._history
+
+    def _result(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._data is not None:
+                return self._data
+            now_local = datetime.now(ZoneInfo(self.tz))
+            user = (
+                f"Timezone: {self.tz}\n"
+                f"Now Local ISO: {now_local.isoformat()}\n"
+                f"Conversation History:\n{self.history().strip()[-_HISTORY_CLIP:]}"
+            )
+            t0 = time.monotonic()
+            try:
+                raw = self._llm([
+                    {"role": "system", "content": _SYSTEM_PROMPT},
+                    {"role": "user", "content": user},
+                ])
+            except Exception as e:
+                log.warning("inbound analysis call failed, falling back per field: %s", e)
+                raw = None
+            self._data = validate_analysis(raw)
+            log.info(
+                "inbound analysis %.0fms gate=%s opt_out=%s scheduling=%s",
+                (time.monotonic() - t0) * 1000.0,
+                self._data["gate"] is not None,
+                self._data["opt_out"],
+                (self._data["scheduling"] or {}).get("classification"),
+            )
+            return self._data
+
+    def gate(self, _text: str = "") -> Dict[str, Any]:
+        """Reply-gate verdict; drop-in gate_fn for classify_inbound_email."""
+        from patti_triage import apply_gate_threshold, gpt_reply_gate
+
+        g = self._result()["gate"]
+        if g is None:
+            self.fallbacks.append("gate")
+            return gpt_reply_gate(self.text)
+        return apply_gate_threshold(g)
+
+    def triage(self, *, provider_template: bool = False) -> Dict[str, Any]:
+        """classify_inbound_email with the combined call standing in for the gate."""
+        from patti_triage import classify_inbound_email
+
+        triage = classify_inbound_email(self.text, provider_template=provider_template, gate_fn=self.gate)
+        cls = (triage.get("classification") or "").upper()
+        # only consult the model's opt-out when the call already ran for the gate
+        if self.ran and self._data["opt_out"] is True and cls in ("AUTO_REPLY_SAFE", "HUMAN_REVIEW_REQUIRED"):
+            return {"classification": "EXPLICIT_OPTOUT", "confidence": 0.9,
+                    "reason": "Opt-out request (inbound analysis)."}
+        return triage
+
+    def appt_time(self) -> Dict[str, Any]:
+        """Same result as gpt.extract_appt_time(history, tz)."""
+        import gpt
+
+        s = self._result()["scheduling"]
+        if s is None:
+            self.fallbacks.append("scheduling")
+            return gpt.extract_appt_time(self.history(), tz=self.tz)
+        return gpt._validate_extraction(s["iso"], s["confidence"], s["window"], s["classification"], s["reason"])
+
+    def entities(self) -> Dict[str, Any]:
+        return self._result()["entities"]
+
+
+def record_reply_latency(mode: str, elapsed_s: float) -> None:
+    """mode = 'combined' | 'serial'; inbound received -> reply body ready."""
+    with _latency_lock:
+        _latency.setdefault(mode, deque(maxlen=_LATENCY_WINDOW)).append(elapsed_s)
+
+
+def _percentile(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    i = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return sorted_vals[i]
+
+
+def reply_latency_stats() -> Dict[str, Dict[str, float]]:
+    """{mode: {n, median_ms, p95_ms}} over the last _LATENCY_WINDOW replies."""
+    with _latency_lock:
+        snap = {k: sorted(v) for k, v in _latency.items()}
+    return {
+        mode: {
+            "n": len(vals),
+            "median_ms": _percentile(vals, 0.5) * 1000.0,
+            "p95_ms": _percentile(vals, 0.95) * 1000.0,
+        }
+        for mode, vals in snap.items()
+    }
+
+
+def compare_pre_reply_latency(texts: List[str], repeat: int = 1) -> Dict[str, Dict[str, float]]:
+    """
+    Time everything send_thread_reply_now does before run_gpt, per message:
+    serial (classify_inbound_email + extract_appt_time) vs combined analysis.
+    Needs OPENAI_API_KEY; reply generation itself is identical in both modes.
+    """
+    import gpt
+    from patti_triage import classify_inbound_email
+
+    samples: Dict[str, List[float]] = {"serial": [], "combined": []}
+    agree = 0
+    for _ in range(repeat):
+        for text in texts:
+            history = format_history("", text)
+            t0 = time.monotonic()
+            classify_inbound_email(text)
+            serial = gpt.extract_appt_time(history)
+            samples["serial"].append(time.monotonic() - t0)
+
+            t0 = time.monotonic()
+            a = InboundAnalysis(text)
+            a.triage()
+            combined = a.appt_time()
+            samples["combined"].append(time.monotonic() - t0)
+            agree += serial["classification"] == combined["classification"]
+
+    out = {}
+    for mode, vals in samples.items():
+        vals.sort()
+        out[mode] = {"n": len(vals), "median_ms": _percentile(vals, 0.5) * 1000.0,
+                     "p95_ms": _percentile(vals, 0.95) * 1000.0}
+    out["scheduling_agreement"] = {"share": agree / max(1, len(samples["serial"]))}
+    return out
+
+
+if __name__ == "__main__":
+    import sys
+    from verify_scheduling import TEST_CASES
+
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    res = compare_pre_reply_latency([t for t, _ in TEST_CASES], repeat=repeat)
+    for mode in ("serial", "combined"):
+        st = res[mode]
+        print(f"{mode:<9} n={st['n']:<4} median={st['median_ms']:7.0f}ms  p95={st['p95_ms']:7.0f}ms")
+    print(f"scheduling classification agreement: {res['scheduling_agreement']['share']:.0%}")
@@ -0,0 +1,429 @@
+# inbound_queue.py
+# Durable inbound queue for webhook payloads (at-least-once processing).
+#
+# web_app appends the normalized inbound dict here before answering the
+# webhook, so nothing is lost if the worker restarts mid-processing.
+# Consumers lease one entry at a time: a leased entry that isn't acked within
+# the visibility timeout (worker died) becomes available again. While a handler
+# runs, a heartbeat keeps extending its lease, and ack/nack only land while the
+# lease is still the consumer's own (same worker and attempt), so a consumer
+# whose lease expired anyway can't finish an entry someone else re-leased.
+# Failed entries are retried with exponential backoff and dead-lettered after
+# INBOUND_MAX_ATTEMPTS. Handlers are registered per kind (the webhook name).
+#
+# Entries may carry a conversation key (customer phone, email thread). Entries
+# with the same key run strictly in order, one at a time, across every worker
+# and process; different keys run in parallel on the pool. Kinds registered
+# with a coalesce function also merge consecutive queued entries of one
+# conversation into a single handler call (two quick texts -> one reply).
+#
+# SQLite in WAL mode, shared by every gunicorn worker on the host; put
+# INBOUND_QUEUE_PATH on a persistent disk.
+#
+#   INBOUND_QUEUE_PATH     sqlite file (default /tmp/patti_inbound_queue.sqlite3)
+#   INBOUND_VISIBILITY_S   lease length before an unacked entry is retried (default 300)
+#   INBOUND_MAX_ATTEMPTS   attempts before dead-lettering (default 3)
+#   INBOUND_RETRY_BASE_S   first retry delay, doubled per attempt (default 30)
+#   INBOUND_MAX_PENDING    ready+leased entries before webhooks answer 429 (default 500)
+#   INBOUND_KEEP_DONE_H    hours to keep processed entries for replay (default 72)
+#   INBOUND_SWEEPER        0 = web_app doesn't start the background sweeper (default 1)
+#   INBOUND_COALESCE_MAX   max queued entries merged into one call; 1 = no coalescing (default 5)
+#
+#   python inbound_queue.py stats
+#   python inbound_queue.py list [ready|leased|done|dead] [limit]
+#   python inbound_queue.py show ID
+#   python inbound_queue.py replay ID     # run it again through its handler, synchronously
+#   python inbound_queue.py requeue ID    # dead/done -> ready
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+log = logging.getLogger("patti.inbound_queue")
+
+INBOUND_QUEUE_PATH = os.getenv("INBOUND_QUEUE_PATH", "/tmp/patti_inbound_queue.sqlite3")
+INBOUND_VISIBILITY_S = float(os.getenv("INBOUND_VISIBILITY_S", "300"))
+INBOUND_MAX_ATTEMPTS = int(os.getenv("INBOUND_MAX_ATTEMPTS", "3"))
+INBOUND_RETRY_BASE_S = float(os.getenv("INBOUND_RETRY_BASE_S", "30"))
+INBOUND_MAX_PENDING = int(os.getenv("INBOUND_MAX_PENDING", "500"))
+INBOUND_KEEP_DONE_S = float(os.getenv("INBOUND_KEEP_DONE_H", "72")) * 3600.0
+INBOUND_COALESCE_MAX = max(1, int(os.getenv("INBOUND_COALESCE_MAX", "5")))
+
+_SWEEP_S = 5.0
+_PRUNE_EVERY_S = 600.0
+
+_local = threading.local()
+_handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+_coalescers: Dict[str, Callable[[List[Dict[str, Any]]], Dict[str, Any]]] = {}
+_worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def _conn() -> sqlite3.Connection:
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(INBOUND_QUEUE_PATH)
+    if conn is not None:
+        return conn
+    conn = sqlite3.connect(INBOUND_QUEUE_PATH, timeout=10.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS inbound_queue ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, payload TEXT NOT NULL,"
+        " status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,"
+        " available_at REAL NOT NULL, lease_until REAL, leased_by TEXT,"
+        " created_at REAL NOT NULL, updated_at REAL NOT NULL, last_error TEXT,"
+        " conv_key TEXT NOT NULL DEFAULT '', merged_into INTEGER)"
+    )
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(inbound_queue)")}
+    for col, ddl in (("conv_key", "TEXT NOT NULL DEFAULT ''"), ("merged_into", "INTEGER")):
+        if col not in cols:
+            conn.execute(f"ALTER TABLE inbound_queue ADD COLUMN {col} {ddl}")
+    conn.execute("CREATE INDEX IF NOT EXISTS inbound_queue_conv ON inbound_queue(conv_key, status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS inbound_queue_status ON inbound_queue(status, available_at)")
+    conns[INBOUND_QUEUE_PATH] = conn
+    return conn
+
+
+def register(
+    kind: str,
+    handler: Callable[[Dict[str, Any]], Any],
+    coalesce: Optional[Callable[[List[Dict[str, Any]]], Dict[str, Any]]] = None,
+) -> None:
+    """
+    handler(payload) processes one entry; raising marks the attempt failed.
+    coalesce(payloads) -> payload merges consecutive queued entries of one
+    conversation (oldest first) into the payload for a single handler call.
+    """
+    _handlers[kind] = handler
+    if coalesce is not None:
+        _coalescers[kind] = coalesce
+    else:
+        _coalescers.pop(kind, None)
+
+
+def enqueue(kind: str, payload: Dict[str, Any], conv_key: str = "") -> int:
+    """conv_key: entries sharing it are processed one at a time, in enqueue order ("" = unordered)."""
+    now = time.time()
+    cur = _conn().execute(
+        "INSERT INTO inbound_queue(kind, payload, status, available_at, created_at, updated_at, conv_key)"
+        " VALUES (?, ?, 'ready', ?, ?, ?, ?)",
+        (kind, json.dumps(payload, ensure_ascii=False, default=str), now, now, now, conv_key or ""),
+    )
+    return int(cur.lastrowid)
+
+
+def pending() -> int:
+    (n,) = _conn().execute("SELECT COUNT(*) FROM inbound_queue WHERE status IN ('ready', 'leased')").fetchone()
+    return int(n)
+
+
+# due, and not queued behind an unfinished entry of its own conversation
+_DUE_WHERE = (
+    "((status = 'ready' AND available_at <= ?) OR (status = 'leased' AND lease_until < ?))"
+    " AND (conv_key = '' OR NOT EXISTS (SELECT 1 FROM inbound_queue o WHERE o.conv_key = q.conv_key"
+    " AND o.id < q.id AND o.status IN ('ready', 'leased')))"
+)
+
+
+def due() -> int:
+    """Entries a consumer could lease right now."""
+    now = time.time()
+    (n,) = _conn().execute(f"SELECT COUNT(*) FROM inbound_queue q WHERE {_DUE_WHERE}", (now, now)).fetchone()
+    return int(n)
+
+
+Leased = Tuple[int, str, Dict[str, Any], int, List[Tuple[int, Dict[str, Any], int]]]
+
+
+def lease(visibility_s: Optional[float] = None) -> Optional[Leased]:
+    """
+    Atomically take the oldest available entry:
+    (id, kind, payload, attempt_no, merged) or None. merged lists the
+    (id, payload, attempt_no) of later queued entries of the same conversation
+    leased along with it for coalescing (empty unless the kind has a coalesce function).
+    """
+    conn = _conn()
+    now = time.time()
+    lease_until = now + (INBOUND_VISIBILITY_S if visibility_s is None else visibility_s)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT id, kind, payload, attempts, status, conv_key FROM inbound_queue q"
+            f" WHERE {_DUE_WHERE} ORDER BY id LIMIT 1",
+            (now, now),
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        entry_id, kind, payload, attempts, status, conv_key = row
+        if status == "leased":
+            log.warning("inbound_queue: lease expired id=%s kind=%s attempt=%s; retrying", entry_id, kind, attempts)
+        merged: List[Tuple[int, Dict[str, Any], int]] = []
+        if conv_key and kind in _coalescers and INBOUND_COALESCE_MAX > 1:
+            following = conn.execute(
+                "SELECT id, kind, payload, status, attempts FROM inbound_queue WHERE conv_key = ? AND id > ?"
+                " AND status IN ('ready', 'leased') ORDER BY id LIMIT ?",
+                (conv_key, entry_id, INBOUND_COALESCE_MAX - 1),
+            ).fetchall()
+            for other_id, other_kind, other_payload, other_status, other_attempts in following:
+                if other_kind != kind or other_status != "ready":
+                    break
+                merged.append((other_id, json.loads(other_payload), other_attempts + 1))
+        ids = [entry_id] + [m[0] for m in merged]
+        conn.execute(
+            f"UPDATE inbound_queue SET status = 'leased', attempts = attempts + 1, lease_until = ?,"
+            f" leased_by = ?, updated_at = ? WHERE id IN ({','.join('?' * len(ids))})",
+            (lease_until, _worker_id, now, *ids),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return entry_id, kind, json.loads(payload), attempts + 1, merged
+
+
+# only while the lease taken as attempt_no is still this worker's
+_OWNED_WHERE = "id = ? AND status = 'leased' AND leased_by = ? AND attempts = ?"
+
+
+def ack(entry_id: int, merged_into: Optional[int] = None, attempt: Optional[int] = None) -> bool:
+    """
+    Mark an entry done. With attempt (the lease's attempt_no) it only lands while
+    that lease is still ours; without it (replay, admin) it is unconditional.
+    Returns False if the lease was lost.
+    """
+    q = ("UPDATE inbound_queue SET status = 'done', lease_until = NULL, updated_at = ?, last_error = NULL,"
+         " merged_into = ? WHERE ")
+    args: tuple = (time.time(), merged_into)
+    if attempt is None:
+        return _conn().execute(q + "id = ?", args + (entry_id,)).rowcount > 0
+    return _conn().execute(q + _OWNED_WHERE, args + (entry_id, _worker_id, attempt)).rowcount > 0
+
+
+def nack(entry_id: int, attempt: int, error: str, retry_no: Optional[int] = None) -> str:
+    """
+    Record a failed attempt of the lease taken as attempt: retry later with
+    backoff, or dead-letter. retry_no overrides attempt for that decision.
+    Returns the new status, or "lost" if the lease is no longer ours.
+    """
+    now = time.time()
+    n = attempt if retry_no is None else retry_no
+    if n >= INBOUND_MAX_ATTEMPTS:
+        status, available_at = "dead", now
+    else:
+        status, available_at = "ready", now + INBOUND_RETRY_BASE_S * (2 ** (n - 1))
+    cur = _conn().execute(
+        "UPDATE inbound_queue SET status = ?, available_at = ?, lease_until = NULL, updated_at = ?,"
+        f" last_error = ? WHERE {_OWNED_WHERE}",
+        (status, available_at, now, (error or "")[:2000], entry_id, _worker_id, attempt),
+    )
+    return status if cur.rowcount else "lost"
+
+
+def _extend(leases: List[Tuple[int, int]], visibility_s: float) -> bool:
+    """Push lease_until out on our (id, attempt_no) leases. False once the first one is lost."""
+    now = time.time()
+    owned = [
+        _conn().execute(
+            f"UPDATE inbound_queue SET lease_until = ?, updated_at = ? WHERE {_OWNED_WHERE}",
+            (now + visibility_s, now, entry_id, _worker_id, attempt),
+        ).rowcount > 0
+        for entry_id, attempt in leases
+    ]
+    return owned[0]
+
+
+@contextmanager
+def _heartbeat(leases: List[Tuple[int, int]], visibility_s: float):
+    """Keep the leases alive while the handler runs (a long LLM call outlasting the visibility timeout)."""
+    stop = threading.Event()
+
+    def _beat():
+        while not stop.wait(visibility_s / 3.0):
+            try:
+                if not _extend(leases, visibility_s):
+                    log.warning("inbound_queue: lease lost id=%s attempt=%s; stopping heartbeat", *leases[0])
+                    return
+            except Exception:
+                log.exception("inbound_queue: lease heartbeat failed id=%s", leases[0][0])
+
+    t = threading.Thread(target=_beat, name="inbound-queue-heartbeat", daemon=True)
+    t.start()
+    try:
+        yield
+    finally:
+        stop.set()
+
+
+def consume_one() -> Optional[str]:
+    """
+    Lease and process one entry. Returns its outcome (done/ready/dead, or lost if
+    the lease expired and someone else took the entry) or None if nothing was due.
+    """
+    item = lease()
+    if item is None:
+        return None
+    entry_id, kind, payload, attempt, merged = item
+    handler = _handlers.get(kind)
+    if handler is None:
+        log.error("inbound_queue: no handler for kind=%s id=%s; dead-lettering", kind, entry_id)
+        return nack(entry_id, attempt, f"no handler for {kind}", retry_no=INBOUND_MAX_ATTEMPTS)
+    try:
+        with _heartbeat([(entry_id, attempt)] + [(m[0], m[2]) for m in merged], INBOUND_VISIBILITY_S):
+            if merged:
+                log.info("inbound_queue: %s id=%s coalescing %d queued entries %s", kind, entry_id,
+                         len(merged), [m[0] for m in merged])
+                payload = _coalescers[kind]([payload] + [m[1] for m in merged])
+            handler(payload)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        status = nack(entry_id, attempt, error)
+        for other_id, _, other_attempt in merged:
+            # back in line behind entry_id; they coalesce again on its retry
+            nack(other_id, other_attempt, error, retry_no=1)
+        log.exception("inbound_queue: %s id=%s attempt=%d failed -> %s", kind, entry_id, attempt, status)
+        return status
+    if not ack(entry_id, attempt=attempt):
+        log.warning("inbound_queue: %s id=%s attempt=%d finished after its lease was lost; not acking",
+                    kind, entry_id, attempt)
+        return "lost"
+    for other_id, _, other_attempt in merged:
+        ack(other_id, merged_into=entry_id, attempt=other_attempt)
+    return "done"
+
+
+def prune() -> int:
+    return _conn().execute(
+        "DELETE FROM inbound_queue WHERE status = 'done' AND updated_at < ?",
+        (time.time() - INBOUND_KEEP_DONE_S,),
+    ).rowcount
+
+
+def start_sweeper(submit: Callable[[], bool], interval_s: float = _SWEEP_S) -> threading.Thread:
+    """
+    Background thread that hands due entries to consumers: retries whose backoff
+    elapsed, expired leases, and anything left behind by a restarted worker.
+    submit() queues one consume_one() call and returns False when consumers are full.
+    """
+    def _loop():
+        last_prune = 0.0
+        while threading.main_thread().is_alive():
+            try:
+                for _ in range(due()):
+                    if not submit():
+                        break
+                if time.monotonic() - last_prune > _PRUNE_EVERY_S:
+                    prune()
+                    last_prune = time.monotonic()
+            except Exception:
+                log.exception("inbound_queue sweeper failed")
+            time.sleep(interval_s)
+
+    t = threading.Thread(target=_loop, name="inbound-queue-sweeper", daemon=True)
+    t.start()
+    return t
+
+
+def stats() -> Dict[str, Any]:
+    rows = _conn().execute(
+        "SELECT kind, status, COUNT(*), MIN(created_at) FROM inbound_queue GROUP BY kind, status"
+    ).fetchall()
+    out: Dict[str, Any] = {"kinds": {}, "pending": 0, "dead": 0}
+    now = time.time()
+    for kind, status, n, oldest in rows:
+        k = out["kinds"].setdefault(kind, {})
+        k[status] = n
+        if status in ("ready", "leased"):
+            out["pending"] += n
+            k["oldest_pending_s"] = max(k.get("oldest_pending_s", 0.0), now - oldest)
+        elif status == "dead":
+            out["dead"] += n
+    return out
+
+
+def get(entry_id: int) -> Optional[Dict[str, Any]]:
+    row = _conn().execute(
+        "SELECT id, kind, payload, status, attempts, created_at, updated_at, last_error"
+        " FROM inbound_queue WHERE id = ?",
+        (entry_id,),
+    ).fetchone()
+    if not row:
+        return None
+    keys = ("id", "kind", "payload", "status", "attempts", "created_at", "updated_at", "last_error")
+    entry = dict(zip(keys, row))
+    entry["payload"] = json.loads(entry["payload"])
+    return entry
+
+
+def list_entries(status: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    q = "SELECT id, kind, status, attempts, created_at, last_error FROM inbound_queue"
+    args: tuple = ()
+    if status:
+        q += " WHERE status = ?"
+        args = (status,)
+    q += " ORDER BY id DESC LIMIT ?"
+    rows = _conn().execute(q, args + (limit,)).fetchall()
+    keys = ("id", "kind", "status", "attempts", "created_at", "last_error")
+    return [dict(zip(keys, r)) for r in rows]
+
+
+def requeue(entry_id: int) -> bool:
+    now = time.time()
+    return _conn().execute(
+        "UPDATE inbound_queue SET status = 'ready', attempts = 0, available_at = ?, lease_until = NULL,"
+        " updated_at = ? WHERE id = ?",
+        (now, now, entry_id),
+    ).rowcount > 0
+
+
+def replay(entry_id: int) -> None:
+    """Run a stored payload through its handler now (in this process); marks it done on success."""
+    entry = get(entry_id)
+    if entry is None:
+        raise KeyError(entry_id)
+    handler = _handlers.get(entry["kind"])
+    if handler is None:
+        raise KeyError(f"no handler registered for kind={entry['kind']}")
+    handler(entry["payload"])
+    ack(entry_id)
+
+
+def _main(argv: List[str]) -> int:
+    cmd = argv[0] if argv else "stats"
+    if cmd == "stats":
+        print(f"{INBOUND_QUEUE_PATH}")
+        print(json.dumps(stats(), indent=2))
+    elif cmd == "list":
+        status = argv[1] if len(argv) > 1 else None
+        limit = int(argv[2]) if len(argv) > 2 else 20
+        for e in list_entries(status, limit):
+            ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(e["created_at"]))
+            print(f"{e['id']:>7} {ts} {e['kind']:<26} {e['status']:<7} attempts={e['attempts']} {e['last_error'] or ''}"[:200])
+    elif cmd == "show" and len(argv) > 1:
+        print(json.dumps(get(int(argv[1])), indent=2, ensure_ascii=False))
+    elif cmd == "replay" and len(argv) > 1:
+        os.environ["INBOUND_SWEEPER"] = "0"  # replay only the requested entry
+        import web_app  # noqa: F401  (registers the webhook handlers)
+
+        replay(int(argv[1]))
+        print(f"replayed {argv[1]}")
+    elif cmd == "requeue" and len(argv) > 1:
+        print("requeued" if requeue(int(argv[1])) else "not found")
+    else:
+        print("usage: python inbound_queue.py [stats|list [status] [limit]|show ID|replay ID|requeue ID]")
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    raise SystemExit(_main(sys.argv[1:]))
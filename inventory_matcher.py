@@ -2,13 +2,83 @@
 # Drop-in recommender for Patti: parse OT inventory XML, extract interest from email text,
 # score vehicles, and format 1–2 recommendations.
 
+import hashlib
+import heapq
+import io
 import re
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import IO, Any, Dict, Iterator, List, Optional, Union
 import xml.etree.ElementTree as ET
 
-# ---------- 1) Minimal parser (same shape as earlier) ----------
+# ---------- 1) Streaming parser ----------
+# The OT VehicleInventory SOAP response can hold tens of thousands of <Result>
+# rows for an enterprise. We stream it with iterparse and drop each <Result>
+# subtree as soon as its record is built, so memory stays flat no matter how
+# large the feed is.
 _NS = {"t": "opentrack.dealertrack.com/transitional"}
+_T = "{" + _NS["t"] + "}"
+_RESULT_TAG = _T + "Result"
+
+# XML tag -> record key (scorer + formatter only read these)
+_VEHICLE_FIELDS = {
+    "CompanyNumber": "CompanyNumber",
+    "VIN": "VIN",
+    "StockNumber": "StockNumber",
+    "Status": "Status",                  # 'I' = in inventory
+    "TypeNU": "TypeNU",                  # 'N','U','T' (new/used/trade)
+    "ModelYear": "Year",
+    "Make": "Make",
+    "Model": "Model",
+    "Trim": "Trim",
+    "BodyStyle": "BodyStyle",
+    "Color": "Color",
+    "FuelType": "FuelType",
+    "Cylinders": "Cylinders",
+    "Odometer": "Odometer",
+    "DateInInventory": "DateInInventory",
+    "ListPrice": "ListPrice",
+    "VehicleCost": "VehicleCost",
+    "PublishVehicleInfoToWeb": "PublishToWeb",
+}
+
+_OPTIONAL_FIELD_TAGS = (
+    "OptionNumber", "Description", "FieldType", "AlphaFieldValue",
+    "NumericFieldValue", "DateFieldValue", "AddToCostFlag",
+)
+
+
+class Vehicle:
+    """
+    Compact inventory record. Supports dict-style .get()/[] so existing
+    callers that treated rows as dicts keep working.
+    OptionalFields/Options are None unless the parser was asked for them.
+    """
+    __slots__ = tuple(_VEHICLE_FIELDS.values()) + ("OptionalFields", "Options")
+
+    def __init__(self, **kw):
+        for k in self.__slots__:
+            setattr(self, k, kw.get(k))
+
+    def get(self, key, default=None):
+        if key not in self.__slots__:
+            return default
+        val = getattr(self, key)
+        return default if val is None else val
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and getattr(self, key) is not None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__ if getattr(self, k) is not None}
+
+    def __repr__(self):
+        return f"Vehicle(VIN={self.VIN!r}, {self.Year} {self.Make} {self.Model})"
+
 
 def _ymd(s: str):
     s = (s or "").strip()
@@ -24,57 +94,79 @@ def _ymd(s: str):
     except Exception:
         return s
 
-def parse_vehicle_inventory(xml_text: str) -> List[Dict[str, Any]]:
-    root = ET.fromstring(xml_text)
-    rows = []
-    for r in root.findall(".//t:Result", _NS):
-        def g(tag):
-            el = r.find(f"t:{tag}", _NS)
-            return (el.text or "").strip() if el is not None and el.text is not None else ""
-        # optional fields (kept but not used by scorer)
-        opt = []
-        for of in r.findall("t:OptionalFields/t:VehicleOptionalField", _NS):
-            def tx(name): 
-                el = of.find(f"t:{name}", _NS); 
-                return (el.text or "").strip() if el is not None and el.text else ""
-            opt.append({
-                "OptionNumber": tx("OptionNumber"),
-                "Description": tx("Description"),
-                "FieldType": tx("FieldType"),
-                "AlphaFieldValue": tx("AlphaFieldValue"),
-                "NumericFieldValue": tx("NumericFieldValue"),
-                "DateFieldValue": tx("DateFieldValue"),
-                "AddToCostFlag": tx("AddToCostFlag"),
-            })
-        opts = []
-        for op in r.findall("t:Options/t:VehicleOption", _NS):
-            def tx(name): 
-                el = op.find(f"t:{name}", _NS); 
-                return (el.text or "").strip() if el is not None and el.text else ""
-            opts.append({"OptionCode": tx("OptionCode"), "Description": tx("Description")})
-        rows.append({
-            "CompanyNumber": g("CompanyNumber"),
-            "VIN": g("VIN"),
-            "StockNumber": g("StockNumber"),
-            "Status": g("Status"),               # 'I' = in inventory
-            "TypeNU": g("TypeNU"),               # 'N','U','T' (new/used/trade)
-            "Year": g("ModelYear"),
-            "Make": g("Make"),
-            "Model": g("Model"),
-            "Trim": g("Trim"),
-            "BodyStyle": g("BodyStyle"),
-            "Color": g("Color"),
-            "FuelType": g("FuelType"),
-            "Cylinders": g("Cylinders"),
-            "Odometer": g("Odometer"),
-            "DateInInventory": _ymd(g("DateInInventory")),
-            "ListPrice": g("ListPrice"),
-            "VehicleCost": g("VehicleCost"),
-            "PublishToWeb": g("PublishVehicleInfoToWeb") in ("Y","y","1","true"),
-            "OptionalFields": opt,
-            "Options": opts,
-        })
-    return rows
+def _local(tag: str) -> str:
+    return tag[len(_T):] if tag.startswith(_T) else tag
+
+def _tx(el, name: str) -> str:
+    child = el.find(_T + name)
+    return (child.text or "").strip() if child is not None and child.text else ""
+
+def _vehicle_from_result(r, include_optional: bool, include_options: bool) -> Vehicle:
+    vals: Dict[str, Any] = {}
+    opt = None
+    opts = None
+    # single pass over the direct children instead of one find() per field
+    for child in r:
+        name = _local(child.tag)
+        key = _VEHICLE_FIELDS.get(name)
+        if key is not None:
+            if key not in vals:
+                vals[key] = (child.text or "").strip()
+        elif name == "OptionalFields" and include_optional:
+            opt = opt or []
+            for of in child.findall(_T + "VehicleOptionalField"):
+                opt.append({t: _tx(of, t) for t in _OPTIONAL_FIELD_TAGS})
+        elif name == "Options" and include_options:
+            opts = opts or []
+            for op in child.findall(_T + "VehicleOption"):
+                opts.append({"OptionCode": _tx(op, "OptionCode"), "Description": _tx(op, "Description")})
+
+    for key in _VEHICLE_FIELDS.values():
+        vals.setdefault(key, "")
+    vals["DateInInventory"] = _ymd(vals["DateInInventory"])
+    vals["PublishToWeb"] = vals["PublishToWeb"] in ("Y","y","1","true")
+    if include_optional:
+        vals["OptionalFields"] = opt or []
+    if include_options:
+        vals["Options"] = opts or []
+    return Vehicle(**vals)
+
+def _open_xml_source(source: Union[str, bytes, IO[bytes]]) -> IO[bytes]:
+    if isinstance(source, str):
+        return io.BytesIO(source.encode("utf-8"))
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return source  # already a binary file-like (open file, resp.raw, ...)
+
+def iter_vehicle_inventory(
+    source: Union[str, bytes, IO[bytes]],
+    include_optional: bool = False,
+    include_options: bool = False,
+) -> Iterator[Vehicle]:
+    """
+    Stream Vehicle records out of an OT VehicleInventory response.
+    `source` may be the XML text, raw bytes, or a binary file-like object.
+    Each <Result> element is detached from the tree once yielded.
+    """
+    parents = []
+    for event, el in ET.iterparse(_open_xml_source(source), events=("start", "end")):
+        if event == "start":
+            parents.append(el)
+            continue
+        parents.pop()
+        if el.tag != _RESULT_TAG:
+            continue
+        yield _vehicle_from_result(el, include_optional, include_options)
+        el.clear()
+        if parents:
+            parents[-1].remove(el)
+
+def parse_vehicle_inventory(
+    xml_text: Union[str, bytes, IO[bytes]],
+    include_optional: bool = False,
+    include_options: bool = False,
+) -> List[Vehicle]:
+    return list(iter_vehicle_inventory(xml_text, include_optional, include_options))
 
 # ---------- 2) Interest extraction from email text ----------
 _MAKES = [
@@ -94,7 +186,7 @@ _MAKE_ALIAS = {
 _BODY_SYNONYMS = {
     "SUV": {"SUV","CROSSOVER","CUV"},
     "TRUCK": {"TRUCK","PICKUP"},
-    "SEDAN": {"SEDAN","SALoon"},  # add more if needed
+    "SEDAN": {"SEDAN","SALOON"},  # add more if needed
     "COUPE": {"COUPE"},
     "VAN": {"VAN","MINIVAN"},
     "HATCHBACK": {"HATCH","HATCHBACK"},
@@ -106,46 +198,10 @@ def _norm(s: str) -> str:
 def _upper_clean(s: str) -> str:
     return re.sub(r"\s+", " ", (s or "").upper()).strip()
 
-def _find_years(txt: str) -> List[int]:
-    yrs = []
-    for m in re.finditer(r"\b(20\d{2}|19\d{2})\b", txt):
-        try:
-            y = int(m.group(1))
-            if 1980 <= y <= 2100:
-                yrs.append(y)
-        except:
-            pass
-    return yrs
-
-def _find_price(txt: str) -> Optional[float]:
-    # $30k, $30,000, under 25k, budget 18k, etc.
-    m = re.search(r"\$\s*([\d,]+(?:\.\d{1,2})?)\s*[kK]?", txt)
-    if m:
-        raw = m.group(1).replace(",", "")
-        try:
-            return float(raw)
-        except:
-            return None
-    m2 = re.search(r"\b(?:under|budget|max)\s+(\d{2,3})\s*[kK]\b", txt)
-    if m2:
-        return float(m2.group(1)) * 1000.0
-    return None
-
-def _find_make(txt_up: str) -> Optional[str]:
-    for mk in _MAKES:
-        key = _upper_clean(mk)
-        if key in txt_up:
-            return _MAKE_ALIAS.get(key, key)
-    # try collapsing spaces for aliases like LANDROVER
-    txt_collapsed = txt_up.replace(" ", "")
-    for alias, norm in _MAKE_ALIAS.items():
-        if alias == "LANDROVER" and "LANDROVER" in txt_collapsed:
-            return norm
-    return None
-
 def _find_model(candidate: str, after_make_segment: str) -> Optional[str]:
     """
     Heuristic: take first 1–2 tokens after the make that look like a model (letters/numbers).
+    Only used when the make has no known models in the matcher vocabulary.
     """
     toks = [t for t in re.split(r"[^A-Z0-9]+", after_make_segment.upper()) if t]
     if toks:
@@ -156,45 +212,190 @@ def _find_model(candidate: str, after_make_segment: str) -> Optional[str]:
                 return t
     return None
 
-def _find_body(txt_up: str) -> Optional[str]:
-    for canonical, words in _BODY_SYNONYMS.items():
-        for w in words:
-            if _upper_clean(w) in txt_up:
-                return canonical
-    return None
+# Word tokens plus "$30,000" / "$30k" price tokens, in one regex pass.
+_TOKEN_RE = re.compile(r"\$\s*(?P<price>\d[\d,]*(?:\.\d{1,2})?)\s*(?P<k>[kK]\b)?|(?P<word>[A-Za-z0-9]+)")
+_BUDGET_WORDS = {"UNDER", "BUDGET", "MAX", "BELOW"}
+_BUDGET_K_RE = re.compile(r"(\d{2,3})K")
+_TYPE_PHRASES = {
+    "CPO": "U", "CERTIFIED": "U", "CERTIFIED PRE OWNED": "U",
+    "USED": "U", "PRE OWNED": "U", "PREOWNED": "U",
+    "NEW": "N",
+}
+_END = "\0"
 
-def _find_type(txt_up: str) -> Optional[str]:
-    # 'N' for new, 'U' for used. Prefer specific words.
-    if re.search(r"\b(CPO|CERTIFIED PRE[- ]OWNED|CERTIFIED)\b", txt_up):
-        return "U"
-    if re.search(r"\bUSED|PRE[- ]OWNED\b", txt_up):
-        return "U"
-    if re.search(r"\bNEW\b", txt_up):
-        return "N"
-    return None
+def _phrase_tokens(s: str) -> List[str]:
+    return [w.upper() for w in re.findall(r"[A-Za-z0-9]+", s or "")]
+
+
+class InterestMatcher:
+    """
+    Token trie over the make/model/trim/body/type vocabulary. extract() walks the
+    text once, taking the longest phrase match at each token, and picks up year
+    and budget on the same pass.
+
+    Built from the static make list by default; InventoryIndex builds one from
+    the live inventory so every in-stock model/trim is recognized by name.
+    """
+
+    def __init__(self, vehicles=()):
+        self._trie: Dict[str, Any] = {}
+        self._model_makes: Dict[str, set] = {}
+        self._has_models: set = set()
+
+        for mk in _MAKES:
+            key = _upper_clean(mk)
+            self._add(key, ("make", _MAKE_ALIAS.get(key, key)))
+        for alias, canonical in _MAKE_ALIAS.items():
+            self._add(alias, ("make", canonical))
+        for canonical, words in _BODY_SYNONYMS.items():
+            for w in words:
+                self._add(w, ("body", canonical))
+        for phrase, t in _TYPE_PHRASES.items():
+            self._add(phrase, ("type", t))
+
+        for make, model, trim in vehicles:
+            make = _upper_clean(make)
+            model = _upper_clean(model)
+            if not make:
+                continue
+            self._add(make, ("make", _MAKE_ALIAS.get(make, make)))
+            if not model:
+                continue
+            self._has_models.add(make)
+            self._model_makes.setdefault(model, set()).add(make)
+            self._add(model, ("model", make, model))
+            toks = _phrase_tokens(model)
+            if len(toks) > 1:
+                # "CX-5" is also written "CX5"
+                self._add_tokens(["".join(toks)], ("model", make, model))
+            trim = _upper_clean(trim)
+            if trim:
+                self._add(trim, ("trim", make, model, trim))
 
-def extract_interest(email_text: str) -> Dict[str, Any]:
-    txt_up = _upper_clean(email_text)
-    yrs = _find_years(txt_up)
-    year = yrs[0] if yrs else None
-    mk = _find_make(txt_up)
-    model = None
-    if mk:
-        # attempt to grab model after first mention of make
-        idx = txt_up.find(mk)
-        if idx >= 0:
-            model = _find_model(mk, txt_up[idx+len(mk):])
-    body = _find_body(txt_up)
-    max_price = _find_price(email_text)
-    t = _find_type(txt_up)
-    return {
-        "year": year,           # int or None
-        "make": mk,             # "TOYOTA"
-        "model": model,         # "RAV4"
-        "body": body,           # "SUV"/"SEDAN"/...
-        "typeNU": t,            # "N" or "U" or None
-        "max_price": max_price  # float dollars or None
-    }
+    @classmethod
+    def from_rows(cls, rows) -> "InterestMatcher":
+        return cls((v.get("Make"), v.get("Model"), v.get("Trim")) for v in rows)
+
+    def _add(self, phrase: str, payload) -> None:
+        self._add_tokens(_phrase_tokens(phrase), payload)
+
+    def _add_tokens(self, toks: List[str], payload) -> None:
+        if not toks:
+            return
+        node = self._trie
+        for t in toks:
+            node = node.setdefault(t, {})
+        hits = node.setdefault(_END, [])
+        if payload not in hits:
+            hits.append(payload)
+
+    def extract(self, email_text: str) -> Dict[str, Any]:
+        words: List[str] = []    # upper-cased word tokens
+        titled: List[bool] = []  # written with a capital in the original text
+        price_dollars = None
+        price_budget = None
+        years: List[int] = []
+        hits = []                # (token position, payload)
+
+        for m in _TOKEN_RE.finditer(email_text or ""):
+            if m.group("price") is not None:
+                if price_dollars is None:
+                    try:
+                        price_dollars = float(m.group("price").replace(",", ""))
+                        if m.group("k"):
+                            price_dollars *= 1000.0
+                    except ValueError:
+                        pass
+                continue
+            w = m.group("word")
+            words.append(w.upper())
+            titled.append(w[:1].isupper())
+
+        trie = self._trie
+        n = len(words)
+        i = 0
+        while i < n:
+            node = trie
+            j = i
+            best_end, best = i, None
+            while j < n:
+                node = node.get(words[j])
+                if node is None:
+                    break
+                j += 1
+                if _END in node:
+                    best_end, best = j, node[_END]
+            if best is not None:
+                for payload in best:
+                    hits.append((i, payload))
+                i = best_end
+                continue
+
+            w = words[i]
+            if len(w) == 4 and w.isdigit() and w[:2] in ("19", "20"):
+                y = int(w)
+                if 1980 <= y <= 2100:
+                    years.append(y)
+            elif price_budget is None and i > 0 and words[i - 1] in _BUDGET_WORDS:
+                bm = _BUDGET_K_RE.fullmatch(w)
+                if bm:
+                    price_budget = float(bm.group(1)) * 1000.0
+            i += 1
+
+        return self._resolve(words, titled, hits, years, price_dollars if price_dollars is not None else price_budget)
+
+    def _resolve(self, words, titled, hits, years, max_price) -> Dict[str, Any]:
+        make_hit = next(((p, h[1]) for p, h in hits if h[0] == "make"), None)
+        make = make_hit[1] if make_hit else None
+
+        model_pos, model = None, None
+        for p, h in hits:
+            if h[0] != "model":
+                continue
+            if make and h[1] != make:
+                continue
+            # A bare dictionary word ("escape", "pilot") only counts as a model
+            # when the make is mentioned or the customer capitalized it.
+            if not make and h[2].isalpha() and not titled[p]:
+                continue
+            if not make and len(self._model_makes.get(h[2], ())) > 1:
+                continue
+            model_pos, model = p, h[2]
+            if not make:
+                make = _MAKE_ALIAS.get(h[1], h[1])
+            break
+
+        if make and model is None and make not in self._has_models and make_hit:
+            # make we have no inventory models for: fall back to the old heuristic
+            end = make_hit[0] + len(_phrase_tokens(make_hit[1]))
+            model = _find_model(make, " ".join(words[end:]))
+
+        trim = None
+        if model_pos is not None:
+            trim = next(
+                (h[3] for p, h in hits if h[0] == "trim" and p > model_pos and h[2] == model),
+                None,
+            )
+
+        body = next((h[1] for _, h in hits if h[0] == "body"), None)
+        types = {h[1] for _, h in hits if h[0] == "type"}
+        type_nu = "U" if "U" in types else ("N" if "N" in types else None)
+
+        return {
+            "year": years[0] if years else None,  # int or None
+            "make": make,             # "TOYOTA"
+            "model": model,           # "RAV4"
+            "trim": trim,             # "XLE" (only for known inventory trims)
+            "body": body,             # "SUV"/"SEDAN"/...
+            "typeNU": type_nu,        # "N" or "U" or None
+            "max_price": max_price,   # float dollars or None
+        }
+
+
+_DEFAULT_MATCHER = InterestMatcher()
+
+def extract_interest(email_text: str, matcher: Optional[InterestMatcher] = None) -> Dict[str, Any]:
+    return (matcher or _DEFAULT_MATCHER).extract(email_text)
 
 # ---------- 3) Scoring against inventory ----------
 def _price_to_float(v: str) -> Optional[float]:
@@ -264,15 +465,168 @@ def score_vehicle(v: Dict[str, Any], interest: Dict[str, Any]) -> float:
 
     return score
 
-def recommend_inventory(rows: List[Dict[str, Any]], email_text: str, k: int = 2) -> List[Dict[str, Any]]:
-    interest = extract_interest(email_text)
-    # Prefer in-stock only
-    scored = [(score_vehicle(v, interest), v) for v in rows]
-    # drop filtered/negative scores
-    scored = [x for x in scored if x[0] >= 0.0]
-    scored.sort(key=lambda x: x[0], reverse=True)
-    recs = [v for _, v in scored[:k]]
-    return recs
+# ---------- 3b) Precomputed inventory index ----------
+# score_vehicle re-normalizes every row on every lead. InventoryIndex does that
+# once per inventory snapshot: in-stock rows only, normalized columns, and
+# inverted indexes on make/model so most leads only score a small candidate
+# subset. Rankings are identical to sorting by score_vehicle (stable, desc).
+
+# Largest score a row can reach without the make/model terms:
+# PublishToWeb + TypeNU + body + exact year + under budget.
+_MAX_SCORE_WITHOUT_MAKE_MODEL = 0.25 + 1.0 + 1.0 + 1.5 + 1.0
+
+
+class InventoryIndex:
+    __slots__ = ("rows", "pos", "pub", "type_nu", "make", "model", "body", "year", "price",
+                 "by_make", "by_model", "matcher")
+
+    def __init__(self, rows: List[Any]):
+        self.rows = rows
+        # column arrays, one entry per in-stock row; pos[i] -> index into rows
+        self.pos: List[int] = []
+        self.pub: List[bool] = []
+        self.type_nu: List[Any] = []
+        self.make: List[str] = []
+        self.model: List[str] = []
+        self.body: List[str] = []
+        self.year: List[Optional[int]] = []
+        self.price: List[Optional[float]] = []
+        self.by_make: Dict[str, List[int]] = {}
+        self.by_model: Dict[str, List[int]] = {}
+
+        for p, v in enumerate(rows):
+            if v.get("Status") != "I":
+                continue  # score_vehicle returns -1.0, never recommended
+            i = len(self.pos)
+            make = _upper_clean(v.get("Make"))
+            model = _upper_clean(v.get("Model"))
+            self.pos.append(p)
+            self.pub.append(bool(v.get("PublishToWeb")))
+            self.type_nu.append(v.get("TypeNU"))
+            self.make.append(make)
+            self.model.append(model)
+            self.body.append(_upper_clean(v.get("BodyStyle")))
+            self.year.append(_year_to_int(v.get("Year")))
+            self.price.append(_price_to_float(v.get("ListPrice")))
+            self.by_make.setdefault(make, []).append(i)
+            self.by_model.setdefault(model, []).append(i)
+        # interest vocabulary = what is actually on the lot
+        self.matcher = InterestMatcher.from_rows(rows[p] for p in self.pos)
+
+    def __len__(self):
+        return len(self.pos)
+
+    def _candidates(self, interest: Dict[str, Any]) -> Optional[List[int]]:
+        """Rows that get make/model credit, or None when the lead names neither."""
+        want_make = interest.get("make")
+        want_model = interest.get("model")
+        if not want_make and not want_model:
+            return None
+        cand = set()
+        if want_make:
+            cand.update(self.by_make.get(want_make, ()))
+        if want_model:
+            for model, idxs in self.by_model.items():
+                if want_model in model:  # covers exact match too
+                    cand.update(idxs)
+        return sorted(cand)
+
+    def _scores(self, idxs, interest: Dict[str, Any]) -> List[float]:
+        """Same terms, same order as score_vehicle, over column arrays."""
+        n = len(idxs)
+        scores = [0.25 if self.pub[i] else 0.0 for i in idxs]
+
+        want_type = interest.get("typeNU")
+        if want_type in ("N", "U"):
+            col = self.type_nu
+            for j in range(n):
+                if col[idxs[j]] == want_type:
+                    scores[j] += 1.0
+
+        want_make = interest.get("make")
+        if want_make:
+            col = self.make
+            for j in range(n):
+                if col[idxs[j]] == want_make:
+                    scores[j] += 3.0
+
+        want_model = interest.get("model")
+        if want_model:
+            col = self.model
+            for j in range(n):
+                m = col[idxs[j]]
+                if m == want_model:
+                    scores[j] += 3.0
+                elif want_model in m:
+                    scores[j] += 1.5
+
+        want_body = interest.get("body")
+        if want_body:
+            col = self.body
+            for j in range(n):
+                if col[idxs[j]] == want_body:
+                    scores[j] += 1.0
+
+        want_year = interest.get("year")
+        if want_year:
+            col = self.year
+            for j in range(n):
+                y = col[idxs[j]]
+                if y:
+                    diff = abs(y - want_year)
+                    if diff == 0:
+                        scores[j] += 1.5
+                    elif diff == 1:
+                        scores[j] += 1.0
+                    elif diff == 2:
+                        scores[j] += 0.5
+                    else:
+                        scores[j] -= min(1.0, diff * 0.25)
+
+        max_price = interest.get("max_price")
+        if max_price:
+            col = self.price
+            for j in range(n):
+                p = col[idxs[j]]
+                if p:
+                    scores[j] += 1.0 if p <= max_price else -0.5
+        return scores
+
+    def _top(self, idxs, interest: Dict[str, Any], k: int) -> List[Any]:
+        scores = self._scores(idxs, interest)
+        # nlargest is documented as sorted(..., reverse=True)[:k], so ties keep
+        # inventory order exactly like the old full sort.
+        best = heapq.nlargest(
+            k,
+            (j for j in range(len(idxs)) if scores[j] >= 0.0),
+            key=lambda j: scores[j],
+        )
+        return [(scores[j], idxs[j]) for j in best]
+
+    def top_k(self, interest: Dict[str, Any], k: int = 2) -> List[Any]:
+        if k <= 0 or not self.pos:
+            return []
+        cand = self._candidates(interest)
+        if cand:
+            top = self._top(cand, interest, k)
+            # Rows outside the candidate set can't beat this bound; if the
+            # candidates fill k slots strictly above it the answer is exact.
+            if len(top) == k and top[-1][0] > _MAX_SCORE_WITHOUT_MAKE_MODEL:
+                return [self.rows[self.pos[i]] for _, i in top]
+        top = self._top(range(len(self.pos)), interest, k)
+        return [self.rows[self.pos[i]] for _, i in top]
+
+
+def build_inventory_index(rows: List[Any]) -> InventoryIndex:
+    return InventoryIndex(rows)
+
+def recommend_inventory(rows: Union[List[Any], InventoryIndex], email_text: str, k: int = 2) -> List[Any]:
+    """
+    Top-k in-stock vehicles for the lead text. Pass a prebuilt InventoryIndex
+    to reuse it across leads; a plain row list is indexed on the fly.
+    """
+    index = rows if isinstance(rows, InventoryIndex) else InventoryIndex(rows)
+    return index.top_k(extract_interest(email_text, index.matcher), k)
 
 # ---------- 4) Patti-friendly formatter ----------
 def format_recommendations(email_text: str, recs: List[Dict[str, Any]]) -> str:
@@ -299,7 +653,21 @@ def format_recommendations(email_text: str, recs: List[Dict[str, Any]]) -> str:
     return "\n".join(lines)
 
 # ---------- 5) End-to-end helper ----------
+# One inventory pull is shared by every lead in a run, so keep the index for
+# the most recent XML payload instead of re-parsing per lead.
+_INDEX_CACHE: Dict[str, InventoryIndex] = {}
+
+def _index_for_xml(xml_text: str) -> InventoryIndex:
+    raw = xml_text.encode("utf-8") if isinstance(xml_text, str) else xml_text
+    key = hashlib.blake2b(raw, digest_size=16).hexdigest()
+    index = _INDEX_CACHE.get(key)
+    if index is None:
+        index = InventoryIndex(parse_vehicle_inventory(raw))
+        _INDEX_CACHE.clear()
+        _INDEX_CACHE[key] = index
+    return index
+
 def recommend_from_xml(xml_text: str, customer_email_text: str, k: int = 2) -> str:
-    inv = parse_vehicle_inventory(xml_text)
-    recs = recommend_inventory(inv, customer_email_text, k=k)
+    index = _index_for_xml(xml_text)
+    recs = recommend_inventory(index, customer_email_text, k=k)
     return format_recommendations(customer_email_text, recs)
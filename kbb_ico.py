@@ -20,6 +20,7 @@ from fortellis import search_activities_by_opportunity
 from helpers import build_calendar_links
 import json, re
 from crm_logging import log_email_to_crm
+import phase_timing
 STATE_TAG = "[PATTI_KBB_STATE]"  # marker to find the state comment quickly
 
 import os
@@ -1276,6 +1277,9 @@ def _handle_optout(opportunity, state, optout_text, *, token, subscription_id):
 
 
 
+@phase_timing.timed_flow(
+    "kbb_ico", first="state", key=lambda opportunity, *a, **kw: opportunity.get("opportunityId") or opportunity.get("id"),
+)
 def process_kbb_ico_lead(
     opportunity,
     lead_age_days,
@@ -1466,6 +1470,7 @@ def process_kbb_ico_lead(
     reply_subject = "Re:"
     from helpers import build_kbb_ctx
     
+    phase_timing.mark("fetch_activities")
     kbb_ctx = build_kbb_ctx(opportunity)
 
     opp_id = opportunity.get("opportunityId") or opportunity.get("id")
@@ -1625,6 +1630,7 @@ def process_kbb_ico_lead(
                 return state, action_taken
 
 
+    phase_timing.mark("inbound")
     # --- Detect whether we have a NEW inbound to respond to ---
 
     if is_webhook:
@@ -1725,6 +1731,7 @@ def process_kbb_ico_lead(
             state["last_inbound_activity_id"] = last_inbound_activity_id
     
     # If we have new inbound, prepare reply subject/body context
+    phase_timing.mark("reply")
     if has_new_inbound:
         # Only re-fetch activities if we are in CRM mode and actually sent something new
         if (not is_webhook) and action_taken:
@@ -2347,6 +2354,7 @@ def process_kbb_ico_lead(
 
 
     # ===== NUDGE LOGIC (customer went dark AFTER a reply) =====
+    phase_timing.mark("nudge")
 
     # 🚫 HARD GATE: stop all automated nudges if human review is set
     if opportunity.get("needs_human_review") is True:
@@ -2473,6 +2481,7 @@ def process_kbb_ico_lead(
         return state, action_taken
         
     # ===== Still in cadence (never replied) =====
+    phase_timing.mark("cadence")
     state["mode"] = "cadence"
     
     # ------------------------------------------------------------
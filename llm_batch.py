@@ -0,0 +1,191 @@
+# llm_batch.py
+# Provider-agnostic batch generation for work that doesn't need a fast answer
+# (cadence follow-ups). Callers hand over a list of BatchRequest and get back
+# {custom_id: text}; anything a provider couldn't finish comes back as None.
+#
+#   LLM_BATCH_PROVIDER   local (default) | openai
+#   LLM_BATCH_WAIT_S     how long the openai provider waits for a batch (default 1800);
+#                        unfinished requests are cancelled and finished locally
+#   LLM_BATCH_WORKERS    concurrency of the local provider (default 4)
+#   LLM_BATCH_MODEL      model for the openai provider (default OPENAI_MODEL / gpt-4o)
+#
+# "local" runs the requests concurrently through gpt.chat_complete_with_fallback
+# at cadence priority; it is also the stand-in used by tests.
+
+import io
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+log = logging.getLogger("patti.llm_batch")
+
+LLM_BATCH_PROVIDER = (os.getenv("LLM_BATCH_PROVIDER") or "local").strip().lower()
+LLM_BATCH_WAIT_S = float(os.getenv("LLM_BATCH_WAIT_S", "1800"))
+LLM_BATCH_WORKERS = int(os.getenv("LLM_BATCH_WORKERS", "4"))
+LLM_BATCH_MODEL = (os.getenv("LLM_BATCH_MODEL") or os.getenv("OPENAI_MODEL") or "gpt-4o").strip()
+
+_POLL_S = 15.0
+_DONE_STATES = ("completed", "failed", "expired", "cancelled")
+
+
+@dataclass
+class BatchRequest:
+    custom_id: str
+    messages: List[Dict[str, str]]
+    temperature: float = 0.6
+    want_json: bool = True
+    tags: Dict[str, str] = field(default_factory=dict)   # telemetry tags (persona, rooftop)
+
+
+class BatchProvider(ABC):
+    """submit() starts the work and returns a handle; collect() blocks for results."""
+
+    name = "base"
+
+    @abstractmethod
+    def submit(self, requests: List[BatchRequest]):
+        ...
+
+    @abstractmethod
+    def collect(self, handle, timeout_s: float) -> Dict[str, Optional[str]]:
+        ...
+
+    def run(self, requests: List[BatchRequest], timeout_s: Optional[float] = None) -> Dict[str, Optional[str]]:
+        if not requests:
+            return {}
+        return self.collect(self.submit(requests), LLM_BATCH_WAIT_S if timeout_s is None else timeout_s)
+
+
+def _default_complete(req: BatchRequest) -> Optional[str]:
+    from gpt import _safe_extract_text, chat_complete_with_fallback
+    from llm_gateway import PRIORITY_CADENCE, llm_priority, llm_tags
+
+    with llm_priority(PRIORITY_CADENCE), llm_tags(**req.tags):
+        _, resp = chat_complete_with_fallback(
+            req.messages, want_json=req.want_json, temperature=req.temperature, caller="llm_batch.local",
+        )
+    return _safe_extract_text(resp)
+
+
+class LocalBatchProvider(BatchProvider):
+    """Runs the batch right away on a small thread pool. complete_fn(req) -> text."""
+
+    name = "local"
+
+    def __init__(self, complete_fn: Optional[Callable[[BatchRequest], Optional[str]]] = None, workers: Optional[int] = None):
+        self.complete_fn = complete_fn or _default_complete
+        self.workers = max(1, workers or LLM_BATCH_WORKERS)
+
+    def _one(self, req: BatchRequest) -> Optional[str]:
+        try:
+            return self.complete_fn(req)
+        except Exception as e:
+            log.warning("batch request failed id=%s err=%s", req.custom_id, e)
+            return None
+
+    def submit(self, requests: List[BatchRequest]):
+        pool = ThreadPoolExecutor(max_workers=min(self.workers, len(requests)), thread_name_prefix="llm-batch")
+        futures = {r.custom_id: pool.submit(self._one, r) for r in requests}
+        pool.shutdown(wait=False)
+        return futures
+
+    def collect(self, handle, timeout_s: float) -> Dict[str, Optional[str]]:
+        deadline = time.monotonic() + timeout_s
+        out = {}
+        for cid, fut in handle.items():
+            try:
+                out[cid] = fut.result(timeout=max(0.0, deadline - time.monotonic()))
+            except Exception:
+                out[cid] = None
+        return out
+
+
+class OpenAIBatchProvider(BatchProvider):
+    """OpenAI Batch API (/v1/chat/completions, 24h window) on the shared client."""
+
+    name = "openai"
+
+    def __init__(self, model: Optional[str] = None, poll_s: float = _POLL_S):
+        self.model = model or LLM_BATCH_MODEL
+        self.poll_s = poll_s
+
+    def _line(self, req: BatchRequest) -> str:
+        body = {"model": self.model, "messages": req.messages, "temperature": req.temperature}
+        if req.want_json:
+            body["response_format"] = {"type": "json_object"}
+        return json.dumps({"custom_id": req.custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body})
+
+    def submit(self, requests: List[BatchRequest]):
+        from llm_gateway import client
+
+        payload = "\n".join(self._line(r) for r in requests).encode("utf-8")
+        f = client().files.create(file=("cadence_batch.jsonl", io.BytesIO(payload)), purpose="batch")
+        batch = client().batches.create(input_file_id=f.id, endpoint="/v1/chat/completions", completion_window="24h")
+        log.info("openai batch submitted id=%s requests=%d", batch.id, len(requests))
+        return {"id": batch.id, "ids": [r.custom_id for r in requests]}
+
+    def collect(self, handle, timeout_s: float) -> Dict[str, Optional[str]]:
+        from llm_gateway import client
+
+        deadline = time.monotonic() + timeout_s
+        batch = client().batches.retrieve(handle["id"])
+        while batch.status not in _DONE_STATES and time.monotonic() < deadline:
+            time.sleep(min(self.poll_s, max(0.0, deadline - time.monotonic())))
+            batch = client().batches.retrieve(handle["id"])
+
+        if batch.status not in _DONE_STATES:
+            log.warning("openai batch id=%s still %s after %.0fs; cancelling", handle["id"], batch.status, timeout_s)
+            try:
+                client().batches.cancel(handle["id"])
+            except Exception as e:
+                log.warning("openai batch cancel failed id=%s err=%s", handle["id"], e)
+
+        out: Dict[str, Optional[str]] = {cid: None for cid in handle["ids"]}
+        file_id = getattr(batch, "output_file_id", None)
+        if file_id:
+            for line in client().files.content(file_id).text.splitlines():
+                try:
+                    row = json.loads(line)
+                    choices = (((row.get("response") or {}).get("body") or {}).get("choices")) or []
+                    out[row["custom_id"]] = (choices[0].get("message") or {}).get("content") if choices else None
+                except Exception:
+                    continue
+        log.info("openai batch id=%s status=%s done=%d/%d", handle["id"], batch.status,
+                 sum(1 for v in out.values() if v), len(out))
+        return out
+
+
+def get_provider(name: Optional[str] = None) -> BatchProvider:
+    name = (name or LLM_BATCH_PROVIDER or "local").lower()
+    if name == "openai":
+        return OpenAIBatchProvider()
+    return LocalBatchProvider()
+
+
+def run_batch(
+    requests: List[BatchRequest],
+    provider: Optional[BatchProvider] = None,
+    *,
+    fallback: Optional[BatchProvider] = None,
+    timeout_s: Optional[float] = None,
+) -> Dict[str, Optional[str]]:
+    """Run on `provider`; whatever it didn't return is retried on `fallback` (local by default)."""
+    provider = provider or get_provider()
+    t0 = time.monotonic()
+    try:
+        out = provider.run(requests, timeout_s)
+    except Exception as e:
+        log.warning("batch provider %s failed (%s); using fallback for all %d", provider.name, e, len(requests))
+        out = {}
+    missing = [r for r in requests if not out.get(r.custom_id)]
+    if missing and not isinstance(provider, LocalBatchProvider):
+        out.update((fallback or LocalBatchProvider()).run(missing, timeout_s))
+    log.info("batch done provider=%s requests=%d ok=%d retried=%d elapsed=%.1fs", provider.name, len(requests),
+             sum(1 for r in requests if out.get(r.custom_id)),
+             0 if isinstance(provider, LocalBatchProvider) else len(missing), time.monotonic() - t0)
+    return out
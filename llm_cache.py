@@ -0,0 +1,220 @@
+# llm_cache.py
+# Content-addressed result cache for deterministic LLM classifier calls
+# (reply gate, phone extraction, customer-message extraction, ...).
+#
+# Key = sha256(classifier name, model, prompt version, normalized input).
+# Backed by a local SQLite file in WAL mode, so every gunicorn worker / cron
+# process on the host shares it. Entries expire after a TTL and the table is
+# trimmed to a max row count (least recently hit first).
+#
+#   LLM_CACHE_PATH       sqlite file (default /tmp/patti_llm_cache.sqlite3)
+#   LLM_CACHE_DISABLE    "1" to bypass the cache entirely
+#   LLM_CACHE_TTL_HOURS  default TTL (default 168 = 7 days)
+#   LLM_CACHE_MAX_ROWS   size cap (default 50000)
+#
+#   python llm_cache.py stats     # per-classifier hit rate across processes
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+log = logging.getLogger("patti.llm_cache")
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "/tmp/patti_llm_cache.sqlite3")
+LLM_CACHE_DISABLE = os.getenv("LLM_CACHE_DISABLE", "0").strip().lower() in ("1", "true", "yes")
+LLM_CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_HOURS", "168")) * 3600.0
+LLM_CACHE_MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "50000"))
+
+# prune at most once every N writes per process
+_PRUNE_EVERY = 200
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+_writes = 0
+
+_WS_RE = re.compile(r"\s+")
+
+
+def prompt_version(*parts: str) -> str:
+    """Short hash of the prompt text, so editing a prompt invalidates its entries."""
+    h = hashlib.sha256()
+    for p in parts:
+        h.update((p or "").encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:12]
+
+
+def normalize_input(text: str) -> str:
+    return _WS_RE.sub(" ", (text or "")).strip()
+
+
+def cache_key(name: str, model: str, version: str, text: str) -> str:
+    raw = "\0".join([name, model or "", version or "", normalize_input(text)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+    conn = sqlite3.connect(LLM_CACHE_PATH, timeout=5.0)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS llm_cache ("
+        " key TEXT PRIMARY KEY, name TEXT NOT NULL, value TEXT NOT NULL,"
+        " created_at REAL NOT NULL, expires_at REAL NOT NULL, last_hit_at REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_hit ON llm_cache(last_hit_at)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS llm_cache_stats ("
+        " name TEXT PRIMARY KEY, hits INTEGER NOT NULL DEFAULT 0, misses INTEGER NOT NULL DEFAULT 0)"
+    )
+    conn.commit()
+    _local.conn = conn
+    return conn
+
+
+def _count(name: str, field: str) -> None:
+    with _stats_lock:
+        st = _stats.setdefault(name, {"hits": 0, "misses": 0})
+        st[field] += 1
+    try:
+        conn = _conn()
+        conn.execute(
+            f"INSERT INTO llm_cache_stats(name, {field}) VALUES (?, 1) "
+            f"ON CONFLICT(name) DO UPDATE SET {field} = {field} + 1",
+            (name,),
+        )
+        conn.commit()
+    except Exception as e:
+        log.debug("llm_cache stats write failed: %s", e)
+
+
+def _get(key: str) -> Optional[Any]:
+    conn = _conn()
+    now = time.time()
+    row = conn.execute(
+        "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+    ).fetchone()
+    if not row:
+        return None
+    value, expires_at = row
+    if expires_at < now:
+        conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+        conn.commit()
+        return None
+    conn.execute("UPDATE llm_cache SET last_hit_at = ? WHERE key = ?", (now, key))
+    conn.commit()
+    return json.loads(value)
+
+
+def _put(key: str, name: str, value: Any, ttl_s: float) -> None:
+    global _writes
+    conn = _conn()
+    now = time.time()
+    conn.execute(
+        "INSERT OR REPLACE INTO llm_cache(key, name, value, created_at, expires_at, last_hit_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (key, name, json.dumps(value, ensure_ascii=False), now, now + ttl_s, now),
+    )
+    conn.commit()
+    _writes += 1
+    if _writes % _PRUNE_EVERY == 0:
+        prune()
+
+
+def prune(max_rows: int = None) -> int:
+    """Drop expired rows, then the least recently hit rows above max_rows."""
+    max_rows = LLM_CACHE_MAX_ROWS if max_rows is None else max_rows
+    conn = _conn()
+    removed = conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),)).rowcount
+    (n,) = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+    if n > max_rows:
+        removed += conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            " SELECT key FROM llm_cache ORDER BY last_hit_at ASC LIMIT ?)",
+            (n - max_rows,),
+        ).rowcount
+    conn.commit()
+    return removed
+
+
+def cached_llm_call(
+    name: str,
+    text: str,
+    compute: Callable[[], Any],
+    *,
+    model: str = "",
+    version: str = "",
+    ttl_s: Optional[float] = None,
+    bypass: bool = False,
+    cache_if: Callable[[Any], bool] = lambda v: v is not None,
+) -> Any:
+    """
+    Return the cached result for (name, model, version, text) or run compute().
+    compute() must return a JSON-serializable value and should raise on failure
+    so error fallbacks never get cached. Only results passing cache_if are stored.
+    Cache errors are logged and never break the caller.
+    """
+    if bypass or LLM_CACHE_DISABLE:
+        return compute()
+
+    key = cache_key(name, model, version, text)
+    try:
+        hit = _get(key)
+    except Exception as e:
+        log.warning("llm_cache read failed name=%s: %s", name, e)
+        hit = None
+    if hit is not None:
+        _count(name, "hits")
+        log.debug("llm_cache HIT name=%s key=%s", name, key[:12])
+        return hit
+
+    _count(name, "misses")
+    value = compute()
+    if cache_if(value):
+        try:
+            _put(key, name, value, LLM_CACHE_TTL_S if ttl_s is None else ttl_s)
+        except Exception as e:
+            log.warning("llm_cache write failed name=%s: %s", name, e)
+    return value
+
+
+def cache_stats(shared: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    {classifier: {hits, misses, hit_rate}}. shared=True reads the totals
+    recorded by every process using the same cache file.
+    """
+    if shared:
+        rows = _conn().execute("SELECT name, hits, misses FROM llm_cache_stats").fetchall()
+        raw = {name: {"hits": h, "misses": m} for name, h, m in rows}
+    else:
+        with _stats_lock:
+            raw = {k: dict(v) for k, v in _stats.items()}
+    out = {}
+    for name, st in raw.items():
+        total = st["hits"] + st["misses"]
+        out[name] = {**st, "hit_rate": (st["hits"] / total) if total else 0.0}
+    return out
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if cmd == "stats":
+        (rows,) = _conn().execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        print(f"{LLM_CACHE_PATH}: {rows} entries")
+        for name, st in sorted(cache_stats(shared=True).items()):
+            print(f"{name:<36} hits={st['hits']:<7} misses={st['misses']:<7} hit_rate={st['hit_rate']:.1%}")
+    elif cmd == "prune":
+        print(f"removed {prune()} entries")
+    else:
+        print("usage: python llm_cache.py [stats|prune]")
@@ -0,0 +1,384 @@
+# llm_gateway.py
+# Single entry point for OpenAI chat calls from every module (gpt, triage,
+# sms/mazda/event brains, phone extraction).
+#
+# - one shared OpenAI client on a pooled keep-alive HTTP connection pool
+# - per-model request-per-minute and token-per-minute budgets (60s sliding window)
+# - a global in-flight cap
+# - a priority queue in front of all of the above: live replies
+#   (PRIORITY_LIVE, the default) are admitted before cadence follow-ups
+#   (PRIORITY_CADENCE, set with `with llm_priority(PRIORITY_CADENCE): ...`)
+# - per-caller latency / queue-wait / token metrics, see gateway_stats()
+# - every call is also handed to llm_telemetry (tokens, cost, retries, fallback
+#   hop, persona/rooftop tags set with `with llm_tags(persona=..., rooftop=...)`)
+#
+# Budgets are per process; size them for (limit / number of workers).
+#
+#   LLM_MAX_CONCURRENCY   in-flight requests per process (default 16)
+#   LLM_POOL_SIZE         HTTP keep-alive connections (default 20)
+#   LLM_DEFAULT_RPM       requests/min per model (default 500)
+#   LLM_DEFAULT_TPM       tokens/min per model (default 200000)
+#   LLM_RPM_LIMITS        per-model overrides, "gpt-4o=300,gpt-4o-mini=1000"
+#   LLM_TPM_LIMITS        per-model overrides, same format
+#   LLM_QUEUE_TIMEOUT_S   max wait for admission before LLMQueueTimeout (default 60)
+#   OPENAI_TIMEOUT        per-request timeout seconds (default 30)
+#   OPENAI_MAX_RETRIES    SDK retries on 429/5xx (default 2)
+
+import bisect
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import llm_telemetry
+import patti_metrics
+
+log = logging.getLogger("patti.llm_gateway")
+
+PRIORITY_LIVE = 0
+PRIORITY_CADENCE = 10
+
+
+def _limits(env: str) -> Dict[str, int]:
+    out = {}
+    for part in (os.getenv(env) or "").split(","):
+        model, _, n = part.partition("=")
+        if model.strip() and n.strip().isdigit():
+            out[model.strip()] = int(n)
+    return out
+
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+LLM_DEFAULT_RPM = int(os.getenv("LLM_DEFAULT_RPM", "500"))
+LLM_DEFAULT_TPM = int(os.getenv("LLM_DEFAULT_TPM", "200000"))
+LLM_RPM_LIMITS = _limits("LLM_RPM_LIMITS")
+LLM_TPM_LIMITS = _limits("LLM_TPM_LIMITS")
+LLM_QUEUE_TIMEOUT_S = float(os.getenv("LLM_QUEUE_TIMEOUT_S", "60"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+# completion tokens assumed when a call doesn't set max_tokens
+_EST_COMPLETION_TOKENS = 400
+_WINDOW_S = 60.0
+_LATENCY_SAMPLES = 500
+
+
+class LLMQueueTimeout(RuntimeError):
+    """The request could not be admitted within LLM_QUEUE_TIMEOUT_S."""
+
+
+_client_lock = threading.Lock()
+_client = None
+
+_cv = threading.Condition()
+_seq = itertools.count()
+_waiters: List[tuple] = []          # sorted (priority, seq, model, est_tokens)
+_in_flight = 0
+_budgets: Dict[str, "_ModelBudget"] = {}
+
+_prio = threading.local()
+_tags = threading.local()
+_http = threading.local()            # HTTP attempts of the current call (SDK retries)
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def available() -> bool:
+    return bool((os.getenv("OPENAI_API_KEY") or "").strip())
+
+
+def client():
+    """The shared OpenAI client (created on first use)."""
+    global _client
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is None:
+            from openai import OpenAI
+
+            kwargs = dict(
+                api_key=(os.getenv("OPENAI_API_KEY") or "").strip(),
+                timeout=OPENAI_TIMEOUT,
+                max_retries=OPENAI_MAX_RETRIES,
+            )
+            try:
+                import httpx
+                from openai import DefaultHttpxClient
+
+                kwargs["http_client"] = DefaultHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=LLM_POOL_SIZE,
+                        max_keepalive_connections=LLM_POOL_SIZE,
+                        keepalive_expiry=120,
+                    ),
+                    event_hooks={"request": [_count_http_attempt]},
+                )
+            except Exception:
+                pass  # older SDK: keep its default pool
+            _client = OpenAI(**kwargs)
+    return _client
+
+
+class _ModelBudget:
+    """RPM/TPM over a sliding 60s window for one model."""
+
+    def __init__(self, model: str):
+        self.rpm = LLM_RPM_LIMITS.get(model, LLM_DEFAULT_RPM)
+        self.tpm = LLM_TPM_LIMITS.get(model, LLM_DEFAULT_TPM)
+        self.window: deque = deque()   # [admitted_at, tokens]
+        self.tokens = 0
+
+    def _prune(self, now: float) -> None:
+        while self.window and now - self.window[0][0] >= _WINDOW_S:
+            self.tokens -= self.window.popleft()[1]
+
+    def fits(self, now: float, est: int) -> bool:
+        self._prune(now)
+        if len(self.window) >= self.rpm:
+            return False
+        # a single request bigger than the whole TPM budget still goes when the window is empty
+        return self.tokens + est <= self.tpm or not self.window
+
+    def next_change_in(self, now: float) -> float:
+        return max(0.01, _WINDOW_S - (now - self.window[0][0])) if self.window else 0.5
+
+    def take(self, now: float, est: int) -> list:
+        entry = [now, est]
+        self.window.append(entry)
+        self.tokens += est
+        return entry
+
+    def settle(self, entry: list, actual: int) -> None:
+        if any(e is entry for e in self.window):
+            self.tokens += actual - entry[1]
+        entry[1] = actual
+
+
+def _budget(model: str) -> _ModelBudget:
+    b = _budgets.get(model)
+    if b is None:
+        b = _budgets[model] = _ModelBudget(model)
+    return b
+
+
+@contextmanager
+def llm_priority(priority: int):
+    """Run the block's LLM calls at `priority` (lower = sooner)."""
+    prev = getattr(_prio, "value", PRIORITY_LIVE)
+    _prio.value = priority
+    try:
+        yield
+    finally:
+        _prio.value = prev
+
+
+def current_priority() -> int:
+    return getattr(_prio, "value", PRIORITY_LIVE)
+
+
+@contextmanager
+def llm_tags(**tags):
+    """Tag the block's LLM calls for telemetry (persona=, rooftop=, ...); nests."""
+    prev = getattr(_tags, "value", {})
+    _tags.value = {**prev, **{k: v for k, v in tags.items() if v is not None}}
+    try:
+        yield
+    finally:
+        _tags.value = prev
+
+
+def current_tags() -> Dict[str, Any]:
+    return dict(getattr(_tags, "value", {}))
+
+
+def _count_http_attempt(request) -> None:
+    # httpx request hook; runs on the calling thread for the sync client
+    _http.n = getattr(_http, "n", 0) + 1
+
+
+def _estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    chars = 0
+    for m in kwargs.get("messages") or []:
+        c = m.get("content") if isinstance(m, dict) else None
+        if isinstance(c, str):
+            chars += len(c)
+        elif isinstance(c, list):
+            chars += sum(len(str(p.get("text", ""))) for p in c if isinstance(p, dict))
+    out = kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or _EST_COMPLETION_TOKENS
+    return chars // 4 + int(out)
+
+
+def _admissible(ticket: tuple, now: float) -> bool:
+    if _in_flight >= LLM_MAX_CONCURRENCY:
+        return False
+    _, _, model, est = ticket
+    if not _budget(model).fits(now, est):
+        return False
+    seen = set()
+    for ahead in _waiters:
+        if ahead == ticket:
+            return True
+        # higher-priority work for the same model, or any that could run now, goes first
+        if ahead[2] == model or (ahead[2] not in seen and _budget(ahead[2]).fits(now, ahead[3])):
+            return False
+        seen.add(ahead[2])
+    return True
+
+
+def _acquire(model: str, est: int, priority: int, timeout_s: float) -> list:
+    global _in_flight
+    ticket = (priority, next(_seq), model, est)
+    deadline = time.monotonic() + timeout_s
+    with _cv:
+        bisect.insort(_waiters, ticket)
+        try:
+            while True:
+                now = time.monotonic()
+                if _admissible(ticket, now):
+                    _in_flight += 1
+                    return _budget(model).take(now, est)
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise LLMQueueTimeout(f"LLM queue timeout model={model} priority={priority}")
+                _cv.wait(min(remaining, _budget(model).next_change_in(now)))
+        finally:
+            _waiters.remove(ticket)
+            _cv.notify_all()
+
+
+def _release(model: str, entry: list, actual_tokens: Optional[int]) -> None:
+    global _in_flight
+    with _cv:
+        _in_flight -= 1
+        if actual_tokens is not None:
+            _budget(model).settle(entry, actual_tokens)
+        _cv.notify_all()
+
+
+def _usage(resp) -> Dict[str, int]:
+    u = getattr(resp, "usage", None)
+    if u is None:
+        return {}
+    details = getattr(u, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": int(getattr(u, "prompt_tokens", 0) or 0),
+        "completion_tokens": int(getattr(u, "completion_tokens", 0) or 0),
+        "cached_tokens": int(getattr(details, "cached_tokens", 0) or 0) if details is not None else 0,
+    }
+
+
+def _record(caller: str, elapsed_s: float, wait_s: float, usage: Dict[str, int], ok: bool) -> None:
+    with _stats_lock:
+        st = _stats.get(caller)
+        if st is None:
+            st = _stats[caller] = {
+                "calls": 0, "errors": 0, "total_s": 0.0, "wait_s": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+                "latencies": deque(maxlen=_LATENCY_SAMPLES),
+            }
+        st["calls"] += 1
+        st["errors"] += 0 if ok else 1
+        st["total_s"] += elapsed_s
+        st["wait_s"] += wait_s
+        st["latencies"].append(elapsed_s)
+        for k, v in usage.items():
+            st[k] += v
+
+
+def _telemetry(caller, model, prio, tags, usage, elapsed_s, wait_s, err) -> None:
+    attempts = getattr(_http, "n", 0)
+    try:
+        llm_telemetry.record_call({
+            "caller": caller,
+            "model": model,
+            "priority": prio,
+            **tags,
+            **usage,
+            "latency_ms": round(elapsed_s * 1000.0, 1),
+            "wait_ms": round(wait_s * 1000.0, 1),
+            "retries": max(0, attempts - 1),
+            "ok": err is None,
+            "error": err,
+        })
+        if err != "LLMQueueTimeout":   # never reached OpenAI
+            patti_metrics.observe_dependency("openai", elapsed_s, None if err else 200, err)
+    except Exception:
+        log.debug("llm telemetry failed", exc_info=True)
+
+
+def _call(caller: str, fn, kwargs: Dict[str, Any], priority: Optional[int], timeout_s: Optional[float],
+          tags: Optional[Dict[str, Any]] = None):
+    model = str(kwargs.get("model") or "")
+    est = _estimate_tokens(kwargs)
+    prio = current_priority() if priority is None else priority
+    tags = {**current_tags(), **(tags or {})}
+    t0 = time.monotonic()
+    try:
+        entry = _acquire(model, est, prio, LLM_QUEUE_TIMEOUT_S if timeout_s is None else timeout_s)
+    except LLMQueueTimeout:
+        _http.n = 0
+        _telemetry(caller, model, prio, tags, {}, 0.0, time.monotonic() - t0, "LLMQueueTimeout")
+        raise
+    t1 = time.monotonic()
+    usage: Dict[str, int] = {}
+    err: Optional[str] = "error"
+    _http.n = 0
+    try:
+        resp = fn(**kwargs)
+        usage = _usage(resp)
+        err = None
+        return resp
+    except Exception as e:
+        err = type(e).__name__
+        raise
+    finally:
+        actual = (usage["prompt_tokens"] + usage["completion_tokens"]) if usage else None
+        _release(model, entry, actual)
+        _record(caller, time.monotonic() - t1, t1 - t0, usage, err is None)
+        _telemetry(caller, model, prio, tags, usage, time.monotonic() - t1, t1 - t0, err)
+
+
+def chat_completion(caller: str, *, priority: Optional[int] = None, queue_timeout_s: Optional[float] = None,
+                    tags: Optional[Dict[str, Any]] = None, **kwargs):
+    """
+    client().chat.completions.create(**kwargs) behind the budgets/queue; `caller` names
+    the metrics row, `tags` (persona/rooftop/hop...) go to llm_telemetry with the call.
+    """
+    return _call(caller, client().chat.completions.create, kwargs, priority, queue_timeout_s, tags)
+
+
+def parse_completion(caller: str, *, priority: Optional[int] = None, queue_timeout_s: Optional[float] = None,
+                     tags: Optional[Dict[str, Any]] = None, **kwargs):
+    """Structured-output variant (client().beta.chat.completions.parse)."""
+    return _call(caller, client().beta.chat.completions.parse, kwargs, priority, queue_timeout_s, tags)
+
+
+def gateway_stats() -> Dict[str, Any]:
+    """Per-caller calls/errors/latency (avg, p50, p95)/queue wait/tokens, plus live queue state."""
+    callers = {}
+    with _stats_lock:
+        snap = {k: dict(v, latencies=sorted(v["latencies"])) for k, v in _stats.items()}
+    for caller, st in snap.items():
+        lat = st.pop("latencies")
+        n = st["calls"]
+        callers[caller] = {
+            **{k: v for k, v in st.items() if k not in ("total_s", "wait_s")},
+            "avg_ms": st["total_s"] * 1000.0 / n if n else 0.0,
+            "p50_ms": lat[len(lat) // 2] * 1000.0 if lat else 0.0,
+            "p95_ms": lat[min(len(lat) - 1, int(len(lat) * 0.95))] * 1000.0 if lat else 0.0,
+            "avg_wait_ms": st["wait_s"] * 1000.0 / n if n else 0.0,
+        }
+    with _cv:
+        now = time.monotonic()
+        models = {}
+        for m, b in _budgets.items():
+            b._prune(now)
+            models[m] = {"rpm_used": len(b.window), "rpm": b.rpm, "tpm_used": b.tokens, "tpm": b.tpm}
+        queue = {"in_flight": _in_flight, "waiting": len(_waiters)}
+    return {"callers": callers, "models": models, **queue}
@@ -0,0 +1,222 @@
+# llm_telemetry.py
+# Per-call LLM telemetry. llm_gateway hands every finished call to record_call():
+# model, prompt/completion/cached tokens, latency, queue wait, SDK retries,
+# fallback hop, and the persona / rooftop / caller it was made for.
+# Each call is appended as one JSON line to LLM_METRICS_PATH and folded into
+# an in-process aggregate (telemetry_stats()).
+#
+#   LLM_METRICS_PATH   append-only JSONL file (default /tmp/patti_llm_calls.jsonl; "off" disables)
+#   LLM_PRICES         $ per 1M tokens, "model=input/cached_input/output,..."
+#                      (defaults below cover gpt-4o and gpt-4o-mini)
+#
+#   python llm_telemetry.py [path] [--by caller|persona|rooftop|model|path] [--top N] [--hours H]
+
+import json
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+log = logging.getLogger("patti.llm_telemetry")
+
+LLM_METRICS_PATH = (os.getenv("LLM_METRICS_PATH", "/tmp/patti_llm_calls.jsonl") or "").strip()
+
+_DEFAULT_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+_LATENCY_SAMPLES = 500
+_GROUP_KEYS = ("caller", "persona", "rooftop", "model", "path")
+
+
+def _prices() -> Dict[str, tuple]:
+    out = dict(_DEFAULT_PRICES)
+    for part in (os.getenv("LLM_PRICES") or "").split(","):
+        model, _, rates = part.partition("=")
+        try:
+            p_in, p_cached, p_out = (float(x) for x in rates.split("/"))
+        except ValueError:
+            continue
+        out[model.strip()] = (p_in, p_cached, p_out)
+    return out
+
+
+LLM_PRICES = _prices()
+
+
+def _price_for(model: str) -> Optional[tuple]:
+    if model in LLM_PRICES:
+        return LLM_PRICES[model]
+    # dated snapshots ("gpt-4o-2024-08-06") price like their base model
+    best = max((m for m in LLM_PRICES if model.startswith(m + "-")), key=len, default=None)
+    return LLM_PRICES.get(best) if best else None
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    p = _price_for(model or "")
+    if not p:
+        return 0.0
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (uncached * p[0] + cached_tokens * p[1] + completion_tokens * p[2]) / 1_000_000
+
+
+_write_lock = threading.Lock()
+_agg_lock = threading.Lock()
+_agg: Dict[tuple, Dict[str, Any]] = {}
+
+
+def _new_row() -> Dict[str, Any]:
+    return {
+        "calls": 0, "errors": 0, "retries": 0, "fallback_calls": 0,
+        "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+        "cost_usd": 0.0, "latency_ms": deque(maxlen=_LATENCY_SAMPLES),
+    }
+
+
+def _fold(row: Dict[str, Any], ev: Dict[str, Any]) -> None:
+    row["calls"] += 1
+    row["errors"] += 0 if ev.get("ok", True) else 1
+    row["retries"] += int(ev.get("retries") or 0)
+    row["fallback_calls"] += 1 if int(ev.get("hop") or 0) > 0 else 0
+    for k in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+        row[k] += int(ev.get(k) or 0)
+    row["cost_usd"] += float(ev.get("cost_usd") or 0.0)
+    row["latency_ms"].append(float(ev.get("latency_ms") or 0.0))
+
+
+def record_call(ev: Dict[str, Any]) -> None:
+    """Fill in ts/cost, append to the metrics file and the in-process aggregate."""
+    ev.setdefault("ts", datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ"))
+    ev["cost_usd"] = round(estimate_cost(
+        ev.get("model") or "", int(ev.get("prompt_tokens") or 0),
+        int(ev.get("completion_tokens") or 0), int(ev.get("cached_tokens") or 0),
+    ), 6)
+
+    key = (ev.get("caller") or "", ev.get("persona") or "", ev.get("rooftop") or "", ev.get("model") or "")
+    with _agg_lock:
+        row = _agg.get(key)
+        if row is None:
+            row = _agg[key] = _new_row()
+        _fold(row, ev)
+
+    if LLM_METRICS_PATH and LLM_METRICS_PATH.lower() != "off":
+        line = json.dumps(ev, ensure_ascii=False, default=str)
+        try:
+            with _write_lock, open(LLM_METRICS_PATH, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            log.debug("llm metrics write failed: %s", e)
+
+
+def _pct(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * q))]
+
+
+def _finish(row: Dict[str, Any]) -> Dict[str, Any]:
+    lat = sorted(row["latency_ms"])
+    n = row["calls"]
+    return {
+        **{k: v for k, v in row.items() if k != "latency_ms"},
+        "cost_usd": round(row["cost_usd"], 4),
+        "avg_cost_usd": round(row["cost_usd"] / n, 6) if n else 0.0,
+        "p50_ms": _pct(lat, 0.5),
+        "p95_ms": _pct(lat, 0.95),
+    }
+
+
+def _group_key(ev: Dict[str, Any], by: str) -> str:
+    if by == "path":
+        return "/".join(x for x in (ev.get("caller"), ev.get("persona"), ev.get("rooftop")) if x) or "-"
+    return str(ev.get(by) or "-")
+
+
+def aggregate(events: Iterable[Dict[str, Any]], by: str = "path") -> Dict[str, Dict[str, Any]]:
+    """Group raw call events; each row has calls/errors/retries/tokens/cost and p50/p95 latency."""
+    rows: Dict[str, Dict[str, Any]] = {}
+    for ev in events:
+        k = _group_key(ev, by)
+        row = rows.get(k)
+        if row is None:
+            row = rows[k] = _new_row()
+            row["latency_ms"] = []
+        _fold(row, ev)
+    return {k: _finish(v) for k, v in rows.items()}
+
+
+def telemetry_stats(by: str = "path") -> Dict[str, Dict[str, Any]]:
+    """In-process aggregate since start (latency percentiles over the last samples per key)."""
+    with _agg_lock:
+        snap = [(k, dict(v, latency_ms=list(v["latency_ms"]))) for k, v in _agg.items()]
+    merged: Dict[str, Dict[str, Any]] = {}
+    for (caller, persona, rooftop, model), row in snap:
+        k = _group_key({"caller": caller, "persona": persona, "rooftop": rooftop, "model": model}, by)
+        m = merged.get(k)
+        if m is None:
+            merged[k] = m = _new_row()
+            m["latency_ms"] = []
+        for f in ("calls", "errors", "retries", "fallback_calls", "prompt_tokens",
+                  "completion_tokens", "cached_tokens", "cost_usd"):
+            m[f] += row[f]
+        m["latency_ms"].extend(row["latency_ms"])
+    return {k: _finish(v) for k, v in merged.items()}
+
+
+def read_events(path: Optional[str] = None, since: Optional[datetime] = None) -> Iterable[Dict[str, Any]]:
+    with open(path or LLM_METRICS_PATH, encoding="utf-8") as f:
+        for line in f:
+            try:
+                ev = json.loads(line)
+            except ValueError:
+                continue  # torn last line while a writer is appending
+            if since is not None:
+                try:
+                    if datetime.fromisoformat(str(ev.get("ts", "")).replace("Z", "+00:00")) < since:
+                        continue
+                except ValueError:
+                    continue
+            yield ev
+
+
+def format_report(rows: Dict[str, Dict[str, Any]], top: int = 15, label: str = "path") -> str:
+    total_cost = sum(r["cost_usd"] for r in rows.values()) or 1e-12
+    total_calls = sum(r["calls"] for r in rows.values())
+    hdr = f"{label:<52} {'calls':>6} {'err':>4} {'retry':>5} {'fb':>4} {'prompt':>9} {'compl':>8} {'cached':>8} {'cost $':>9} {'share':>6} {'p50ms':>7} {'p95ms':>7}"
+    out = [f"calls={total_calls}  cost=${sum(r['cost_usd'] for r in rows.values()):.4f}", "", "Top by cost:", hdr]
+    for k, r in sorted(rows.items(), key=lambda kv: -kv[1]["cost_usd"])[:top]:
+        out.append(
+            f"{k[:52]:<52} {r['calls']:>6} {r['errors']:>4} {r['retries']:>5} {r['fallback_calls']:>4} "
+            f"{r['prompt_tokens']:>9} {r['completion_tokens']:>8} {r['cached_tokens']:>8} {r['cost_usd']:>9.4f} "
+            f"{r['cost_usd'] / total_cost:>6.1%} {r['p50_ms']:>7.0f} {r['p95_ms']:>7.0f}"
+        )
+    out += ["", "Top by p95 latency:"]
+    for k, r in sorted(rows.items(), key=lambda kv: -kv[1]["p95_ms"])[:top]:
+        out.append(f"{k[:52]:<52} p95={r['p95_ms']:>7.0f}ms  p50={r['p50_ms']:>7.0f}ms  calls={r['calls']}")
+    return "\n".join(out)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Report LLM spend and latency by code path")
+    ap.add_argument("path", nargs="?", default=LLM_METRICS_PATH)
+    ap.add_argument("--by", choices=_GROUP_KEYS, default="path")
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--hours", type=float, default=None, help="only calls from the last H hours")
+    args = ap.parse_args(argv)
+
+    since = datetime.now(timezone.utc) - timedelta(hours=args.hours) if args.hours else None
+    try:
+        rows = aggregate(read_events(args.path, since), by=args.by)
+    except FileNotFoundError:
+        print(f"{args.path}: no metrics file")
+        return 1
+    print(format_report(rows, args.top, args.by))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,6 +1,7 @@
 import os, json, re, xml.etree.ElementTree as ET, email
 from imapclient import IMAPClient
 import logging
+from patti_logging import setup_logging
 from datetime import datetime as _dt, timedelta as _td, timezone as _tz
 from rooftops import get_rooftop_info
 from gpt import run_gpt
@@ -76,8 +77,7 @@ def maybe_call(fn, *args, **kwargs):
 
 # ── Logging (compact) ────────────────────────────────────────────────
 LOG_LEVEL = os.getenv("APP_LOG_LEVEL", "INFO").upper()
-logging.basicConfig(level=getattr(logging, LOG_LEVEL, logging.INFO),
-                    format="%(asctime)s %(levelname)s %(message)s")
+setup_logging(LOG_LEVEL, "%(asctime)s %(levelname)s %(message)s")
 log = logging.getLogger("patti")
 
 # === Modes & Safety ==================================================
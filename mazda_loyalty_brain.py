@@ -17,14 +17,13 @@ import json
 import logging
 from typing import Any, Dict, Optional
 
-from openai import OpenAI
+from llm_gateway import chat_completion
 
 log = logging.getLogger("patti.mazda_loyalty_brain")
 
 OPENAI_API_KEY = (os.getenv("OPENAI_API_KEY") or "").strip()
 EMAIL_MODEL = (os.getenv("EMAIL_OPENAI_MODEL") or os.getenv("OPENAI_MODEL") or "gpt-4o-mini").strip()
 
-_oai = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 
 STOP_TOKENS = (
     "stop",
@@ -452,7 +451,7 @@ def generate_mazda_loyalty_email_reply(
         }
 
     # ---- GPT for everything else ----
-    if not _oai:
+    if not OPENAI_API_KEY:
         # fail-open, minimal helpful reply
         txt = (
             f"{'Hi ' + first_name + ',' if first_name else 'Hi there,'}\n\n"
@@ -482,7 +481,9 @@ def generate_mazda_loyalty_email_reply(
         system_prompt = SYSTEM_PROMPT.format(
             rooftop_name=rooftop_name or "Patterson Autos Mazda dealership"
         )
-        resp = _oai.chat.completions.create(
+        resp = chat_completion(
+            "mazda_loyalty_brain.generate_mazda_loyalty_email_reply",
+            tags={"persona": "mazda_loyalty", "rooftop": rooftop_name},
             model=EMAIL_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
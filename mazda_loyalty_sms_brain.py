@@ -11,14 +11,14 @@ from __future__ import annotations
 import os, re, json, logging
 from typing import Any, Dict
 
-from openai import OpenAI
+from conversation_history import history_text, thread_text
+from llm_gateway import chat_completion
 
 log = logging.getLogger("patti.mazda_loyalty_sms_brain")
 
 OPENAI_API_KEY = (os.getenv("OPENAI_API_KEY") or "").strip()
 SMS_MODEL = (os.getenv("SMS_OPENAI_MODEL") or os.getenv("OPENAI_MODEL") or "gpt-4o-mini").strip()
 
-_oai = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 
 STOP_TOKENS = ("stop", "unsubscribe", "end", "quit", "do not contact", "dont contact")
 PRICING_TOKENS = (
@@ -122,24 +122,8 @@ Return ONLY JSON:
 {{"reply": "...", "needs_handoff": true/false, "handoff_reason": "pricing|trade|finance|angry|complaint|other"}}
 """
 
-def _thread_to_text(thread_snippet: list[dict] | None, max_msgs: int = 8) -> str:
-    if not thread_snippet:
-        return ""
-
-    lines = []
-    for m in thread_snippet[-max_msgs:]:
-        role = (m.get("role") or "").strip().lower()
-        content = (m.get("content") or "").strip()
-        if not content:
-            continue
-        who = "Customer" if role == "user" else "Patti"
-        lines.append(f"{who}: {content}")
-
-    return "\n".join(lines).strip()
-
-
 def _thread_has_service_credit_flow(thread_snippet: list[dict] | None) -> bool:
-    t = _thread_to_text(thread_snippet).lower()
+    t = thread_text(thread_snippet).lower()
     if not t:
         return False
     return any(x in t for x in (
@@ -154,7 +138,7 @@ def _thread_has_service_credit_flow(thread_snippet: list[dict] | None) -> bool:
 
 
 def _thread_has_voucher_request(thread_snippet: list[dict] | None) -> bool:
-    t = _thread_to_text(thread_snippet).lower()
+    t = thread_text(thread_snippet).lower()
     if not t:
         return False
     return any(x in t for x in (
@@ -167,7 +151,7 @@ def _thread_has_voucher_request(thread_snippet: list[dict] | None) -> bool:
 
 
 def _thread_has_handoff_started(thread_snippet: list[dict] | None) -> bool:
-    t = _thread_to_text(thread_snippet).lower()
+    t = thread_text(thread_snippet).lower()
     if not t:
         return False
     return any(x in t for x in (
@@ -346,7 +330,7 @@ def generate_mazda_loyalty_sms_reply(
 ) -> Dict[str, Any]:
     inbound = (last_inbound or "").strip()
     first = (first_name or "").strip()
-    thread_text = _thread_to_text(thread_snippet)
+    thread_history = history_text(thread_snippet or [])
 
     # Stop keywords
     if _contains_any(inbound, STOP_TOKENS):
@@ -480,7 +464,7 @@ def generate_mazda_loyalty_sms_reply(
 
 
     # GPT for everything else
-    if not _oai:
+    if not OPENAI_API_KEY:
         prefix = f"{first}, " if first else ""
         return {
             "reply": f"{prefix}I can help. If you have your 16-digit voucher code, text it here and I’ll verify it for you.",
@@ -494,7 +478,7 @@ def generate_mazda_loyalty_sms_reply(
         f"Rooftop: {rooftop_name or 'Mazda'}\n"
         f"Customer first name: {first or 'there'}\n"
         f"Bucket/tier: {bucket or 'unknown'} ({tier})\n\n"
-        f"Recent thread (oldest -> newest):\n{thread_text or '[no prior thread available]'}\n\n"
+        f"Recent thread (oldest -> newest):\n{thread_history or '[no prior thread available]'}\n\n"
         f"Latest inbound SMS:\n{inbound}\n\n"
         "Important:\n"
         "- Reply to the latest message in context of the thread.\n"
@@ -510,7 +494,9 @@ def generate_mazda_loyalty_sms_reply(
     )
     
     try:
-        resp = _oai.chat.completions.create(
+        resp = chat_completion(
+            "mazda_loyalty_sms_brain.generate_mazda_loyalty_sms_reply",
+            tags={"persona": "mazda_loyalty_sms", "rooftop": rooftop_name},
             model=SMS_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
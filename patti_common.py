@@ -240,7 +240,7 @@ def looks_like_sms_appointment_intent(text: str) -> bool:
     return False
 
 _SMS_STOP_RE = re.compile(
-    r"""(?ix)
+    r"""(?imx)
     ^\s*(stop|unsubscribe|end|quit)\s*$ |
     \b(stop\s+text(ing)?|stop\s+messages?)\b |
     \b(do\s*not\s*text|do\s*not\s*contact|dont\s*text|don't\s*text|dont\s*contact|don't\s*contact)\b |
@@ -0,0 +1,195 @@
+# patti_logging.py
+# Cheap logging for hot paths.
+#
+# - lazy(fn, *args) / lazy_json(obj, limit): log arguments that are only built
+#   if the record is actually emitted (and then on the log thread, see below)
+# - log_sampled(logger, category, level, msg, *args): per-category sampling for
+#   payload dumps; categories are dotted ("payload.run_gpt") and the longest
+#   configured prefix wins
+# - setup_logging(): root logger behind a QueueHandler/QueueListener, so
+#   formatting and stream I/O happen on one background thread instead of the
+#   request thread
+#
+#   LOG_ASYNC          1 (default) queue-based handler; 0 = plain StreamHandler
+#   LOG_SAMPLE_RATES   "payload=0.02,payload.sms_raw=1" (default payload=0.02,
+#                      i.e. 1 in 50 large payload dumps; 1 = log all, 0 = none)
+#
+#   python patti_logging.py [requests]    # CPU per request, old vs new, at INFO
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+from typing import Any, Callable, Dict, Optional
+
+_DEFAULT_RATES = {"payload": 0.02}
+
+
+def _parse_rates(raw: str) -> Dict[str, float]:
+    out = dict(_DEFAULT_RATES)
+    for part in (raw or "").split(","):
+        cat, _, rate = part.partition("=")
+        try:
+            out[cat.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return out
+
+
+LOG_SAMPLE_RATES = _parse_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+class Lazy:
+    """Log argument evaluated only when the record is formatted."""
+
+    __slots__ = ("fn", "args")
+
+    def __init__(self, fn: Callable[..., Any], *args):
+        self.fn = fn
+        self.args = args
+
+    def __str__(self) -> str:
+        try:
+            return str(self.fn(*self.args))
+        except Exception as e:
+            return f"<lazy log field failed: {e!r}>"
+
+    __repr__ = __str__
+
+
+def lazy(fn: Callable[..., Any], *args) -> Lazy:
+    return Lazy(fn, *args)
+
+
+def _dump(obj: Any, limit: Optional[int]) -> str:
+    s = json.dumps(obj, ensure_ascii=False, default=str)
+    return s if limit is None else s[:limit]
+
+
+def lazy_json(obj: Any, limit: Optional[int] = None) -> Lazy:
+    """json.dumps(obj)[:limit], deferred."""
+    return Lazy(_dump, obj, limit)
+
+
+def sample_rate(category: str) -> float:
+    cat = category
+    while True:
+        if cat in LOG_SAMPLE_RATES:
+            return LOG_SAMPLE_RATES[cat]
+        if "." not in cat:
+            return 1.0
+        cat = cat.rsplit(".", 1)[0]
+
+
+def sampled(category: str) -> bool:
+    rate = sample_rate(category)
+    return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
+def log_sampled(logger: logging.Logger, category: str, level: int, msg: str, *args) -> None:
+    """logger.log(level, msg, *args) for a sampled fraction of calls in `category`."""
+    if logger.isEnabledFor(level) and sampled(category):
+        logger.log(level, msg, *args)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    The stock QueueHandler formats on the caller's thread. Records whose args
+    are Lazy are queued as-is, so the lazy work runs on the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if record.exc_info or not args or not isinstance(args, tuple) or not any(isinstance(a, Lazy) for a in args):
+            return super().prepare(record)
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(level: Optional[str] = None, fmt: str = "%(asctime)s %(levelname)s %(message)s") -> None:
+    """
+    Drop-in for logging.basicConfig(level=APP_LOG_LEVEL, format=fmt): a no-op
+    when the root logger is already configured, queue-based when LOG_ASYNC.
+    """
+    global _listener
+    level_name = (level or os.getenv("APP_LOG_LEVEL", "INFO")).upper()
+    root = logging.getLogger()
+    with _setup_lock:
+        if root.handlers:
+            return
+        stream = logging.StreamHandler()
+        stream.setFormatter(logging.Formatter(fmt))
+        root.setLevel(getattr(logging, level_name, logging.INFO))
+        if not LOG_ASYNC:
+            root.addHandler(stream)
+            return
+        q: "queue.SimpleQueue" = queue.SimpleQueue()
+        root.addHandler(_DeferredQueueHandler(q))
+        _listener = logging.handlers.QueueListener(q, stream, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Flush the queue and stop the listener thread."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def run_benchmark(requests: int = 2000) -> None:
+    import io
+    import time
+
+    messages = [{"role": "system", "content": "You are Patti. " + "Rules and rooftop context. " * 120}] * 6
+    messages = messages + [{"role": "user", "content": "Thread (Python list of dicts): " + "x" * 3000}]
+    payload = {"data": {"body": "Yes Saturday works", "meta": ["m" * 40] * 80}}
+
+    def old(lg):
+        dump = json.dumps(messages, ensure_ascii=False)
+        lg.info("RUN_GPT debug: kbb_ctx_in_messages=%s", "$27,000" in dump)
+        lg.info("RUN_GPT debug: messages_preview=%s", dump[:1500])
+        lg.info("SMS inbound raw_json=%s", json.dumps(payload)[:4000])
+
+    def new(lg):
+        log_sampled(lg, "payload.run_gpt", logging.INFO, "RUN_GPT debug: messages_preview=%s", lazy_json(messages, 1500))
+        log_sampled(lg, "payload.sms_raw", logging.INFO, "SMS inbound raw_json=%s", lazy_json(payload, 4000))
+
+    def measure(fn, handler):
+        lg = logging.getLogger(f"patti.bench.{fn.__name__}.{id(handler)}")
+        lg.propagate = False
+        lg.setLevel(logging.INFO)
+        lg.addHandler(handler)
+        t0 = time.process_time()
+        for _ in range(requests):
+            fn(lg)
+        return (time.process_time() - t0) * 1e6 / requests
+
+    sink = logging.StreamHandler(io.StringIO())
+    sink.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    q: "queue.SimpleQueue" = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(q, sink)
+    old_us = measure(old, sink)
+    listener.start()
+    new_us = measure(new, _DeferredQueueHandler(q))
+    listener.stop()
+    print(f"requests={requests}  INFO level, payload sample rate={sample_rate('payload'):g}")
+    print(f"  sync handler, eager dumps      : {old_us:8.1f} us CPU/request")
+    print(f"  queue handler, lazy + sampled  : {new_us:8.1f} us CPU/request")
+    print(f"  saved                          : {old_us - new_us:8.1f} us/request ({1 - new_us / old_us:.0%})")
+
+
+if __name__ == "__main__":
+    import sys
+
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,231 @@
+# patti_metrics.py
+# In-process metrics in Prometheus text format (GET /metrics on web_app).
+#
+# Fed by cheap hooks, no client library:
+#   - web_app before/after_request     -> per-route request counts + latency histogram
+#   - requests.Session.send (install_requests_hook) -> Airtable / Fortellis / GoTo /
+#     SendGrid / Outlook webhook latency, status classes and errors
+#   - llm_gateway                      -> OpenAI latency and errors (observe_dependency)
+#   - collectors (register_collector)  -> gauges read only when /metrics is scraped:
+#     work pool / inbound queue depth, cache hit ratios
+#
+# Recording is a lock + a few integer adds; nothing is formatted until a scrape.
+
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+log = logging.getLogger("patti.metrics")
+
+ROUTE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEPENDENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+# collector() -> [(name, type, help, [(labels dict, value), ...]), ...]
+Sample = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+_lock = threading.Lock()
+_counters: Dict[str, Dict[Labels, float]] = {}
+_histograms: Dict[str, Dict[Labels, List[float]]] = {}   # per series: bucket counts..., sum, count
+_buckets: Dict[str, Tuple[float, ...]] = {}
+_help: Dict[str, str] = {}
+_collectors: List[Callable[[], Iterable[Sample]]] = []
+
+
+def _key(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, labels: Dict[str, str], amount: float = 1.0, help: str = "") -> None:
+    k = _key(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[k] = series.get(k, 0.0) + amount
+        if help:
+            _help.setdefault(name, help)
+
+
+def observe(name: str, labels: Dict[str, str], value: float, buckets: Tuple[float, ...] = ROUTE_BUCKETS,
+            help: str = "") -> None:
+    k = _key(labels)
+    with _lock:
+        b = _buckets.setdefault(name, buckets)
+        series = _histograms.setdefault(name, {})
+        row = series.get(k)
+        if row is None:
+            row = series[k] = [0.0] * (len(b) + 3)   # len(b) buckets, +Inf, sum, count
+        row[bisect.bisect_left(b, value)] += 1     # non-cumulative here, summed on render
+        row[-2] += value
+        row[-1] += 1
+        if help:
+            _help.setdefault(name, help)
+
+
+def register_collector(fn: Callable[[], Iterable[Sample]]) -> None:
+    """fn runs on every scrape (only then); it must be cheap and may raise."""
+    _collectors.append(fn)
+
+
+# --- requests / dependencies ---
+
+_HOSTS = (
+    ("airtable.com", "airtable"),
+    ("fortellis.io", "fortellis"),
+    ("goto.com", "goto"),
+    ("logmeininc.com", "goto"),
+    ("sendgrid.com", "sendgrid"),
+    ("openai.com", "openai"),
+)
+
+
+def dependency_for_url(url: str) -> str:
+    host = (urlsplit(url or "").hostname or "").lower()
+    for suffix, name in _HOSTS:
+        if host == suffix or host.endswith("." + suffix):
+            return name
+    outlook = urlsplit(os.getenv("OUTLOOK_SEND_ENDPOINT", "")).hostname
+    if outlook and host == outlook.lower():
+        return "outlook"
+    return "other"
+
+
+_dependency_listeners: List[Callable[[str], None]] = []
+
+
+def add_dependency_listener(fn: Callable[[str], None]) -> None:
+    """fn(dependency) on every downstream call, in the calling thread (phase_timing uses it)."""
+    _dependency_listeners.append(fn)
+
+
+def observe_dependency(dependency: str, seconds: float, status: Optional[int] = None,
+                       error: Optional[str] = None) -> None:
+    """One downstream call. status=None with error set means it never got a response."""
+    for fn in _dependency_listeners:
+        fn(dependency)
+    code = f"{status // 100}xx" if status else "none"
+    observe("patti_dependency_request_seconds", {"dependency": dependency}, seconds, DEPENDENCY_BUCKETS,
+            "Downstream call latency")
+    inc("patti_dependency_requests_total", {"dependency": dependency, "code": code},
+        help="Downstream calls by status class")
+    if error or (status is not None and (status >= 500 or status == 429)):
+        inc("patti_dependency_errors_total", {"dependency": dependency},
+            help="Downstream calls that raised, or answered 429/5xx")
+
+
+_requests_hooked = False
+
+
+def install_requests_hook() -> None:
+    """Time every requests call (all modules use requests.get/post/request). Idempotent."""
+    global _requests_hooked
+    if _requests_hooked:
+        return
+    import requests
+
+    original = requests.Session.send
+
+    def send(self, request, **kwargs):
+        dep = dependency_for_url(getattr(request, "url", ""))
+        t0 = time.perf_counter()
+        try:
+            resp = original(self, request, **kwargs)
+        except Exception as e:
+            observe_dependency(dep, time.perf_counter() - t0, None, type(e).__name__)
+            raise
+        observe_dependency(dep, time.perf_counter() - t0, resp.status_code)
+        return resp
+
+    requests.Session.send = send
+    _requests_hooked = True
+
+
+# --- caches ---
+
+_LRU_CACHES = (
+    ("conversation_history", "clean_turn"),
+    ("airtable_store", "_is_hr_key"),
+    ("gpt", "_persona_static_blocks"),
+    ("gpt", "_rooftop_static_blocks"),
+)
+
+
+def _cache_samples() -> Iterable[Sample]:
+    hits: List[Tuple[Dict[str, str], float]] = []
+    misses: List[Tuple[Dict[str, str], float]] = []
+    for module, fn_name in _LRU_CACHES:
+        mod = sys.modules.get(module)          # never import at scrape time
+        fn = getattr(mod, fn_name, None) if mod else None
+        if fn is not None and hasattr(fn, "cache_info"):
+            info = fn.cache_info()
+            hits.append(({"cache": f"{module}.{fn_name}"}, float(info.hits)))
+            misses.append(({"cache": f"{module}.{fn_name}"}, float(info.misses)))
+    llm_cache = sys.modules.get("llm_cache")
+    if llm_cache is not None:
+        for name, st in llm_cache.cache_stats().items():
+            hits.append(({"cache": f"llm_cache.{name}"}, float(st.get("hits", 0))))
+            misses.append(({"cache": f"llm_cache.{name}"}, float(st.get("misses", 0))))
+    ratio = [(labels, h / (h + m) if h + m else 0.0) for (labels, h), (_, m) in zip(hits, misses)]
+    return [
+        ("patti_cache_hits_total", "counter", "Cache hits (this process)", hits),
+        ("patti_cache_misses_total", "counter", "Cache misses (this process)", misses),
+        ("patti_cache_hit_ratio", "gauge", "hits / (hits + misses)", ratio),
+    ]
+
+
+register_collector(_cache_samples)
+
+
+# --- exposition ---
+
+def _fmt_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    parts = []
+    for k, v in labels:
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def render() -> str:
+    """Everything, in Prometheus text exposition format (0.0.4)."""
+    out: List[str] = []
+    with _lock:
+        counters = {n: dict(s) for n, s in _counters.items()}
+        histograms = {n: {k: list(r) for k, r in s.items()} for n, s in _histograms.items()}
+        helps = dict(_help)
+    for name in sorted(counters):
+        out.append(f"# HELP {name} {helps.get(name, name)}")
+        out.append(f"# TYPE {name} counter")
+        for k, v in sorted(counters[name].items()):
+            out.append(f"{name}{_fmt_labels(k)} {_fmt_value(v)}")
+    for name in sorted(histograms):
+        b = _buckets[name]
+        out.append(f"# HELP {name} {helps.get(name, name)}")
+        out.append(f"# TYPE {name} histogram")
+        for k, row in sorted(histograms[name].items()):
+            acc = 0.0
+            for le, n in zip(b + (float("inf"),), row[:-2]):
+                acc += n
+                out.append(f"{name}_bucket{_fmt_labels(k + (('le', '+Inf' if le == float('inf') else repr(le)),))} {_fmt_value(acc)}")
+            out.append(f"{name}_sum{_fmt_labels(k)} {row[-2]!r}")
+            out.append(f"{name}_count{_fmt_labels(k)} {_fmt_value(row[-1])}")
+    for collector in list(_collectors):
+        try:
+            samples = list(collector())
+        except Exception:
+            log.exception("metrics collector %s failed", getattr(collector, "__name__", collector))
+            continue
+        for name, kind, help_text, rows in samples:
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            for labels, v in rows:
+                out.append(f"{name}{_fmt_labels(sorted(labels.items()))} {_fmt_value(v)}")
+    return "\n".join(out) + "\n"
@@ -4,9 +4,8 @@ import re
 import json
 import logging
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Callable, Dict, Optional, Tuple
 
-from openai import OpenAI
 
 from airtable_store import patch_by_id, save_opp
 from rooftops import get_rooftop_info
@@ -16,6 +15,8 @@ from fortellis import schedule_activity, add_opportunity_comment
 
 from patti_common import EMAIL_RE, PHONE_RE
 from patti_common import extract_customer_comment_from_provider
+from llm_cache import cached_llm_call, prompt_version
+from llm_gateway import chat_completion
 
 log = logging.getLogger("patti.triage")
 
@@ -43,8 +44,6 @@ AT_AT = os.getenv("AT_HUMAN_REVIEW_AT", "Human Review At")
 AT_NOTIFIED = os.getenv("AT_HUMAN_REVIEW_NOTIFIED", "Human Review Notified")
 AT_NOTIFIED_AT = os.getenv("AT_HUMAN_REVIEW_NOTIFIED_AT", "Human Review Notified At")
 
-_oai = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
-
 # Fortellis salesTeam[].id -> email
 SALESTEAM_ID_TO_EMAIL = {
     # --- Tustin Kia / Internet leads ---
@@ -492,24 +491,7 @@ _MODEL_HINT_RE = re.compile(
     r")\b"
 )
 
-def gpt_reply_gate(email_text: str) -> Dict[str, Any]:
-    """
-    Decide if Patti can safely auto-reply WITHOUT guessing or needing verification.
-    Returns:
-      {
-        "can_auto_reply": bool,
-        "confidence": float,
-        "reason": str
-      }
-    """
-    t = (email_text or "").strip()
-    t_short = _clip(t, 2500)
-
-    if not _oai:
-        # If OpenAI not configured, default safe (human)
-        return {"can_auto_reply": False, "confidence": 0.60, "reason": "OpenAI not configured; default to human review."}
-
-    prompt = f"""
+_REPLY_GATE_PROMPT = """
 You are the escalation gate for a dealership assistant named Patti.
 
 Your only job: decide if Patti can reply directly **truthfully and completely** using ONLY what she has,
@@ -539,44 +521,96 @@ Return JSON ONLY:
 }}
 
 Email:
-\"\"\"{t_short}\"\"\"
+\"\"\"{email}\"\"\"
 """.strip()
+_REPLY_GATE_SYSTEM = "Return JSON only. No extra text."
+_REPLY_GATE_VERSION = prompt_version(_REPLY_GATE_PROMPT, _REPLY_GATE_SYSTEM)
+
+
+def _reply_gate_llm(t_short: str) -> Dict[str, Any]:
+    """Raw model verdict; raises on API/JSON errors so failures are never cached."""
+    resp = chat_completion(
+        "patti_triage.gpt_reply_gate",
+        model=OPENAI_MODEL,
+        temperature=0,
+        response_format={"type": "json_object"},
+        messages=[
+            {"role": "system", "content": _REPLY_GATE_SYSTEM},
+            {"role": "user", "content": _REPLY_GATE_PROMPT.format(email=t_short)},
+        ],
+    )
+    raw = resp.choices[0].message.content or "{}"
+    data = json.loads(raw)
+    return {
+        "can_auto_reply": bool(data.get("can_auto_reply")),
+        "confidence": float(data.get("confidence") or 0.0),
+        "reason": (data.get("reason") or "").strip(),
+    }
+
+
+def apply_gate_threshold(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize a raw gate verdict and force handoff below TRIAGE_MIN_CONF."""
+    can_auto = bool(data.get("can_auto_reply"))
+    conf = float(data.get("confidence") or 0.0)
+    reason = (data.get("reason") or "").strip()
+
+    # safety valve: if it says "auto" but low confidence, force handoff
+    if can_auto and conf < TRIAGE_MIN_CONF:
+        return {
+            "can_auto_reply": False,
+            "confidence": conf,
+            "reason": f"Confidence below threshold ({TRIAGE_MIN_CONF}). {reason}".strip()
+        }
+
+    return {"can_auto_reply": can_auto, "confidence": conf, "reason": reason or "Gated by model."}
+
+
+def gpt_reply_gate(email_text: str) -> Dict[str, Any]:
+    """
+    Decide if Patti can safely auto-reply WITHOUT guessing or needing verification.
+    Verdicts are cached by normalized text (temperature 0), see llm_cache.
+    Returns:
+      {
+        "can_auto_reply": bool,
+        "confidence": float,
+        "reason": str
+      }
+    """
+    t = (email_text or "").strip()
+    t_short = _clip(t, 2500)
+
+    if not OPENAI_API_KEY:
+        # If OpenAI not configured, default safe (human)
+        return {"can_auto_reply": False, "confidence": 0.60, "reason": "OpenAI not configured; default to human review."}
 
     try:
-        resp = _oai.chat.completions.create(
+        data = cached_llm_call(
+            "patti_triage.gpt_reply_gate",
+            t_short,
+            lambda: _reply_gate_llm(t_short),
             model=OPENAI_MODEL,
-            temperature=0,
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": "Return JSON only. No extra text."},
-                {"role": "user", "content": prompt},
-            ],
+            version=_REPLY_GATE_VERSION,
         )
-        raw = resp.choices[0].message.content or "{}"
-        data = json.loads(raw)
-
-        can_auto = bool(data.get("can_auto_reply"))
-        conf = float(data.get("confidence") or 0.0)
-        reason = (data.get("reason") or "").strip()
 
-        # safety valve: if it says "auto" but low confidence, force handoff
-        if can_auto and conf < TRIAGE_MIN_CONF:
-            return {
-                "can_auto_reply": False,
-                "confidence": conf,
-                "reason": f"Confidence below threshold ({TRIAGE_MIN_CONF}). {reason}".strip()
-            }
-
-        return {"can_auto_reply": can_auto, "confidence": conf, "reason": reason or "Gated by model."}
+        return apply_gate_threshold(data)
 
     except Exception as e:
         log.exception("Reply gate failed: %s", e)
         return {"can_auto_reply": False, "confidence": 0.55, "reason": "Reply gate error; default to human review."}
 
 
-def classify_inbound_email(email_text: str, *, provider_template: bool = False) -> Dict[str, Any]:
+def classify_inbound_email(
+    email_text: str,
+    *,
+    provider_template: bool = False,
+    gate_fn: Optional[Callable[[str], Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
 
     """
+    gate_fn replaces gpt_reply_gate for the model step (e.g. the reply gate
+    from a combined inbound_analysis call); it is only invoked when the
+    cheap rules below don't decide.
+
     Returns:
       {
         "classification": "AUTO_REPLY_SAFE|HUMAN_REVIEW_REQUIRED|EXPLICIT_OPTOUT|NON_LEAD",
@@ -677,7 +711,7 @@ def classify_inbound_email(email_text: str, *, provider_template: bool = False)
                     }
     
             # Run the GPT reply gate ONLY on the extracted customer comment
-            gate = gpt_reply_gate(comment)
+            gate = (gate_fn or gpt_reply_gate)(comment)
     
             if not gate.get("can_auto_reply", False):
                 return {
@@ -705,7 +739,7 @@ def classify_inbound_email(email_text: str, *, provider_template: bool = False)
             pass  # <-- best: allow GPT to classify instead of auto-escalating
 
     # 3) NEW: GPT Reply Gate (THIS REPLACES regex escalation + old GPT classifier)
-    gate = gpt_reply_gate(t_short)
+    gate = (gate_fn or gpt_reply_gate)(t_short)
 
     log.info("TRIAGE_GATE can_auto=%s conf=%.2f reason=%s",
          gate.get("can_auto_reply"), float(gate.get("confidence") or 0), gate.get("reason"))
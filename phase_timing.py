@@ -0,0 +1,309 @@
+# phase_timing.py
+# Per-phase timing for the big per-lead flows: processHit, process_kbb_ico_lead,
+# process_inbound_email and process_lead_notification.
+#
+# A flow is wrapped with @timed_flow; inside it mark("phase") ends the current
+# phase and starts the next. These functions are long with many early returns,
+# so sequential marks fit them better than nested with-blocks. Each phase records
+# wall time, thread CPU time and its external calls by dependency (every requests
+# call via patti_metrics' hook, OpenAI via llm_gateway). A flow entered inside
+# another one (processHit -> process_kbb_ico_lead) is recorded under the outer hit
+# as "kbb_ico.<phase>". mark() outside a timed flow is a no-op.
+#
+# Output:
+#   - one log line per hit (INFO when slower than PHASE_SLOW_MS, else DEBUG)
+#   - patti_phase_seconds / patti_phase_cpu_seconds / patti_phase_calls_total on /metrics
+#   - summary() / log_summary(): per flow and phase totals for this run (process)
+#
+#   PHASE_TIMING         0 turns it all off (default 1)
+#   PHASE_SLOW_MS        hits slower than this log at INFO (default 30000)
+#   PHASE_PROFILE        cprofile | pyinstrument: profile hits and keep the slowest on disk
+#                        (default off; pyinstrument falls back to cProfile if not installed)
+#   PHASE_PROFILE_TOP    slowest hits kept per run (default 5)
+#   PHASE_PROFILE_DIR    where they go (default /tmp/patti_profiles): <flow>-<key>-<ms>ms.prof
+#                        (python -m pstats) or .html (pyinstrument)
+#
+# Profilers hook the interpreter globally, so only one hit is profiled at a time;
+# with CADENCE_WORKERS > 1 concurrent hits are timed but not profiled.
+
+import functools
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import patti_metrics
+
+log = logging.getLogger("patti.phase_timing")
+
+PHASE_TIMING = os.getenv("PHASE_TIMING", "1").lower() not in ("0", "false", "no")
+PHASE_SLOW_MS = float(os.getenv("PHASE_SLOW_MS", "30000"))
+PHASE_PROFILE = os.getenv("PHASE_PROFILE", "").strip().lower()
+PHASE_PROFILE_TOP = int(os.getenv("PHASE_PROFILE_TOP", "5"))
+PHASE_PROFILE_DIR = os.getenv("PHASE_PROFILE_DIR", "/tmp/patti_profiles")
+
+_local = threading.local()
+
+
+class _Hit:
+    """One top-level flow invocation; phases[name] = [wall_s, cpu_s, entries, {dependency: calls}]."""
+
+    def __init__(self, flow: str, key: str, first: str):
+        self.flow, self.key = flow, key
+        self.error = ""
+        self.phases: Dict[str, list] = {}
+        self.prefix = ""
+        self._stack: List[Tuple[str, str]] = []
+        self.t0, self.c0 = time.perf_counter(), time.thread_time()
+        self._open(first)
+
+    def _open(self, full_name: str) -> None:
+        self.current = full_name
+        self.calls: Dict[str, int] = {}
+        self.p_wall, self.p_cpu = time.perf_counter(), time.thread_time()
+
+    def _close(self) -> None:
+        row = self.phases.setdefault(self.current, [0.0, 0.0, 0, {}])
+        row[0] += time.perf_counter() - self.p_wall
+        row[1] += time.thread_time() - self.p_cpu
+        row[2] += 1
+        for dep, n in self.calls.items():
+            row[3][dep] = row[3].get(dep, 0) + n
+
+    def mark(self, name: str) -> None:
+        self._close()
+        self._open(self.prefix + name)
+
+    def enter(self, flow: str, first: str) -> None:
+        self._close()
+        self._stack.append((self.prefix, self.current))
+        self.prefix = f"{flow}."
+        self._open(self.prefix + first)
+
+    def leave(self) -> None:
+        self._close()
+        self.prefix, resume = self._stack.pop()
+        self._open(resume)
+
+    def finish(self) -> Tuple[float, float]:
+        self._close()
+        return time.perf_counter() - self.t0, time.thread_time() - self.c0
+
+
+def mark(name: str) -> None:
+    """End the current phase of this thread's hit and start `name`."""
+    hit = getattr(_local, "hit", None)
+    if hit is not None:
+        hit.mark(name)
+
+
+def note_call(dependency: str) -> None:
+    hit = getattr(_local, "hit", None)
+    if hit is not None:
+        hit.calls[dependency] = hit.calls.get(dependency, 0) + 1
+
+
+patti_metrics.add_dependency_listener(note_call)
+
+_hooked = False
+
+
+def _ensure_requests_hook() -> None:
+    global _hooked
+    if not _hooked:
+        _hooked = True
+        try:
+            patti_metrics.install_requests_hook()
+        except Exception:
+            log.exception("phase timing: requests hook not installed; external calls won't be counted")
+
+
+# --- run totals ---
+
+_totals_lock = threading.Lock()
+_totals: Dict[str, Dict[str, list]] = {}     # flow -> phase -> [entries, wall_s, cpu_s, calls]
+_hits: Dict[str, List[float]] = {}           # flow -> [hits, wall_s, errors]
+
+
+def summary() -> Dict[str, Any]:
+    """Per flow: hits, total wall time, errors, and per-phase totals (slowest phase first)."""
+    with _totals_lock:
+        out = {}
+        for flow, (n, wall, errors) in _hits.items():
+            phases = sorted(_totals.get(flow, {}).items(), key=lambda kv: -kv[1][1])
+            out[flow] = {
+                "hits": int(n), "wall_s": round(wall, 3), "errors": int(errors),
+                "phases": {p: {"n": r[0], "wall_s": round(r[1], 3), "cpu_s": round(r[2], 3), "calls": r[3]}
+                           for p, r in phases},
+            }
+        return out
+
+
+def log_summary(flow: Optional[str] = None, top: int = 8) -> None:
+    for name, st in summary().items():
+        if flow and name != flow:
+            continue
+        parts = [f"{p} {r['wall_s']:.1f}s/{r['cpu_s']:.1f}cpu/{r['calls']}calls"
+                 for p, r in list(st["phases"].items())[:top]]
+        log.info("phase totals %s: %d hits %.1fs (%d errors) | %s", name, st["hits"], st["wall_s"], st["errors"],
+                 ", ".join(parts))
+
+
+def reset() -> None:
+    with _totals_lock:
+        _totals.clear()
+        _hits.clear()
+    with _profile_lock:
+        _slowest.clear()
+
+
+def _record(hit: _Hit, wall: float, cpu: float) -> None:
+    with _totals_lock:
+        h = _hits.setdefault(hit.flow, [0, 0.0, 0])
+        h[0] += 1
+        h[1] += wall
+        h[2] += 1 if hit.error else 0
+        flow_totals = _totals.setdefault(hit.flow, {})
+        for name, (p_wall, p_cpu, entries, calls) in hit.phases.items():
+            row = flow_totals.setdefault(name, [0, 0.0, 0.0, 0])
+            row[0] += entries
+            row[1] += p_wall
+            row[2] += p_cpu
+            row[3] += sum(calls.values())
+    for name, (p_wall, p_cpu, _, calls) in hit.phases.items():
+        labels = {"flow": hit.flow, "phase": name}
+        patti_metrics.observe("patti_phase_seconds", labels, p_wall, patti_metrics.DEPENDENCY_BUCKETS,
+                              "Wall time per flow phase")
+        patti_metrics.observe("patti_phase_cpu_seconds", labels, p_cpu, patti_metrics.DEPENDENCY_BUCKETS,
+                              "Thread CPU time per flow phase")
+        for dep, n in calls.items():
+            patti_metrics.inc("patti_phase_calls_total", {**labels, "dependency": dep}, n,
+                              help="External calls made in each flow phase")
+    level = logging.INFO if wall * 1000.0 >= PHASE_SLOW_MS else logging.DEBUG
+    if log.isEnabledFor(level):
+        parts = []
+        for name, (p_wall, p_cpu, _, calls) in hit.phases.items():
+            deps = ",".join(f"{d}={n}" for d, n in sorted(calls.items()))
+            parts.append(f"{name} {p_wall:.2f}s/{p_cpu:.2f}cpu" + (f" [{deps}]" if deps else ""))
+        log.log(level, "%s %s: %.2fs wall %.2fs cpu%s | %s", hit.flow, hit.key or "-", wall, cpu,
+                f" error={hit.error}" if hit.error else "", "; ".join(parts))
+
+
+# --- opt-in profiling of the slowest hits ---
+
+_profile_lock = threading.Lock()
+_profiling = threading.Lock()                 # one profiled hit at a time
+_slowest: List[Tuple[float, str]] = []        # min-heap of (wall_s, path) kept on disk
+_profile_kind = PHASE_PROFILE
+
+
+def _start_profile():
+    global _profile_kind
+    if _profile_kind not in ("cprofile", "pyinstrument") or not _profiling.acquire(blocking=False):
+        return None
+    try:
+        if _profile_kind == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                log.warning("PHASE_PROFILE=pyinstrument but pyinstrument isn't installed; using cProfile")
+                _profile_kind = "cprofile"
+            else:
+                prof = Profiler()
+                prof.start()
+                return prof
+        import cProfile
+
+        prof = cProfile.Profile()
+        prof.enable()
+        return prof
+    except Exception:
+        log.exception("phase timing: profiler failed to start")
+        _profiling.release()
+        return None
+
+
+def _safe_name(s: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", s or "")[:60] or "-"
+
+
+def _stop_profile(prof, hit: _Hit, wall: float) -> None:
+    try:
+        if hasattr(prof, "disable"):
+            prof.disable()
+        else:
+            prof.stop()
+    finally:
+        _profiling.release()
+    with _profile_lock:
+        if len(_slowest) >= PHASE_PROFILE_TOP and (PHASE_PROFILE_TOP <= 0 or wall <= _slowest[0][0]):
+            return
+        os.makedirs(PHASE_PROFILE_DIR, exist_ok=True)
+        ext = "prof" if hasattr(prof, "dump_stats") else "html"
+        path = os.path.join(PHASE_PROFILE_DIR,
+                            f"{hit.flow}-{_safe_name(hit.key)}-{int(wall * 1000)}ms-{int(time.time())}.{ext}")
+        if ext == "prof":
+            prof.dump_stats(path)
+        else:
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write(prof.output_html())
+        heapq.heappush(_slowest, (wall, path))
+        if len(_slowest) > PHASE_PROFILE_TOP:
+            _, evicted = heapq.heappop(_slowest)
+            try:
+                os.remove(evicted)
+            except OSError:
+                pass
+    log.info("profile for %s %s (%.1fs) written to %s", hit.flow, hit.key or "-", wall, path)
+
+
+def slowest_profiles() -> List[Tuple[float, str]]:
+    with _profile_lock:
+        return sorted(_slowest, reverse=True)
+
+
+# --- decorator ---
+
+def timed_flow(flow: str, first: str = "start", key: Optional[Callable[..., Any]] = None):
+    """Time the wrapped flow as one hit (or as nested phases inside the caller's hit)."""
+
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not PHASE_TIMING:
+                return fn(*args, **kwargs)
+            outer = getattr(_local, "hit", None)
+            if outer is not None:
+                outer.enter(flow, first)
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    outer.leave()
+            try:
+                hit_key = str(key(*args, **kwargs) or "") if key else ""
+            except Exception:
+                hit_key = ""
+            _ensure_requests_hook()
+            hit = _local.hit = _Hit(flow, hit_key, first)
+            prof = _start_profile()
+            try:
+                return fn(*args, **kwargs)
+            except BaseException as e:
+                hit.error = type(e).__name__
+                raise
+            finally:
+                _local.hit = None
+                wall, cpu = hit.finish()
+                try:
+                    if prof is not None:
+                        _stop_profile(prof, hit, wall)
+                    _record(hit, wall, cpu)
+                except Exception:
+                    log.exception("phase timing: recording %s failed", flow)
+
+        return wrapper
+
+    return deco
@@ -1,11 +1,9 @@
 import sys
 from helpers import (
     rJson,
-    wJson,
     getFirstActivity,
     adf_to_dict,
     getInqueryUsingAdf,
-    get_names_in_dir,
     sortActivities
 )
 from kbb_ico import process_kbb_ico_lead 
@@ -22,6 +20,8 @@ from gpt import (
     _getDigPrefsPrompts,
     _getMultiOptionPrompts,
     _getAlreadyBookedGuardrails,
+    build_run_gpt_messages,
+    finish_thread_reply,
 )
 import re
 import logging
@@ -33,7 +33,7 @@ import uuid
 from airtable_store import (
     _ensure_conversation,
     find_by_opp_id,
-    query_view,
+    query_view_page,
     acquire_lock,
     release_lock,
     should_suppress_all_sends_airtable,
@@ -42,8 +42,6 @@ from airtable_store import (
     find_by_customer_email,
     patch_by_id,
     upsert_conversation,
-    _get_messages_for_conversation,
-    _find_conversation_by_conversation_id
 )
 from patti_mailer import _bump_ai_send_metrics_in_airtable, _bump_ai_send_metrics_in_conversations_airtable
 
@@ -69,6 +67,19 @@ from patti_common import (
     rewrite_sched_cta_for_booked,
 )
 from patti_triage import classify_inbound_email, handoff_to_human, should_triage
+from conversation_history import email_thread
+from inbound_analysis import (
+    INBOUND_ANALYSIS_ENABLED,
+    InboundAnalysis,
+    conversation_history_for,
+    record_reply_latency,
+)
+from llm_gateway import PRIORITY_CADENCE, llm_priority
+from cadence_batch import CADENCE_BATCH_ENABLED, FollowupBatch, FollowupJob, collecting
+from cadence_batch import current as cadence_batch_current
+from cadence_runner import drain_due_now, run_due_now
+import phase_timing
+import snapshot_sink
 from airtable_store import find_by_customer_email
 
 # from fortellis import get_vehicle_inventory_xml
@@ -283,7 +294,7 @@ You are Patti, a helpful internet leads assistant for {rooftop_name}.
 {stage_guidance}
 
 Thread (Python list of dicts):
-{messages}
+{email_thread(messages)}
 """.strip()
 
     return prompt
@@ -394,7 +405,6 @@ def is_exit_message(msg: str) -> bool:
     return any(k in msg_low for k in EXIT_KEYWORDS)
 
 
-already_processed = get_names_in_dir("jsons/process")
 DEBUGMODE = os.getenv("DEBUGMODE", "1") == "1"
 
 import random
@@ -1386,7 +1396,7 @@ def process_general_lead_convo_reply(
     \"\"\"{inquiry_text}\"\"\"
 
     Thread (Python list of dicts):
-    {messages}
+    {email_thread(messages)}
 
     Write a short email reply. Do not include any signature/footer; it will be appended.
     """
@@ -1585,7 +1595,7 @@ def checkActivities(opportunity, currDate, rooftop_name, activities_override=Non
                     opportunity["follow_up_at"] = None
                     airtable_save(opportunity, extra_fields={"follow_up_at": None})
 
-                wJson(opportunity, f"jsons/process/{opportunity['opportunityId']}.json")
+                snapshot_sink.save(opportunity, opportunity['opportunityId'])
                 return
 
             # --- Step 2: try to auto-schedule an appointment from this reply ---
@@ -1699,11 +1709,11 @@ def checkActivities(opportunity, currDate, rooftop_name, activities_override=Non
             - NOT ask the customer to choose a time again.
 
             Here are the messages (Python list of dicts):
-            {messages}
+            {email_thread(messages)}
             """
             elif override_prompt:
                 # Use the specialized prompt determined by classification
-                prompt = override_prompt + f"\n\nMessages (Python list of dicts):\n{messages}"
+                prompt = override_prompt + f"\n\nMessages (Python list of dicts):\n{email_thread(messages)}"
                 log.info("Using OVERRIDE prompt for intent=%s opp=%s", intent_action, opportunity["opportunityId"])
             else:
                 base_prompt = f"""
@@ -1720,7 +1730,7 @@ def checkActivities(opportunity, currDate, rooftop_name, activities_override=Non
             Return ONLY valid JSON with keys: subject, body.
             
             Messages (python list of dicts):
-            {messages}
+            {email_thread(messages)}
             """.strip()
 
                 if already_scheduled:
@@ -1863,7 +1873,7 @@ def checkActivities(opportunity, currDate, rooftop_name, activities_override=Non
                 airtable_save(opportunity)
 
             # write debug json + stop processing this opp for this run
-            wJson(opportunity, f"jsons/process/{opportunity['opportunityId']}.json")
+            snapshot_sink.save(opportunity, opportunity['opportunityId'])
             return
 
 
@@ -1944,6 +1954,57 @@ def _derive_appointment_from_sched_activities(opportunity, tz_name="America/Los_
         return False
 
 
+def _followup_blocked(opportunity: dict) -> str:
+    """
+    Why a general follow-up generated earlier must not go out now ("" = still due).
+    The Due Now batch applies follow-ups minutes after collecting them; webhooks may
+    have changed the record since, so the processHit gates are re-run on a fresh copy.
+    """
+    from airtable_store import get_mode_airtable, is_customer_replied_airtable
+
+    now_utc = _dt.now(_tz.utc)
+    stop, why = should_suppress_all_sends_airtable(opportunity, now_utc=now_utc)
+    if stop:
+        return why
+    mode = get_mode_airtable(opportunity)
+    if mode in ("convo", "scheduled"):
+        return f"mode={mode}"
+    if is_customer_replied_airtable(opportunity) or (opportunity.get("checkedDict") or {}).get("last_msg_by") == "customer":
+        return "customer_replied"
+
+    patti_meta = opportunity.get("patti") or {}
+    sub_status = str(opportunity.get("subStatus") or opportunity.get("substatus") or "").lower()
+    if "appointment" in sub_status:
+        return "appointment"
+    appt_due = patti_meta.get("appt_due_utc")
+    if appt_due:
+        try:
+            appt_dt = _dt.fromisoformat(str(appt_due).replace("Z", "+00:00"))
+            if appt_dt.tzinfo is None:
+                appt_dt = appt_dt.replace(tzinfo=_tz.utc)
+            if appt_dt > now_utc:
+                return "appointment"
+        except ValueError:
+            pass
+
+    _normalize_cadence_brain_fields(opportunity)
+    due_iso = str(opportunity.get("follow_up_at") or "").strip()
+    if not due_iso:
+        return "follow_up_cleared"
+    try:
+        due_dt = _dt.fromisoformat(due_iso.replace("Z", "+00:00"))
+    except ValueError:
+        return "follow_up_invalid"
+    if due_dt.tzinfo is None:
+        due_dt = due_dt.replace(tzinfo=_tz.utc)
+    if due_dt > now_utc:
+        return "follow_up_moved"
+    return ""
+
+
+@phase_timing.timed_flow(
+    "processHit", first="hydrate", key=lambda hit: (hit.get("fields") or {}).get("opp_id") or hit.get("id"),
+)
 def processHit(hit):
     currDate = _dt.now(_tz.utc)
     currDate_iso = currDate.strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -2009,7 +2070,7 @@ def processHit(hit):
             except Exception as e:
                 log.warning("Failed to clear follow_up_at for HR opp=%s: %s", opportunityId, e)
 
-        wJson(opportunity, f"jsons/process/{opportunityId}.json")
+        snapshot_sink.save(opportunity, opportunityId)
         return
 
     # (optional debug)
@@ -2068,10 +2129,6 @@ def processHit(hit):
 
     checkedDict = opportunity.get("checkedDict", {})
 
-    # remove it later
-    # if f"{opportunityId}.json" in already_processed:
-    #     return
-
     # --- Customer: tolerate missing + self-heal from Fortellis ---
     customer = opportunity.get("customer") or {}
 
@@ -2179,6 +2236,7 @@ def processHit(hit):
         or rooftop_name
     )
 
+    phase_timing.mark("refresh_opp")
     # 🔒 Fresh active-check from Fortellis (ES can be stale)
 
     try:
@@ -2260,6 +2318,7 @@ def processHit(hit):
                     )
         return
 
+    phase_timing.mark("route")
     # === KBB routing ===
     flags = _kbb_flags_from(opportunity, fresh_opp)
     log.info("KBB detect → %s", flags)
@@ -2358,6 +2417,7 @@ def processHit(hit):
 
     # Persona routing for exact KBB (ICO/ServiceDrive)
     if _is_exact_kbb_ico_flags(flags, opportunity):
+        phase_timing.mark("kbb")
         # Lead age (safe default)
         lead_age_days = 0
         created_raw = (
@@ -2541,12 +2601,13 @@ def processHit(hit):
             log.exception("KBB ICO handler failed for opp %s: %s", opportunityId, e)
 
         # Do not fall through to general flow
-        wJson(opportunity, f"jsons/process/{opportunityId}.json")
+        snapshot_sink.save(opportunity, opportunityId)
         return
 
     # === if we got here, proceed with the normal (non-KBB) flow ===
 
     # ========= Getting new activities from Fortellis (NON-KBB only) =====
+    phase_timing.mark("fetch_activities")
 
     if OFFLINE_MODE:
         local_completed = opportunity.get("completedActivitiesTesting", []) or []
@@ -2567,6 +2628,7 @@ def processHit(hit):
     }
     opportunity.update(docToUpdate)
 
+    phase_timing.mark("appointments")
     # Best-effort: if the CRM already has a future appointment scheduled
     # (for example, via a booking link), mirror that into Patti's state so
     # she pauses cadence nudges but continues to watch for replies.
@@ -2628,7 +2690,7 @@ def processHit(hit):
                     e,
                 )
 
-        wJson(opportunity, f"jsons/process/{opportunityId}.json")
+        snapshot_sink.save(opportunity, opportunityId)
         return
 
     # normal ES cleanup when there is *no* appointment yet
@@ -2670,13 +2732,14 @@ def processHit(hit):
     stop, why = should_suppress_all_sends_airtable(opportunity)  # let helper decide now_utc
     if stop:
         log.info("⛔ Suppressed/blocked opp=%s — skipping sends (%s)", opportunityId, why)
-        wJson(opportunity, f"jsons/process/{opportunityId}.json")
+        snapshot_sink.save(opportunity, opportunityId)
         return
 
     # ✅ Airtable-only "already contacted"
     patti_already_contacted = already_contacted_airtable(opportunity)
 
     if not patti_already_contacted:
+        phase_timing.mark("first_touch")
 
         firstActivity = getFirstActivity(completedActivities)
         opportunity["firstActivity"] = firstActivity
@@ -2849,7 +2912,7 @@ def processHit(hit):
                     except Exception as e:
                         log.error(f"Failed to set CRM inactive / do-not-email: {e}")
 
-                wJson(opportunity, f"jsons/process/{opportunityId}.json")
+                snapshot_sink.save(opportunity, opportunityId)
                 return
 
             if customerFirstMsgDict.get("salesAlreadyContact", False):
@@ -2859,7 +2922,7 @@ def processHit(hit):
                 if not OFFLINE_MODE:
                     airtable_save(opportunity, extra_fields={"follow_up_at": None})
 
-                wJson(opportunity, f"jsons/process/{opportunityId}.json")
+                snapshot_sink.save(opportunity, opportunityId)
                 return
 
             # --- Step 3: try to auto-schedule an appointment from the inquiry text ---
@@ -2948,7 +3011,9 @@ def processHit(hit):
 
     else:
         # handle follow-ups messages
+        phase_timing.mark("check_activities")
         checkActivities(opportunity, currDate, rooftop_name)
+        phase_timing.mark("followup")
 
         # --- One-time confirmation for appointments booked via the online link ---
         patti_meta = opportunity.get("patti") or {}
@@ -2983,7 +3048,7 @@ def processHit(hit):
             - NOT ask the customer to choose a time again.
 
             Here are the messages (Python list of dicts):
-            {messages}
+            {email_thread(messages)}
             """
 
             response = run_gpt(prompt, customer_name, rooftop_name, prevMessages=True)
@@ -3098,7 +3163,7 @@ def processHit(hit):
                     )
 
             # Debug JSON + stop this run
-            wJson(opportunity, f"jsons/process/{opportunity['opportunityId']}.json")
+            snapshot_sink.save(opportunity, opportunity['opportunityId'])
             return
 
         # ✅ NUMBER 3: Convo/reply gates (Airtable brain)
@@ -3107,7 +3172,7 @@ def processHit(hit):
 
         if mode == "convo" or replied:
             log.info("⏸ Skipping CADENCE follow-ups (mode=%r replied=%s) opp=%s", mode, replied, opportunityId)
-            wJson(opportunity, f"jsons/process/{opportunityId}.json")
+            snapshot_sink.save(opportunity, opportunityId)
             return
 
         # ✅ Airtable cadence timing (follow_up_at is the brain)
@@ -3119,7 +3184,7 @@ def processHit(hit):
             opportunity["follow_up_at"] = seed_iso
             if not OFFLINE_MODE:
                 airtable_save(opportunity, extra_fields={"follow_up_at": seed_iso})
-            wJson(opportunity, f"jsons/process/{opportunityId}.json")
+            snapshot_sink.save(opportunity, opportunityId)
             return
 
         try:
@@ -3131,12 +3196,12 @@ def processHit(hit):
             opportunity["follow_up_at"] = seed_iso
             if not OFFLINE_MODE:
                 airtable_save(opportunity, extra_fields={"follow_up_at": seed_iso})
-            wJson(opportunity, f"jsons/process/{opportunityId}.json")
+            snapshot_sink.save(opportunity, opportunityId)
             return
 
         now_utc = _dt.now(_tz.utc)
         if due_dt > now_utc:
-            wJson(opportunity, f"jsons/process/{opportunityId}.json")
+            snapshot_sink.save(opportunity, opportunityId)
             return
 
         # ✅ If we reach here: cadence is due now
@@ -3186,7 +3251,7 @@ def processHit(hit):
                         },
                     )
 
-                wJson(opportunity, f"jsons/process/{opportunityId}.json")
+                snapshot_sink.save(opportunity, opportunityId)
                 return
 
         # --- Step 4A.2: Tustin Kia Day-3 Walk-around Video email ---
@@ -3276,7 +3341,7 @@ def processHit(hit):
                                 e2,
                             )
 
-                wJson(opportunity, f"jsons/process/{opportunityId}.json")
+                snapshot_sink.save(opportunity, opportunityId)
                 return
 
         # --- Step 4B: pause cadence if there is an upcoming appointment (normal behavior) ---
@@ -3292,7 +3357,7 @@ def processHit(hit):
                         opportunityId,
                         appt_dt.isoformat(),
                     )
-                    wJson(opportunity, f"jsons/process/{opportunityId}.json")
+                    snapshot_sink.save(opportunity, opportunityId)
                     return
             except Exception as e:
                 log.warning(
@@ -3306,7 +3371,7 @@ def processHit(hit):
 
         if last_by == "customer":
             # customer replied; don't send an automated nudge
-            wJson(opportunity, f"jsons/process/{opportunityId}.json")
+            snapshot_sink.save(opportunity, opportunityId)
             return
 
         last_sent = int(opportunity.get("last_template_day_sent") or 0)
@@ -3344,152 +3409,191 @@ def processHit(hit):
                 (customer.get("firstName") if isinstance(customer, dict) else None),
             )
 
-            response = run_gpt(prompt, customer_name, rooftop_name, prevMessages=True)
+            def _send_followup(get_response, opp, tok):
+                """One send-window check, at send time; returns applied / deferred / not_sent."""
+                from patti_common import within_email_send_window
 
-            subject = response["subject"]
-            body_html = response["body"]
-
-            body_html = re.sub(r"(?is)(?:\n\s*)?patti\s*(?:\r?\n)+virtual assistant.*?$", "", body_html)
-
-            # ✅ Normalize + CTA + footer (match first-touch formatting)
-            body_html = normalize_patti_body(body_html)
-            body_html = _patch_address_placeholders(body_html, rooftop_name)
-            body_html = append_soft_schedule_sentence(body_html, rooftop_name)
-            body_html = _PREFS_RE.sub("", body_html).strip()
-            body_html = body_html + build_patti_footer(rooftop_name)
+                if not within_email_send_window():
+                    log.info("EMAIL cadence blocked — outside send window")
+                    return "deferred"
+                sent_at = _dt.now(_tz.utc)
+                sent_iso = sent_at.strftime("%Y-%m-%dT%H:%M:%SZ")
 
-            # --- Compute next_due BEFORE sending (needed for send_patti_email args) ---
-            patti = opportunity.get("patti") or {}
+                response = get_response()
+                subject = response["subject"]
+                body_html = response["body"]
 
-            created_iso = (
-                patti.get("salesai_created_iso")  # authoritative anchor
-                or opportunity.get("created_at")
-                or opportunity.get("dateIn")
-                or opportunity.get("createdDate")
-                or opportunity.get("updated_at")  # last resort
-                or currDate_iso
-            )
+                body_html = re.sub(r"(?is)(?:\n\s*)?patti\s*(?:\r?\n)+virtual assistant.*?$", "", body_html)
 
-            next_due = _next_salesai_due_iso(created_iso=created_iso, last_day_sent=template_day)
-            last_sent = opportunity.get("last_template_day_sent")
-
-            # ✅ SEND the follow-up (currently missing)
-            sent_ok = False
-
-            from patti_common import within_email_send_window
+                # ✅ Normalize + CTA + footer (match first-touch formatting)
+                body_html = normalize_patti_body(body_html)
+                body_html = _patch_address_placeholders(body_html, rooftop_name)
+                body_html = append_soft_schedule_sentence(body_html, rooftop_name)
+                body_html = _PREFS_RE.sub("", body_html).strip()
+                body_html = body_html + build_patti_footer(rooftop_name)
+
+                # --- Compute next_due BEFORE sending (needed for send_patti_email args) ---
+                patti = opp.get("patti") or {}
+
+                created_iso = (
+                    patti.get("salesai_created_iso")  # authoritative anchor
+                    or opp.get("created_at")
+                    or opp.get("dateIn")
+                    or opp.get("createdDate")
+                    or opp.get("updated_at")  # last resort
+                    or sent_iso
+                )
 
-            if not within_email_send_window():
-                log.info("EMAIL cadence blocked — outside send window")
-                return False
+                next_due = _next_salesai_due_iso(created_iso=created_iso, last_day_sent=template_day)
 
-            if not OFFLINE_MODE:
-                from patti_mailer import send_patti_email  # wrapper: Outlook send + CRM comment
+                # ✅ SEND the follow-up (currently missing)
+                sent_ok = False
 
-                actual_to = resolve_customer_email(
-                    opportunity,
-                    SAFE_MODE=False,  # Override SAFE_MODE to False for proper email resolution
-                    test_recipient=test_recipient,
-                )
+                if not OFFLINE_MODE:
+                    from patti_mailer import send_patti_email  # wrapper: Outlook send + CRM comment
 
-                if actual_to:
-                    sent_ok = False
-                    try:
-                        sent_ok = send_patti_email(
-                            token=token,
-                            subscription_id=subscription_id,
-                            opp_id=opportunityId,
-                            rooftop_name=rooftop_name,
-                            rooftop_sender=rooftop_sender,
-                            to_addr=actual_to,
-                            subject=subject,
-                            body_html=body_html,
-                            cc_addrs=[],
-                            force_mode="cadence",
-                            next_follow_up_at=next_due,
-                            template_day=template_day,
-                            timestamp=currDate,
-                            source=source,
-                        )
-                    except Exception as e:
-                        log.warning("Follow-up send failed for opp %s: %s", opportunityId, e)
+                    actual_to = resolve_customer_email(
+                        opp,
+                        SAFE_MODE=False,  # Override SAFE_MODE to False for proper email resolution
+                        test_recipient=test_recipient,
+                    )
 
-                    if sent_ok:
+                    if actual_to:
+                        sent_ok = False
                         try:
-                            conversation_id = f"conv_{subscription_id}_{opportunityId}"
-                            convo_update = Conversation(
-                                conversation_id=conversation_id,
-                                opportunity_id=opportunityId,
+                            sent_ok = send_patti_email(
+                                token=tok,
                                 subscription_id=subscription_id,
-                                last_channel="email",
-                                last_activity_at=currDate_iso,
-                                ai_last_reply_at=currDate_iso,
-                                status="open",
+                                opp_id=opportunityId,
+                                rooftop_name=rooftop_name,
+                                rooftop_sender=rooftop_sender,
+                                to_addr=actual_to,
+                                subject=subject,
+                                body_html=body_html,
+                                cc_addrs=[],
+                                force_mode="cadence",
+                                next_follow_up_at=next_due,
+                                template_day=template_day,
+                                timestamp=sent_at,
+                                source=source,
                             )
-                            upsert_conversation(convo_update)
                         except Exception as e:
-                            log.error(f"Conversation upsert failed (processHit) (2): {e}")
-                else:
-                    log.warning("No customer email resolved for opp %s; skipping follow-up send", opportunityId)
-
-            # Only record + advance cadence if we actually sent (or you're in OFFLINE_MODE)
-            if sent_ok or OFFLINE_MODE:
-                opportunity.setdefault("messages", []).append(
-                    {
-                        "msgFrom": "patti",
-                        "subject": subject,
-                        "body": body_html,
-                        "date": currDate_iso,
-                        "action": response.get("action"),
-                        "notes": response.get("notes"),
-                    }
-                )
-                opportunity.setdefault("checkedDict", {})["last_msg_by"] = "patti"
+                            log.warning("Follow-up send failed for opp %s: %s", opportunityId, e)
+
+                        if sent_ok:
+                            try:
+                                conversation_id = f"conv_{subscription_id}_{opportunityId}"
+                                convo_update = Conversation(
+                                    conversation_id=conversation_id,
+                                    opportunity_id=opportunityId,
+                                    subscription_id=subscription_id,
+                                    last_channel="email",
+                                    last_activity_at=sent_iso,
+                                    ai_last_reply_at=sent_iso,
+                                    status="open",
+                                )
+                                upsert_conversation(convo_update)
+                            except Exception as e:
+                                log.error(f"Conversation upsert failed (processHit) (2): {e}")
+                    else:
+                        log.warning("No customer email resolved for opp %s; skipping follow-up send", opportunityId)
+
+                # Only record + advance cadence if we actually sent (or you're in OFFLINE_MODE)
+                if sent_ok or OFFLINE_MODE:
+                    opp.setdefault("messages", []).append(
+                        {
+                            "msgFrom": "patti",
+                            "subject": subject,
+                            "body": body_html,
+                            "date": sent_iso,
+                            "action": response.get("action"),
+                            "notes": response.get("notes"),
+                        }
+                    )
+                    opp.setdefault("checkedDict", {})["last_msg_by"] = "patti"
 
-                # Advance SalesAI index in-memory
-                patti = opportunity.setdefault("patti", {})
+                    # Advance SalesAI index in-memory
+                    patti = opp.setdefault("patti", {})
 
-                # --- Advance cadence state (single owner: processNewData) ---
-                new_count = int(float(opportunity.get("followUP_count") or 0)) + 1
-                opportunity["followUP_count"] = new_count
-                opportunity["last_template_day_sent"] = template_day
-                opportunity["follow_up_at"] = next_due
+                    # --- Advance cadence state (single owner: processNewData) ---
+                    new_count = int(float(opp.get("followUP_count") or 0)) + 1
+                    opp["followUP_count"] = new_count
+                    opp["last_template_day_sent"] = template_day
+                    opp["follow_up_at"] = next_due
 
-                # compute next_due however you want, BUT do not allow past dates
-                if next_due:
-                    try:
-                        ndt = _dt.fromisoformat(str(next_due).replace("Z", "+00:00"))
-                        if ndt.tzinfo is None:
-                            ndt = ndt.replace(tzinfo=_tz.utc)
-                    except Exception:
+                    # compute next_due however you want, BUT do not allow past dates
+                    if next_due:
+                        try:
+                            ndt = _dt.fromisoformat(str(next_due).replace("Z", "+00:00"))
+                            if ndt.tzinfo is None:
+                                ndt = ndt.replace(tzinfo=_tz.utc)
+                        except Exception:
+                            ndt = None
+                    else:
                         ndt = None
-                else:
-                    ndt = None
 
-                min_next = (now_utc + _td(days=1)).replace(microsecond=0)
-                if (ndt is None) or (ndt < min_next):
-                    next_due = min_next.isoformat()
+                    min_next = (sent_at + _td(days=1)).replace(microsecond=0)
+                    if (ndt is None) or (ndt < min_next):
+                        next_due = min_next.isoformat()
 
-                opportunity["follow_up_at"] = next_due
-                opportunity["last_template_day_sent"] = template_day
+                    opp["follow_up_at"] = next_due
+                    opp["last_template_day_sent"] = template_day
 
-                if not OFFLINE_MODE:
-                    try:
-                        airtable_save(
-                            opportunity,
-                            extra_fields={
-                                "followUP_count": new_count,
-                                "last_template_day_sent": template_day,
-                                "follow_up_at": next_due,
-                            },
-                        )
-                    except Exception as e:
-                        log.warning(
-                            "Airtable save failed opp=%s (continuing): %s",
-                            opportunity.get("opportunityId") or opportunity.get("id"),
-                            e,
-                        )
+                    if not OFFLINE_MODE:
+                        try:
+                            airtable_save(
+                                opp,
+                                extra_fields={
+                                    "followUP_count": new_count,
+                                    "last_template_day_sent": template_day,
+                                    "follow_up_at": next_due,
+                                },
+                            )
+                        except Exception as e:
+                            log.warning(
+                                "Airtable save failed opp=%s (continuing): %s",
+                                opp.get("opportunityId") or opp.get("id"),
+                                e,
+                            )
+
+                return "applied" if (sent_ok or OFFLINE_MODE) else "not_sent"
+
+            def _apply_batched(response, rec):
+                # Minutes may have passed since collect: send from the record as it is now,
+                # with a fresh token, and only if the follow-up is still wanted.
+                fresh = opp_from_record(rec)
+                blocked = _followup_blocked(fresh)
+                if blocked:
+                    log.info("cadence batch: %s day%s skipped at apply (%s)", opportunityId, template_day, blocked)
+                    return f"skipped:{blocked}"
+                outcome = _send_followup(lambda: response, fresh, get_token(subscription_id))
+                snapshot_sink.save(fresh, opportunityId)
+                return outcome
+
+            batch = cadence_batch_current()
+            if batch is not None:
+                # Due Now batch run: the reply is generated with the rest of the run and
+                # sent in the apply phase (cadence_batch), not while this lock is held
+                batch.add(FollowupJob(
+                    key=f"{opportunityId}:day{template_day}",
+                    rec_id=hit.get("id"),
+                    template_day=int(template_day),
+                    messages=build_run_gpt_messages(prompt, customer_name, rooftop_name),
+                    finish=lambda text: finish_thread_reply(text, rooftop_name),
+                    apply=_apply_batched,
+                    tags={"persona": "sales", "rooftop": rooftop_name},
+                ))
+            else:
+                def _generate():
+                    phase_timing.mark("gpt")
+                    response = run_gpt(prompt, customer_name, rooftop_name, prevMessages=True)
+                    phase_timing.mark("send")
+                    return response
 
-    wJson(opportunity, f"jsons/process/{opportunityId}.json")
+                _send_followup(_generate, opportunity, token)
+
+    phase_timing.mark("save")
+    snapshot_sink.save(opportunity, opportunityId)
 
 
 _CARFAX_EMAIL_RE = re.compile(r"(?i)\bEmail:\s*([A-Z0-9._%+\-]+@[A-Z0-9.\-]+\.[A-Z]{2,})\b")
@@ -4358,8 +4462,11 @@ def send_thread_reply_now(
     inbound_ts: str | None = None,
     inbound_subject: str | None = None,
     message_id: str | None = None,
+    analysis: InboundAnalysis | None = None,
+    inbound_t0: float | None = None,
 ) -> tuple[bool, dict]:
 
+    t_start = inbound_t0 or time.monotonic()
     currDate = _dt.now(_tz.utc)
     currDate_iso = currDate.strftime("%Y-%m-%dT%H:%M:%SZ")
 
@@ -4394,6 +4501,18 @@ def send_thread_reply_now(
         return ""
 
     customer_body = _latest_customer_body(messages)
+    conversation_id = f"conv_{subscription_id}_{opportunityId}"
+
+    # One combined LLM call covers the reply gate + appointment extraction
+    # (see inbound_analysis); reuse the caller's if it analyzed the same text.
+    if INBOUND_ANALYSIS_ENABLED and customer_body:
+        if analysis is None or not analysis.matches(customer_body):
+            analysis = InboundAnalysis(
+                customer_body,
+                history_fn=lambda: conversation_history_for(conversation_id, customer_body),
+            )
+    else:
+        analysis = None
 
     # --- Step 1.5 — TRIAGE before any reply (pricing/OTD/finance/trade/etc.) ---
     try:
@@ -4402,7 +4521,7 @@ def send_thread_reply_now(
         is_kbb = ("kbb" in src) or ("instant cash offer" in src) or ("ico" in src)
 
         if should_triage(is_kbb=is_kbb) and customer_body:
-            triage = classify_inbound_email(customer_body)
+            triage = analysis.triage() if analysis else classify_inbound_email(customer_body)
 
             cls = (triage.get("classification") or "").strip().upper()
 
@@ -4476,30 +4595,6 @@ def send_thread_reply_now(
     except Exception as e:
         log.warning("Triage gate failed (continuing without triage) opp=%s: %s", opportunityId, e)
 
-    conversation_id = f"conv_{subscription_id}_{opportunityId}"
-    conv_id = _find_conversation_by_conversation_id(conversation_id=conversation_id)
-    messages_for_conversations = _get_messages_for_conversation(conversation_id=conv_id, direction="inbound")
-    
-    previous_conversion_lines = ""
-    conversation_history = ""
-    for conv in messages_for_conversations:
-        fields = conv.get('fields', {})
-        body_text = fields.get('body_text', '') or fields.get('body_html', '')
-        subject = fields.get('subject', '')
-        
-        if body_text:
-            previous_conversion_lines += body_text + "\n"
-    
-    # latest/new message as last
-    if customer_body:
-        conversation_history = f"""
-        User (earlier) : 
-        {previous_conversion_lines if previous_conversion_lines else "None"}
-
-        User (most recent message):
-        {customer_body}
-        """
-    
     # --- Step 2: try to auto-schedule an appointment from this reply (WEBHOOK PATH) ---
     created_appt_ok = False
     appt_human = None
@@ -4525,9 +4620,14 @@ def send_thread_reply_now(
             conf = 0.0
             
             # Build a user prompt that makes message roles/history explicit for OpenAI
-            if (not already_scheduled) and conversation_history:
+            if (not already_scheduled) and customer_body:
                 
-                proposed = extract_appt_time(conversation_history, tz="America/Los_Angeles")
+                if analysis is not None:
+                    proposed = analysis.appt_time()
+                else:
+                    proposed = extract_appt_time(
+                        conversation_history_for(conversation_id, customer_body), tz="America/Los_Angeles"
+                    )
                 
                 intent_action = classify_scheduling_intent(proposed)
                 
@@ -4668,7 +4768,7 @@ def send_thread_reply_now(
             {gen_prompt}
             
             messages between Patti and the customer (python list of dicts):
-            {messages}
+            {email_thread(messages)}
             
             Return ONLY valid JSON with keys: subject, body.
         """
@@ -4676,6 +4776,8 @@ def send_thread_reply_now(
         
         subject   = response["subject"]
         body_html = response["body"]
+
+    record_reply_latency("combined" if analysis is not None else "serial", time.monotonic() - t_start)
     
     body_html = normalize_patti_body(body_html)
     body_html = _patch_address_placeholders(body_html, rooftop_name)
@@ -4902,6 +5004,41 @@ def send_thread_reply_now(
 
 
 # ---- Airtable-driven cadence runner ----
+def run_cadence(records: list | None = None):
+    """
+    The Due Now pass. With records=None: the whole view, most overdue first, page by
+    page (drain_due_now, stops at DUE_NOW_BUDGET_S). Otherwise just those records
+    (cadence_scheduler fires them when follow_up_at comes due). Either way
+    CADENCE_WORKERS at a time, round-robin across rooftops, each under its lock.
+    """
+    # general follow-ups are collected here and generated as one batch below
+    followups = FollowupBatch() if CADENCE_BATCH_ENABLED else None
+
+    def _process_due(rec):
+        # IMPORTANT: pass Airtable record into processHit
+        # cadence work yields the LLM budget to live replies (set per worker thread)
+        with llm_priority(PRIORITY_CADENCE), collecting(followups):
+            processHit(rec)
+
+    if records is None:
+        summary = drain_due_now(
+            lambda offset: query_view_page("Due Now", offset, sort_field="follow_up_at"),
+            _process_due,
+            acquire=acquire_lock,
+            release=release_lock,
+        )
+    else:
+        summary = run_due_now(records, _process_due, acquire=acquire_lock, release=release_lock)
+    summary.log()
+    phase_timing.log_summary("processHit")
+
+    if followups:
+        log.info("Generating %d cadence follow-ups as a batch", len(followups))
+        with llm_priority(PRIORITY_CADENCE):
+            followups.run()
+    return summary
+
+
 if __name__ == "__main__":
     test_opp_id = (os.getenv("TEST_OPPORTUNITY_ID") or "").strip()
 
@@ -4934,21 +5071,4 @@ if __name__ == "__main__":
         if OFFLINE_MODE:
             log.info("OFFLINE_MODE=true; skipping Airtable cadence run.")
         else:
-            records = query_view("Due Now", max_records=200) or []
-            log.info("Pulled %d records from Airtable view 'Due Now'", len(records))
-
-            for rec in records:
-                rec_id = rec.get("id")
-                if not rec_id:
-                    log.warning("Skipping Airtable item with no record id: %r", rec)
-                    continue
-
-                token = acquire_lock(rec, lock_minutes=10)
-                if not token:
-                    continue
-
-                try:
-                    # IMPORTANT: pass Airtable record into processHit
-                    processHit(rec)
-                finally:
-                    release_lock(rec_id, token)
+            run_cadence()
@@ -18,7 +18,8 @@ import logging
 from typing import Any, Dict, List, Optional
 import re
 
-from openai import OpenAI
+from conversation_history import history_messages
+from llm_gateway import chat_completion
 
 VEHICLE_Q_TOKENS = (
     "what vehicle", "which vehicle", "what car", "which car",
@@ -86,8 +87,6 @@ WHY_BUYS = [
 WHY_BUY_TEXT = " • ".join(WHY_BUYS)
 
 
-_oai = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
-
 SYSTEM_PROMPT = """You are Patti, an AI online relations assistant for a car dealership.
 
 Voice / vibe:
@@ -253,38 +252,46 @@ def build_user_prompt(
         f"Write Patti's next SMS."
     )
 
+def _chat_turns(thread_snippet: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Only real conversation turns (user/assistant) go into the history."""
+    return [
+        m for m in thread_snippet
+        if (m.get("role") or "").strip().lower() in ("user", "assistant") and (m.get("content") or "").strip()
+    ]
+
+
 def _run_sms_json_reply(
     *,
     system_prompt: str,
     user_prompt: str,
     thread_snippet: Optional[List[Dict[str, str]]] = None,
     temperature: float = 0.2,
+    rooftop_name: str = "",
 ) -> Dict[str, Any]:
-    if not _oai:
+    if not OPENAI_API_KEY:
         return {}
 
     messages: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
 
     if thread_snippet:
-        for m in thread_snippet[-12:]:
-            role = (m.get("role") or "").strip().lower()
-            content = (m.get("content") or "").strip()
-            if not content or role not in ("user", "assistant"):
-                continue
-            messages.append({"role": role, "content": content})
+        messages.extend(history_messages(_chat_turns(thread_snippet)))
 
     messages.append({"role": "user", "content": user_prompt})
 
     try:
         try:
-            resp = _oai.chat.completions.create(
+            resp = chat_completion(
+                "sms_brain.scheduling",
+                tags={"persona": "sms", "rooftop": rooftop_name},
                 model=SMS_MODEL,
                 temperature=temperature,
                 messages=messages,
                 response_format={"type": "json_object"},
             )
         except TypeError:
-            resp = _oai.chat.completions.create(
+            resp = chat_completion(
+                "sms_brain.scheduling",
+                tags={"persona": "sms", "rooftop": rooftop_name},
                 model=SMS_MODEL,
                 temperature=temperature,
                 messages=messages,
@@ -376,6 +383,7 @@ Rules:
             user_prompt=user_prompt,
             thread_snippet=thread_snippet,
             temperature=0.2,
+            rooftop_name=rooftop_name,
         )
 
         reply = (data.get("reply") or "").strip() or "What time works best for you that day?"
@@ -419,6 +427,7 @@ Return ONLY valid JSON with:
             user_prompt=user_prompt,
             thread_snippet=thread_snippet,
             temperature=0.2,
+            rooftop_name=rooftop_name,
         )
 
         reply = (data.get("reply") or "").strip() or "Would weekdays or weekends be easier for you?"
@@ -461,6 +470,7 @@ Return ONLY valid JSON with:
             user_prompt=user_prompt,
             thread_snippet=thread_snippet,
             temperature=0.2,
+            rooftop_name=rooftop_name,
         )
 
         reply = (data.get("reply") or "").strip() or "That works — want me to lock that in?"
@@ -495,7 +505,7 @@ def generate_sms_reply(
     
     persona = (persona or "").strip().lower()
 
-    if not _oai:
+    if not OPENAI_API_KEY:
         fallback_reply = "Thanks — what day/time works best for you to come in?"
         if persona == "facebook_closer":
             fallback_reply = "Thanks — would morning or afternoon work better for you to come by?"
@@ -588,15 +598,9 @@ def generate_sms_reply(
     messages: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
 
     # If we have thread context, pass it as actual conversation turns
+    # (recent turns within the history budget, older ones summarized)
     if thread_snippet:
-        for m in thread_snippet[-12:]:
-            role = (m.get("role") or "").strip().lower()
-            content = (m.get("content") or "").strip()
-            if not content:
-                continue
-            if role not in ("user", "assistant"):
-                continue
-            messages.append({"role": role, "content": content})
+        messages.extend(history_messages(_chat_turns(thread_snippet)))
 
     # Then add the final instruction as the last user message
     messages.append({"role": "user", "content": user_prompt})
@@ -606,7 +610,9 @@ def generate_sms_reply(
     try:
         try:
             # Preferred: force JSON-only output if supported
-            resp = _oai.chat.completions.create(
+            resp = chat_completion(
+                "sms_brain.generate_sms_reply",
+                tags={"persona": "sms", "rooftop": rooftop_name},
                 model=SMS_MODEL,
                 temperature=0.3,
                 messages=messages,
@@ -614,7 +620,9 @@ def generate_sms_reply(
             )
         except TypeError:
             # Older SDK/runtime: response_format not supported
-            resp = _oai.chat.completions.create(
+            resp = chat_completion(
+                "sms_brain.generate_sms_reply",
+                tags={"persona": "sms", "rooftop": rooftop_name},
                 model=SMS_MODEL,
                 temperature=0.3,
                 messages=messages,
@@ -1,10 +1,10 @@
 # sms_ingestion.py
 import os
 import re
-import json
 import logging
 from datetime import datetime as _dt, timezone as _tz
 from phone_utils import norm_phone_e164_us
+from patti_logging import lazy_json, log_sampled
 from patti_common import (
     classify_sms_inbound_route,
     looks_like_sms_appointment_intent,
@@ -224,15 +224,45 @@ def _extract_inbound(payload: dict, raw_text: str) -> dict:
     }
 
 
+# --- Ordering / coalescing (inbound_queue) ---
+def sms_conversation_key(payload: dict) -> str:
+    """Texts from one customer phone are processed in order, one at a time."""
+    phone = _extract_inbound(payload or {}, "").get("from_phone") or ""
+    return f"sms:{phone}" if phone else ""
+
+
+def coalesce_sms_payloads(payloads: list[dict]) -> dict:
+    """
+    Several texts from one customer queued back to back -> one payload (the
+    newest) whose body field holds every text, one per line, oldest first.
+    Every route in web_app._handle_sms_inbound (event RSVP/STOP, standard,
+    Mazda loyalty) reads that field, so none of them misses an earlier STOP.
+    """
+    merged = dict(payloads[-1])
+    bodies = [_extract_inbound(p, "").get("body") for p in payloads]
+    combined = "\n".join(b for b in bodies if b)
+    if not combined:
+        return merged
+    for key in ("body", "text", "message", "content"):
+        if isinstance(merged.get(key), str) and merged[key].strip():
+            merged[key] = combined
+            return merged
+    message = merged.get("message")
+    if isinstance(message, dict):
+        for key in ("body", "text"):
+            if isinstance(message.get(key), str) and message[key].strip():
+                merged["message"] = {**message, key: combined}
+                return merged
+    merged["body"] = combined
+    return merged
+
+
 # --- Main handler ---
 def process_inbound_sms(payload_json: dict | None, raw_text: str = "") -> dict:
     payload_json = payload_json or {}
 
-    # Always log raw payload so we can map it once we see real schema
-    try:
-        log.info("📩 SMS inbound raw_json=%s", json.dumps(payload_json)[:4000])
-    except Exception:
-        log.info("📩 SMS inbound raw_json=<unserializable> len=%s", len(str(payload_json)))
+    # Raw payload (sampled, LOG_SAMPLE_RATES payload.sms_raw) so we can map it once we see real schema
+    log_sampled(log, "payload.sms_raw", logging.INFO, "📩 SMS inbound raw_json=%s", lazy_json(payload_json, 4000))
 
     if raw_text:
         log.info("📩 SMS inbound raw_text=%s", (raw_text[:2000] + ("..." if len(raw_text) > 2000 else "")))
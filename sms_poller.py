@@ -2,6 +2,7 @@
 import os
 import re
 import logging
+from patti_logging import setup_logging
 from datetime import datetime, timezone, timedelta
 from datetime import datetime as _dt, timezone as _tz
 from rooftops import get_rooftop_info, list_rooftop_sms_numbers
@@ -10,6 +11,7 @@ from fortellis import get_token, schedule_activity, get_opportunity, add_opportu
 
 from phone_utils import norm_phone_e164_us
 from goto_sms import list_conversations, iter_conversations, list_messages, send_sms
+from conversation_history import thread_text
 from sms_brain import generate_sms_reply, generate_sms_schedule_reply
 from mazda_loyalty_sms_brain import generate_mazda_loyalty_sms_reply
 from templates import build_mazda_loyalty_sms
@@ -57,7 +59,7 @@ _TIME_RE = re.compile(r"\b(\d{1,2})(:\d{2})?\s?(am|pm)?\b", re.IGNORECASE)
 _DOW_RE  = re.compile(r"\b(mon(day)?|tue(sday)?|wed(nesday)?|thu(rsday)?|fri(day)?|sat(urday)?|sun(day)?)\b", re.IGNORECASE)
 
 _STOP_RE = re.compile(
-    r"""(?ix)
+    r"""(?imx)
     ^\s*(stop|unsubscribe|end|quit)\s*$ |
     \b(stop\s+text(ing)?|stop\s+messages?)\b |
     \b(do\s*not\s*text|do\s*not\s*contact|dont\s*text|don't\s*text|dont\s*contact|don't\s*contact)\b |
@@ -65,7 +67,7 @@ _STOP_RE = re.compile(
     """
 )
 
-_MAZDA_STOP_RE = re.compile(r"""(?ix)
+_MAZDA_STOP_RE = re.compile(r"""(?imx)
     ^\s*(stop|unsubscribe|end|quit)\s*$ |
     \b(stop\s+text(ing)?|stop\s+messages?)\b |
     \b(do\s*not\s*text|do\s*not\s*contact|dont\s*text|don't\s*text|dont\s*contact|don't\s*contact)\b |
@@ -641,7 +643,7 @@ def handle_mazda_loyalty_inbound_sms_webhook(*, payload_json: dict) -> dict:
                 customer_name=first_name or "Customer",
                 customer_email=customer_email or "unknown",
                 customer_phone=phone or "unknown",
-                thread_text=_thread_text(thread),
+                thread_text=thread_text(thread),
                 bucket=bucket,
                 inbound_text=inbound_text,
                 reason=f"Mazda Loyalty SMS handoff: {reason}",
@@ -709,22 +711,8 @@ def _looks_like_appt_intent(text: str) -> bool:
 
     return (has_day or has_time) and has_sched_context
 
-def _thread_text(thread_snippet: list[dict] | None, max_msgs: int = 8) -> str:
-    if not thread_snippet:
-        return ""
-    out = []
-    for m in thread_snippet[-max_msgs:]:
-        role = (m.get("role") or "").strip().lower()
-        content = (m.get("content") or "").strip()
-        if not content:
-            continue
-        who = "Customer" if role == "user" else "Patti"
-        out.append(f"{who}: {content}")
-    return "\n".join(out).strip()
-
-
 def _thread_indicates_service_credit_flow(thread_snippet: list[dict] | None) -> bool:
-    t = _thread_text(thread_snippet).lower()
+    t = thread_text(thread_snippet).lower()
     return any(x in t for x in (
         "service & parts credit",
         "service and parts credit",
@@ -736,7 +724,7 @@ def _thread_indicates_service_credit_flow(thread_snippet: list[dict] | None) ->
 
 
 def _thread_indicates_handoff_started(thread_snippet: list[dict] | None) -> bool:
-    t = _thread_text(thread_snippet).lower()
+    t = thread_text(thread_snippet).lower()
     return any(x in t for x in (
         "looping in a team member",
         "what day/time were you hoping for",
@@ -957,14 +945,15 @@ def _is_terminal_mazda_sms(fields: dict) -> bool:
     return False
 
 
-def send_sms_cadence_once():
+def send_sms_cadence_once(records: list | None = None):
+    """One SMS cadence pass over SMS_DUE_VIEW, or over `records` (cadence_scheduler)."""
     if not _within_send_window():
         log.info("⏰ Outside SMS send window (8am–8pm local). Skipping run.")
         return
 
     MAX_SMS_DAY = int(os.getenv("MAZDA_MAX_SMS_DAY", "3"))
 
-    recs = list_records_by_view(SMS_DUE_VIEW, max_records=100)
+    recs = records if records is not None else list_records_by_view(SMS_DUE_VIEW, max_records=100)
 
     for r in recs:
         rid = r.get("id")
@@ -1594,7 +1583,7 @@ def poll_once(owner: str):
                         customer_name=customer_name,
                         customer_email=customer_email or "unknown",
                         customer_phone=customer_phone or "unknown",
-                        thread_text=_thread_text(thread),
+                        thread_text=thread_text(thread),
                         bucket=bucket,
                         inbound_text=last_inbound,
                         reason=handoff_reason_text,
@@ -2218,10 +2207,7 @@ if __name__ == "__main__":
     import logging
     import traceback
 
-    logging.basicConfig(
-        level=getattr(logging, os.getenv("APP_LOG_LEVEL", "INFO").upper(), logging.INFO),
-        format="%(asctime)s %(levelname)s %(name)s %(message)s",
-    )
+    setup_logging(os.getenv("APP_LOG_LEVEL", "INFO"), "%(asctime)s %(levelname)s %(name)s %(message)s")
 
     log = logging.getLogger("patti.sms_poller")
 
@@ -0,0 +1,242 @@
+# snapshot_sink.py
+# Debug snapshots of the opportunity dict (jsons/snapshots/<opportunityId>.snapshot.json),
+# written off the processHit hot path. They stay out of jsons/process, the
+# recorded corpus bench_replay replays, which is checked in.
+#
+# save(obj, name) serializes on the caller's thread (compact JSON, no indent;
+# the dict keeps being mutated after the call, so it can't be handed over as-is)
+# and queues the text. One background thread writes it atomically (temp file +
+# os.replace, so readers never see a torn file). processHit saves the same
+# opportunity several times per hit; queued writes for the same file coalesce,
+# so only the latest text reaches the disk. When the queue is full new files are
+# dropped rather than blocking the hit. Failures are logged, never raised.
+#
+# Retention: files older than SNAPSHOT_MAX_AGE_H go, then the oldest beyond
+# SNAPSHOT_MAX_FILES; checked at most every SNAPSHOT_PRUNE_S by the writer.
+# Only files the sink wrote (*.snapshot.json) are touched, so pointing it at a
+# directory that also holds recorded snapshots never deletes those.
+# Subdirectories are left alone.
+#
+#   SNAPSHOT_MODE         async (default) | sampled | sync | off
+#                         sampled: async, for SNAPSHOT_SAMPLE_RATE of opportunities
+#                         (stable per name, so a sampled opportunity keeps every write)
+#                         sync: written inline, as wJson used to
+#   SNAPSHOT_SAMPLE_RATE  share kept in sampled mode (default 0.1)
+#   SNAPSHOT_DIR          default jsons/snapshots (relative to the cwd at save time)
+#   SNAPSHOT_MAX_FILES    default 5000 (0 = no cap)
+#   SNAPSHOT_MAX_AGE_H    default 72 (0 = keep forever)
+#   SNAPSHOT_PRUNE_S      default 600
+#   SNAPSHOT_QUEUE_MAX    pending files before new ones are dropped (default 1000)
+#
+#   python snapshot_sink.py [dir]    # apply the retention policy once and exit
+
+import atexit
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+
+import patti_metrics
+
+log = logging.getLogger("patti.snapshot_sink")
+
+SNAPSHOT_MODE = os.getenv("SNAPSHOT_MODE", "async").strip().lower()
+SNAPSHOT_SAMPLE_RATE = float(os.getenv("SNAPSHOT_SAMPLE_RATE", "0.1"))
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "jsons/snapshots")
+SNAPSHOT_MAX_FILES = int(os.getenv("SNAPSHOT_MAX_FILES", "5000"))
+SNAPSHOT_MAX_AGE_H = float(os.getenv("SNAPSHOT_MAX_AGE_H", "72"))
+SNAPSHOT_PRUNE_S = float(os.getenv("SNAPSHOT_PRUNE_S", "600"))
+SNAPSHOT_QUEUE_MAX = int(os.getenv("SNAPSHOT_QUEUE_MAX", "1000"))
+
+SUFFIX = ".snapshot.json"                            # what retention may delete
+
+_cv = threading.Condition()
+_pending: "OrderedDict[str, str]" = OrderedDict()    # abs path -> latest text
+_busy = 0                                            # files taken off _pending, not yet written
+_writer: Optional[threading.Thread] = None
+_last_prune: Dict[str, float] = {}                   # dir -> monotonic time of last prune
+_stats: Dict[str, int] = {}
+
+
+def _count(result: str, n: int = 1) -> None:
+    with _cv:
+        _stats[result] = _stats.get(result, 0) + n
+    patti_metrics.inc("patti_snapshot_writes_total", {"result": result}, n,
+                      help="Debug snapshot writes by result (written/coalesced/dropped/sampled_out/error)")
+
+
+def _default(o):
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    return str(o)
+
+
+def dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default)
+
+
+def _sampled_in(name: str) -> bool:
+    if SNAPSHOT_SAMPLE_RATE >= 1:
+        return True
+    return zlib.crc32(name.encode("utf-8")) % 10_000 < SNAPSHOT_SAMPLE_RATE * 10_000
+
+
+def save(obj: Any, name: str) -> None:
+    """Snapshot obj as <SNAPSHOT_DIR>/<name>.snapshot.json according to SNAPSHOT_MODE."""
+    mode = SNAPSHOT_MODE
+    if mode == "off" or not name:
+        return
+    if mode == "sampled" and not _sampled_in(name):
+        _count("sampled_out")
+        return
+    try:
+        text = dumps(obj)
+    except Exception:
+        log.warning("snapshot %s not serializable; skipped", name, exc_info=True)
+        _count("error")
+        return
+    path = os.path.abspath(os.path.join(SNAPSHOT_DIR, f"{name}{SUFFIX}"))
+    if mode == "sync":
+        _write(path, text)
+        _maybe_prune(os.path.dirname(path))
+        return
+    with _cv:
+        if path in _pending:
+            _pending[path] = text
+            _pending.move_to_end(path)
+            result = "coalesced"
+        elif len(_pending) >= SNAPSHOT_QUEUE_MAX:
+            result = "dropped"
+        else:
+            _pending[path] = text
+            result = ""
+            _ensure_writer()
+            _cv.notify()
+    if result:
+        _count(result)
+
+
+def _write(path: str, text: str) -> None:
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(text)
+        os.replace(tmp, path)
+    except OSError:
+        log.warning("snapshot write failed: %s", path, exc_info=True)
+        _count("error")
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return
+    _count("written")
+
+
+def _ensure_writer() -> None:
+    global _writer
+    if _writer is None or not _writer.is_alive():
+        _writer = threading.Thread(target=_run_writer, name="snapshot-sink", daemon=True)
+        _writer.start()
+
+
+def _run_writer() -> None:
+    global _busy
+    while True:
+        with _cv:
+            while not _pending:
+                _cv.wait()
+            path, text = _pending.popitem(last=False)
+            _busy += 1
+        try:
+            _write(path, text)
+            _maybe_prune(os.path.dirname(path))
+        except Exception:
+            log.exception("snapshot writer: %s", path)
+        finally:
+            with _cv:
+                _busy -= 1
+                _cv.notify_all()
+
+
+def flush(timeout: float = 5.0) -> bool:
+    """Wait until every queued snapshot is on disk; False on timeout."""
+    deadline = time.monotonic() + timeout
+    with _cv:
+        while _pending or _busy:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _cv.wait(remaining)
+    return True
+
+
+atexit.register(flush, 2.0)
+
+
+# --- retention ---
+
+def _maybe_prune(directory: str) -> None:
+    now = time.monotonic()
+    with _cv:
+        last = _last_prune.get(directory)
+        if last is not None and now - last < SNAPSHOT_PRUNE_S:
+            return
+        _last_prune[directory] = now
+    prune(directory)
+
+
+def prune(directory: str = SNAPSHOT_DIR, max_files: Optional[int] = None,
+          max_age_h: Optional[float] = None) -> int:
+    """Apply the retention policy to the sink's files in one directory; returns how many were removed."""
+    max_files = SNAPSHOT_MAX_FILES if max_files is None else max_files
+    max_age_h = SNAPSHOT_MAX_AGE_H if max_age_h is None else max_age_h
+    now = time.time()
+    files, stale_tmp = [], []
+    try:
+        with os.scandir(directory) as it:
+            for e in it:
+                if not e.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    mtime = e.stat(follow_symlinks=False).st_mtime
+                except OSError:
+                    continue
+                if e.name.endswith(SUFFIX):
+                    files.append((mtime, e.path))
+                elif f"{SUFFIX}." in e.name and e.name.endswith(".tmp") and now - mtime > 3600:   # crashed writer
+                    stale_tmp.append(e.path)
+    except FileNotFoundError:
+        return 0
+    files.sort()                                  # oldest first, so expired files are a prefix
+    expired = sum(1 for m, _ in files if max_age_h and now - m > max_age_h * 3600)
+    over = max(0, len(files) - expired - max_files) if max_files else 0
+    doomed = [p for _, p in files[:expired + over]] + stale_tmp
+    removed = 0
+    for p in doomed:
+        try:
+            os.remove(p)
+            removed += 1
+        except OSError:
+            pass
+    if removed:
+        log.info("snapshot retention: removed %d of %d files in %s", removed, len(files), directory)
+    return removed
+
+
+def stats() -> Dict[str, int]:
+    with _cv:
+        return {**_stats, "pending": len(_pending)}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    target = sys.argv[1] if len(sys.argv) > 1 else SNAPSHOT_DIR
+    print(f"removed {prune(target)} snapshot files from {target}")
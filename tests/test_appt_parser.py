@@ -0,0 +1,50 @@
+# tests/test_appt_parser.py
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import appt_parser
+from verify_scheduling import TEST_CASES, rules_matches
+
+LA = ZoneInfo("America/Los_Angeles")
+MONDAY_11AM = datetime(2026, 2, 23, 11, 0, tzinfo=LA)
+
+
+def test_rules_agree_with_verification_cases():
+    for now in (MONDAY_11AM, datetime(2026, 2, 25, 17, 30, tzinfo=LA)):
+        for text, expected_action in TEST_CASES:
+            res = appt_parser.fast_extract_appt_time(text, now=now)
+            if res is not None:
+                assert rules_matches(expected_action, res), (text, res)
+
+
+def test_weekday_resolution():
+    def iso(text, now=MONDAY_11AM):
+        return appt_parser.fast_extract_appt_time(text, now=now)["iso"]
+
+    assert iso("Wednesday at 4") == "2026-02-25T16:00:00-08:00"
+    assert iso("Tomorrow at 10:30am") == "2026-02-24T10:30:00-08:00"
+    assert iso("monday at 3") == "2026-02-23T15:00:00-08:00"       # later today
+    assert iso("monday at 10am") == "2026-03-02T10:00:00-08:00"    # already passed -> next week
+    assert iso("next monday at 3") == "2026-03-02T15:00:00-08:00"
+    assert iso("saturday noon") == "2026-02-28T12:00:00-08:00"
+
+
+def test_time_already_passed_today_falls_back():
+    evening = datetime(2026, 10, 19, 17, 30, tzinfo=LA)
+    assert appt_parser.fast_extract_appt_time("today at 4", now=evening) is None
+    assert appt_parser.fast_extract_appt_time("today at 5:30pm", now=evening) is None
+    assert appt_parser.fast_extract_appt_time("today at 6", now=evening)["iso"] == "2026-10-19T18:00:00-07:00"
+
+
+def test_declines_ambiguous_text():
+    for text in (
+        "Sunday at 9pm",               # out of hours
+        "Can't do Friday at 4",
+        "Are you open Sunday at 9?",
+        "I sat there at 4",
+        "My budget is 300 a month",
+        "sounds good",
+        "Friday at 2 and Saturday at 11",
+        "x" * 200,
+    ):
+        assert appt_parser.fast_extract_appt_time(text, now=MONDAY_11AM) is None, text
@@ -0,0 +1,31 @@
+# tests/test_bench_replay.py
+import bench_replay
+
+
+def test_replay_runs_offline_and_reports():
+    corpus = bench_replay.load_snapshots()[:3]
+    assert corpus, "recorded snapshots missing"
+
+    reports = bench_replay.run(corpus=corpus, memory=False, latency_ms={}, error_rate={})
+
+    assert [r["flow"] for r in reports] == list(bench_replay.FLOWS)
+    for r in reports:
+        assert r["records"] > 0 and r["errors"] == 0, r["error_samples"]
+        assert r["calls_per_record"]["total"] > 0
+        assert r["latency_ms"]["p95"] >= r["latency_ms"]["p50"] > 0
+    by_flow = {r["flow"]: r for r in reports}
+    assert by_flow["processHit"]["calls_per_record"]["fortellis"] > 0
+    assert by_flow["sms_poll"]["sent"].get("sms") == by_flow["sms_poll"]["records"]
+    assert bench_replay.check_budgets(reports) == []
+
+
+def test_fake_airtable_formulas():
+    fake = bench_replay.FakeServices(bench_replay.load_snapshots()[:2])
+    rec_id, rec = next(iter(fake.tables["Leads"].items()))
+    opp_id = rec["fields"]["opp_id"]
+
+    assert fake._match(f"{{opp_id}}='{opp_id}'", rec["fields"], rec_id)
+    assert not fake._match(f"AND({{opp_id}}='{opp_id}', {{subscription_id}}='nope')", rec["fields"], rec_id)
+    assert fake._match(f"OR({{opp_id}}='x', RECORD_ID()='{rec_id}')", rec["fields"], rec_id)
+    status, page = fake.handle("GET", "https://api.airtable.com/v0/appX/Leads?pageSize=1", None)
+    assert status == 200 and len(page["records"]) == 1 and page["offset"] == "1"
@@ -0,0 +1,158 @@
+# tests/test_cadence_batch.py
+import json
+
+import pytest
+
+import cadence_batch as cb
+from llm_batch import BatchProvider, BatchRequest, LocalBatchProvider, run_batch
+
+
+def _job(key, rec_id, day, applied):
+    return cb.FollowupJob(
+        key=key,
+        rec_id=rec_id,
+        template_day=day,
+        messages=[{"role": "user", "content": key}],
+        finish=json.loads,
+        apply=lambda resp, rec: applied.append((key, resp["subject"])) or True,
+    )
+
+
+def test_generate_then_apply_with_idempotency_and_locks():
+    records = {
+        "rec1": {"id": "rec1", "fields": {"last_template_day_sent": 2}},
+        "rec2": {"id": "rec2", "fields": {"last_template_day_sent": 3}},   # day 3 already went out
+        "rec3": {"id": "rec3", "fields": {}},                               # someone else holds the lock
+    }
+    events, applied = [], []
+    provider = LocalBatchProvider(
+        complete_fn=lambda req: events.append(("gen", req.custom_id)) or json.dumps({"subject": req.custom_id}),
+    )
+
+    def acquire(rec, lock_minutes=10):
+        events.append(("lock", rec["id"]))
+        return None if rec["id"] == "rec3" else "tok"
+
+    batch = cb.FollowupBatch()
+    with cb.collecting(batch):
+        for key, rec, day in (("o1:day3", "rec1", 3), ("o2:day3", "rec2", 3), ("o3:day1", "rec3", 1)):
+            cb.current().add(_job(key, rec, day, applied))
+        cb.current().add(_job("o1:day3", "rec1", 3, applied))    # duplicate in the same run
+    assert cb.current() is None and len(batch) == 3
+
+    out = batch.run(
+        provider,
+        get_record=records.get,
+        acquire=acquire,
+        release=lambda rec_id, token: events.append(("release", rec_id)),
+    )
+    assert out == {"o1:day3": "applied", "o2:day3": "already_sent", "o3:day1": "locked"}
+    assert applied == [("o1:day3", "o1:day3")]
+    # every generation finished before the first lock was taken
+    first_lock = next(i for i, e in enumerate(events) if e[0] == "lock")
+    assert all(e[0] == "gen" for e in events[:first_lock]) and first_lock == 3
+    assert ("release", "rec1") in events and ("release", "rec3") not in events
+
+
+class _HalfDone(BatchProvider):
+    name = "half"
+
+    def submit(self, requests):
+        return requests
+
+    def collect(self, handle, timeout_s):
+        return {r.custom_id: ("remote" if i % 2 == 0 else None) for i, r in enumerate(handle)}
+
+
+def test_unfinished_batch_requests_fall_back():
+    reqs = [BatchRequest(custom_id=str(i), messages=[]) for i in range(4)]
+    out = run_batch(reqs, _HalfDone(), fallback=LocalBatchProvider(complete_fn=lambda r: "local"))
+    assert out == {"0": "remote", "1": "local", "2": "remote", "3": "local"}
+
+
+def test_incomplete_provider_fails_at_construction():
+    class _NoCollect(BatchProvider):
+        def submit(self, requests):
+            return None
+
+    with pytest.raises(TypeError):
+        _NoCollect()
+
+
+@pytest.fixture
+def replay(tmp_path):
+    """processHit against bench_replay's in-memory Airtable/Fortellis/Outlook."""
+    import bench_replay
+
+    fake = bench_replay.FakeServices(bench_replay.load_snapshots()[:2])
+    undo = bench_replay.prepare(str(tmp_path), fake)
+    unwire = bench_replay._wire(fake)
+    try:
+        yield bench_replay, fake
+    finally:
+        unwire()
+        undo()
+
+
+@pytest.mark.parametrize("change", [{"Customer Replied": True}, {"Suppressed": True}, {"follow_up_at": None}])
+def test_apply_rechecks_a_record_changed_since_collect(replay, change):
+    bench_replay, fake = replay
+    from processNewData import processHit
+
+    rec = fake.tables["Leads"]["recReplay00001"]                 # follow-up path, due
+    batch = cb.FollowupBatch()
+    with cb.collecting(batch):
+        processHit(json.loads(json.dumps(rec)))
+    assert len(batch) == 1 and fake.sent == {}
+
+    for k, v in change.items():                                   # a webhook lands meanwhile
+        if v is None:
+            rec["fields"].pop(k, None)
+        else:
+            rec["fields"][k] = v
+    before = json.loads(json.dumps(rec["fields"]))
+    out = batch.run(LocalBatchProvider(complete_fn=lambda r: json.dumps(bench_replay.CANNED_REPLY)))
+
+    assert list(out.values())[0].startswith("skipped:")
+    assert fake.sent == {}
+    after = {k: v for k, v in rec["fields"].items() if k not in ("lock_until", "lock_token")}
+    assert after == {k: v for k, v in before.items() if k not in ("lock_until", "lock_token")}
+
+
+def test_apply_sends_from_the_fresh_record(replay, monkeypatch):
+    bench_replay, fake = replay
+    import processNewData
+
+    tokens = []
+    real_get_token = processNewData.get_token
+    monkeypatch.setattr(processNewData, "get_token", lambda sub: tokens.append(sub) or real_get_token(sub))
+    rec = fake.tables["Leads"]["recReplay00001"]
+    batch = cb.FollowupBatch()
+    with cb.collecting(batch):
+        processNewData.processHit(json.loads(json.dumps(rec)))
+    collected = len(tokens)
+    rec["fields"]["Assigned Sales Rep"] = "Set after collect"
+
+    out = batch.run(LocalBatchProvider(complete_fn=lambda r: json.dumps(bench_replay.CANNED_REPLY)))
+
+    assert list(out.values()) == ["applied"] and fake.sent == {"email:outlook": 1}
+    assert len(tokens) == collected + 1                           # fresh Fortellis token at apply
+    assert rec["fields"]["last_template_day_sent"] == 2
+    assert rec["fields"]["Assigned Sales Rep"] == "Set after collect"   # not overwritten by the stale dict
+
+
+def test_apply_outside_send_window_is_deferred(replay, monkeypatch):
+    bench_replay, fake = replay
+    import patti_common
+    from processNewData import processHit
+
+    rec = fake.tables["Leads"]["recReplay00001"]
+    batch = cb.FollowupBatch()
+    with cb.collecting(batch):
+        processHit(json.loads(json.dumps(rec)))
+    monkeypatch.setattr(patti_common, "within_email_send_window", lambda: False)
+
+    out = batch.run(LocalBatchProvider(complete_fn=lambda r: json.dumps(bench_replay.CANNED_REPLY)))
+
+    assert list(out.values()) == ["deferred"] and fake.sent == {}
+    assert rec["fields"]["last_template_day_sent"] == 1
@@ -0,0 +1,90 @@
+# tests/test_cadence_runner.py
+import threading
+import time
+
+from cadence_runner import run_due_now
+
+
+def _rec(i, sub):
+    return {"id": f"rec{i}", "fields": {"subscription_id": sub}}
+
+
+def test_round_robin_locks_and_error_isolation():
+    records = [_rec(i, "big") for i in range(6)] + [_rec(10, "small"), {"fields": {}}]
+    started, released = [], []
+    mu = threading.Lock()
+
+    def acquire(rec, lock_minutes=10):
+        return None if rec["id"] == "rec3" else f"tok-{rec['id']}"
+
+    def process(rec):
+        with mu:
+            started.append(rec["id"])
+        time.sleep(0.02)
+        if rec["id"] == "rec1":
+            raise RuntimeError("fortellis 502")
+
+    summary = run_due_now(
+        records, process, acquire=acquire, release=lambda rid, tok: released.append((rid, tok)),
+        workers=4, rooftop_max=2,
+    )
+
+    assert "rec10" in started[:3]                    # small rooftop isn't stuck behind big's backlog
+    assert summary.counts() == {"ok": 5, "error": 1, "locked": 1, "skipped": 1}
+    assert ("rec1", "tok-rec1") in released and not any(r == "rec3" for r, _ in released)
+    d = summary.as_dict()
+    assert d["failures"] == [("rec1", "RuntimeError: fortellis 502")]
+    assert d["by_rooftop"]["small"] == {"ok": 1}
+
+
+def test_fair_queue_interleaves_rooftops():
+    from cadence_runner import _FairQueue, subscription_of
+
+    fq = _FairQueue([_rec(i, "big") for i in range(4)] + [_rec(9, "small"), _rec(8, "small")], subscription_of, cap=1)
+    order = []
+    while fq:
+        sub, rec = fq.next()
+        fq.done(sub)
+        order.append(sub)
+    assert order == ["big", "small", "big", "small", "big", "big"]
+
+
+def test_drain_pages_by_overdue_and_resumes_from_checkpoint(tmp_path):
+    import cadence_runner as cr
+
+    view = {f"rec{i}": f"2026-01-{10 - i:02d}T09:00:00Z" for i in range(6)}   # rec5 most overdue
+    calls = []
+
+    snapshots = []
+
+    def fetch_page(offset):
+        # Airtable-style iterator: the offset points into the listing taken on the first page
+        if offset is None:
+            snapshots.append(sorted(view, key=lambda r: view[r]))   # server-side sort
+            snap, start = len(snapshots) - 1, 0
+        else:
+            snap, start = map(int, offset.split(":"))
+        ids = [r for r in snapshots[snap][start:start + 2] if r in view]
+        more = start + 2 < len(snapshots[snap])
+        return [{"id": r, "fields": {"follow_up_at": view[r]}} for r in ids], (f"{snap}:{start + 2}" if more else None)
+
+    def process(rec):
+        calls.append(rec["id"])
+        if rec["id"] == "rec4":
+            raise RuntimeError("boom")
+        view.pop(rec["id"])                                 # handled -> leaves "Due Now"
+
+    path = str(tmp_path / "cp.json")
+    kw = dict(acquire=lambda rec, lock_minutes=10: "t", release=lambda rid, tok: None,
+              checkpoint_path=path, workers=1)
+
+    first = cr.drain_due_now(fetch_page, process, max_records=3, **kw)
+    assert calls == ["rec5", "rec4", "rec3"] and first.counts() == {"ok": 2, "error": 1}
+    assert cr._load_checkpoint(path)["attempted"] == ["rec3", "rec4", "rec5"]
+
+    second = cr.drain_due_now(fetch_page, process, **kw)   # resumes page 2 from the offset; rec4 skipped
+    assert calls[3:] == ["rec2", "rec1", "rec0"] and second.counts() == {"ok": 3}
+    assert cr._load_checkpoint(path) == {}                  # drained -> cycle closed
+
+    stopped = cr.drain_due_now(fetch_page, process, budget_s=0, **kw)
+    assert stopped.results == [] and cr._load_checkpoint(path)["pages"] == 0
@@ -0,0 +1,66 @@
+# tests/test_cadence_scheduler.py
+from datetime import datetime, timezone
+
+from cadence_scheduler import CadenceScheduler, TimerWheel, next_window_open
+
+T0 = 1_700_000_000.0
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def test_wheel_fires_on_time_across_levels():
+    wheel = TimerWheel(T0)
+    offsets = {"past": -30, "sec": 5, "min": 125, "hour": 7300, "days": 3 * 86400 + 17}
+    for key, off in offsets.items():
+        wheel.schedule(key, T0 + off)
+    wheel.schedule("gone", T0 + 60)
+    wheel.cancel("gone")
+    wheel.schedule("moved", T0 + 10)
+    wheel.schedule("moved", T0 + 200)          # rescheduling replaces the old timer
+
+    seen = {}
+    t = T0
+    while len(wheel):
+        t += 1
+        for key, _ in wheel.advance(t):
+            seen[key] = t
+    assert seen == {
+        "past": T0 + 1, "sec": T0 + 5, "min": T0 + 125, "hour": T0 + 7300,
+        "days": T0 + 3 * 86400 + 17, "moved": T0 + 200,
+    }
+
+
+def test_scheduler_updates_windows_and_rechecks():
+    now = [T0]
+    calls = []
+    window = {"open": True}
+    rec = {"id": "rec1", "fields": {"next_sms_at": _iso(T0 + 10), "follow_up_at": _iso(T0 + 20)}}
+    sched = CadenceScheduler(
+        {"sms": lambda ids: calls.append(("sms", ids)), "due_now": lambda ids: calls.append(("due", ids))},
+        load=lambda since: [rec] if since is None else [],
+        windows={"sms": lambda: window["open"]},
+        clock=lambda: now[0], recheck_s=60, max_refires=2, background=False,
+    )
+    sched.sync(full=True)
+    assert len(sched.wheel) == 2
+
+    # local write moves the follow-up earlier and clears the SMS
+    sched.update({"id": "rec1", "fields": {"follow_up_at": _iso(T0 + 3)}})
+    assert sched.fire_due(T0 + 3) == {"due_now": ["rec1"]} and calls == [("due", ["rec1"])]
+    assert ("rec1", "sms") not in sched.wheel
+    assert sched.wheel.when(("rec1", "due_now")) == T0 + 63      # recheck: timestamp didn't move
+
+    # SMS due while the window is closed: held until it opens
+    window["open"] = False
+    sched.update({"id": "rec1", "fields": {"follow_up_at": _iso(T0 + 3), "next_sms_at": _iso(T0 + 5)}})
+    assert sched.fire_due(T0 + 6) == {}
+    assert sched.wheel.when(("rec1", "sms")) == next_window_open(T0 + 6) > T0 + 6
+
+    # same timestamp keeps re-firing only max_refires times
+    assert sched.fire_due(T0 + 63) == {"due_now": ["rec1"]}
+    assert sched.fire_due(T0 + 123) == {}
+    assert ("rec1", "due_now") not in sched.wheel
+    sched.update({"id": "rec1", "fields": {"follow_up_at": _iso(T0 + 3)}})
+    assert ("rec1", "due_now") not in sched.wheel               # unchanged value: still parked
@@ -0,0 +1,45 @@
+# tests/test_conversation_history.py
+import conversation_history as ch
+
+
+def test_clean_turn_strips_quotes_signature_and_html():
+    raw = (
+        "<p>Saturday at 11 works.</p><p>Thanks!</p>\n"
+        "<div class=\"gmail_quote\">On Mon, Patti wrote: <blockquote>old stuff</blockquote></div>"
+    )
+    assert ch.clean_turn(raw) == "Saturday at 11 works.\nThanks!"
+    txt = "Sounds good\n\nSent from my iPhone\n\nOn Tue, Mar 3, 2026 at 9:14 AM Patti wrote:\n> hi"
+    assert ch.clean_turn(txt) == "Sounds good"
+
+
+def test_budget_keeps_newest_and_summarizes_older(monkeypatch):
+    monkeypatch.setattr(ch, "_summary_cache", ch.OrderedDict())
+    turns = [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"Message number {i}. " + "filler " * 40}
+        for i in range(20)
+    ]
+    hist = ch.build_history(turns, max_tokens=300, summary_tokens=80)
+    assert hist["turns"][-1]["content"].startswith("Message number 19.")
+    assert hist["dropped"] > 0 and len(hist["turns"]) + hist["dropped"] == 20
+    assert hist["tokens"] <= 300
+    assert 0 < ch.estimate_tokens(hist["summary"]) <= 80
+
+    # one more turn: the summary of the old prefix is reused, not recomputed
+    calls = []
+    real = ch._summary_line
+    monkeypatch.setattr(ch, "_summary_line", lambda r, t: calls.append(t) or real(r, t))
+    ch.build_history(turns + [{"role": "user", "content": "Message number 20. " + "filler " * 40}],
+                     max_tokens=300, summary_tokens=80)
+    assert len(calls) == 1
+
+
+def test_email_thread_keeps_prompt_shape():
+    msgs = [
+        {"msgFrom": "customer", "subject": "CX-5", "body": "Is it available?", "date": "d1"},
+        {"msgFrom": "patti", "subject": "Re: CX-5", "body": "<p>Yes it is!</p>", "date": "d2"},
+        {"msgFrom": "customer", "subject": "Re: CX-5", "body": "Great\n> Yes it is!", "date": "d3"},
+    ]
+    out = ch.email_thread(msgs)
+    assert [m["msgFrom"] for m in out] == ["customer", "patti", "customer"]
+    assert out[1]["body"] == "Yes it is!" and out[2]["body"] == "Great"
+    assert out[2]["date"] == "d3"
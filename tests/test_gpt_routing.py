@@ -0,0 +1,84 @@
+# tests/test_gpt_routing.py
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import gpt
+
+
+def _resp(text):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+@pytest.fixture
+def routing(monkeypatch):
+    monkeypatch.setattr(gpt, "OPENAI_ROUTING", "hedged")
+    monkeypatch.setattr(gpt, "MODEL_CHAIN", ["slow", "fast"])
+    monkeypatch.setattr(gpt, "HEDGE_DEFAULT_DELAY_S", 0.05)
+    monkeypatch.setattr(gpt, "_MODEL_STATS", {})
+    monkeypatch.setattr(gpt, "_ROUTE_WINS", {})
+    calls = []
+
+    def install(behaviour):
+        def fake(caller, priority=None, **kwargs):
+            calls.append(kwargs["model"])
+            delay, text = behaviour[kwargs["model"]]
+            time.sleep(delay)
+            if isinstance(text, Exception):
+                raise text
+            return _resp(text)
+        monkeypatch.setattr(gpt, "chat_completion", fake)
+        return calls
+    return install
+
+
+def test_slow_primary_is_hedged(routing):
+    calls = routing({"slow": (0.5, '{"a": 1}'), "fast": (0.0, '{"a": 2}')})
+    t0 = time.monotonic()
+    model, resp = gpt.chat_complete_with_fallback([], caller="t")
+    assert model == "fast" and resp.choices[0].message.content == '{"a": 2}'
+    assert time.monotonic() - t0 < 0.4
+    assert calls == ["slow", "fast"]
+    assert gpt.model_routing_stats()["callers"]["t"] == {"calls": 1, "hedged": 1, "won": {"fast": 1}}
+
+
+def test_fast_primary_never_hedges(routing):
+    calls = routing({"slow": (0.0, '{"a": 1}'), "fast": (0.0, '{"a": 2}')})
+    assert gpt.chat_complete_with_fallback([], caller="t")[0] == "slow"
+    assert calls == ["slow"]
+
+
+def test_invalid_json_loses_to_slower_valid_answer(routing):
+    routing({"slow": (0.2, '{"ok": true}'), "fast": (0.0, "not json")})
+    assert gpt.chat_complete_with_fallback([], caller="t")[0] == "slow"
+
+
+def test_delay_tracks_p90(routing, monkeypatch):
+    monkeypatch.setattr(gpt, "HEDGE_MIN_SAMPLES", 10)
+    monkeypatch.setattr(gpt, "HEDGE_MIN_DELAY_S", 0.0)
+    for i in range(1, 21):
+        gpt._record_model_result("slow", i / 10.0, True)
+    assert gpt._hedge_delay("slow") == pytest.approx(1.9)
+
+
+def test_customer_msg_dict_caches_primary_answers_only(monkeypatch, tmp_path):
+    import llm_cache
+
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_DISABLE", False)
+    monkeypatch.setattr(llm_cache, "_local", llm_cache.threading.local())
+    monkeypatch.setattr(gpt, "PRIMARY_MODEL", "primary")
+    answers = []
+
+    def fake(messages, want_json=True, temperature=0.6, caller="gpt"):
+        model, text = answers.pop(0)
+        assert temperature == 0.0
+        return model, _resp(text)
+
+    monkeypatch.setattr(gpt, "chat_complete_with_fallback", fake)
+    answers[:] = [("fallback", '{"customerMsg": "a"}'), ("primary", '{"customerMsg": "b"}')]
+    assert gpt.getCustomerMsgDict("Is it available?")["customerMsg"] == "a"
+    assert gpt.getCustomerMsgDict("Is it available?")["customerMsg"] == "b"     # fallback not cached
+    assert gpt.getCustomerMsgDict("Is it available?")["customerMsg"] == "b"     # primary cached
+    assert answers == []
@@ -0,0 +1,85 @@
+# tests/test_inbound_analysis.py
+import pytest
+
+import inbound_analysis as ia
+
+GOOD = {
+    "gate": {"can_auto_reply": True, "confidence": 0.9, "reason": "scheduling"},
+    "opt_out": False,
+    "scheduling": {"classification": "EXACT_TIME", "iso": "2099-03-04T16:00:00-08:00",
+                   "confidence": 0.95, "window": "exact", "reason": "day and time"},
+    "entities": {"vehicle": "CX-5", "questions": ["is it blue?", ""]},
+}
+
+
+def test_validate_per_section():
+    v = ia.validate_analysis(GOOD)
+    assert v["gate"]["can_auto_reply"] is True
+    assert v["scheduling"]["iso"] == "2099-03-04T16:00:00-08:00"
+    assert v["entities"] == {"vehicle": "CX-5", "trade_in": "", "phone": "", "questions": ["is it blue?"]}
+
+    bad = ia.validate_analysis({
+        "gate": {"can_auto_reply": "yes", "confidence": 0.9},
+        "opt_out": "no",
+        "scheduling": {"classification": "EXACT_TIME", "iso": "", "confidence": 0.9},
+        "entities": "CX-5",
+    })
+    assert bad["gate"] is None and bad["opt_out"] is None and bad["scheduling"] is None
+    assert bad["entities"]["questions"] == []
+
+    assert ia.validate_analysis({"scheduling": {"classification": "SOON", "confidence": 1}})["scheduling"] is None
+    assert ia.validate_analysis("not json")["gate"] is None
+
+
+@pytest.fixture
+def gpt_mod(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    import gpt
+    return gpt
+
+
+def test_single_call_feeds_every_field(gpt_mod, monkeypatch):
+    calls = []
+    def llm(messages):
+        calls.append(messages)
+        return GOOD
+    monkeypatch.setattr(gpt_mod, "extract_appt_time", lambda *a, **k: pytest.fail("fallback used"))
+
+    a = ia.InboundAnalysis("Wednesday at 4 works", history_fn=lambda: "earlier: hi\nlatest: Wednesday at 4 works", llm=llm)
+    assert a.appt_time()["classification"] == "EXACT_TIME"
+    assert a.entities()["vehicle"] == "CX-5"
+    assert len(calls) == 1
+    assert "earlier: hi" in calls[0][1]["content"]
+    assert calls[0][0]["content"] == ia._SYSTEM_PROMPT
+    assert a.matches("  Wednesday at 4\nworks ")
+
+
+def test_invalid_section_falls_back_for_that_field_only(gpt_mod, monkeypatch):
+    fallback = {"iso": "", "confidence": 0.5, "window": "", "classification": "VAGUE_DATE", "reason": "fallback"}
+    seen = []
+    def fake_extract(text, tz="America/Los_Angeles"):
+        seen.append(text)
+        return fallback
+    monkeypatch.setattr(gpt_mod, "extract_appt_time", fake_extract)
+
+    a = ia.InboundAnalysis("maybe friday", history_fn=lambda: "HISTORY",
+                           llm=lambda m: {**GOOD, "scheduling": {"classification": "??"}})
+    assert a.appt_time() == fallback
+    assert seen == ["HISTORY"]
+    assert a.fallbacks == ["scheduling"]
+    assert a.entities()["vehicle"] == "CX-5"
+
+    def boom(messages):
+        raise RuntimeError("api down")
+    a = ia.InboundAnalysis("maybe friday", llm=boom)
+    assert a.appt_time() == fallback
+
+
+def test_reply_latency_percentiles(monkeypatch):
+    monkeypatch.setattr(ia, "_latency", {})
+    for ms in range(1, 101):
+        ia.record_reply_latency("combined", ms / 1000.0)
+    st = ia.reply_latency_stats()["combined"]
+    assert st["n"] == 100
+    assert 50 <= st["median_ms"] <= 51
+    assert 94 <= st["p95_ms"] <= 96
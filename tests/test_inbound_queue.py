@@ -0,0 +1,144 @@
+# tests/test_inbound_queue.py
+import time
+
+import pytest
+
+import inbound_queue as iq
+
+
+@pytest.fixture
+def queue_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(iq, "INBOUND_QUEUE_PATH", str(tmp_path / "q.sqlite3"))
+    monkeypatch.setattr(iq, "INBOUND_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(iq, "INBOUND_RETRY_BASE_S", 0.0)
+    monkeypatch.setattr(iq, "_handlers", {})
+    monkeypatch.setattr(iq, "_coalescers", {})
+    return iq
+
+
+def test_failed_entries_retry_then_dead_letter(queue_db):
+    seen = []
+
+    def flaky(payload):
+        seen.append(payload["n"])
+        raise RuntimeError("boom")
+
+    iq.register("sms-inbound", flaky)
+    entry_id = iq.enqueue("sms-inbound", {"n": 1})
+    assert iq.pending() == 1
+
+    assert iq.consume_one() == "ready"        # attempt 1 -> retry
+    assert iq.consume_one() == "dead"         # attempt 2 -> dead letter
+    assert iq.consume_one() is None
+    assert seen == [1, 1] and iq.pending() == 0
+
+    entry = iq.get(entry_id)
+    assert entry["status"] == "dead" and entry["attempts"] == 2 and "boom" in entry["last_error"]
+
+    handled = []
+    iq.register("sms-inbound", handled.append)
+    iq.replay(entry_id)
+    assert handled == [{"n": 1}] and iq.get(entry_id)["status"] == "done"
+
+
+def test_expired_lease_is_redelivered(queue_db):
+    entry_id = iq.enqueue("email-inbound", {"subject": "hi"})
+    first = iq.lease(visibility_s=-1)         # consumer "died" holding the lease
+    assert first[0] == entry_id and first[3] == 1
+
+    done = []
+    iq.register("email-inbound", done.append)
+    assert iq.consume_one() == "done"
+    assert done == [{"subject": "hi"}]
+    assert iq.get(entry_id)["attempts"] == 2 and iq.stats()["pending"] == 0
+
+
+def test_conversation_order_and_coalescing(queue_db):
+    a1 = iq.enqueue("sms-inbound", {"body": "a1"}, "sms:+1555")
+    b1 = iq.enqueue("sms-inbound", {"body": "b1"}, "sms:+1666")
+    a2 = iq.enqueue("sms-inbound", {"body": "a2"}, "sms:+1555")
+
+    first = iq.lease()
+    assert first[0] == a1 and first[4] == []        # no coalesce fn registered
+    second = iq.lease()
+    assert second[0] == b1                          # a2 waits behind a1; b runs in parallel
+    assert iq.lease() is None and iq.due() == 0
+    iq.ack(a1)
+    assert iq.lease()[0] == a2
+
+    calls = []
+    iq.register("sms-inbound", calls.append, coalesce=lambda ps: {"body": " | ".join(p["body"] for p in ps)})
+    c1 = iq.enqueue("sms-inbound", {"body": "c1"}, "sms:+1777")
+    c2 = iq.enqueue("sms-inbound", {"body": "c2"}, "sms:+1777")
+    assert iq.consume_one() == "done"
+    assert calls == [{"body": "c1 | c2"}]
+    assert iq.get(c1)["status"] == iq.get(c2)["status"] == "done"
+
+
+def test_lease_expiring_while_the_handler_runs(queue_db, monkeypatch):
+    monkeypatch.setattr(iq, "INBOUND_VISIBILITY_S", 0.3)
+    entry_id = iq.enqueue("sms-inbound", {"n": 1}, "sms:+1555")
+    later = iq.enqueue("sms-inbound", {"n": 2}, "sms:+1555")
+
+    seen = []
+
+    def slow(payload):                        # outlasts the visibility timeout 3x
+        for _ in range(3):
+            time.sleep(0.3)
+            seen.append(iq.lease(visibility_s=60))
+    iq.register("sms-inbound", slow)
+    assert iq.consume_one() == "done"
+    assert seen == [None, None, None]         # heartbeat kept it leased; its conversation stayed blocked
+    assert iq.get(entry_id)["status"] == "done" and iq.get(later)["status"] == "ready"
+
+    stolen = []
+
+    def stalled(payload):                     # heartbeat couldn't save it (process paused): someone re-leases
+        iq._conn().execute("UPDATE inbound_queue SET lease_until = 0 WHERE status = 'leased'")
+        stolen.append(iq.lease(visibility_s=60))
+        if payload["n"] == 3:
+            raise RuntimeError("late failure")
+    iq.register("sms-inbound", stalled)
+    assert iq.consume_one() == "lost"
+    assert stolen[0][0] == later and stolen[0][3] == 2
+    assert iq.get(later)["status"] == "leased"              # the late finish didn't ack it
+    assert iq.ack(later, attempt=2) and iq.get(later)["status"] == "done"
+
+    failing = iq.enqueue("sms-inbound", {"n": 3})
+    assert iq.consume_one() == "lost"                       # the late failure didn't reset it either
+    assert iq.get(failing)["status"] == "leased" and iq.get(failing)["attempts"] == 2
+
+
+def test_coalesced_stop_reaches_every_sms_route(queue_db, monkeypatch):
+    monkeypatch.setenv("AIRTABLE_API_TOKEN", "test")
+    monkeypatch.setenv("AIRTABLE_BASE_ID", "appTest")
+    import event_campaign_state as ecs
+    import sms_poller
+    from patti_common import sms_stop_requested
+    from sms_ingestion import coalesce_sms_payloads
+
+    opted_out = []
+    monkeypatch.setattr(ecs, "_find_guest_by_phone", lambda phone: {"id": "recGuest"})
+    monkeypatch.setattr(ecs, "_find_best_invite_for_guest", lambda *a, **k: ({"id": "recInvite"}, {"fields": {}}))
+    monkeypatch.setattr(ecs, "_patch_opt_out_guest", lambda rec, channel: opted_out.append(rec["id"]))
+    monkeypatch.setattr(ecs, "_patch_opt_out_invite", lambda *a, **k: None)
+    monkeypatch.setattr(ecs, "_send_sms_confirmation", lambda **k: None)
+
+    seen = []
+
+    def route(payload):
+        seen.append((
+            ecs.handle_event_sms_reply(payload_json=payload).get("action"),
+            bool(sms_poller._MAZDA_STOP_RE.search(sms_poller._extract_goto_payload(payload)["text"])),
+            sms_stop_requested(payload["body"]),
+        ))
+    iq.register("sms-inbound", route, coalesce=coalesce_sms_payloads)
+
+    for body in ("STOP", "thanks"):
+        iq.enqueue("sms-inbound", {"authorPhoneNumber": "+15555550100", "ownerPhoneNumber": "+15555550199",
+                                   "body": body}, "sms:+15555550100")
+    assert iq.consume_one() == "done" and iq.consume_one() is None
+    assert seen == [("opt_out", True, True)] and opted_out == ["recGuest"]
+
+    nested = coalesce_sms_payloads([{"message": {"text": "see you then"}}, {"message": {"text": "STOP"}}])
+    assert nested == {"message": {"text": "see you then\nSTOP"}}
@@ -0,0 +1,126 @@
+# tests/test_inventory_matcher.py
+import io
+
+import inventory_matcher as im
+
+XML = """<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>
+<VehicleInventoryResponse xmlns="opentrack.dealertrack.com">
+<VehicleInventoryResult xmlns="opentrack.dealertrack.com/transitional">
+  <Result>
+    <CompanyNumber>ZE7</CompanyNumber><VIN>JM3KFBCM1R0000001</VIN><StockNumber>M1001</StockNumber>
+    <Status>I</Status><TypeNU>N</TypeNU><ModelYear>2024</ModelYear><Make>MAZDA</Make><Model>CX-5</Model>
+    <Trim>Touring</Trim><BodyStyle>SUV</BodyStyle><DateInInventory>20250105</DateInInventory>
+    <ListPrice>31,500</ListPrice><PublishVehicleInfoToWeb>Y</PublishVehicleInfoToWeb>
+    <OptionalFields><VehicleOptionalField><OptionNumber>1</OptionNumber><Description>Lot</Description></VehicleOptionalField></OptionalFields>
+    <Options><VehicleOption><OptionCode>PREM</OptionCode><Description>Premium Pkg</Description></VehicleOption></Options>
+  </Result>
+  <Result>
+    <CompanyNumber>ZE7</CompanyNumber><VIN>2T3P1RFV0RW000002</VIN><StockNumber>T2002</StockNumber>
+    <Status>I</Status><TypeNU>U</TypeNU><ModelYear>2021</ModelYear><Make>TOYOTA</Make><Model>RAV4</Model>
+    <BodyStyle>SUV</BodyStyle><ListPrice>24000</ListPrice><PublishVehicleInfoToWeb>N</PublishVehicleInfoToWeb>
+  </Result>
+  <Result>
+    <VIN>1HGCV1F30LA000003</VIN><Status>S</Status><TypeNU>U</TypeNU><ModelYear>2020</ModelYear>
+    <Make>HONDA</Make><Model>ACCORD</Model><BodyStyle>SEDAN</BodyStyle>
+  </Result>
+</VehicleInventoryResult></VehicleInventoryResponse></soap:Body></soap:Envelope>"""
+
+
+def test_parse_fields():
+    rows = im.parse_vehicle_inventory(XML)
+    assert [r["VIN"] for r in rows] == ["JM3KFBCM1R0000001", "2T3P1RFV0RW000002", "1HGCV1F30LA000003"]
+    cx5 = rows[0]
+    assert cx5.get("Year") == "2024"
+    assert cx5.get("DateInInventory") == "2025-01-05"
+    assert cx5.get("PublishToWeb") is True
+    assert rows[1].get("PublishToWeb") is False
+    assert rows[2].get("StockNumber") == ""
+    assert cx5.get("NotAField", "x") == "x"
+
+
+def test_options_only_when_requested():
+    lean = im.parse_vehicle_inventory(XML)[0]
+    assert lean.get("OptionalFields") is None and lean.get("Options") is None
+    full = im.parse_vehicle_inventory(XML, include_optional=True, include_options=True)
+    assert full[0]["OptionalFields"][0]["Description"] == "Lot"
+    assert full[0]["Options"] == [{"OptionCode": "PREM", "Description": "Premium Pkg"}]
+    assert full[1]["Options"] == []
+
+
+def test_stream_from_file_object():
+    stream = im.iter_vehicle_inventory(io.BytesIO(XML.encode("utf-8")))
+    first = next(stream)
+    assert first.Make == "MAZDA"
+    assert len(list(stream)) == 2
+
+
+def test_recommend_from_xml():
+    out = im.recommend_from_xml(XML, "Looking for a new 2024 Mazda CX-5 under $35,000", k=1)
+    assert "Stock M1001" in out
+
+
+def _reference_top_k(rows, interest, k):
+    scored = [(im.score_vehicle(v, interest), v) for v in rows]
+    scored = [x for x in scored if x[0] >= 0.0]
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [v for _, v in scored[:k]]
+
+
+def test_index_matches_score_vehicle_ranking():
+    import random
+    rnd = random.Random(3)
+    makes = {"TOYOTA": ["RAV4", "RAV4 PRIME", "CAMRY"], "HONDA": ["CR-V", "CIVIC"], "MAZDA": ["CX-5", "CX-50"]}
+    rows = []
+    for i in range(600):
+        make = rnd.choice(list(makes))
+        rows.append({
+            "VIN": str(i), "Status": rnd.choice("IIIS"), "TypeNU": rnd.choice("NU"),
+            "Year": rnd.choice(["2019", "2021", "2023", "2024", ""]), "Make": make.lower(),
+            "Model": rnd.choice(makes[make]), "BodyStyle": rnd.choice(["SUV", "SEDAN"]),
+            "ListPrice": rnd.choice(["18,000", "29500", "41000", ""]), "PublishToWeb": rnd.random() > 0.5,
+        })
+    index = im.InventoryIndex(rows)
+    for _ in range(300):
+        interest = {
+            "year": rnd.choice([None, 2020, 2023, 2024]),
+            "make": rnd.choice([None, "TOYOTA", "HONDA", "MAZDA", "FORD"]),
+            "model": rnd.choice([None, "RAV4", "CX", "CIVIC", "F150"]),
+            "body": rnd.choice([None, "SUV", "SEDAN"]),
+            "typeNU": rnd.choice([None, "N", "U"]),
+            "max_price": rnd.choice([None, 20000.0, 35000.0]),
+        }
+        for k in (1, 2, 5):
+            got = index.top_k(interest, k)
+            want = _reference_top_k(rows, interest, k)
+            assert [v["VIN"] for v in got] == [v["VIN"] for v in want], interest
+
+
+def test_interest_matcher_uses_inventory_vocabulary():
+    rows = [
+        {"Status": "I", "Make": "MAZDA", "Model": "CX-5", "Trim": "TOURING"},
+        {"Status": "I", "Make": "HONDA", "Model": "PILOT", "Trim": "EX-L"},
+        {"Status": "I", "Make": "TOYOTA", "Model": "RAV4", "Trim": "XLE"},
+        {"Status": "I", "Make": "TOYOTA", "Model": "RAV4 PRIME", "Trim": "XSE"},
+    ]
+    m = im.InterestMatcher.from_rows(rows)
+
+    got = m.extract("Do you have a used cx5 touring? budget under 30k")
+    assert (got["make"], got["model"], got["trim"], got["typeNU"], got["max_price"]) == (
+        "MAZDA", "CX-5", "TOURING", "U", 30000.0)
+
+    got = m.extract("Is the 2024 RAV4 Prime XSE still there? $45k max")
+    assert (got["year"], got["make"], got["model"], got["trim"], got["max_price"]) == (
+        2024, "TOYOTA", "RAV4 PRIME", "XSE", 45000.0)
+
+    # lowercase dictionary word is not a model; capitalized one is
+    assert m.extract("I need to pilot this program")["model"] is None
+    assert m.extract("any 2022 Pilot left?")["make"] == "HONDA"
+
+
+def test_default_extractor_word_boundaries():
+    got = im.extract_interest("Moving to Vancouver, my program needs a new Chevy Tahoe")
+    assert got["make"] == "CHEVROLET"
+    assert got["model"] == "TAHOE"
+    assert got["body"] is None
+    assert got["typeNU"] == "N"
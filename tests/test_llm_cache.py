@@ -0,0 +1,52 @@
+# tests/test_llm_cache.py
+import pytest
+
+import llm_cache
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_DISABLE", False)
+    monkeypatch.setattr(llm_cache, "_local", llm_cache.threading.local())
+    monkeypatch.setattr(llm_cache, "_stats", {})
+
+
+def test_hit_on_normalized_text():
+    calls = []
+    def compute():
+        calls.append(1)
+        return {"can_auto_reply": True}
+
+    a = llm_cache.cached_llm_call("gate", "Is it  still\navailable?", compute, model="m", version="v1")
+    b = llm_cache.cached_llm_call("gate", " Is it still available? ", compute, model="m", version="v1")
+    assert a == b == {"can_auto_reply": True}
+    assert len(calls) == 1
+    assert llm_cache.cache_stats()["gate"] == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert llm_cache.cache_stats(shared=True)["gate"]["hits"] == 1
+
+    # different prompt version -> different key
+    llm_cache.cached_llm_call("gate", "Is it still available?", compute, model="m", version="v2")
+    assert len(calls) == 2
+
+
+def test_errors_and_rejected_values_not_cached():
+    def boom():
+        raise RuntimeError("api down")
+    with pytest.raises(RuntimeError):
+        llm_cache.cached_llm_call("gate", "hello", boom)
+    assert llm_cache.cached_llm_call("gate", "hello", lambda: None) is None
+    assert llm_cache.cached_llm_call("gate", "hello", lambda: "ok") == "ok"
+    assert llm_cache.cached_llm_call("gate", "hello", lambda: "other") == "ok"
+
+
+def test_ttl_bypass_and_prune():
+    llm_cache.cached_llm_call("phone", "a", lambda: "+17145550100", ttl_s=-1)
+    assert llm_cache.cached_llm_call("phone", "a", lambda: "fresh") == "fresh"
+    assert llm_cache.cached_llm_call("phone", "a", lambda: "bypassed", bypass=True) == "bypassed"
+
+    for i in range(5):
+        llm_cache.cached_llm_call("phone", f"n{i}", lambda: "x")
+    llm_cache.prune(max_rows=2)
+    (n,) = llm_cache._conn().execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+    assert n == 2
@@ -0,0 +1,76 @@
+# tests/test_llm_gateway.py
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import llm_gateway as gw
+
+
+class _FakeCompletions:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.order = []
+
+    def create(self, **kwargs):
+        self.order.append(kwargs["messages"][0]["content"])
+        time.sleep(self.delay)
+        return SimpleNamespace(usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, prompt_tokens_details=None))
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    completions = _FakeCompletions()
+    monkeypatch.setattr(gw, "_client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    monkeypatch.setattr(gw, "_budgets", {})
+    monkeypatch.setattr(gw, "_stats", {})
+    monkeypatch.setattr(gw, "_waiters", [])
+    monkeypatch.setattr(gw, "_in_flight", 0)
+    monkeypatch.setattr(gw.llm_telemetry, "LLM_METRICS_PATH", "off")
+    return completions
+
+
+def _msg(text):
+    return [{"role": "user", "content": text}]
+
+
+def test_metrics_and_token_settlement(fake):
+    gw.chat_completion("triage", model="m", messages=_msg("hi"))
+    gw.chat_completion("triage", model="m", messages=_msg("hi again"))
+    st = gw.gateway_stats()
+    assert st["callers"]["triage"]["calls"] == 2
+    assert st["callers"]["triage"]["prompt_tokens"] == 20
+    assert st["models"]["m"] == {"rpm_used": 2, "rpm": gw.LLM_DEFAULT_RPM, "tpm_used": 30, "tpm": gw.LLM_DEFAULT_TPM}
+    assert st["in_flight"] == 0 and st["waiting"] == 0
+
+
+def test_rpm_budget_times_out(fake, monkeypatch):
+    monkeypatch.setattr(gw, "LLM_RPM_LIMITS", {"tiny": 1})
+    gw.chat_completion("a", model="tiny", messages=_msg("1"))
+    with pytest.raises(gw.LLMQueueTimeout):
+        gw.chat_completion("a", model="tiny", messages=_msg("2"), queue_timeout_s=0.05)
+    # other models are unaffected
+    gw.chat_completion("a", model="other", messages=_msg("3"))
+    assert fake.order == ["1", "3"]
+
+
+def test_live_replies_admitted_before_cadence(fake, monkeypatch):
+    monkeypatch.setattr(gw, "LLM_MAX_CONCURRENCY", 1)
+    fake.delay = 0.05
+    blocker = threading.Thread(target=gw.chat_completion, args=("x",), kwargs=dict(model="m", messages=_msg("first")))
+    blocker.start()
+    time.sleep(0.01)
+
+    def cadence():
+        with gw.llm_priority(gw.PRIORITY_CADENCE):
+            gw.chat_completion("cadence", model="m", messages=_msg("cadence"))
+
+    threads = [threading.Thread(target=cadence)]
+    threads[0].start()
+    time.sleep(0.01)
+    threads.append(threading.Thread(target=gw.chat_completion, args=("live",), kwargs=dict(model="m", messages=_msg("live"))))
+    threads[1].start()
+    for t in [blocker] + threads:
+        t.join()
+    assert fake.order == ["first", "live", "cadence"]
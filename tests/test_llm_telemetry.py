@@ -0,0 +1,48 @@
+# tests/test_llm_telemetry.py
+from types import SimpleNamespace
+
+import llm_gateway as gw
+import llm_telemetry as tm
+
+
+def test_gateway_calls_land_in_file_and_report(monkeypatch, tmp_path):
+    path = tmp_path / "calls.jsonl"
+    monkeypatch.setattr(tm, "LLM_METRICS_PATH", str(path))
+    monkeypatch.setattr(tm, "_agg", {})
+    monkeypatch.setattr(gw, "_budgets", {})
+    monkeypatch.setattr(gw, "_stats", {})
+
+    def create(**kwargs):
+        if kwargs["messages"][0]["content"] == "boom":
+            raise RuntimeError("api down")
+        details = SimpleNamespace(cached_tokens=400)
+        return SimpleNamespace(usage=SimpleNamespace(prompt_tokens=1000, completion_tokens=200,
+                                                     prompt_tokens_details=details))
+    monkeypatch.setattr(gw, "_client", SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+
+    with gw.llm_tags(persona="sales", rooftop="Tustin Mazda"):
+        gw.chat_completion("gpt.run_gpt.sales", model="gpt-4o", messages=[{"role": "user", "content": "hi"}])
+        gw.chat_completion("gpt.run_gpt.sales", model="gpt-4o-mini", tags={"hop": 1},
+                           messages=[{"role": "user", "content": "hi"}])
+    try:
+        gw.chat_completion("patti_triage.gpt_reply_gate", model="gpt-4o", messages=[{"role": "user", "content": "boom"}])
+    except RuntimeError:
+        pass
+
+    events = list(tm.read_events(str(path)))
+    assert len(events) == 3
+    assert events[0]["persona"] == "sales" and events[0]["rooftop"] == "Tustin Mazda"
+    # 600 uncached in + 400 cached in + 200 out on gpt-4o
+    assert abs(events[0]["cost_usd"] - (600 * 2.5 + 400 * 1.25 + 200 * 10) / 1e6) < 1e-9
+    assert events[2]["ok"] is False and events[2]["error"] == "RuntimeError"
+
+    rows = tm.aggregate(events)
+    sales = rows["gpt.run_gpt.sales/sales/Tustin Mazda"]
+    assert sales["calls"] == 2 and sales["fallback_calls"] == 1 and sales["cached_tokens"] == 800
+    assert rows["patti_triage.gpt_reply_gate"]["errors"] == 1
+    assert tm.telemetry_stats()["gpt.run_gpt.sales/sales/Tustin Mazda"]["calls"] == 2
+    assert list(tm.aggregate(events, by="model")) == ["gpt-4o", "gpt-4o-mini"]
+
+    report = tm.format_report(rows)
+    assert report.index("gpt.run_gpt.sales") < report.index("patti_triage")
+    assert tm.main([str(path), "--by", "persona"]) == 0
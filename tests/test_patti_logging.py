@@ -0,0 +1,36 @@
+# tests/test_patti_logging.py
+import logging
+import queue
+
+import patti_logging as pl
+
+
+def test_lazy_fields_only_built_when_emitted(monkeypatch):
+    monkeypatch.setattr(pl, "LOG_SAMPLE_RATES", {"payload": 0.0, "payload.keep": 1.0})
+    built = []
+    lg = logging.getLogger("patti.test.lazy")
+    q = queue.SimpleQueue()
+    handler = pl._DeferredQueueHandler(q)
+    lg.addHandler(handler)
+    lg.propagate = False
+    lg.setLevel(logging.INFO)
+    try:
+        field = pl.lazy(lambda: built.append(1) or "big")
+        pl.log_sampled(lg, "payload.drop", logging.INFO, "x=%s", field)   # sampled out
+        pl.log_sampled(lg, "payload.keep", logging.DEBUG, "x=%s", field)  # level off
+        assert q.empty() and built == []
+
+        pl.log_sampled(lg, "payload.keep.sub", logging.INFO, "x=%s", field)
+        rec = q.get_nowait()
+        assert built == []                      # queued unformatted
+        assert rec.getMessage() == "x=big" and built == [1]
+
+        lg.info("plain %s", {"a": 1})           # non-lazy records are formatted up front
+        assert q.get_nowait().msg == "plain {'a': 1}"
+    finally:
+        lg.removeHandler(handler)
+
+
+def test_lazy_json_truncates_and_never_raises():
+    assert str(pl.lazy_json({"a": "x" * 50}, 10)) == '{"a": "xxx'
+    assert "failed" in str(pl.lazy(lambda: 1 / 0))
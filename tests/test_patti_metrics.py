@@ -0,0 +1,43 @@
+# tests/test_patti_metrics.py
+import pytest
+
+import patti_metrics as pm
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry(monkeypatch):
+    for name in ("_counters", "_histograms", "_buckets", "_help"):
+        monkeypatch.setattr(pm, name, {})
+    monkeypatch.setattr(pm, "_collectors", [])
+
+
+def test_histogram_and_counter_exposition():
+    for v in (0.004, 0.2, 3.0):
+        pm.observe("t_seconds", {"route": "/sms-inbound"}, v, buckets=(0.01, 1.0), help="latency")
+    pm.inc("t_total", {"route": "/sms-inbound", "status": "200"}, 3)
+    pm.register_collector(lambda: [("t_depth", "gauge", "depth", [({"kind": 'a"b'}, 2)])])
+    pm.register_collector(lambda: 1 / 0)     # a broken collector doesn't break the scrape
+
+    text = pm.render()
+    assert '# TYPE t_seconds histogram' in text
+    assert 't_seconds_bucket{route="/sms-inbound",le="0.01"} 1' in text
+    assert 't_seconds_bucket{route="/sms-inbound",le="1.0"} 2' in text
+    assert 't_seconds_bucket{route="/sms-inbound",le="+Inf"} 3' in text
+    assert 't_seconds_count{route="/sms-inbound"} 3' in text
+    assert 't_total{route="/sms-inbound",status="200"} 3' in text
+    assert 't_depth{kind="a\\"b"} 2' in text
+
+
+def test_dependency_classification(monkeypatch):
+    monkeypatch.setenv("OUTLOOK_SEND_ENDPOINT", "https://prod-12.westus.logic.azure.com/workflows/x")
+    assert pm.dependency_for_url("https://api.airtable.com/v0/app/Leads") == "airtable"
+    assert pm.dependency_for_url("https://identity.fortellis.io/oauth2/token") == "fortellis"
+    assert pm.dependency_for_url("https://authentication.logmeininc.com/oauth/token") == "goto"
+    assert pm.dependency_for_url("https://prod-12.westus.logic.azure.com/workflows/x?sig=1") == "outlook"
+    assert pm.dependency_for_url("https://example.com/") == "other"
+
+    pm.observe_dependency("goto", 0.3, 503)
+    pm.observe_dependency("goto", 0.1, 200)
+    text = pm.render()
+    assert 'patti_dependency_errors_total{dependency="goto"} 1' in text
+    assert 'patti_dependency_requests_total{code="2xx",dependency="goto"} 1' in text
@@ -0,0 +1,62 @@
+# tests/test_phase_timing.py
+import os
+import time
+
+import pytest
+
+import patti_metrics
+import phase_timing as pt
+
+
+@pytest.fixture(autouse=True)
+def _fresh(monkeypatch):
+    monkeypatch.setattr(pt, "_hooked", True)          # don't patch requests in tests
+    pt.reset()
+    yield
+    pt.reset()
+
+
+def test_phases_nested_flows_and_call_counts():
+    @pt.timed_flow("inner", first="think")
+    def inner():
+        patti_metrics.observe_dependency("openai", 0.01, 200)
+        pt.mark("send")
+        patti_metrics.observe_dependency("sendgrid", 0.01, 202)
+
+    @pt.timed_flow("outer", first="hydrate", key=lambda rec: rec["id"])
+    def outer(rec):
+        patti_metrics.observe_dependency("airtable", 0.01, 200)
+        pt.mark("route")
+        time.sleep(0.02)
+        inner()
+        pt.mark("save")
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        outer({"id": "rec1"})
+    pt.mark("ignored")                                 # outside a flow: no-op
+
+    st = pt.summary()
+    assert list(st) == ["outer"] and st["outer"]["hits"] == 1 and st["outer"]["errors"] == 1
+    phases = st["outer"]["phases"]
+    assert set(phases) == {"hydrate", "route", "inner.think", "inner.send", "save"}
+    assert phases["route"]["wall_s"] >= 0.02
+    assert [phases[p]["calls"] for p in ("hydrate", "route", "inner.think", "inner.send", "save")] == [1, 0, 1, 1, 0]
+    assert 'patti_phase_calls_total{dependency="openai",flow="outer",phase="inner.think"} 1' in patti_metrics.render()
+
+
+def test_profiles_keep_only_the_slowest(tmp_path, monkeypatch):
+    monkeypatch.setattr(pt, "_profile_kind", "cprofile")
+    monkeypatch.setattr(pt, "PHASE_PROFILE_TOP", 2)
+    monkeypatch.setattr(pt, "PHASE_PROFILE_DIR", str(tmp_path))
+
+    @pt.timed_flow("hit", key=lambda s: f"opp/{s}")
+    def hit(s):
+        time.sleep(s)
+
+    for s in (0.03, 0.01, 0.05, 0.02):
+        hit(s)
+    kept = pt.slowest_profiles()
+    assert len(kept) == 2 and kept[0][0] >= 0.05 and kept[1][0] >= 0.03      # the 0.05 s and 0.03 s hits
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(p) for _, p in kept)
+    assert all(name.startswith("hit-opp_") and name.endswith(".prof") for name in os.listdir(tmp_path))
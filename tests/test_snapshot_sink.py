@@ -0,0 +1,57 @@
+# tests/test_snapshot_sink.py
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import snapshot_sink as sink
+
+
+def test_async_writes_are_compact_and_coalesced(tmp_path, monkeypatch):
+    monkeypatch.setattr(sink, "SNAPSHOT_MODE", "async")
+    monkeypatch.setattr(sink, "SNAPSHOT_DIR", str(tmp_path))
+    before = sink.stats()
+
+    opp = {"opportunityId": "opp1", "at": datetime(2025, 1, 2, tzinfo=timezone.utc), "n": 0}
+    for i in range(50):
+        opp["n"] = i
+        sink.save(opp, "opp1")
+    opp["n"] = 99                                       # mutations after save() don't leak in
+    assert sink.flush(5.0)
+
+    text = (tmp_path / "opp1.snapshot.json").read_text(encoding="utf-8")
+    assert "\n" not in text and json.loads(text) == {"opportunityId": "opp1", "at": "2025-01-02T00:00:00+00:00", "n": 49}
+    assert not [p for p in os.listdir(tmp_path) if p.endswith(".tmp")]
+    after = sink.stats()
+    assert after.get("written", 0) - before.get("written", 0) + after.get("coalesced", 0) - before.get("coalesced", 0) == 50
+
+
+def test_sampled_off_and_retention(tmp_path, monkeypatch):
+    monkeypatch.setattr(sink, "SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(sink, "SNAPSHOT_MODE", "off")
+    sink.save({"a": 1}, "x")
+    monkeypatch.setattr(sink, "SNAPSHOT_MODE", "sampled")
+    monkeypatch.setattr(sink, "SNAPSHOT_SAMPLE_RATE", 0.5)
+    names = [f"opp{i}" for i in range(200)]
+    for name in names:
+        sink.save({"id": name}, name)
+    assert sink.flush(5.0)
+    kept = {p[:-len(sink.SUFFIX)] for p in os.listdir(tmp_path)}
+    assert "x" not in kept and 60 < len(kept) < 140
+    assert kept == {n for n in names if sink._sampled_in(n)}      # stable per opportunity
+
+    (tmp_path / "old").mkdir()
+    recorded = tmp_path / "recorded-opp.json"                      # a replay corpus file, not ours
+    recorded.write_text("{}", encoding="utf-8")
+    now = time.time()
+    os.utime(recorded, (now - 1000 * 3600, now - 1000 * 3600))
+    for i, name in enumerate(sorted(kept)):
+        os.utime(tmp_path / f"{name}{sink.SUFFIX}", (now - i * 60, now - i * 60))
+    expired = sorted(kept)[-5:]
+    for name in expired:
+        os.utime(tmp_path / f"{name}{sink.SUFFIX}", (now - 10 * 3600, now - 10 * 3600))
+
+    removed = sink.prune(str(tmp_path), max_files=10, max_age_h=2)
+    left = sorted(p[:-len(sink.SUFFIX)] for p in os.listdir(tmp_path) if p.endswith(sink.SUFFIX))
+    assert removed == len(kept) - 10 and left == sorted(kept)[:10]
+    assert (tmp_path / "old").is_dir() and recorded.exists()
@@ -0,0 +1,19 @@
+# tests/test_startup.py
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_web_app_import_defers_processors_and_clients():
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("AIRTABLE_", "OPENAI_", "ELASTIC_"))}
+    env.update({"WEB_WARM_IMPORTS": "0", "INBOUND_SWEEPER": "0", "INBOUND_QUEUE_PATH": ":memory:"})
+    code = (
+        "import sys, web_app\n"
+        "heavy = ['openai', 'airtable_store', 'email_ingestion', 'sms_ingestion', 'fortellis', 'bs4', 'gpt']\n"
+        "print(','.join(m for m in heavy if m in sys.modules))\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    assert proc.stdout.strip() == ""
@@ -0,0 +1,29 @@
+# tests/test_webhook_dedupe.py
+import webhook_dedupe as wd
+
+
+def test_claim_window_release_and_keys(tmp_path, monkeypatch):
+    monkeypatch.setattr(wd, "WEBHOOK_DEDUPE_PATH", str(tmp_path / "d.sqlite3"))
+    monkeypatch.setattr(wd, "WEBHOOK_DEDUPE_ENABLED", True)
+
+    email = {"message_id": " <ABC@mail> ", "subject": "Offer"}
+    key = wd.email_key(email)
+    assert key == wd.email_key({"message_id": "ABC@mail"}) == "email:mid:ABC@mail"
+    assert wd.email_key({"message_id": "AAMkAGI2=="}) != wd.email_key({"message_id": "AAMKagi2=="})
+
+    assert wd.claim(key, "lead-notification-inbound")
+    assert not wd.claim(key, "kbb-email-inbound")          # same email, other endpoint
+    wd.release(key)
+    assert wd.claim(key, "kbb-email-inbound")
+
+    assert wd.claim("email:mid:old", "email-inbound", window_s=-1)
+    assert wd.claim("email:mid:old", "email-inbound")       # window expired
+
+    body = {"from": "a@x.com", "body_text": "Yes  Saturday\nworks", "subscription_id": "s1"}
+    assert wd.email_key(body) == wd.email_key({**body, "from": "A@X.com ", "body_text": "yes saturday works"})
+    assert wd.email_key(body, "2026-01-01T10:00") != wd.email_key(body, "2026-01-01T11:00")
+    assert wd.sms_key({"lastMessage": {"id": "M1"}, "body": "hi"}) == "sms:mid:M1"
+
+    st = wd.stats()
+    assert st["endpoints"]["kbb-email-inbound"] == {"claimed": 1, "duplicate": 1}
+    assert st["store"]["kbb-email-inbound"]["keys"] == 1
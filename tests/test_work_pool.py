@@ -0,0 +1,38 @@
+# tests/test_work_pool.py
+import threading
+
+from work_pool import WorkPool
+
+
+def test_full_queue_rejects_and_shutdown_drains():
+    gate, started = threading.Event(), threading.Event()
+    done = []
+    pool = WorkPool("t", workers=1, queue_size=2)
+
+    assert pool.submit("a", lambda: started.set() or gate.wait(5))    # occupies the only worker
+    assert started.wait(5)
+    assert pool.submit("a", done.append, 1)
+    assert pool.submit("b", done.append, 2)
+    assert not pool.submit("b", done.append, 3)        # queue full -> backpressure
+
+    st = pool.stats()
+    assert st["queue_depth"] == 2 and st["endpoints"]["b"]["rejected"] == 1
+
+    gate.set()
+    assert pool.shutdown(timeout_s=5)
+    assert done == [1, 2]
+    assert not pool.submit("a", done.append, 4) and not pool.accepting
+
+    st = pool.stats()["endpoints"]
+    assert st["a"]["completed"] == 2 and st["b"]["completed"] == 1
+    assert st["a"]["p95_run_ms"] >= st["b"]["p95_run_ms"]
+
+
+def test_failed_job_is_counted_and_worker_survives():
+    pool = WorkPool("t", workers=1, queue_size=4)
+    out = []
+    pool.submit("x", lambda: 1 / 0)
+    pool.submit("x", out.append, "ok")
+    pool.shutdown(timeout_s=5)
+    assert out == ["ok"]
+    assert pool.stats()["endpoints"]["x"]["failed"] == 1
@@ -3,20 +3,132 @@ import logging
 import json
 import re
 from datetime import datetime as _dt
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 import os
 import threading
+import time
 
-from email_ingestion import process_inbound_email, process_lead_notification
-from kbb_adf_ingestion import process_kbb_adf_notification
-from sms_ingestion import process_inbound_sms
-from sms_poller import send_sms_cadence_once
+from llm_gateway import PRIORITY_CADENCE, gateway_stats, llm_priority
 from lead_router import detect_lead_source
+from work_pool import WorkPool
+import inbound_queue
+import patti_metrics
+import webhook_dedupe
+
+# The processors (email_ingestion, kbb_adf_ingestion, sms_ingestion, sms_poller)
+# pull in airtable_store, fortellis, gpt, bs4, pydantic models... They are
+# imported where they're used, so a worker answers /health as soon as Flask is
+# up; WEB_WARM_IMPORTS=1 (default) loads them on a background thread right after.
+_PROCESSOR_MODULES = ("email_ingestion", "kbb_adf_ingestion", "sms_ingestion", "sms_poller", "event_campaign_state")
 
 log = logging.getLogger("patti.web")
 app = Flask(__name__)
 
 
+def _background_boot(warm: bool) -> None:
+    import importlib
+
+    patti_metrics.install_requests_hook()
+    if not warm:
+        return
+    for name in _PROCESSOR_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            log.exception("warm import of %s failed (will retry on first use)", name)
+
+
+threading.Thread(
+    target=_background_boot, args=(os.getenv("WEB_WARM_IMPORTS", "1") != "0",),
+    name="web-boot", daemon=True,
+).start()
+
+
+@app.before_request
+def _metrics_start():
+    g.metrics_t0 = time.perf_counter()
+
+
+@app.after_request
+def _metrics_record(response):
+    t0 = g.pop("metrics_t0", None)
+    if t0 is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        labels = {"route": route, "method": request.method}
+        patti_metrics.observe("patti_http_request_seconds", labels, time.perf_counter() - t0,
+                              help="Webhook/API request latency by route")
+        patti_metrics.inc("patti_http_requests_total", {**labels, "status": str(response.status_code)},
+                          help="Requests by route and status")
+    return response
+
+# webhook work runs here, not on the request thread (bounded; see work_pool.py).
+# Payloads are persisted first (inbound_queue.py), so a restart or a failed
+# attempt doesn't lose them: the pool only carries "consume one" tokens.
+_pool = WorkPool("web")
+
+
+def _consume_token(endpoint: str = "inbound-queue") -> bool:
+    return _pool.submit(endpoint, inbound_queue.consume_one)
+
+
+def _duplicate(endpoint: str):
+    return jsonify({"status": "duplicate", "endpoint": endpoint}), 200
+
+
+def _email_conversation_key(inbound: dict) -> str:
+    thread = (inbound.get("conversation_id") or "").strip()
+    if thread:
+        return f"email:{thread}"
+    sender = (inbound.get("from") or "").strip().lower()
+    return f"email:{sender}" if sender else ""
+
+
+def _enqueue(endpoint: str, payload: dict, dedupe_key: str = "", conversation_key: str = ""):
+    """
+    Persist payload for the `endpoint` handler and wake a worker. Payloads with
+    the same conversation_key run one at a time, in order (see inbound_queue.py).
+    Returns None when accepted, otherwise the response to send: "duplicate" when dedupe_key was
+    already seen (webhook_dedupe.py), 429 while the backlog is over
+    INBOUND_MAX_PENDING, 503 while shutting down.
+    """
+    if not _pool.accepting:
+        resp = jsonify({"status": "unavailable", "reason": "shutting_down"})
+        resp.headers["Retry-After"] = "30"
+        return resp, 503
+    if inbound_queue.pending() >= inbound_queue.INBOUND_MAX_PENDING:
+        log.warning("inbound queue backlog full: rejecting %s", endpoint)
+        resp = jsonify({"status": "busy", "reason": "queue_full"})
+        resp.headers["Retry-After"] = "10"
+        return resp, 429
+    if not webhook_dedupe.claim(dedupe_key, endpoint):
+        return _duplicate(endpoint)
+    try:
+        inbound_queue.enqueue(endpoint, payload, conversation_key)
+    except Exception:
+        webhook_dedupe.release(dedupe_key)
+        raise
+    # pool full is fine here: the entry is stored and the sweeper picks it up
+    _consume_token(endpoint)
+    return None
+
+
+def _executor_samples():
+    st = _pool.stats()
+    q = inbound_queue.stats()
+    depth = [({"kind": kind, "status": status}, n) for kind, by in q["kinds"].items()
+             for status, n in by.items() if status in ("ready", "leased", "dead")]
+    return [
+        ("patti_work_pool_queue_depth", "gauge", "Jobs waiting for a pool worker", [({}, st["queue_depth"])]),
+        ("patti_work_pool_busy", "gauge", "Pool workers running a job", [({}, st["busy"])]),
+        ("patti_work_pool_rejected_total", "counter", "Submissions refused (pool full / shutting down)",
+         [({"endpoint": ep}, e["rejected"]) for ep, e in st["endpoints"].items()]),
+        ("patti_inbound_queue_entries", "gauge", "Durable inbound queue entries by status", depth),
+    ]
+
+
+patti_metrics.register_collector(_executor_samples)
+
+
 KBB_RULES = [
     # strong phrases (safe anywhere)
     ("kelley_blue_book", re.compile(r"(?i)kelley\s+blue\s+book")),
@@ -72,6 +184,7 @@ def kbb_adf_inbound():
 
         log.info("📩 KBB ADF inbound: from=%s subject=%s", inbound["from"], inbound["subject"])
 
+        from kbb_adf_ingestion import process_kbb_adf_notification
         process_kbb_adf_notification(inbound)
 
         return jsonify({"status": "ok"}), 200
@@ -112,9 +225,14 @@ def kbb_email_inbound():
             inbound["from"], inbound["subject"], inbound.get("subscription_id"), inbound.get("source")
         )
 
-        process_inbound_email(inbound)
+        rejected = _enqueue(
+            "kbb-email-inbound", inbound,
+            webhook_dedupe.email_key(inbound, payload.get("timestamp")), _email_conversation_key(inbound),
+        )
+        if rejected:
+            return rejected
 
-        return jsonify({"status": "ok"}), 200
+        return jsonify({"status": "accepted"}), 200
 
     except Exception as e:
         log.exception("KBB email ingestion failed: %s", e)
@@ -219,23 +337,10 @@ def lead_notification_inbound():
             "reason": "no_rule_match",
         }), 200
 
-    # ✅ Kick off background work so PA never times out
-    import threading
-
-    def _worker(snapshot: dict):
-        try:
-            # Move heavy imports inside worker (prevents cold-start import delays blocking PA)
-            if snapshot.get("source") == "Team Velocity - Pre-Qualification" and not snapshot.get("lead_type"):
-                from lead_router import detect_lead_type
-                snapshot["lead_type"] = detect_lead_type(snapshot)
-
-            from email_ingestion import process_lead_notification
-            process_lead_notification(snapshot)
-
-        except Exception:
-            log.exception("lead-notification-inbound worker failed")
-
-    threading.Thread(target=_worker, args=(inbound,), daemon=True).start()
+    # ✅ Persist + kick off background work so PA never times out
+    rejected = _enqueue("lead-notification-inbound", inbound, webhook_dedupe.email_key(inbound, payload.get("timestamp")))
+    if rejected:
+        return rejected
 
     # ✅ Respond immediately
     return jsonify({
@@ -299,33 +404,12 @@ def email_inbound():
         )
 
         # --- ASYNC: respond fast to Power Automate, process in background ---
-        import threading
-
-        def _worker(snapshot: dict):
-            try:
-                # --- Event campaign RSVP / STOP handling ---
-                try:
-                    from event_campaign_state import handle_event_email_reply
-
-                    event_out = handle_event_email_reply(snapshot)
-                    if event_out.get("handled"):
-                        log.info(
-                            "📨 Event email reply handled action=%s from=%s subject=%s",
-                            event_out.get("action"),
-                            snapshot.get("from"),
-                            snapshot.get("subject"),
-                        )
-                        return
-                except Exception:
-                    log.exception("Event email reply handler failed")
-
-                # --- Normal processing ---
-                process_inbound_email(snapshot)
-
-            except Exception:
-                log.exception("email_inbound worker failed")
-
-        threading.Thread(target=_worker, args=(inbound,), daemon=True).start()
+        rejected = _enqueue(
+            "email-inbound", inbound,
+            webhook_dedupe.email_key(inbound, payload.get("timestamp")), _email_conversation_key(inbound),
+        )
+        if rejected:
+            return rejected
 
         # Return immediately so PA never hits the ~120s timeout
         return jsonify({"status": "accepted"}), 200
@@ -334,55 +418,119 @@ def email_inbound():
         log.exception("Email ingestion failed: %s", e)
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route("/sms-inbound", methods=["POST"])
-def sms_inbound():
+def _lead_notification_job(snapshot: dict) -> None:
+    # Heavy imports stay inside the worker (prevents cold-start import delays blocking PA).
+    # Exceptions propagate so inbound_queue retries / dead-letters the payload.
+    if snapshot.get("source") == "Team Velocity - Pre-Qualification" and not snapshot.get("lead_type"):
+        from lead_router import detect_lead_type
+        snapshot["lead_type"] = detect_lead_type(snapshot)
+
+    from email_ingestion import process_lead_notification
+    process_lead_notification(snapshot)
+
+
+def _email_inbound_job(snapshot: dict) -> None:
+    # --- Event campaign RSVP / STOP handling ---
+    try:
+        from event_campaign_state import handle_event_email_reply
+
+        event_out = handle_event_email_reply(snapshot)
+        if event_out.get("handled"):
+            log.info(
+                "📨 Event email reply handled action=%s from=%s subject=%s",
+                event_out.get("action"),
+                snapshot.get("from"),
+                snapshot.get("subject"),
+            )
+            return
+    except Exception:
+        log.exception("Event email reply handler failed")
+
+    # --- Normal processing ---
+    from email_ingestion import process_inbound_email
+    process_inbound_email(snapshot)
+
+
+def _handle_sms_inbound(payload_json: dict) -> None:
     """
-    Webhook endpoint called by GoTo for inbound SMS.
     Routing order:
       1) Event RSVP / STOP
       2) Regular internet lead SMS handling
       3) Mazda loyalty fallback
     """
+    # 1) Event campaign RSVP / STOP handling
+    try:
+        from event_campaign_state import handle_event_sms_reply
+        event_out = handle_event_sms_reply(payload_json=payload_json)
+        if event_out.get("handled"):
+            log.info("📲 Event SMS reply handled action=%s", event_out.get("action"))
+            return
+    except Exception as e:
+        log.exception("Event SMS reply handler failed: %s", e)
+
+    # 2) Regular internet leads / standard Patti SMS handling
+    try:
+        from sms_ingestion import process_inbound_sms
+        out = process_inbound_sms(payload_json=payload_json)
+        if (out or {}).get("status") == "ok":
+            log.info("📲 Standard SMS inbound handled action=%s", (out or {}).get("action"))
+            return
+    except Exception as e:
+        log.exception("Standard SMS inbound handler failed: %s", e)
+
+    # 3) Existing Mazda loyalty fallback
+    from sms_poller import handle_mazda_loyalty_inbound_sms_webhook
+    out = handle_mazda_loyalty_inbound_sms_webhook(payload_json=payload_json)
+    log.info("📲 Mazda loyalty SMS fallback status=%s", (out or {}).get("status"))
+
+
+def _kbb_email_job(snapshot: dict) -> None:
+    from email_ingestion import process_inbound_email
+    process_inbound_email(snapshot)
+
+
+def _coalesce_sms(payloads: list) -> dict:
+    from sms_ingestion import coalesce_sms_payloads
+    return coalesce_sms_payloads(payloads)
+
+
+# -----------------------------
+#   Inbound queue handlers
+# -----------------------------
+inbound_queue.register("lead-notification-inbound", _lead_notification_job)
+inbound_queue.register("email-inbound", _email_inbound_job)
+inbound_queue.register("kbb-email-inbound", _kbb_email_job)
+inbound_queue.register("sms-inbound", _handle_sms_inbound, coalesce=_coalesce_sms)
+
+if os.getenv("INBOUND_SWEEPER", "1") != "0":
+    inbound_queue.start_sweeper(_consume_token)
+
+
+@app.route("/sms-inbound", methods=["POST"])
+def sms_inbound():
+    """
+    Webhook endpoint called by GoTo for inbound SMS.
+    Answers right away; the routing in _handle_sms_inbound runs on the worker pool.
+    """
     try:
         payload_json = request.get_json(silent=True) or {}
         log.info("📥 Incoming SMS webhook")
 
-        # 1) Event campaign RSVP / STOP handling
-        try:
-            from event_campaign_state import handle_event_sms_reply
-            event_out = handle_event_sms_reply(payload_json=payload_json)
-            if event_out.get("handled"):
-                log.info("📲 Event SMS reply handled action=%s", event_out.get("action"))
-                return jsonify({
-                    "status": "ok",
-                    "event_handled": True,
-                    "action": event_out.get("action"),
-                }), 200
-        except Exception as e:
-            log.exception("Event SMS reply handler failed: %s", e)
-
-        # 2) Regular internet leads / standard Patti SMS handling
-        try:
-            out = process_inbound_sms(payload_json=payload_json)
-            if (out or {}).get("status") == "ok":
-                log.info("📲 Standard SMS inbound handled action=%s", (out or {}).get("action"))
-                return jsonify(out), 200
-        except Exception as e:
-            log.exception("Standard SMS inbound handler failed: %s", e)
+        from sms_ingestion import sms_conversation_key
 
-        # 3) Existing Mazda loyalty fallback
-        from sms_poller import handle_mazda_loyalty_inbound_sms_webhook
-        out = handle_mazda_loyalty_inbound_sms_webhook(payload_json=payload_json)
+        rejected = _enqueue(
+            "sms-inbound", payload_json, webhook_dedupe.sms_key(payload_json), sms_conversation_key(payload_json),
+        )
+        if rejected:
+            return rejected
 
-        return jsonify(out), 200
+        return jsonify({"status": "accepted"}), 200
 
     except Exception as e:
         log.exception("SMS ingestion failed: %s", e)
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
-from sms_poller import poll_once
-
 @app.route("/sms-poll", methods=["POST"])
 def sms_poll():
     # simple guard so nobody hits it publicly
@@ -390,6 +538,7 @@ def sms_poll():
     if key != os.getenv("ADMIN_KEY", ""):
         return jsonify({"ok": False, "error": "unauthorized"}), 401
 
+    from sms_poller import poll_once
     poll_once()
     return jsonify({"ok": True}), 200
 
@@ -400,9 +549,49 @@ def sms_cadence():
     if key != os.getenv("ADMIN_KEY", ""):
         return jsonify({"ok": False, "error": "unauthorized"}), 401
 
-    send_sms_cadence_once()
+    with llm_priority(PRIORITY_CADENCE):
+        from sms_poller import send_sms_cadence_once
+        send_sms_cadence_once()
     return jsonify({"ok": True}), 200
 
+@app.route("/llm-stats", methods=["GET"])
+def llm_stats():
+    key = request.headers.get("X-Admin-Key", "")
+    if key != os.getenv("ADMIN_KEY", ""):
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+
+    from gpt import model_routing_stats
+    from llm_telemetry import telemetry_stats
+
+    by = request.args.get("by") or "path"
+    return jsonify({
+        "ok": True,
+        **gateway_stats(),
+        "routing": model_routing_stats(),
+        "telemetry": telemetry_stats(by=by),
+    }), 200
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    key = request.headers.get("X-Admin-Key", "") or request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if key != os.getenv("ADMIN_KEY", ""):
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+
+    return Response(patti_metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/work-stats", methods=["GET"])
+def work_stats():
+    key = request.headers.get("X-Admin-Key", "")
+    if key != os.getenv("ADMIN_KEY", ""):
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+
+    return jsonify({
+        "ok": True,
+        **_pool.stats(),
+        "inbound_queue": inbound_queue.stats(),
+        "dedupe": webhook_dedupe.stats(),
+    }), 200
+
 @app.route("/email-router-inbound", methods=["POST"])
 def email_router_inbound():
     """
@@ -462,7 +651,15 @@ def email_router_inbound():
         # processors if needed.
         if lead_source:
             inbound["lead_source"] = lead_source
-            process_lead_notification(inbound)
+            dedupe_key = webhook_dedupe.email_key(inbound, payload.get("timestamp"))
+            if not webhook_dedupe.claim(dedupe_key, "email-router-inbound"):
+                return _duplicate("email-router-inbound")
+            try:
+                from email_ingestion import process_lead_notification
+                process_lead_notification(inbound)
+            except Exception:
+                webhook_dedupe.release(dedupe_key)  # let the sender's retry through
+                raise
             return jsonify({"status": "ok", "handled": True, "lead_source": lead_source}), 200
 
         return jsonify({"status": "ok", "handled": False, "ignored": True, "reason": "no_rule_match"}), 200
@@ -0,0 +1,178 @@
+# webhook_dedupe.py
+# Ingress de-duplication for webhooks (web_app).
+#
+# Power Automate and GoTo retry deliveries, and one email can reach several
+# endpoints (/email-router-inbound, /lead-notification-inbound,
+# /kbb-email-inbound). Each endpoint claims a key before doing any work; a key
+# already claimed inside the window answers "duplicate" right away instead of
+# running the pipeline (LLM calls, CRM writes) again.
+#
+# Keys are the provider message id when there is one, otherwise a hash of the
+# normalized content. Claims live in a small SQLite file so every gunicorn
+# worker on the host sees them.
+#
+#   WEBHOOK_DEDUPE_PATH       sqlite file (default /tmp/patti_webhook_dedupe.sqlite3)
+#   WEBHOOK_DEDUPE_WINDOW_S   how long a key stays claimed (default 86400)
+#   WEBHOOK_DEDUPE            0 = disabled, every delivery is processed (default 1)
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+log = logging.getLogger("patti.webhook_dedupe")
+
+WEBHOOK_DEDUPE_PATH = os.getenv("WEBHOOK_DEDUPE_PATH", "/tmp/patti_webhook_dedupe.sqlite3")
+WEBHOOK_DEDUPE_WINDOW_S = float(os.getenv("WEBHOOK_DEDUPE_WINDOW_S", "86400"))
+WEBHOOK_DEDUPE_ENABLED = os.getenv("WEBHOOK_DEDUPE", "1").strip() != "0"
+
+_PRUNE_EVERY_S = 600.0
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_counts: Dict[str, Dict[str, int]] = defaultdict(lambda: {"claimed": 0, "duplicate": 0})
+_last_prune = 0.0
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_WS_RE = re.compile(r"\s+")
+
+
+def _conn() -> sqlite3.Connection:
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(WEBHOOK_DEDUPE_PATH)
+    if conn is not None:
+        return conn
+    conn = sqlite3.connect(WEBHOOK_DEDUPE_PATH, timeout=5.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS webhook_dedupe ("
+        " key TEXT PRIMARY KEY, endpoint TEXT NOT NULL, first_seen REAL NOT NULL,"
+        " expires_at REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+    )
+    conns[WEBHOOK_DEDUPE_PATH] = conn
+    return conn
+
+
+# --- keys ---
+
+def _norm(value: Any) -> str:
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, default=str) if value is not None else ""
+    return _WS_RE.sub(" ", value).strip().lower()
+
+
+def message_key(scope: str, message_id: Optional[str]) -> str:
+    """
+    Key for a provider message id (Message-ID header, GoTo message id), or "" if missing.
+    Ids are case-sensitive (Graph/Outlook ids are base64-like), so only whitespace and
+    the Message-ID angle brackets are stripped.
+    """
+    mid = (message_id or "").strip().strip("<>").strip()
+    return f"{scope}:mid:{mid}" if mid else ""
+
+
+def content_key(scope: str, *parts: Any) -> str:
+    """Key for the normalized content when there's no message id."""
+    h = hashlib.blake2b(digest_size=16)
+    for p in parts:
+        h.update(_norm(p).encode("utf-8"))
+        h.update(b"\x1f")
+    return f"{scope}:sha:{h.hexdigest()}"
+
+
+def email_key(inbound: Dict[str, Any], sent_at: Optional[str] = None) -> str:
+    """
+    Shared by every email endpoint, so the same message arriving on two of them
+    is processed once. sent_at is the sender's timestamp (not our utcnow default).
+    """
+    key = message_key("email", inbound.get("message_id"))
+    if key:
+        return key
+    body = inbound.get("body_text") or _TAG_RE.sub(" ", inbound.get("body_html") or "")
+    return content_key(
+        "email", inbound.get("subscription_id"), inbound.get("from"), inbound.get("to"),
+        inbound.get("subject"), body, sent_at,
+    )
+
+
+def sms_key(payload: Dict[str, Any]) -> str:
+    last = payload.get("lastMessage") if isinstance(payload.get("lastMessage"), dict) else {}
+    for mid in (last.get("id"), payload.get("lastMessageId"), payload.get("messageId"), payload.get("message_id")):
+        if isinstance(mid, str) and mid.strip():
+            return message_key("sms", mid)
+    return content_key("sms", payload)
+
+
+# --- claims ---
+
+def claim(key: str, endpoint: str, window_s: Optional[float] = None) -> bool:
+    """
+    True if this delivery should be processed (first time `key` is seen inside
+    the window); False for a duplicate. Fails open if the store is unavailable.
+    """
+    if not WEBHOOK_DEDUPE_ENABLED or not key:
+        return True
+    now = time.time()
+    expires = now + (WEBHOOK_DEDUPE_WINDOW_S if window_s is None else window_s)
+    try:
+        conn = _conn()
+        fresh = conn.execute(
+            "INSERT INTO webhook_dedupe(key, endpoint, first_seen, expires_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET endpoint = excluded.endpoint, first_seen = excluded.first_seen,"
+            " expires_at = excluded.expires_at, hits = 0 WHERE webhook_dedupe.expires_at < ?",
+            (key, endpoint, now, expires, now),
+        ).rowcount > 0
+        if not fresh:
+            conn.execute("UPDATE webhook_dedupe SET hits = hits + 1 WHERE key = ?", (key,))
+        _maybe_prune(conn, now)
+    except sqlite3.Error:
+        log.exception("webhook dedupe store unavailable; processing %s", endpoint)
+        return True
+    with _stats_lock:
+        _counts[endpoint]["claimed" if fresh else "duplicate"] += 1
+    if not fresh:
+        log.info("🔁 duplicate webhook on %s key=%s", endpoint, key)
+    return fresh
+
+
+def release(key: str) -> None:
+    """Forget a claim whose processing never started (e.g. rejected with 429), so the retry goes through."""
+    if not WEBHOOK_DEDUPE_ENABLED or not key:
+        return
+    try:
+        _conn().execute("DELETE FROM webhook_dedupe WHERE key = ?", (key,))
+    except sqlite3.Error:
+        log.exception("webhook dedupe release failed key=%s", key)
+
+
+def _maybe_prune(conn: sqlite3.Connection, now: float) -> None:
+    global _last_prune
+    if now - _last_prune < _PRUNE_EVERY_S:
+        return
+    _last_prune = now
+    conn.execute("DELETE FROM webhook_dedupe WHERE expires_at < ?", (now,))
+
+
+def stats() -> Dict[str, Any]:
+    """This process's claimed/duplicate counts per endpoint, plus host-wide hits from the store."""
+    with _stats_lock:
+        local = {ep: dict(c) for ep, c in _counts.items()}
+    out: Dict[str, Any] = {"enabled": WEBHOOK_DEDUPE_ENABLED, "window_s": WEBHOOK_DEDUPE_WINDOW_S, "endpoints": local}
+    try:
+        rows = _conn().execute(
+            "SELECT endpoint, COUNT(*), SUM(hits) FROM webhook_dedupe WHERE expires_at >= ? GROUP BY endpoint",
+            (time.time(),),
+        ).fetchall()
+        out["store"] = {ep: {"keys": n, "duplicate_hits": int(hits or 0)} for ep, n, hits in rows}
+    except sqlite3.Error:
+        out["store"] = {}
+    return out
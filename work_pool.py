@@ -0,0 +1,168 @@
+# work_pool.py
+# Bounded background worker pool for webhook processing (web_app).
+#
+# Webhooks answer Power Automate / GoTo right away and hand the work to this
+# pool. When the queue is full, submit() returns False and the endpoint answers
+# 429 so the sender retries later instead of the process piling up threads.
+# Workers are regular (non-daemon) threads: on shutdown the pool stops taking
+# work and drains what is queued, bounded by WEB_DRAIN_S.
+#
+#   WEB_WORKERS      worker threads (default 8)
+#   WEB_QUEUE_SIZE   queued jobs before submit() refuses (default 100)
+#   WEB_DRAIN_S      max seconds to finish queued work on shutdown (default 25)
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+log = logging.getLogger("patti.work_pool")
+
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "8"))
+WEB_QUEUE_SIZE = int(os.getenv("WEB_QUEUE_SIZE", "100"))
+WEB_DRAIN_S = float(os.getenv("WEB_DRAIN_S", "25"))
+
+_SAMPLES = 500
+_IDLE_POLL_S = 0.5
+
+
+def _pct(vals, q: float) -> float:
+    s = sorted(vals)
+    return s[min(len(s) - 1, int(len(s) * q))] if s else 0.0
+
+
+class WorkPool:
+    def __init__(self, name: str = "web", workers: Optional[int] = None, queue_size: Optional[int] = None,
+                 drain_s: Optional[float] = None):
+        self.name = name
+        self.workers = max(1, workers or WEB_WORKERS)
+        self.drain_s = WEB_DRAIN_S if drain_s is None else drain_s
+        self._q: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size or WEB_QUEUE_SIZE))
+        self._threads: list = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._drain_deadline: Optional[float] = None
+        self._busy = 0
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    # --- submit / run ---
+
+    def _endpoint(self, endpoint: str) -> Dict[str, Any]:
+        st = self._stats.get(endpoint)
+        if st is None:
+            st = self._stats[endpoint] = {
+                "submitted": 0, "rejected": 0, "completed": 0, "failed": 0, "dropped": 0,
+                "wait_s": deque(maxlen=_SAMPLES), "run_s": deque(maxlen=_SAMPLES),
+            }
+        return st
+
+    def _start_workers(self) -> None:
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._loop, name=f"{self.name}-worker-{len(self._threads)}")
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, endpoint: str, fn: Callable[..., Any], *args, **kwargs) -> bool:
+        """Queue fn(*args, **kwargs); False when full or shutting down (caller answers 429/503)."""
+        with self._lock:
+            st = self._endpoint(endpoint)
+            if self._closed:
+                st["rejected"] += 1
+                return False
+            self._start_workers()
+            try:
+                self._q.put_nowait((endpoint, fn, args, kwargs, time.monotonic()))
+            except queue.Full:
+                st["rejected"] += 1
+                log.warning("work pool %s full: rejected %s (depth=%d)", self.name, endpoint, self._q.qsize())
+                return False
+            st["submitted"] += 1
+            return True
+
+    @property
+    def accepting(self) -> bool:
+        return not self._closed
+
+    def _should_exit(self) -> bool:
+        if not self._closed and threading.main_thread().is_alive():
+            return False
+        # interpreter is going down (or shutdown() was called): drain, then exit
+        with self._lock:
+            self._closed = True
+            if self._drain_deadline is None:
+                self._drain_deadline = time.monotonic() + self.drain_s
+        return True
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                item = self._q.get(timeout=_IDLE_POLL_S)
+            except queue.Empty:
+                if self._should_exit():
+                    return
+                continue
+            endpoint, fn, args, kwargs, queued_at = item
+            if self._should_exit() and time.monotonic() > (self._drain_deadline or 0):
+                with self._lock:
+                    self._endpoint(endpoint)["dropped"] += 1
+                log.error("work pool %s: drain timeout, dropping queued %s", self.name, endpoint)
+                self._q.task_done()
+                continue
+            t0 = time.monotonic()
+            with self._lock:
+                self._busy += 1
+            ok = False
+            try:
+                fn(*args, **kwargs)
+                ok = True
+            except Exception:
+                log.exception("work pool %s: %s job failed", self.name, endpoint)
+            finally:
+                t1 = time.monotonic()
+                with self._lock:
+                    self._busy -= 1
+                    st = self._endpoint(endpoint)
+                    st["completed" if ok else "failed"] += 1
+                    st["wait_s"].append(t0 - queued_at)
+                    st["run_s"].append(t1 - t0)
+                self._q.task_done()
+
+    # --- lifecycle ---
+
+    def shutdown(self, timeout_s: Optional[float] = None) -> bool:
+        """Stop accepting, finish queued work (up to timeout_s), join workers. True if fully drained."""
+        timeout_s = self.drain_s if timeout_s is None else timeout_s
+        with self._lock:
+            self._closed = True
+            self._drain_deadline = time.monotonic() + timeout_s
+            threads = list(self._threads)
+        for t in threads:
+            t.join(max(0.0, self._drain_deadline - time.monotonic()) + _IDLE_POLL_S * 2)
+        drained = self._q.empty() and not any(t.is_alive() for t in threads)
+        log.info("work pool %s shut down drained=%s", self.name, drained)
+        return drained
+
+    # --- metrics ---
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            endpoints = {}
+            for ep, st in self._stats.items():
+                endpoints[ep] = {
+                    **{k: v for k, v in st.items() if k not in ("wait_s", "run_s")},
+                    "avg_wait_ms": sum(st["wait_s"]) * 1000.0 / len(st["wait_s"]) if st["wait_s"] else 0.0,
+                    "p95_wait_ms": _pct(st["wait_s"], 0.95) * 1000.0,
+                    "avg_run_ms": sum(st["run_s"]) * 1000.0 / len(st["run_s"]) if st["run_s"] else 0.0,
+                    "p95_run_ms": _pct(st["run_s"], 0.95) * 1000.0,
+                }
+            return {
+                "workers": self.workers,
+                "busy": self._busy,
+                "queue_depth": self._q.qsize(),
+                "queue_size": self._q.maxsize,
+                "accepting": not self._closed,
+                "endpoints": endpoints,
+            }